@@ -1,21 +1,38 @@
 from importlib.metadata import distribution
 
+from .backoff import ExpiryAwareBackoff, FixedWait
 from .client import Distlock, DistlockAsync
 from .exceptions import (
     AlreadyAcquiredError,
     AlreadyExistsError,
+    DeadlineExceededError,
+    InvalidArgumentError,
+    LeaseLostError,
     NotFoundError,
+    ResourceExhaustedError,
     UnreleasableError,
 )
+from .keepalive import KeepAlive, KeepAliveAsync
 from .models import Lock
+from .sharding import ShardedDistlock, ShardedDistlockAsync
 
 __all__ = [
     "Distlock",
     "DistlockAsync",
     "AlreadyAcquiredError",
     "AlreadyExistsError",
+    "DeadlineExceededError",
+    "ExpiryAwareBackoff",
+    "FixedWait",
+    "InvalidArgumentError",
+    "KeepAlive",
+    "KeepAliveAsync",
+    "LeaseLostError",
     "Lock",
     "NotFoundError",
+    "ResourceExhaustedError",
+    "ShardedDistlock",
+    "ShardedDistlockAsync",
     "UnreleasableError",
 ]
 
@@ -1,34 +1,61 @@
+import asyncio
 import logging
+from pathlib import Path
+from typing import AsyncIterator, Callable
 
 import grpc
 
-from .exceptions import AlreadyExistsError, UnreleasableError
-from .lock_store import ThreadSafeLockStore
-from .models import Lock
+from .exceptions import AlreadyExistsError, LeaseLostError, UnreleasableError
+from .lock_store import AsyncLockStore
+from .metrics import (
+    AsyncMetricsInterceptor,
+    MetricsServer,
+    RpcMetrics,
+    lock_store_gauges,
+)
+from .models import LockRecord
+from .reaper import reap_forever
+from .server import acquire_batch, lock_result
+from .snapshot import DEFAULT_SNAPSHOT_INTERVAL_SECONDS, Snapshotter, recover
 from .stubs import distlock_pb2, distlock_pb2_grpc
+from .tuning import AsyncAdmissionInterceptor, ServerTuning
+from .wal import WriteAheadLog
 
 ONE_MINUTE_IN_SECONDS = 1 * 60
+MAX_WAIT_SECONDS = ONE_MINUTE_IN_SECONDS
+DEFAULT_PAGE_SIZE = 1_000
+MAX_PAGE_SIZE = 10_000
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(levelname)s %(asctime)s.%(msecs)03d %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
 logger = logging.getLogger(__name__)
 
 
 class AsyncServicer(distlock_pb2_grpc.DistlockServicer):
-    def __init__(self):
-        self.lock_store = ThreadSafeLockStore()
+    def __init__(
+        self,
+        wal: WriteAheadLog | None = None,
+        lock_store: AsyncLockStore | None = None,
+    ):
+        # The store belongs to the server's event loop, so handlers use it
+        # without taking any locks, and waiters wait on the loop
+        self.lock_store = lock_store if lock_store is not None else AsyncLockStore(wal)
+        self.wal = wal
+
+    async def _sync(self) -> None:
+        """
+        Waits until every mutation made so far is on disk, without blocking
+        the event loop while the log's fsync is in flight.
+        """
+        if self.wal is not None:
+            await self.wal.sync_async()
 
     async def CreateLock(
         self, request: distlock_pb2.Lock, context: grpc.aio.ServicerContext
     ) -> distlock_pb2.EmptyResponse:
-        logger.info(f"Received request to create lock named {request.key}")
+        logger.debug("Received request to create lock named %s", request.key)
         try:
             self.lock_store.set_not_exists(
                 request.key,
-                Lock(key=request.key),
+                LockRecord(key=request.key, permits=request.permits),
             )
         except AlreadyExistsError:
             msg = f"A lock with key {request.key} already exists"
@@ -36,7 +63,14 @@ class AsyncServicer(distlock_pb2_grpc.DistlockServicer):
             context.set_details(msg)
             context.set_code(grpc.StatusCode.ALREADY_EXISTS)
             return distlock_pb2.EmptyResponse()
-        logger.info(f"Created lock named {request.key}")
+        except ValueError as e:
+            msg = f"Could not create lock: {e}"
+            logger.error(msg)
+            context.set_details(msg)
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            return distlock_pb2.EmptyResponse()
+        await self._sync()
+        logger.info("Created lock named %s", request.key)
         return distlock_pb2.EmptyResponse()
 
     async def AcquireLock(
@@ -44,8 +78,10 @@ class AsyncServicer(distlock_pb2_grpc.DistlockServicer):
         request: distlock_pb2.AcquireLockRequest,
         context: grpc.aio.ServicerContext,
     ) -> distlock_pb2.Lock:
-        logger.info(
-            f"Received request to acquire lock named {request.key} with an expires in of {request.expires_in_seconds} seconds"
+        logger.debug(
+            "Received request to acquire lock named %s with an expires in of %s seconds",
+            request.key,
+            request.expires_in_seconds,
         )
         if request.expires_in_seconds != 0:
             expires_in_seconds = request.expires_in_seconds
@@ -55,6 +91,60 @@ class AsyncServicer(distlock_pb2_grpc.DistlockServicer):
             lock = self.lock_store.acquire(
                 key=request.key,
                 expires_in_seconds=expires_in_seconds,
+                shared=request.mode == distlock_pb2.SHARED,
+                owner=request.owner,
+                request_id=request.request_id,
+            )
+        except KeyError:
+            msg = f"A lock with key {request.key} does not exist"
+            logger.error(msg)
+            context.set_details(msg)
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            return distlock_pb2.Lock()
+        except ValueError as e:
+            msg = f"Could not acquire lock: {e}"
+            logger.error(msg)
+            context.set_details(msg)
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            return distlock_pb2.Lock()
+        await self._sync()
+        logger.info(
+            "Lock with key %s has %s been acquired",
+            request.key,
+            "" if lock.acquired else "not",
+        )
+        return lock.to_pb()
+
+    async def WaitAcquireLock(
+        self,
+        request: distlock_pb2.WaitAcquireLockRequest,
+        context: grpc.aio.ServicerContext,
+    ) -> distlock_pb2.Lock:
+        logger.debug(
+            "Received request to wait up to %s seconds to acquire lock named %s with an expires in of %s seconds",
+            request.timeout_seconds,
+            request.key,
+            request.expires_in_seconds,
+        )
+        if request.expires_in_seconds != 0:
+            expires_in_seconds = request.expires_in_seconds
+        else:
+            expires_in_seconds = ONE_MINUTE_IN_SECONDS
+        if request.timeout_seconds >= 0:
+            timeout_seconds = min(request.timeout_seconds, MAX_WAIT_SECONDS)
+        else:
+            timeout_seconds = MAX_WAIT_SECONDS
+        time_remaining = context.time_remaining()
+        if time_remaining is not None:
+            timeout_seconds = min(timeout_seconds, time_remaining)
+        try:
+            lock = await self.lock_store.acquire_wait(
+                key=request.key,
+                expires_in_seconds=expires_in_seconds,
+                timeout_seconds=timeout_seconds,
+                shared=request.mode == distlock_pb2.SHARED,
+                owner=request.owner,
+                request_id=request.request_id,
             )
         except KeyError:
             msg = f"A lock with key {request.key} does not exist"
@@ -62,21 +152,32 @@ class AsyncServicer(distlock_pb2_grpc.DistlockServicer):
             context.set_details(msg)
             context.set_code(grpc.StatusCode.NOT_FOUND)
             return distlock_pb2.Lock()
+        except ValueError as e:
+            msg = f"Could not acquire lock: {e}"
+            logger.error(msg)
+            context.set_details(msg)
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            return distlock_pb2.Lock()
+        await self._sync()
         logger.info(
-            f"Lock with key {request.key} has {'' if lock.acquired else 'not'} been acquired"
+            "Lock with key %s has %s been acquired",
+            request.key,
+            "" if lock.acquired else "not",
         )
         return lock.to_pb()
 
     async def ReleaseLock(
         self, request: distlock_pb2.Lock, context: grpc.aio.ServicerContext
     ) -> distlock_pb2.EmptyResponse:
-        logger.info(f"Received request to release lock named {request.key}")
+        logger.debug("Received request to release lock named %s", request.key)
         try:
             self.lock_store.release(
                 key=request.key,
                 clock=request.clock,
+                request_id=request.request_id,
             )
-            logger.info(f"Lock with key {request.key} has been released")
+            await self._sync()
+            logger.info("Lock with key %s has been released", request.key)
         except UnreleasableError as e:
             msg = f"Could not release lock: {e}"
             logger.error(msg)
@@ -91,13 +192,47 @@ class AsyncServicer(distlock_pb2_grpc.DistlockServicer):
             return distlock_pb2.EmptyResponse()
         return distlock_pb2.EmptyResponse()
 
+    async def RenewLock(
+        self, request: distlock_pb2.RenewLockRequest, context: grpc.aio.ServicerContext
+    ) -> distlock_pb2.Lock:
+        logger.debug(
+            "Received request to renew lease on lock named %s for %s seconds",
+            request.key,
+            request.expires_in_seconds,
+        )
+        if request.expires_in_seconds != 0:
+            expires_in_seconds = request.expires_in_seconds
+        else:
+            expires_in_seconds = ONE_MINUTE_IN_SECONDS
+        try:
+            lock = self.lock_store.renew(
+                key=request.key,
+                clock=request.clock,
+                expires_in_seconds=expires_in_seconds,
+            )
+        except LeaseLostError as e:
+            msg = f"Could not renew lease: {e}"
+            logger.error(msg)
+            context.set_details(msg)
+            context.set_code(grpc.StatusCode.ABORTED)
+            return distlock_pb2.Lock()
+        except KeyError:
+            msg = f"A lock with key {request.key} does not exist"
+            logger.error(msg)
+            context.set_details(msg)
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            return distlock_pb2.Lock()
+        await self._sync()
+        logger.info("Lease on lock with key %s has been renewed", request.key)
+        return lock.to_pb()
+
     async def GetLock(
         self, request: distlock_pb2.Lock, context: grpc.aio.ServicerContext
     ) -> distlock_pb2.Lock:
-        logger.info(f"Received request to fetch lock named {request.key}")
+        logger.debug("Received request to fetch lock named %s", request.key)
         try:
             lock = self.lock_store[request.key]
-            logger.info(f"Lock with key {lock.key} has been fetched")
+            logger.info("Lock with key %s has been fetched", lock.key)
         except KeyError:
             msg = f"A lock with key {request.key} does not exist"
             logger.error(msg)
@@ -109,17 +244,39 @@ class AsyncServicer(distlock_pb2_grpc.DistlockServicer):
     async def ListLocks(
         self, request: distlock_pb2.EmptyRequest, context: grpc.aio.ServicerContext
     ) -> distlock_pb2.Locks:
-        logger.info("Received request to list locks")
+        logger.debug("Received request to list locks")
         locks = [lock.to_pb() for lock in self.lock_store.to_list()]
         return distlock_pb2.Locks(locks=locks)
 
+    async def StreamLocks(
+        self,
+        request: distlock_pb2.StreamLocksRequest,
+        context: grpc.aio.ServicerContext,
+    ) -> AsyncIterator[distlock_pb2.Locks]:
+        logger.debug("Received request to stream locks with prefix %r", request.prefix)
+        if request.page_size > 0:
+            page_size = min(request.page_size, MAX_PAGE_SIZE)
+        else:
+            page_size = DEFAULT_PAGE_SIZE
+        start_after = None
+        while True:
+            locks = self.lock_store.page(
+                prefix=request.prefix, start_after=start_after, limit=page_size
+            )
+            if locks:
+                yield distlock_pb2.Locks(locks=[lock.to_pb() for lock in locks])
+            if len(locks) < page_size:
+                return
+            start_after = locks[-1].key
+
     async def DeleteLock(
         self, request: distlock_pb2.Lock, context: grpc.aio.ServicerContext
     ) -> distlock_pb2.EmptyResponse:
-        logger.info(f"Received request to delete lock with key {request.key}")
+        logger.debug("Received request to delete lock with key %s", request.key)
         try:
             del self.lock_store[request.key]
-            logger.info(f"Lock with key {request.key} has been deleted")
+            await self._sync()
+            logger.info("Lock with key %s has been deleted", request.key)
         except KeyError:
             msg = f"A lock with key {request.key} does not exist"
             logger.error(msg)
@@ -128,6 +285,106 @@ class AsyncServicer(distlock_pb2_grpc.DistlockServicer):
             return distlock_pb2.EmptyResponse()
         return distlock_pb2.EmptyResponse()
 
+    async def CreateLocks(
+        self, request: distlock_pb2.Locks, context: grpc.aio.ServicerContext
+    ) -> distlock_pb2.LockResults:
+        logger.debug("Received request to create %s locks", len(request.locks))
+        results = self.lock_store.set_not_exists_many(
+            [LockRecord(key=lock.key, permits=lock.permits) for lock in request.locks]
+        )
+        await self._sync()
+        return distlock_pb2.LockResults(
+            results=[
+                lock_result(lock.key, result)
+                for lock, result in zip(request.locks, results)
+            ]
+        )
+
+    async def AcquireLocks(
+        self,
+        request: distlock_pb2.AcquireLocksRequest,
+        context: grpc.aio.ServicerContext,
+    ) -> distlock_pb2.LockResults:
+        logger.debug("Received request to acquire %s locks", len(request.requests))
+        results = acquire_batch(request.requests, self.lock_store.acquire_many)
+        await self._sync()
+        return distlock_pb2.LockResults(
+            results=[
+                lock_result(acquire_request.key, result)
+                for acquire_request, result in zip(request.requests, results)
+            ]
+        )
+
+    async def ReleaseLocks(
+        self, request: distlock_pb2.Locks, context: grpc.aio.ServicerContext
+    ) -> distlock_pb2.LockResults:
+        logger.debug("Received request to release %s locks", len(request.locks))
+        results = self.lock_store.release_many(
+            [(lock.key, lock.clock) for lock in request.locks]
+        )
+        await self._sync()
+        return distlock_pb2.LockResults(
+            results=[
+                lock_result(lock.key, result)
+                for lock, result in zip(request.locks, results)
+            ]
+        )
+
+    async def GetLocks(
+        self, request: distlock_pb2.Locks, context: grpc.aio.ServicerContext
+    ) -> distlock_pb2.LockResults:
+        logger.debug("Received request to fetch %s locks", len(request.locks))
+        results = self.lock_store.get_many([lock.key for lock in request.locks])
+        return distlock_pb2.LockResults(
+            results=[
+                lock_result(lock.key, result)
+                for lock, result in zip(request.locks, results)
+            ]
+        )
+
+
+class _LoopPager:
+    """
+    Pages through a store that belongs to an event loop from another thread,
+    by reading each page on the loop.
+    """
+
+    def __init__(self, lock_store: AsyncLockStore, loop: asyncio.AbstractEventLoop):
+        self._lock_store = lock_store
+        self._loop = loop
+
+    def page(
+        self, prefix: str = "", start_after: str | None = None, limit: int = 1000
+    ) -> list[LockRecord]:
+        async def page() -> list[LockRecord]:
+            # Copied so the thread never sees a lock the loop is changing
+            return [
+                lock.copy()
+                for lock in self._lock_store.page(prefix, start_after, limit)
+            ]
+
+        return asyncio.run_coroutine_threadsafe(page(), self._loop).result()
+
+    def recent_requests(self) -> dict[str, tuple[str, int]]:
+        async def recent_requests() -> dict[str, tuple[str, int]]:
+            return self._lock_store.recent_requests()
+
+        return asyncio.run_coroutine_threadsafe(recent_requests(), self._loop).result()
+
+
+def _on_loop(read: Callable[[], float], loop: asyncio.AbstractEventLoop):
+    """
+    Wraps read, so that calling it from another thread runs it on the loop.
+    """
+
+    async def read_async() -> float:
+        return read()
+
+    def read_on_loop() -> float:
+        return asyncio.run_coroutine_threadsafe(read_async(), loop).result()
+
+    return read_on_loop
+
 
 async def serve(
     *,
@@ -135,16 +392,73 @@ async def serve(
     port: int,
     cleanup_coroutines: list,
     graceful_shutdown_period_seconds: float = 1,
+    data_dir: Path | None = None,
+    snapshot_interval_seconds: float = DEFAULT_SNAPSHOT_INTERVAL_SECONDS,
+    metrics_port: int | None = None,
+    fair: bool = False,
+    tuning: ServerTuning | None = None,
 ):
-    server = grpc.aio.server()
-    distlock_pb2_grpc.add_DistlockServicer_to_server(AsyncServicer(), server)
+    if tuning is None:
+        tuning = ServerTuning()
+    rpc_metrics = RpcMetrics()
+    interceptors: list[grpc.aio.ServerInterceptor] = []
+    if metrics_port is not None:
+        interceptors.append(AsyncMetricsInterceptor(rpc_metrics))
+    if tuning.max_waiting_rpcs is not None:
+        interceptors.append(AsyncAdmissionInterceptor(tuning.max_waiting_rpcs))
+    server = grpc.aio.server(
+        interceptors=interceptors,
+        options=tuning.grpc_options(),
+        maximum_concurrent_rpcs=tuning.max_concurrent_rpcs,
+        compression=tuning.grpc_compression(),
+    )
+    wal = None
+    if data_dir is not None:
+        wal, locks, requests = recover(data_dir)
+    servicer = AsyncServicer(wal=wal, lock_store=AsyncLockStore(wal, fair=fair))
+    snapshotter = None
+    if wal is not None:
+        servicer.lock_store.load(locks.values(), requests)
+        # Snapshots are written from a thread, which reads the store through
+        # the loop that owns it
+        snapshotter = Snapshotter(
+            _LoopPager(servicer.lock_store, asyncio.get_running_loop()),
+            wal,
+            snapshot_interval_seconds,
+        )
+        snapshotter.start()
+    metrics_server = None
+    if metrics_port is not None:
+        # The gauges are read from the metrics server's thread, through the
+        # loop that owns the store
+        loop = asyncio.get_running_loop()
+        gauges = [
+            (name, help, _on_loop(read, loop))
+            for name, help, read in lock_store_gauges(servicer.lock_store)
+        ]
+        metrics_server = MetricsServer(rpc_metrics, gauges, address, metrics_port)
+        logger.info("Serving metrics on %s:%s", address, metrics_port)
+        metrics_server.start()
+    distlock_pb2_grpc.add_DistlockServicer_to_server(servicer, server)
     server.add_insecure_port(f"{address}:{port}")
-    logger.info(f"Starting server on {address}:{port}")
+    logger.info("Starting server on %s:%s", address, port)
     await server.start()
 
+    # The store wakes waiters on the keys it reaps by itself
+    reaper = asyncio.create_task(reap_forever(servicer.lock_store))
+
     async def server_graceful_shutdown():
         logger.info("Starting graceful shutdown")
+        reaper.cancel()
         await server.stop(graceful_shutdown_period_seconds)
+        if snapshotter is not None:
+            # An unfinished snapshot needs the loop to read the store
+            await asyncio.to_thread(snapshotter.stop)
+        if metrics_server is not None:
+            # A scrape in progress needs the loop to read the gauges
+            await asyncio.to_thread(metrics_server.stop)
+        if wal is not None:
+            wal.close()
 
     cleanup_coroutines.append(server_graceful_shutdown())
 
@@ -0,0 +1,85 @@
+import random
+import time
+from datetime import timezone
+from typing import Callable
+
+from .models import Lock
+
+# Given the lock a try was turned down with, and how many seconds are left
+# until the caller's timeout, returns how many seconds to sleep before the next
+# try. One is made for every blocking acquire, so it may keep state between
+# tries.
+WaitPolicy = Callable[[Lock, float], float]
+# Makes the wait policy of one acquire, given its heartbeat_seconds
+WaitPolicyFactory = Callable[[float], WaitPolicy]
+
+DEFAULT_BASE_SECONDS = 0.05
+# How long before the lease runs out to try again, to allow for the clocks of
+# the client and the server to disagree
+DEFAULT_LEAD_SECONDS = 0.01
+
+
+def seconds_until_expiry(lock: Lock) -> float:
+    # Locks from the server carry naive datetimes in UTC
+    return lock.expires_at.replace(tzinfo=timezone.utc).timestamp() - time.time()
+
+
+class FixedWait:
+    """
+    Sleeps the same seconds between every try, or less if the timeout comes
+    sooner.
+    """
+
+    def __init__(self, seconds: float):
+        if seconds < 0:
+            raise ValueError(f"seconds must not be negative, got {seconds}")
+        self._seconds = seconds
+
+    def __call__(self, lock: Lock, remaining_seconds: float) -> float:
+        return max(min(self._seconds, remaining_seconds), 0.0)
+
+
+class ExpiryAwareBackoff:
+    """
+    Backs off exponentially between tries, with decorrelated jitter, from
+    base_seconds up to cap_seconds, so that clients contending for a lock
+    spread their tries out rather than polling in lockstep.
+
+    The lock a try is turned down with tells when its lease, or the first of
+    its leases, runs out, after which the lock is free even if its holder never
+    releases it. If that comes before the next backoff would, the policy sleeps
+    until lead_seconds before then instead, then tries once more as the lease
+    runs out, and starts backing off from base_seconds again, so the lock is
+    picked up as soon as it expires. Sleeps never go past the caller's timeout.
+    """
+
+    def __init__(
+        self,
+        cap_seconds: float,
+        base_seconds: float = DEFAULT_BASE_SECONDS,
+        lead_seconds: float = DEFAULT_LEAD_SECONDS,
+        rng: random.Random | None = None,
+    ):
+        if base_seconds <= 0:
+            raise ValueError(f"base_seconds must be positive, got {base_seconds}")
+        self._cap_seconds = max(cap_seconds, base_seconds)
+        self._base_seconds = base_seconds
+        self._lead_seconds = lead_seconds
+        self._random = rng if rng is not None else random.Random()
+        self._delay_seconds = base_seconds
+
+    def __call__(self, lock: Lock, remaining_seconds: float) -> float:
+        delay_seconds = min(
+            self._cap_seconds,
+            self._random.uniform(self._base_seconds, self._delay_seconds * 3),
+        )
+        self._delay_seconds = delay_seconds
+        until_expiry_seconds = seconds_until_expiry(lock)
+        if 0 < until_expiry_seconds < delay_seconds:
+            # Just before the lease runs out, then once more as it does
+            if until_expiry_seconds > 2 * self._lead_seconds:
+                delay_seconds = until_expiry_seconds - self._lead_seconds
+            else:
+                delay_seconds = until_expiry_seconds
+            self._delay_seconds = self._base_seconds
+        return max(min(delay_seconds, remaining_seconds), 0.0)
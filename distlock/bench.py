@@ -0,0 +1,390 @@
+import asyncio
+import itertools
+import math
+import random
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+
+import grpc
+
+from .client import Distlock, DistlockAsync
+from .exceptions import LeaseLostError, NotFoundError, UnreleasableError
+
+OPERATIONS = ("lock", "wait", "get", "renew")
+DEFAULT_MIX = "lock=80,get=20"
+# Keys are created in batches of this many before the run
+CREATE_BATCH_SIZE = 1_000
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """
+    Parses an operation mix like "lock=80,get=20" into the share of each
+    operation, adding up to 1.
+    """
+    weights: dict[str, float] = {}
+    for part in mix.split(","):
+        name, sep, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(
+                f"Unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}"
+            )
+        try:
+            weights[name] = float(weight) if sep else 1.0
+        except ValueError:
+            raise ValueError(f"Weight of {name} must be a number, got {weight!r}")
+        if weights[name] < 0:
+            raise ValueError(f"Weight of {name} must not be negative")
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("At least one operation must have a positive weight")
+    return {name: weight / total for name, weight in weights.items()}
+
+
+class KeyChooser:
+    """
+    Picks key indexes in [0, keys), either uniformly or following a Zipf
+    distribution with exponent zipf_s, under which index 0 is the hottest.
+    """
+
+    def __init__(self, keys: int, distribution: str, zipf_s: float, seed: int):
+        if keys < 1:
+            raise ValueError(f"keys must be at least 1, got {keys}")
+        self._random = random.Random(seed)
+        self._keys = keys
+        self._cumulative_weights: list[float] | None = None
+        if distribution == "zipf":
+            self._cumulative_weights = list(
+                itertools.accumulate(1 / (i + 1) ** zipf_s for i in range(keys))
+            )
+        elif distribution != "uniform":
+            raise ValueError(
+                f"distribution must be uniform or zipf, got {distribution!r}"
+            )
+
+    def choose(self) -> int:
+        if self._cumulative_weights is None:
+            return self._random.randrange(self._keys)
+        point = self._random.random() * self._cumulative_weights[-1]
+        return min(bisect_left(self._cumulative_weights, point), self._keys - 1)
+
+    def choose_operation(self, mix: dict[str, float]) -> str:
+        return self._random.choices(list(mix), weights=list(mix.values()))[0]
+
+
+@dataclass(slots=True)
+class Results:
+    """
+    Latencies in seconds and error counts by operation, for one worker or
+    merged for the whole run.
+    """
+
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    errors: dict[str, int] = field(default_factory=dict)
+    # Lock operations that found the lock held by someone else
+    contended: int = 0
+
+    def record(self, operation: str, seconds: float) -> None:
+        self.latencies.setdefault(operation, []).append(seconds)
+
+    def error(self, operation: str) -> None:
+        self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def merge(self, other: "Results") -> None:
+        for operation, latencies in other.latencies.items():
+            self.latencies.setdefault(operation, []).extend(latencies)
+        for operation, count in other.errors.items():
+            self.errors[operation] = self.errors.get(operation, 0) + count
+        self.contended += other.contended
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """
+    The nearest-rank percentile of values that are already sorted.
+    """
+    if not sorted_values:
+        return math.nan
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def report(results: Results, elapsed_seconds: float) -> str:
+    """
+    Formats throughput and latency percentiles, in milliseconds, by operation
+    and for all operations together.
+    """
+    lines = [
+        f"{'operation':>10} {'ops':>10} {'errors':>8} {'ops/s':>10} "
+        f"{'p50 ms':>9} {'p99 ms':>9} {'p999 ms':>9}"
+    ]
+    everything: list[float] = []
+    rows = sorted(results.latencies.items())
+    for operation, latencies in rows:
+        everything.extend(latencies)
+    for operation, latencies in rows + [("all", everything)]:
+        latencies = sorted(latencies)
+        errors = (
+            sum(results.errors.values())
+            if operation == "all"
+            else results.errors.get(operation, 0)
+        )
+        lines.append(
+            f"{operation:>10} {len(latencies):>10} {errors:>8} "
+            f"{len(latencies) / elapsed_seconds:>10.0f} "
+            f"{percentile(latencies, 0.5) * 1000:>9.3f} "
+            f"{percentile(latencies, 0.99) * 1000:>9.3f} "
+            f"{percentile(latencies, 0.999) * 1000:>9.3f}"
+        )
+    if "lock" in results.latencies:
+        lines.append(
+            f"{results.contended} of {len(results.latencies['lock'])} lock operations found the lock held"
+        )
+    return "\n".join(lines)
+
+
+@dataclass(slots=True)
+class Workload:
+    keys: int
+    distribution: str
+    zipf_s: float
+    mix: dict[str, float]
+    expires_in_seconds: int
+    wait_timeout_seconds: float
+    key_prefix: str
+
+    def key(self, index: int) -> str:
+        return f"{self.key_prefix}{index}"
+
+
+def _create_keys(distlock: Distlock, workload: Workload) -> None:
+    # Keys left over from an earlier run are reused
+    for start in range(0, workload.keys, CREATE_BATCH_SIZE):
+        distlock.create_many(
+            [
+                workload.key(i)
+                for i in range(start, min(start + CREATE_BATCH_SIZE, workload.keys))
+            ]
+        )
+
+
+def _run_sync_worker(
+    distlock: Distlock,
+    workload: Workload,
+    seed: int,
+    deadline: float,
+    results: Results,
+) -> None:
+    chooser = KeyChooser(workload.keys, workload.distribution, workload.zipf_s, seed)
+    while time.perf_counter() < deadline:
+        operation = chooser.choose_operation(workload.mix)
+        key = workload.key(chooser.choose())
+        start = time.perf_counter()
+        try:
+            if operation == "lock":
+                lock = distlock.acquire_lock(
+                    key=key,
+                    expires_in_seconds=workload.expires_in_seconds,
+                    blocking=False,
+                )
+                if lock.acquired:
+                    distlock.release_lock(lock)
+                else:
+                    results.contended += 1
+            elif operation == "wait":
+                lock = distlock.acquire_lock(
+                    key=key,
+                    expires_in_seconds=workload.expires_in_seconds,
+                    timeout_seconds=workload.wait_timeout_seconds,
+                )
+                distlock.release_lock(lock)
+            elif operation == "get":
+                distlock.get_lock(key)
+            else:
+                lock = distlock.acquire_lock(
+                    key=key,
+                    expires_in_seconds=workload.expires_in_seconds,
+                    blocking=False,
+                )
+                if lock.acquired:
+                    lock = distlock.renew_lock(lock, workload.expires_in_seconds)
+                    distlock.release_lock(lock)
+        except (
+            grpc.RpcError,
+            TimeoutError,
+            LeaseLostError,
+            NotFoundError,
+            UnreleasableError,
+        ):
+            results.error(operation)
+            continue
+        results.record(operation, time.perf_counter() - start)
+
+
+async def _run_async_worker(
+    distlock: DistlockAsync,
+    workload: Workload,
+    seed: int,
+    deadline: float,
+    results: Results,
+) -> None:
+    chooser = KeyChooser(workload.keys, workload.distribution, workload.zipf_s, seed)
+    while time.perf_counter() < deadline:
+        operation = chooser.choose_operation(workload.mix)
+        key = workload.key(chooser.choose())
+        start = time.perf_counter()
+        try:
+            if operation == "lock":
+                lock = await distlock.acquire_lock(
+                    key=key,
+                    expires_in_seconds=workload.expires_in_seconds,
+                    blocking=False,
+                )
+                if lock.acquired:
+                    await distlock.release_lock(lock)
+                else:
+                    results.contended += 1
+            elif operation == "wait":
+                lock = await distlock.acquire_lock(
+                    key=key,
+                    expires_in_seconds=workload.expires_in_seconds,
+                    timeout_seconds=workload.wait_timeout_seconds,
+                )
+                await distlock.release_lock(lock)
+            elif operation == "get":
+                await distlock.get_lock(key)
+            else:
+                lock = await distlock.acquire_lock(
+                    key=key,
+                    expires_in_seconds=workload.expires_in_seconds,
+                    blocking=False,
+                )
+                if lock.acquired:
+                    lock = await distlock.renew_lock(lock, workload.expires_in_seconds)
+                    await distlock.release_lock(lock)
+        except (
+            grpc.RpcError,
+            TimeoutError,
+            LeaseLostError,
+            NotFoundError,
+            UnreleasableError,
+        ):
+            results.error(operation)
+            continue
+        results.record(operation, time.perf_counter() - start)
+
+
+def run_sync(
+    *,
+    address: str,
+    port: int,
+    workload: Workload,
+    concurrency: int,
+    duration_seconds: float,
+    pool_size: int,
+    seed: int,
+) -> tuple[Results, float]:
+    """
+    Runs the workload from concurrency threads sharing one Distlock client,
+    and returns the results along with how long the run took.
+    """
+    with Distlock(address=address, port=port, pool_size=pool_size) as distlock:
+        _create_keys(distlock, workload)
+        worker_results = [Results() for _ in range(concurrency)]
+        start = time.perf_counter()
+        deadline = start + duration_seconds
+        threads = [
+            threading.Thread(
+                target=_run_sync_worker,
+                args=(distlock, workload, seed + i, deadline, worker_results[i]),
+                name=f"distlock-bench-{i}",
+            )
+            for i in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    return _merge(worker_results), elapsed
+
+
+async def run_async(
+    *,
+    address: str,
+    port: int,
+    workload: Workload,
+    concurrency: int,
+    duration_seconds: float,
+    pool_size: int,
+    seed: int,
+) -> tuple[Results, float]:
+    """
+    Runs the workload from concurrency tasks sharing one DistlockAsync client,
+    and returns the results along with how long the run took.
+    """
+    with Distlock(address=address, port=port) as distlock:
+        _create_keys(distlock, workload)
+    async with DistlockAsync(
+        address=address, port=port, pool_size=pool_size
+    ) as distlock_async:
+        worker_results = [Results() for _ in range(concurrency)]
+        start = time.perf_counter()
+        deadline = start + duration_seconds
+        await asyncio.gather(
+            *(
+                _run_async_worker(
+                    distlock_async, workload, seed + i, deadline, worker_results[i]
+                )
+                for i in range(concurrency)
+            )
+        )
+        elapsed = time.perf_counter() - start
+    return _merge(worker_results), elapsed
+
+
+def _merge(worker_results: list[Results]) -> Results:
+    results = Results()
+    for worker_result in worker_results:
+        results.merge(worker_result)
+    return results
+
+
+def run_benchmark(
+    *,
+    client: str,
+    address: str,
+    port: int,
+    workload: Workload,
+    concurrency: int,
+    duration_seconds: float,
+    pool_size: int,
+    seed: int,
+) -> tuple[Results, float]:
+    """
+    Runs the workload with the sync or the async client.
+    """
+    if client == "sync":
+        return run_sync(
+            address=address,
+            port=port,
+            workload=workload,
+            concurrency=concurrency,
+            duration_seconds=duration_seconds,
+            pool_size=pool_size,
+            seed=seed,
+        )
+    if client == "async":
+        return asyncio.run(
+            run_async(
+                address=address,
+                port=port,
+                workload=workload,
+                concurrency=concurrency,
+                duration_seconds=duration_seconds,
+                pool_size=pool_size,
+                seed=seed,
+            )
+        )
+    raise ValueError(f"client must be sync or async, got {client!r}")
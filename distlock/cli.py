@@ -1,17 +1,34 @@
 import asyncio
-from typing import Annotated, Awaitable
+import logging
+from pathlib import Path
+from typing import Annotated, Awaitable, Optional
 
 import typer
 
 from . import __version__
 from .async_server import serve as serve_async
-from .server import serve
+from .bench import (
+    DEFAULT_MIX,
+    KeyChooser,
+    Workload,
+    parse_mix,
+    report,
+    run_benchmark,
+)
+from .log import configure_logging, stop_logging
+from .server import DEFAULT_LOCK_SHARDS, serve, serve_processes
+from .shared_lock_store import DEFAULT_CAPACITY
+from .snapshot import DEFAULT_SNAPSHOT_INTERVAL_SECONDS
+from .tuning import ServerTuning
 
 app = typer.Typer()
 
 
-@app.command()
+# The server runs when no command is given, so that `distlock` keeps taking the
+# server's options directly alongside commands like `distlock bench`
+@app.callback(invoke_without_command=True)
 def run(
+    ctx: typer.Context,
     version: Annotated[
         bool, typer.Option(help="Print the version number and exit")
     ] = False,
@@ -26,26 +43,366 @@ def run(
             help="Maximum number of workers for multithreaded server. Does not matter when running with --run-async.",
         ),
     ] = 5,
+    lock_shards: Annotated[
+        int,
+        typer.Option(
+            "--lock-shards",
+            help="Number of independently locked shards the lock table is split into for multithreaded server. Does not matter when running with --run-async.",
+        ),
+    ] = DEFAULT_LOCK_SHARDS,
+    processes: Annotated[
+        int,
+        typer.Option(
+            "--processes",
+            help="Number of multithreaded server processes to run on the same port, serving the same locks from shared memory, to use more than one core. Locks can then have at most 16 readers at once, and semaphores at most 16 permits. Cannot be combined with --run-async, --data-dir, --peer or --fair.",
+        ),
+    ] = 1,
+    max_locks: Annotated[
+        int,
+        typer.Option(
+            "--max-locks",
+            help="Maximum number of locks in the shared memory lock table. Only used with --processes.",
+        ),
+    ] = DEFAULT_CAPACITY,
+    metrics_port: Annotated[
+        Optional[int],
+        typer.Option(
+            "--metrics-port",
+            help="Port on which to serve metrics for Prometheus, at /metrics. With --processes, each process serves its own metrics, on consecutive ports from this one. Metrics are not collected if not set.",
+        ),
+    ] = None,
+    log_level: Annotated[
+        str,
+        typer.Option(
+            "--log-level",
+            help="Lowest level of messages to log: DEBUG, INFO, WARNING or ERROR. Every request is logged at DEBUG.",
+        ),
+    ] = "INFO",
+    log_sample_rate: Annotated[
+        float,
+        typer.Option(
+            "--log-sample-rate",
+            help="Fraction of messages below WARNING to log, picked at random, to cut the cost of logging under load.",
+        ),
+    ] = 1.0,
     run_async: Annotated[
         bool, typer.Option("--run-async", help="Should the server be run async?")
     ] = False,
+    fair: Annotated[
+        bool,
+        typer.Option(
+            "--fair",
+            help="Grant locks strictly in the order in which requests started waiting for them, turning down requests that would overtake a waiting one. Cannot be combined with --processes.",
+        ),
+    ] = False,
+    data_dir: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--data-dir",
+            help="Directory in which to keep a write-ahead log of lock changes, so that locks survive a restart, or with --peer the node's Raft log, snapshots and votes. Locks are only kept in memory if not set.",
+        ),
+    ] = None,
+    snapshot_interval_seconds: Annotated[
+        float,
+        typer.Option(
+            "--snapshot-interval-seconds",
+            help="How often to snapshot the lock table, so that only the changes since the latest snapshot are replayed on restart. Only used with --data-dir, and not with --peer.",
+        ),
+    ] = DEFAULT_SNAPSHOT_INTERVAL_SECONDS,
+    peers: Annotated[
+        Optional[list[str]],
+        typer.Option(
+            "--peer",
+            help="Raft address (host:port) of another node of the cluster. Repeat for every other node to run as a cluster node instead of a standalone server. Only supported by the multithreaded server.",
+        ),
+    ] = None,
+    raft_port: Annotated[
+        Optional[int],
+        typer.Option(
+            "--raft-port",
+            help="Port on which the node replicates with the other nodes of the cluster. Required with --peer.",
+        ),
+    ] = None,
+    node_id: Annotated[
+        Optional[str],
+        typer.Option(
+            "--node-id",
+            help="Address (host:port) on which clients reach this node, which other nodes redirect clients to while this node leads. Defaults to localhost and --port.",
+        ),
+    ] = None,
+    config: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--config",
+            help="TOML file of gRPC server settings, named like the flags below with underscores, e.g. max_concurrent_rpcs = 1000. Flags given as well win over the file.",
+        ),
+    ] = None,
+    max_concurrent_rpcs: Annotated[
+        Optional[int],
+        typer.Option(
+            "--max-concurrent-rpcs",
+            help="Most calls handled at once, including those queued for a worker and those waiting for a lock. Calls past it are turned away with RESOURCE_EXHAUSTED. Unlimited if not set.",
+        ),
+    ] = None,
+    max_waiting_rpcs: Annotated[
+        Optional[int],
+        typer.Option(
+            "--max-waiting-rpcs",
+            help="Most calls waiting for a lock at once, each of which holds a worker on the multithreaded server. Calls past it are turned away with RESOURCE_EXHAUSTED. Unlimited if not set.",
+        ),
+    ] = None,
+    keepalive_time_ms: Annotated[
+        Optional[int],
+        typer.Option(
+            "--keepalive-time-ms",
+            help="How often to ping clients over HTTP/2 to check that their connections are alive.",
+        ),
+    ] = None,
+    keepalive_timeout_ms: Annotated[
+        Optional[int],
+        typer.Option(
+            "--keepalive-timeout-ms",
+            help="How long to wait for a ping to be answered before closing the connection.",
+        ),
+    ] = None,
+    min_ping_interval_ms: Annotated[
+        Optional[int],
+        typer.Option(
+            "--min-ping-interval-ms",
+            help="Shortest interval between keepalive pings from a client that the server puts up with. Set it below the keepalive time of clients.",
+        ),
+    ] = None,
+    max_connection_idle_ms: Annotated[
+        Optional[int],
+        typer.Option(
+            "--max-connection-idle-ms",
+            help="How long a connection may go without calls before it is closed.",
+        ),
+    ] = None,
+    max_connection_age_ms: Annotated[
+        Optional[int],
+        typer.Option(
+            "--max-connection-age-ms",
+            help="How long a connection may live before it is closed, so that clients reconnect and spread out over servers.",
+        ),
+    ] = None,
+    max_receive_message_bytes: Annotated[
+        Optional[int],
+        typer.Option(
+            "--max-receive-message-bytes",
+            help="Largest request the server accepts, which bounds batch calls.",
+        ),
+    ] = None,
+    max_send_message_bytes: Annotated[
+        Optional[int],
+        typer.Option(
+            "--max-send-message-bytes",
+            help="Largest response the server sends, which bounds listing locks.",
+        ),
+    ] = None,
+    compression: Annotated[
+        Optional[str],
+        typer.Option(
+            "--compression",
+            help="Compression of responses: none, deflate or gzip.",
+        ),
+    ] = None,
+    so_reuseport: Annotated[
+        Optional[bool],
+        typer.Option(
+            "--so-reuseport/--no-so-reuseport",
+            help="Let other processes listen on the same port. Always on with --processes.",
+        ),
+    ] = None,
 ) -> None:
     if version:
         print(f"{__version__}")
         raise typer.Exit()
-    if not run_async:
-        serve(address=address, port=port, max_workers=max_workers)
-    else:
-        loop = asyncio.get_event_loop()
-        cleanup_coroutines: list[Awaitable] = []
-        try:
-            loop.run_until_complete(
-                serve_async(
-                    address=address,
-                    port=port,
-                    cleanup_coroutines=cleanup_coroutines,
-                )
+    if ctx.invoked_subcommand is not None:
+        return
+    if peers:
+        if run_async:
+            raise typer.BadParameter("--peer is not supported with --run-async")
+        if raft_port is None:
+            raise typer.BadParameter("--raft-port is required with --peer")
+    if processes < 1:
+        raise typer.BadParameter("--processes must be at least 1")
+    if processes > 1:
+        if run_async:
+            raise typer.BadParameter("--processes is not supported with --run-async")
+        if data_dir is not None or peers or fair:
+            raise typer.BadParameter(
+                "--processes cannot be combined with --data-dir, --peer or --fair"
+            )
+    if log_level.upper() not in logging.getLevelNamesMapping():
+        raise typer.BadParameter(f"Unknown --log-level {log_level}")
+    if not 0 <= log_sample_rate <= 1:
+        raise typer.BadParameter("--log-sample-rate must be between 0 and 1")
+    try:
+        tuning = ServerTuning.from_file(config) if config else ServerTuning()
+        tuning = tuning.override(
+            max_concurrent_rpcs=max_concurrent_rpcs,
+            max_waiting_rpcs=max_waiting_rpcs,
+            keepalive_time_ms=keepalive_time_ms,
+            keepalive_timeout_ms=keepalive_timeout_ms,
+            min_ping_interval_ms=min_ping_interval_ms,
+            max_connection_idle_ms=max_connection_idle_ms,
+            max_connection_age_ms=max_connection_age_ms,
+            max_receive_message_bytes=max_receive_message_bytes,
+            max_send_message_bytes=max_send_message_bytes,
+            compression=compression,
+            so_reuseport=so_reuseport,
+        )
+    except (OSError, ValueError) as e:
+        raise typer.BadParameter(str(e))
+    if processes > 1 and tuning.so_reuseport is False:
+        raise typer.BadParameter(
+            "--processes cannot be combined with --no-so-reuseport"
+        )
+    configure_logging(level=log_level.upper(), sample_rate=log_sample_rate)
+    try:
+        if processes > 1:
+            serve_processes(
+                processes=processes,
+                address=address,
+                port=port,
+                max_workers=max_workers,
+                max_locks=max_locks,
+                metrics_port=metrics_port,
+                tuning=tuning,
             )
-        finally:
-            loop.run_until_complete(*cleanup_coroutines)
-            loop.close()
+        elif not run_async:
+            serve(
+                address=address,
+                port=port,
+                max_workers=max_workers,
+                lock_shards=lock_shards,
+                data_dir=data_dir,
+                snapshot_interval_seconds=snapshot_interval_seconds,
+                raft_port=raft_port,
+                peers=peers,
+                node_id=node_id,
+                metrics_port=metrics_port,
+                fair=fair,
+                tuning=tuning,
+            )
+        else:
+            loop = asyncio.get_event_loop()
+            cleanup_coroutines: list[Awaitable] = []
+            try:
+                loop.run_until_complete(
+                    serve_async(
+                        address=address,
+                        port=port,
+                        cleanup_coroutines=cleanup_coroutines,
+                        data_dir=data_dir,
+                        snapshot_interval_seconds=snapshot_interval_seconds,
+                        metrics_port=metrics_port,
+                        fair=fair,
+                        tuning=tuning,
+                    )
+                )
+            finally:
+                loop.run_until_complete(*cleanup_coroutines)
+                loop.close()
+    finally:
+        stop_logging()
+
+
+@app.command()
+def bench(
+    address: Annotated[
+        str, typer.Option(help="Address of the server to benchmark")
+    ] = "localhost",
+    port: Annotated[int, typer.Option(help="Port of the server to benchmark")] = 50051,
+    concurrency: Annotated[
+        int,
+        typer.Option(
+            help="Number of clients making requests at once, threads with the sync client and tasks with the async one"
+        ),
+    ] = 16,
+    duration_seconds: Annotated[
+        float, typer.Option("--duration-seconds", help="How long to run for")
+    ] = 10,
+    keys: Annotated[
+        int, typer.Option(help="Number of keys to spread requests over")
+    ] = 1_000,
+    distribution: Annotated[
+        str,
+        typer.Option(
+            help="How keys are picked: uniform, or zipf to make a few keys hot"
+        ),
+    ] = "uniform",
+    zipf_s: Annotated[
+        float,
+        typer.Option(
+            "--zipf-s",
+            help="Exponent of the Zipf distribution, higher makes the hot keys hotter",
+        ),
+    ] = 1.1,
+    mix: Annotated[
+        str,
+        typer.Option(
+            help="Weights of the operations to run, out of lock (acquire without blocking, then release), wait (acquire blocking, then release), get, and renew (acquire, renew, release)"
+        ),
+    ] = DEFAULT_MIX,
+    ttl_seconds: Annotated[
+        int, typer.Option("--ttl-seconds", help="Lease to acquire locks for")
+    ] = 10,
+    wait_timeout_seconds: Annotated[
+        float,
+        typer.Option(
+            "--wait-timeout-seconds",
+            help="How long wait operations wait for a lock before counting as an error",
+        ),
+    ] = 5,
+    client: Annotated[
+        str, typer.Option(help="Which client to drive the server with: sync or async")
+    ] = "sync",
+    pool_size: Annotated[
+        int, typer.Option("--pool-size", help="Number of channels the client uses")
+    ] = 1,
+    key_prefix: Annotated[
+        str,
+        typer.Option(
+            "--key-prefix",
+            help="Prefix of the keys created for the benchmark, which are left on the server",
+        ),
+    ] = "bench/",
+    seed: Annotated[int, typer.Option(help="Seed for picking keys and operations")] = 0,
+) -> None:
+    """
+    Drive a running server with load and report throughput and latency.
+    """
+    try:
+        workload = Workload(
+            keys=keys,
+            distribution=distribution,
+            zipf_s=zipf_s,
+            mix=parse_mix(mix),
+            expires_in_seconds=ttl_seconds,
+            wait_timeout_seconds=wait_timeout_seconds,
+            key_prefix=key_prefix,
+        )
+        # Validates the key options before connecting
+        KeyChooser(keys, distribution, zipf_s, seed)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    if concurrency < 1:
+        raise typer.BadParameter("--concurrency must be at least 1")
+    if client not in ("sync", "async"):
+        raise typer.BadParameter("--client must be sync or async")
+    typer.echo(
+        f"Running {mix} on {keys} {distribution} keys with {concurrency} {client} clients for {duration_seconds}s"
+    )
+    results, elapsed = run_benchmark(
+        client=client,
+        address=address,
+        port=port,
+        workload=workload,
+        concurrency=concurrency,
+        duration_seconds=duration_seconds,
+        pool_size=pool_size,
+        seed=seed,
+    )
+    typer.echo(report(results, elapsed))
@@ -1,17 +1,417 @@
 import asyncio
+import itertools
+import threading
 import time
+import uuid
+from types import TracebackType
+from typing import Any, AsyncIterator, Callable, Iterator, Self, cast
 
 import grpc
 
-from .exceptions import AlreadyExistsError, NotFoundError, UnreleasableError
+from .backoff import ExpiryAwareBackoff, WaitPolicy, WaitPolicyFactory
+from .exceptions import (
+    AlreadyExistsError,
+    DeadlineExceededError,
+    InvalidArgumentError,
+    LeaseLostError,
+    NotFoundError,
+    ResourceExhaustedError,
+    UnreleasableError,
+)
+from .keepalive import KeepAlive, KeepAliveAsync, OnLost
 from .models import Lock
+from .raft import LEADER_METADATA_KEY
 from .stubs import distlock_pb2
 from .stubs.distlock_pb2_grpc import DistlockStub
 
+ChannelOptions = list[tuple[str, int | str]]
+
+_STATUS_CODES = {code.value[0]: code for code in grpc.StatusCode}
+
+# How long a call keeps following redirects between the nodes of a cluster,
+# which includes waiting out an election, and how long it waits between tries
+# while no node knows the leader.
+REDIRECT_TIMEOUT_SECONDS = 10.0
+REDIRECT_RETRY_SECONDS = 0.1
+# How long before the timeout of a blocking acquire the server is asked to stop
+# waiting, so that its answer arrives before the call's deadline runs out
+WAIT_REPLY_SECONDS = 0.1
+
+
+def _channel_options(
+    *,
+    pool_size: int,
+    keepalive_time_ms: int | None,
+    keepalive_timeout_ms: int | None,
+    keepalive_permit_without_calls: bool,
+    options: ChannelOptions | None,
+) -> ChannelOptions:
+    channel_options: ChannelOptions = []
+    if pool_size > 1:
+        # gRPC shares subchannels (and therefore TCP connections) between
+        # channels with identical arguments, so each pooled channel needs its
+        # own subchannel pool to actually get its own connection.
+        channel_options.append(("grpc.use_local_subchannel_pool", 1))
+    if keepalive_time_ms is not None:
+        channel_options.append(("grpc.keepalive_time_ms", keepalive_time_ms))
+        channel_options.append(
+            (
+                "grpc.keepalive_permit_without_calls",
+                int(keepalive_permit_without_calls),
+            )
+        )
+    if keepalive_timeout_ms is not None:
+        channel_options.append(("grpc.keepalive_timeout_ms", keepalive_timeout_ms))
+    if options is not None:
+        channel_options.extend(options)
+    return channel_options
+
+
+def _wait_timeout_seconds(timeout: float) -> float:
+    """
+    How long to ask the server to wait for a lock, given the client's timeout
+    as a time.monotonic() time. A negative value asks the server to wait for
+    as long as it allows.
+    """
+    if timeout == float("inf"):
+        return -1.0
+    return max(timeout - time.monotonic() - WAIT_REPLY_SECONDS, 0.0)
+
+
+def _deadline(deadline_seconds: float | None, timeout: float) -> float | None:
+    """
+    The time.monotonic() time by which a call has to complete, given how long
+    the call may take and the timeout of the acquire it is part of, if any, or
+    None if it may take forever.
+    """
+    if deadline_seconds is not None:
+        timeout = min(timeout, time.monotonic() + deadline_seconds)
+    return None if timeout == float("inf") else timeout
+
+
+def _time_remaining(deadline: float | None) -> float | None:
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def _check_deadline_seconds(deadline_seconds: float | None) -> None:
+    if deadline_seconds is not None and deadline_seconds <= 0:
+        raise ValueError(f"deadline_seconds must be positive, got {deadline_seconds}")
+
+
+def _deadline_exceeded(name: str, e: grpc.RpcError) -> DeadlineExceededError:
+    return DeadlineExceededError(
+        f"{name} did not complete within its deadline: {e.details()}"
+    )
+
+
+def _lock_mode(shared: bool) -> distlock_pb2.LockMode:
+    return distlock_pb2.SHARED if shared else distlock_pb2.EXCLUSIVE
+
+
+def _queued_ahead(lock: Lock) -> str:
+    # Only fair servers say where a request stood in the queue
+    if not lock.queue_position:
+        return ""
+    return f", with {lock.queue_position} requests still queued ahead, estimated to take {lock.estimated_wait_seconds:.3f} seconds"
+
+
+def _request_id() -> str:
+    # Sent with every try of one call, so that the server can tell a retry
+    # from a new request
+    return uuid.uuid4().hex
+
+
+def _check_owner(owner: str | None, shared: bool) -> str:
+    if owner and shared:
+        raise ValueError("Only locks acquired exclusively can have an owner")
+    return owner or ""
+
+
+def _release_request(lock: Lock) -> distlock_pb2.Lock:
+    request = lock.to_pb()
+    request.request_id = _request_id()
+    return request
+
+
+def _check_permits(permits: int) -> None:
+    # A lock created with no permits is a plain lock
+    if permits < 1:
+        raise ValueError(f"A semaphore needs at least one permit, got {permits}")
+
+
+def _leader_address(e: grpc.RpcError) -> str | None:
+    """
+    The address of the leader that a cluster node redirected the call to, an
+    empty string if the node does not know the leader yet, or None if the call
+    was not redirected.
+    """
+    if e.code() != grpc.StatusCode.UNAVAILABLE:
+        return None
+    for key, value in e.trailing_metadata() or ():  # type: ignore[attr-defined]
+        if key == LEADER_METADATA_KEY:
+            return value
+    return None
+
+
+class _RedirectingStub:
+    """
+    Stands in for the client's stubs, calling the next stub of the pool and
+    retrying on the leader when a cluster node redirects the call.
+
+    Calls take a deadline, a time.monotonic() time, rather than a timeout, so
+    that redirects and the tries that follow them are bounded by it as a
+    whole. A call that runs out its deadline raises DeadlineExceededError.
+    """
+
+    def __init__(self, client: "Distlock"):
+        self._client = client
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        def call(request: Any, *, deadline: float | None = None, **kwargs: Any) -> Any:
+            redirect_deadline = time.monotonic() + REDIRECT_TIMEOUT_SECONDS
+            if deadline is not None:
+                redirect_deadline = min(redirect_deadline, deadline)
+            while True:
+                try:
+                    return getattr(self._client._next_stub(), name)(
+                        request, timeout=_time_remaining(deadline), **kwargs
+                    )
+                except grpc.RpcError as e:
+                    if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                        raise _deadline_exceeded(name, e) from e
+                    if not self._client._follow_redirect(e, redirect_deadline):
+                        raise
+
+        return call
+
+
+class _RedirectingStubAsync:
+    """
+    The asyncio counterpart of _RedirectingStub. Cancelling a call cancels the
+    RPC in flight, which the server sees as the call going away.
+    """
+
+    def __init__(self, client: "DistlockAsync"):
+        self._client = client
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        async def call(
+            request: Any, *, deadline: float | None = None, **kwargs: Any
+        ) -> Any:
+            redirect_deadline = time.monotonic() + REDIRECT_TIMEOUT_SECONDS
+            if deadline is not None:
+                redirect_deadline = min(redirect_deadline, deadline)
+            while True:
+                try:
+                    return await getattr(self._client._next_stub(), name)(
+                        request, timeout=_time_remaining(deadline), **kwargs
+                    )
+                except grpc.RpcError as e:
+                    if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                        raise _deadline_exceeded(name, e) from e
+                    if not await self._client._follow_redirect(e, redirect_deadline):
+                        raise
+
+        return call
+
+
+def _lock_or_error(result: distlock_pb2.LockResult) -> Lock | Exception:
+    """
+    Converts one result of a batch call into either the lock, or the exception
+    the single key call would have raised.
+    """
+    code = _STATUS_CODES.get(result.code, grpc.StatusCode.UNKNOWN)
+    key = result.lock.key
+    if code == grpc.StatusCode.OK:
+        return Lock.from_pb(result.lock)
+    elif code == grpc.StatusCode.ALREADY_EXISTS:
+        return AlreadyExistsError(
+            f"Lock by the name {key} already exists on the server"
+        )
+    elif code == grpc.StatusCode.NOT_FOUND:
+        return NotFoundError(f"Lock by the name {key} does not exist on the server")
+    elif code == grpc.StatusCode.ABORTED:
+        return UnreleasableError(result.details)
+    elif code == grpc.StatusCode.INVALID_ARGUMENT:
+        return InvalidArgumentError(result.details)
+    elif code == grpc.StatusCode.RESOURCE_EXHAUSTED:
+        return ResourceExhaustedError(result.details)
+    return RuntimeError(f"Batch call failed for lock {key}: {result.details}")
+
 
 class Distlock:
-    def __init__(self, address: str = "[::]", port: int = 50051):
+    """
+    Client for the distlock server.
+
+    The client owns a pool of long-lived gRPC channels that are reused across
+    calls, so it should be created once and shared rather than created per
+    operation. Channels are thread safe; calls are spread across the pool
+    round-robin. Call close(), or use the client as a context manager, to tear
+    the channels down.
+
+    Pointed at any node of a cluster, the client follows redirects to the
+    leader, and keeps its channels to the leader from then on.
+
+    Against a server that cannot wait for locks, a blocking acquire polls the
+    server instead, sleeping between tries for as long as a policy made by
+    wait_policy says. Given the acquire's heartbeat_seconds, it returns a
+    WaitPolicy. The default backs off up to heartbeat_seconds and tries again
+    as the lease it was turned down by runs out; pass FixedWait to poll every
+    heartbeat_seconds.
+
+    Every call takes at most deadline_seconds, or the deadline_seconds passed
+    to the call itself, and raises DeadlineExceededError, a TimeoutError, if
+    the server does not answer by then. By default calls have no deadline.
+    Blocking acquires are bounded by their timeout_seconds instead, across
+    every try they make.
+    """
+
+    def __init__(
+        self,
+        address: str = "[::]",
+        port: int = 50051,
+        *,
+        pool_size: int = 1,
+        keepalive_time_ms: int | None = None,
+        keepalive_timeout_ms: int | None = None,
+        keepalive_permit_without_calls: bool = False,
+        options: ChannelOptions | None = None,
+        wait_policy: WaitPolicyFactory = ExpiryAwareBackoff,
+        deadline_seconds: float | None = None,
+    ):
+        if pool_size < 1:
+            raise ValueError(f"pool_size must be at least 1, got {pool_size}")
+        _check_deadline_seconds(deadline_seconds)
         self._address = f"{address}:{port}"
+        # The node the client was pointed at, which it goes back to if the
+        # leader it was redirected to goes away
+        self._seed_address = self._address
+        self._pool_size = pool_size
+        self._channel_options = _channel_options(
+            pool_size=pool_size,
+            keepalive_time_ms=keepalive_time_ms,
+            keepalive_timeout_ms=keepalive_timeout_ms,
+            keepalive_permit_without_calls=keepalive_permit_without_calls,
+            options=options,
+        )
+        self._channels: list[grpc.Channel] = []
+        self._stubs: list[DistlockStub] = []
+        self._connect(self._address)
+        # Channels to nodes the client was redirected away from. Other threads
+        # may still have calls in flight on them, so they are only closed
+        # along with the client.
+        self._retired_channels: list[grpc.Channel] = []
+        self._connect_lock = threading.Lock()
+        self._counter = itertools.count()
+        self._redirecting_stub = _RedirectingStub(self)
+        self._wait_policy = wait_policy
+        self._deadline_seconds = deadline_seconds
+        self._server_wait = True
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Closes the pool, along with the channels to nodes the client was
+        redirected away from. Calls made afterwards fail.
+        """
+        with self._connect_lock:
+            channels = self._channels + self._retired_channels
+        for channel in channels:
+            channel.close()
+
+    def _connect(self, address: str) -> None:
+        self._address = address
+        self._channels = [
+            grpc.insecure_channel(address, options=self._channel_options)
+            for _ in range(self._pool_size)
+        ]
+        self._stubs = [DistlockStub(channel) for channel in self._channels]
+
+    def _follow_redirect(self, e: grpc.RpcError, deadline: float) -> bool:
+        """
+        Points the client at the leader if e redirects it there, and returns
+        whether the call should be retried.
+        """
+        leader = _leader_address(e)
+        if time.monotonic() >= deadline:
+            return False
+        if leader is None:
+            if (
+                e.code() != grpc.StatusCode.UNAVAILABLE
+                or self._address == self._seed_address
+            ):
+                return False
+            # The leader went away, ask the original node who leads now
+            leader = self._seed_address
+        if not leader:
+            # The cluster is electing a leader
+            time.sleep(REDIRECT_RETRY_SECONDS)
+            return True
+        if leader in (self._seed_address, self._address):
+            # Back to where the client came from, or redirected to the node it
+            # already calls, which only leads once it is ready
+            time.sleep(REDIRECT_RETRY_SECONDS)
+        with self._connect_lock:
+            if leader != self._address:
+                self._retired_channels.extend(self._channels)
+                self._connect(leader)
+        return True
+
+    def _next_stub(self) -> DistlockStub:
+        stubs = self._stubs
+        return stubs[next(self._counter) % len(stubs)]
+
+    def _stub(self) -> DistlockStub:
+        return cast(DistlockStub, self._redirecting_stub)
+
+    def _deadline(
+        self, deadline_seconds: float | None, timeout: float = float("inf")
+    ) -> float | None:
+        if deadline_seconds is None:
+            deadline_seconds = self._deadline_seconds
+        return _deadline(deadline_seconds, timeout)
+
+    def _stream_locks(
+        self, request: distlock_pb2.StreamLocksRequest, deadline: float | None
+    ) -> Iterator[distlock_pb2.Locks]:
+        # A redirect only shows up once the stream is read from
+        redirect_deadline = time.monotonic() + REDIRECT_TIMEOUT_SECONDS
+        if deadline is not None:
+            redirect_deadline = min(redirect_deadline, deadline)
+        while True:
+            pages = self._next_stub().StreamLocks(
+                request, timeout=_time_remaining(deadline)
+            )
+            try:
+                first_page = next(pages, None)
+            except grpc.RpcError as e:
+                if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                    raise _deadline_exceeded("StreamLocks", e) from e
+                if not self._follow_redirect(e, redirect_deadline):
+                    raise
+                continue
+            if first_page is None:
+                return
+            try:
+                yield first_page
+                yield from pages
+            except grpc.RpcError as e:
+                if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                    raise _deadline_exceeded("StreamLocks", e) from e
+                raise
+            return
 
     def acquire_lock(
         self,
@@ -21,104 +421,566 @@ class Distlock:
         blocking: bool = True,
         timeout_seconds: float = -1.0,
         heartbeat_seconds: float = 3.0,
+        shared: bool = False,
+        owner: str | None = None,
     ) -> Lock:
         """
         If timeout_seconds < 0, the client will never timeout on attempting to acquire the lock.
+        Otherwise it is a deadline for the whole call, however many tries it
+        takes, which raises TimeoutError once it passes. Without one, each try
+        has the client's deadline_seconds, apart from waiting on the server.
+
+        A blocking acquire waits for the lock on the server, which hands the
+        lock over as soon as it is released or expires. heartbeat_seconds is
+        only used against servers that cannot wait, in which case the client
+        polls the server instead, at most heartbeat_seconds apart with the
+        default wait policy.
+
+        If shared, the lock is acquired alongside any other shared holders,
+        rather than exclusively. See acquire_read_lock.
+
+        A server run with --fair turns down requests while others wait for the
+        lock. The lock it returns without acquiring it has queue_position, how
+        many requests are ahead, and estimated_wait_seconds set.
+
+        A lock acquired exclusively with an owner, any string that identifies
+        the holder, is acquired again rather than turned down when its owner
+        acquires it while holding it. The owner then gets the same lease, with
+        holds counting how many times it holds the lock, and the lock is only
+        released once it was released as many times. Every try of one call
+        carries the same request id, so a retry of an acquire that the server
+        granted gets that lease back rather than the lock a second time.
         """
+        owner = _check_owner(owner, shared)
+        request_id = _request_id()
         if timeout_seconds >= 0:
-            timeout = time.time() + timeout_seconds
+            timeout = time.monotonic() + timeout_seconds
             heartbeat_seconds = min(heartbeat_seconds, timeout_seconds)
         else:
             timeout = float("inf")
-        with grpc.insecure_channel(self._address) as channel:
-            stub = DistlockStub(channel)
-            while True:
-                try:
-                    lock = Lock.from_pb(
-                        stub.AcquireLock(
-                            distlock_pb2.AcquireLockRequest(
-                                key=key,
-                                expires_in_seconds=expires_in_seconds,
-                            ),
-                        ),
-                    )
-                except grpc.RpcError as e:
-                    if e.code() == grpc.StatusCode.NOT_FOUND:
-                        raise NotFoundError(
-                            f"Lock by the name {key} does not exist on the server"
-                        )
-                    raise
-                if lock.acquired or not blocking:
-                    break
-                if time.time() > timeout:
-                    raise TimeoutError(
-                        f"Unable to acquire a lock on {key} within the timeout"
-                    )
-                time.sleep(heartbeat_seconds)
-        return lock
-
-    def create_lock(self, key: str) -> None:
-        with grpc.insecure_channel(self._address) as channel:
-            stub = DistlockStub(channel)
-            try:
-                _ = stub.CreateLock(distlock_pb2.Lock(key=key))
-            except grpc.RpcError as e:
-                if e.code() == grpc.StatusCode.ALREADY_EXISTS:
-                    raise AlreadyExistsError(
-                        f"Lock by the name {key} already exists on the server"
-                    )
-                raise
-
-    def delete_lock(self, key: str) -> None:
-        with grpc.insecure_channel(self._address) as channel:
-            stub = DistlockStub(channel)
+        stub = self._stub()
+        if blocking and self._server_wait:
+            waited_lock = self._wait_acquire_lock(
+                stub,
+                key=key,
+                expires_in_seconds=expires_in_seconds,
+                timeout=timeout,
+                shared=shared,
+                owner=owner,
+                request_id=request_id,
+            )
+            if waited_lock is not None:
+                return waited_lock
+        # Only made once the lock turns out to be taken
+        wait_policy: WaitPolicy | None = None
+        while True:
             try:
-                _ = stub.DeleteLock(distlock_pb2.Lock(key=key))
+                lock = Lock.from_pb(
+                    stub.AcquireLock(
+                        distlock_pb2.AcquireLockRequest(
+                            key=key,
+                            expires_in_seconds=expires_in_seconds,
+                            mode=_lock_mode(shared),
+                            owner=owner,
+                            request_id=request_id,
+                        ),
+                        deadline=self._deadline(None, timeout),
+                    ),
+                )
             except grpc.RpcError as e:
                 if e.code() == grpc.StatusCode.NOT_FOUND:
                     raise NotFoundError(
                         f"Lock by the name {key} does not exist on the server"
                     )
                 raise
+            if lock.acquired or not blocking:
+                break
+            if time.monotonic() > timeout:
+                raise TimeoutError(
+                    f"Unable to acquire a lock on {key} within the timeout"
+                )
+            if wait_policy is None:
+                wait_policy = self._wait_policy(heartbeat_seconds)
+            time.sleep(wait_policy(lock, timeout - time.monotonic()))
+        return lock
+
+    def acquire_read_lock(
+        self,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        blocking: bool = True,
+        timeout_seconds: float = -1.0,
+        heartbeat_seconds: float = 3.0,
+    ) -> Lock:
+        """
+        Acquires the lock in shared mode, alongside any other readers. Each
+        reader gets a lease and clock of its own, to renew and release on its
+        own. Readers are kept waiting while a writer waits for the lock, so
+        that writers are not starved.
+        """
+        return self.acquire_lock(
+            key=key,
+            expires_in_seconds=expires_in_seconds,
+            blocking=blocking,
+            timeout_seconds=timeout_seconds,
+            heartbeat_seconds=heartbeat_seconds,
+            shared=True,
+        )
+
+    def acquire_write_lock(
+        self,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        blocking: bool = True,
+        timeout_seconds: float = -1.0,
+        heartbeat_seconds: float = 3.0,
+        owner: str | None = None,
+    ) -> Lock:
+        """
+        Acquires the lock exclusively, once every reader is gone. The same as
+        acquire_lock.
+        """
+        return self.acquire_lock(
+            key=key,
+            expires_in_seconds=expires_in_seconds,
+            blocking=blocking,
+            timeout_seconds=timeout_seconds,
+            heartbeat_seconds=heartbeat_seconds,
+            owner=owner,
+        )
+
+    def acquire_permit(
+        self,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        blocking: bool = True,
+        timeout_seconds: float = -1.0,
+        heartbeat_seconds: float = 3.0,
+    ) -> Lock:
+        """
+        Takes one of the permits of the semaphore, in one round trip. Each
+        permit has a lease and clock of its own, and is renewed and released
+        with renew_lock and release_lock like a lock.
+        """
+        return self.acquire_lock(
+            key=key,
+            expires_in_seconds=expires_in_seconds,
+            blocking=blocking,
+            timeout_seconds=timeout_seconds,
+            heartbeat_seconds=heartbeat_seconds,
+        )
 
-    def get_lock(self, key: str) -> Lock:
-        with grpc.insecure_channel(self._address) as channel:
-            stub = DistlockStub(channel)
+    def _wait_acquire_lock(
+        self,
+        stub: DistlockStub,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        timeout: float,
+        shared: bool,
+        owner: str,
+        request_id: str,
+    ) -> Lock | None:
+        """
+        Returns None if the server does not support waiting for locks.
+        """
+        while True:
             try:
-                lock = Lock.from_pb(stub.GetLock(distlock_pb2.Lock(key=key)))
+                lock = Lock.from_pb(
+                    stub.WaitAcquireLock(
+                        distlock_pb2.WaitAcquireLockRequest(
+                            key=key,
+                            expires_in_seconds=expires_in_seconds,
+                            timeout_seconds=_wait_timeout_seconds(timeout),
+                            mode=_lock_mode(shared),
+                            owner=owner,
+                            request_id=request_id,
+                        ),
+                        deadline=_deadline(None, timeout),
+                    ),
+                )
             except grpc.RpcError as e:
+                if e.code() == grpc.StatusCode.UNIMPLEMENTED:
+                    self._server_wait = False
+                    return None
                 if e.code() == grpc.StatusCode.NOT_FOUND:
                     raise NotFoundError(
                         f"Lock by the name {key} does not exist on the server"
                     )
                 raise
+            if lock.acquired:
+                return lock
+            if timeout - time.monotonic() <= WAIT_REPLY_SECONDS:
+                raise TimeoutError(
+                    f"Unable to acquire a lock on {key} within the timeout{_queued_ahead(lock)}"
+                )
+
+    def create_lock(self, key: str, *, deadline_seconds: float | None = None) -> None:
+        try:
+            _ = self._stub().CreateLock(
+                distlock_pb2.Lock(key=key), deadline=self._deadline(deadline_seconds)
+            )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.ALREADY_EXISTS:
+                raise AlreadyExistsError(
+                    f"Lock by the name {key} already exists on the server"
+                )
+            raise
+
+    def create_semaphore(
+        self, key: str, permits: int, *, deadline_seconds: float | None = None
+    ) -> None:
+        """
+        Creates a counting semaphore, which up to permits holders can acquire
+        at once. See acquire_permit.
+        """
+        _check_permits(permits)
+        try:
+            _ = self._stub().CreateLock(
+                distlock_pb2.Lock(key=key, permits=permits),
+                deadline=self._deadline(deadline_seconds),
+            )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.ALREADY_EXISTS:
+                raise AlreadyExistsError(
+                    f"Lock by the name {key} already exists on the server"
+                )
+            raise
+
+    def delete_lock(self, key: str, *, deadline_seconds: float | None = None) -> None:
+        try:
+            _ = self._stub().DeleteLock(
+                distlock_pb2.Lock(key=key), deadline=self._deadline(deadline_seconds)
+            )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.NOT_FOUND:
+                raise NotFoundError(
+                    f"Lock by the name {key} does not exist on the server"
+                )
+            raise
+
+    def get_lock(self, key: str, *, deadline_seconds: float | None = None) -> Lock:
+        try:
+            lock = Lock.from_pb(
+                self._stub().GetLock(
+                    distlock_pb2.Lock(key=key),
+                    deadline=self._deadline(deadline_seconds),
+                )
+            )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.NOT_FOUND:
+                raise NotFoundError(
+                    f"Lock by the name {key} does not exist on the server"
+                )
+            raise
         return lock
 
-    def list_locks(self) -> list[Lock]:
-        with grpc.insecure_channel(self._address) as channel:
-            stub = DistlockStub(channel)
-            locks = [
-                Lock.from_pb(lock)
-                for lock in stub.ListLocks(distlock_pb2.EmptyRequest()).locks
-            ]
+    def list_locks(self, *, deadline_seconds: float | None = None) -> list[Lock]:
+        locks = [
+            Lock.from_pb(lock)
+            for lock in self._stub()
+            .ListLocks(
+                distlock_pb2.EmptyRequest(), deadline=self._deadline(deadline_seconds)
+            )
+            .locks
+        ]
         return locks
 
-    def release_lock(self, lock: Lock) -> None:
-        with grpc.insecure_channel(self._address) as channel:
-            stub = DistlockStub(channel)
-            try:
-                _ = stub.ReleaseLock(lock.to_pb())
-            except grpc.RpcError as e:
-                if e.code() == grpc.StatusCode.ABORTED:
-                    raise UnreleasableError(e.details())
-                elif e.code() == grpc.StatusCode.NOT_FOUND:
-                    raise NotFoundError(f"Lock by the name {lock.key} does not exist")
-                raise
+    def iter_locks(
+        self,
+        prefix: str = "",
+        page_size: int = 0,
+        *,
+        deadline_seconds: float | None = None,
+    ) -> Iterator[Lock]:
+        """
+        Lazily iterates over the locks on the server whose keys start with
+        prefix, in key order. The server sends the locks in pages of page_size
+        locks, or a page size of its choosing if page_size is zero, so this
+        should be preferred to list_locks for large tables.
+
+        The locks are read as the caller gets to them, so the client's
+        deadline_seconds does not apply. A deadline_seconds passed here bounds
+        the whole iteration, from the first lock.
+        """
+        pages = self._stream_locks(
+            distlock_pb2.StreamLocksRequest(prefix=prefix, page_size=page_size),
+            _deadline(deadline_seconds, float("inf")),
+        )
+        for page in pages:
+            for lock in page.locks:
+                yield Lock.from_pb(lock)
+
+    def release_lock(
+        self, lock: Lock, *, deadline_seconds: float | None = None
+    ) -> None:
+        try:
+            _ = self._stub().ReleaseLock(
+                _release_request(lock), deadline=self._deadline(deadline_seconds)
+            )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.ABORTED:
+                raise UnreleasableError(e.details())
+            elif e.code() == grpc.StatusCode.NOT_FOUND:
+                raise NotFoundError(f"Lock by the name {lock.key} does not exist")
+            raise
+
+    def renew_lock(
+        self,
+        lock: Lock,
+        expires_in_seconds: int,
+        *,
+        deadline_seconds: float | None = None,
+    ) -> Lock:
+        """
+        Extends a held lease to expires_in_seconds from now. Raises
+        LeaseLostError if the lock was released, expired or acquired again
+        since lock was acquired.
+        """
+        try:
+            pb_lock = self._stub().RenewLock(
+                distlock_pb2.RenewLockRequest(
+                    key=lock.key,
+                    clock=lock.clock,
+                    expires_in_seconds=expires_in_seconds,
+                ),
+                deadline=self._deadline(deadline_seconds),
+            )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.ABORTED:
+                raise LeaseLostError(e.details())
+            elif e.code() == grpc.StatusCode.NOT_FOUND:
+                raise NotFoundError(f"Lock by the name {lock.key} does not exist")
+            raise
+        return Lock.from_pb(pb_lock)
+
+    def keep_alive(
+        self,
+        lock: Lock,
+        expires_in_seconds: int,
+        *,
+        interval_seconds: float | None = None,
+        on_lost: OnLost | None = None,
+    ) -> KeepAlive:
+        """
+        Starts renewing the lease on lock in the background, so that it can be
+        acquired with a short expiry and still be held for as long as needed.
+        See KeepAlive for when on_lost is called.
+        """
+        keep_alive = KeepAlive(
+            self,
+            lock,
+            expires_in_seconds,
+            interval_seconds=interval_seconds,
+            on_lost=on_lost,
+        )
+        keep_alive.start()
+        return keep_alive
+
+    # The batch methods below send all keys in a single call. They return one
+    # result per key, in order: the lock, or the exception the single key
+    # method would have raised for that key.
+    def create_many(
+        self, keys: list[str], *, deadline_seconds: float | None = None
+    ) -> list[Lock | Exception]:
+        results = self._stub().CreateLocks(
+            distlock_pb2.Locks(locks=[distlock_pb2.Lock(key=key) for key in keys]),
+            deadline=self._deadline(deadline_seconds),
+        )
+        return [_lock_or_error(result) for result in results.results]
+
+    def acquire_many(
+        self,
+        keys: list[str],
+        expires_in_seconds: int,
+        *,
+        deadline_seconds: float | None = None,
+    ) -> list[Lock | Exception]:
+        """
+        Acquires the locks without blocking; check acquired on each lock.
+        """
+        results = self._stub().AcquireLocks(
+            distlock_pb2.AcquireLocksRequest(
+                requests=[
+                    distlock_pb2.AcquireLockRequest(
+                        key=key, expires_in_seconds=expires_in_seconds
+                    )
+                    for key in keys
+                ]
+            ),
+            deadline=self._deadline(deadline_seconds),
+        )
+        return [_lock_or_error(result) for result in results.results]
+
+    def release_many(
+        self, locks: list[Lock], *, deadline_seconds: float | None = None
+    ) -> list[Lock | Exception]:
+        results = self._stub().ReleaseLocks(
+            distlock_pb2.Locks(locks=[lock.to_pb() for lock in locks]),
+            deadline=self._deadline(deadline_seconds),
+        )
+        return [_lock_or_error(result) for result in results.results]
+
+    def get_many(
+        self, keys: list[str], *, deadline_seconds: float | None = None
+    ) -> list[Lock | Exception]:
+        results = self._stub().GetLocks(
+            distlock_pb2.Locks(locks=[distlock_pb2.Lock(key=key) for key in keys]),
+            deadline=self._deadline(deadline_seconds),
+        )
+        return [_lock_or_error(result) for result in results.results]
 
 
 class DistlockAsync:
-    def __init__(self, address: str = "[::]", port: int = 50051):
+    """
+    Async client for the distlock server.
+
+    Like Distlock, the client owns a pool of long-lived channels. asyncio
+    channels are bound to the event loop they are created on, so the pool is
+    created lazily on first use and the client can be shared by any number of
+    coroutines running on that loop. Call close(), or use the client as an
+    async context manager, to tear the channels down. Blocking acquires
+    against servers that cannot wait poll them as in Distlock, and calls have
+    deadlines as in Distlock. Cancelling a call cancels its RPC, so that the
+    server stops waiting on a lock for it.
+    """
+
+    def __init__(
+        self,
+        address: str = "[::]",
+        port: int = 50051,
+        *,
+        pool_size: int = 1,
+        keepalive_time_ms: int | None = None,
+        keepalive_timeout_ms: int | None = None,
+        keepalive_permit_without_calls: bool = False,
+        options: ChannelOptions | None = None,
+        wait_policy: WaitPolicyFactory = ExpiryAwareBackoff,
+        deadline_seconds: float | None = None,
+    ):
+        if pool_size < 1:
+            raise ValueError(f"pool_size must be at least 1, got {pool_size}")
+        _check_deadline_seconds(deadline_seconds)
         self._address = f"{address}:{port}"
+        # The node the client was pointed at, which it goes back to if the
+        # leader it was redirected to goes away
+        self._seed_address = self._address
+        self._pool_size = pool_size
+        self._channel_options = _channel_options(
+            pool_size=pool_size,
+            keepalive_time_ms=keepalive_time_ms,
+            keepalive_timeout_ms=keepalive_timeout_ms,
+            keepalive_permit_without_calls=keepalive_permit_without_calls,
+            options=options,
+        )
+        self._channels: list[grpc.aio.Channel] = []
+        self._stubs: list[DistlockStub] = []
+        self._retired_channels: list[grpc.aio.Channel] = []
+        self._closed = False
+        self._counter = itertools.count()
+        self._redirecting_stub = _RedirectingStubAsync(self)
+        self._wait_policy = wait_policy
+        self._deadline_seconds = deadline_seconds
+        self._server_wait = True
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """
+        See Distlock.close.
+        """
+        self._closed = True
+        channels = self._channels + self._retired_channels
+        await asyncio.gather(*(channel.close() for channel in channels))
+
+    async def _follow_redirect(self, e: grpc.RpcError, deadline: float) -> bool:
+        """
+        See Distlock._follow_redirect.
+        """
+        leader = _leader_address(e)
+        if time.monotonic() >= deadline:
+            return False
+        if leader is None:
+            if (
+                e.code() != grpc.StatusCode.UNAVAILABLE
+                or self._address == self._seed_address
+            ):
+                return False
+            leader = self._seed_address
+        if not leader:
+            await asyncio.sleep(REDIRECT_RETRY_SECONDS)
+            return True
+        if leader in (self._seed_address, self._address):
+            await asyncio.sleep(REDIRECT_RETRY_SECONDS)
+        if leader != self._address:
+            self._address = leader
+            self._retired_channels.extend(self._channels)
+            self._channels, self._stubs = [], []
+        return True
+
+    def _next_stub(self) -> DistlockStub:
+        if not self._stubs:
+            # Channels opened after close would be left to the GC
+            if self._closed:
+                raise grpc.aio.UsageError("The client is closed")
+            self._channels = [
+                grpc.aio.insecure_channel(self._address, options=self._channel_options)
+                for _ in range(self._pool_size)
+            ]
+            self._stubs = [DistlockStub(channel) for channel in self._channels]
+        return self._stubs[next(self._counter) % len(self._stubs)]
+
+    def _stub(self) -> DistlockStub:
+        return cast(DistlockStub, self._redirecting_stub)
+
+    def _deadline(
+        self, deadline_seconds: float | None, timeout: float = float("inf")
+    ) -> float | None:
+        if deadline_seconds is None:
+            deadline_seconds = self._deadline_seconds
+        return _deadline(deadline_seconds, timeout)
+
+    async def _stream_locks(
+        self, request: distlock_pb2.StreamLocksRequest, deadline: float | None
+    ) -> AsyncIterator[distlock_pb2.Locks]:
+        redirect_deadline = time.monotonic() + REDIRECT_TIMEOUT_SECONDS
+        if deadline is not None:
+            redirect_deadline = min(redirect_deadline, deadline)
+        while True:
+            pages = self._next_stub().StreamLocks(
+                request, timeout=_time_remaining(deadline)
+            )
+            try:
+                first_page = await anext(aiter(pages), None)
+            except grpc.RpcError as e:
+                if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                    raise _deadline_exceeded("StreamLocks", e) from e
+                if not await self._follow_redirect(e, redirect_deadline):
+                    raise
+                continue
+            if first_page is None:
+                return
+            try:
+                yield first_page
+                async for page in pages:
+                    yield page
+            except grpc.RpcError as e:
+                if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                    raise _deadline_exceeded("StreamLocks", e) from e
+                raise
+            return
 
     async def acquire_lock(
         self,
@@ -128,94 +990,406 @@ class DistlockAsync:
         blocking: bool = True,
         timeout_seconds: float = -1.0,
         heartbeat_seconds: float = 3.0,
+        shared: bool = False,
+        owner: str | None = None,
     ) -> Lock:
         """
         If timeout_seconds < 0, the client will never timeout on attempting to acquire the lock.
+        Otherwise it is a deadline for the whole call, however many tries it
+        takes, which raises TimeoutError once it passes. Without one, each try
+        has the client's deadline_seconds, apart from waiting on the server.
+
+        A blocking acquire waits for the lock on the server, which hands the
+        lock over as soon as it is released or expires. heartbeat_seconds is
+        only used against servers that cannot wait, in which case the client
+        polls the server instead, at most heartbeat_seconds apart with the
+        default wait policy.
+
+        If shared, the lock is acquired alongside any other shared holders,
+        rather than exclusively. See acquire_read_lock.
+
+        A server run with --fair turns down requests while others wait for the
+        lock. The lock it returns without acquiring it has queue_position, how
+        many requests are ahead, and estimated_wait_seconds set.
+
+        A lock acquired exclusively with an owner, any string that identifies
+        the holder, is acquired again rather than turned down when its owner
+        acquires it while holding it. The owner then gets the same lease, with
+        holds counting how many times it holds the lock, and the lock is only
+        released once it was released as many times. Every try of one call
+        carries the same request id, so a retry of an acquire that the server
+        granted gets that lease back rather than the lock a second time.
         """
+        owner = _check_owner(owner, shared)
+        request_id = _request_id()
         if timeout_seconds >= 0:
-            timeout = time.time() + timeout_seconds
+            timeout = time.monotonic() + timeout_seconds
             heartbeat_seconds = min(heartbeat_seconds, timeout_seconds)
         else:
             timeout = float("inf")
-        async with grpc.aio.insecure_channel(self._address) as channel:
-            stub = DistlockStub(channel)
-            while True:
-                try:
-                    server_lock = await stub.AcquireLock(
-                        distlock_pb2.AcquireLockRequest(
-                            key=key,
-                            expires_in_seconds=expires_in_seconds,
-                        )
-                    )
-                    lock = Lock.from_pb(server_lock)
-                except grpc.RpcError as e:
-                    if e.code() == grpc.StatusCode.NOT_FOUND:
-                        raise NotFoundError(
-                            f"Lock by the name {key} does not exist on the server"
-                        )
-                    raise
-                if lock.acquired or not blocking:
-                    break
-                if time.time() > timeout:
-                    raise TimeoutError(
-                        f"Unable to acquire a lock on {key} within the timeout"
-                    )
-                await asyncio.sleep(heartbeat_seconds)
-        return lock
-
-    async def create_lock(self, key: str) -> None:
-        async with grpc.aio.insecure_channel(self._address) as channel:
-            stub = DistlockStub(channel)
+        stub = self._stub()
+        if blocking and self._server_wait:
+            waited_lock = await self._wait_acquire_lock(
+                stub,
+                key=key,
+                expires_in_seconds=expires_in_seconds,
+                timeout=timeout,
+                shared=shared,
+                owner=owner,
+                request_id=request_id,
+            )
+            if waited_lock is not None:
+                return waited_lock
+        # Only made once the lock turns out to be taken
+        wait_policy: WaitPolicy | None = None
+        while True:
             try:
-                _ = await stub.CreateLock(distlock_pb2.Lock(key=key))
-            except grpc.RpcError as e:
-                if e.code() == grpc.StatusCode.ALREADY_EXISTS:
-                    raise AlreadyExistsError(
-                        f"Lock by the name {key} already exists on the server"
-                    )
-                raise
-
-    async def delete_lock(self, key: str) -> None:
-        async with grpc.aio.insecure_channel(self._address) as channel:
-            stub = DistlockStub(channel)
-            try:
-                _ = await stub.DeleteLock(distlock_pb2.Lock(key=key))
+                server_lock = await stub.AcquireLock(
+                    distlock_pb2.AcquireLockRequest(
+                        key=key,
+                        expires_in_seconds=expires_in_seconds,
+                        mode=_lock_mode(shared),
+                        owner=owner,
+                        request_id=request_id,
+                    ),
+                    deadline=self._deadline(None, timeout),
+                )
+                lock = Lock.from_pb(server_lock)
             except grpc.RpcError as e:
                 if e.code() == grpc.StatusCode.NOT_FOUND:
                     raise NotFoundError(
                         f"Lock by the name {key} does not exist on the server"
                     )
                 raise
+            if lock.acquired or not blocking:
+                break
+            if time.monotonic() > timeout:
+                raise TimeoutError(
+                    f"Unable to acquire a lock on {key} within the timeout"
+                )
+            if wait_policy is None:
+                wait_policy = self._wait_policy(heartbeat_seconds)
+            await asyncio.sleep(wait_policy(lock, timeout - time.monotonic()))
+        return lock
 
-    async def get_lock(self, key: str) -> Lock:
-        async with grpc.aio.insecure_channel(self._address) as channel:
-            stub = DistlockStub(channel)
+    async def acquire_read_lock(
+        self,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        blocking: bool = True,
+        timeout_seconds: float = -1.0,
+        heartbeat_seconds: float = 3.0,
+    ) -> Lock:
+        """
+        Acquires the lock in shared mode, alongside any other readers. Each
+        reader gets a lease and clock of its own, to renew and release on its
+        own. Readers are kept waiting while a writer waits for the lock, so
+        that writers are not starved.
+        """
+        return await self.acquire_lock(
+            key=key,
+            expires_in_seconds=expires_in_seconds,
+            blocking=blocking,
+            timeout_seconds=timeout_seconds,
+            heartbeat_seconds=heartbeat_seconds,
+            shared=True,
+        )
+
+    async def acquire_write_lock(
+        self,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        blocking: bool = True,
+        timeout_seconds: float = -1.0,
+        heartbeat_seconds: float = 3.0,
+        owner: str | None = None,
+    ) -> Lock:
+        """
+        Acquires the lock exclusively, once every reader is gone. The same as
+        acquire_lock.
+        """
+        return await self.acquire_lock(
+            key=key,
+            expires_in_seconds=expires_in_seconds,
+            blocking=blocking,
+            timeout_seconds=timeout_seconds,
+            heartbeat_seconds=heartbeat_seconds,
+            owner=owner,
+        )
+
+    async def acquire_permit(
+        self,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        blocking: bool = True,
+        timeout_seconds: float = -1.0,
+        heartbeat_seconds: float = 3.0,
+    ) -> Lock:
+        """
+        Takes one of the permits of the semaphore, in one round trip. Each
+        permit has a lease and clock of its own, and is renewed and released
+        with renew_lock and release_lock like a lock.
+        """
+        return await self.acquire_lock(
+            key=key,
+            expires_in_seconds=expires_in_seconds,
+            blocking=blocking,
+            timeout_seconds=timeout_seconds,
+            heartbeat_seconds=heartbeat_seconds,
+        )
+
+    async def _wait_acquire_lock(
+        self,
+        stub: DistlockStub,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        timeout: float,
+        shared: bool,
+        owner: str,
+        request_id: str,
+    ) -> Lock | None:
+        """
+        Returns None if the server does not support waiting for locks.
+        """
+        while True:
             try:
-                pb_lock = await stub.GetLock(distlock_pb2.Lock(key=key))
-                lock = Lock.from_pb(pb_lock)
+                server_lock = await stub.WaitAcquireLock(
+                    distlock_pb2.WaitAcquireLockRequest(
+                        key=key,
+                        expires_in_seconds=expires_in_seconds,
+                        timeout_seconds=_wait_timeout_seconds(timeout),
+                        mode=_lock_mode(shared),
+                        owner=owner,
+                        request_id=request_id,
+                    ),
+                    deadline=_deadline(None, timeout),
+                )
+                lock = Lock.from_pb(server_lock)
             except grpc.RpcError as e:
+                if e.code() == grpc.StatusCode.UNIMPLEMENTED:
+                    self._server_wait = False
+                    return None
                 if e.code() == grpc.StatusCode.NOT_FOUND:
                     raise NotFoundError(
                         f"Lock by the name {key} does not exist on the server"
                     )
                 raise
+            if lock.acquired:
+                return lock
+            if timeout - time.monotonic() <= WAIT_REPLY_SECONDS:
+                raise TimeoutError(
+                    f"Unable to acquire a lock on {key} within the timeout{_queued_ahead(lock)}"
+                )
+
+    async def create_lock(
+        self, key: str, *, deadline_seconds: float | None = None
+    ) -> None:
+        try:
+            _ = await self._stub().CreateLock(
+                distlock_pb2.Lock(key=key), deadline=self._deadline(deadline_seconds)
+            )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.ALREADY_EXISTS:
+                raise AlreadyExistsError(
+                    f"Lock by the name {key} already exists on the server"
+                )
+            raise
+
+    async def create_semaphore(
+        self, key: str, permits: int, *, deadline_seconds: float | None = None
+    ) -> None:
+        """
+        Creates a counting semaphore, which up to permits holders can acquire
+        at once. See acquire_permit.
+        """
+        _check_permits(permits)
+        try:
+            _ = await self._stub().CreateLock(
+                distlock_pb2.Lock(key=key, permits=permits),
+                deadline=self._deadline(deadline_seconds),
+            )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.ALREADY_EXISTS:
+                raise AlreadyExistsError(
+                    f"Lock by the name {key} already exists on the server"
+                )
+            raise
+
+    async def delete_lock(
+        self, key: str, *, deadline_seconds: float | None = None
+    ) -> None:
+        try:
+            _ = await self._stub().DeleteLock(
+                distlock_pb2.Lock(key=key), deadline=self._deadline(deadline_seconds)
+            )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.NOT_FOUND:
+                raise NotFoundError(
+                    f"Lock by the name {key} does not exist on the server"
+                )
+            raise
+
+    async def get_lock(
+        self, key: str, *, deadline_seconds: float | None = None
+    ) -> Lock:
+        try:
+            pb_lock = await self._stub().GetLock(
+                distlock_pb2.Lock(key=key), deadline=self._deadline(deadline_seconds)
+            )
+            lock = Lock.from_pb(pb_lock)
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.NOT_FOUND:
+                raise NotFoundError(
+                    f"Lock by the name {key} does not exist on the server"
+                )
+            raise
         return lock
 
-    async def list_locks(self) -> list[Lock]:
-        async with grpc.aio.insecure_channel(self._address) as channel:
-            stub = DistlockStub(channel)
-            pb_locks = await stub.ListLocks(distlock_pb2.EmptyRequest())
+    async def list_locks(self, *, deadline_seconds: float | None = None) -> list[Lock]:
+        pb_locks = await self._stub().ListLocks(
+            distlock_pb2.EmptyRequest(), deadline=self._deadline(deadline_seconds)
+        )
         locks = [Lock.from_pb(lock) for lock in pb_locks.locks]
         return locks
 
-    async def release_lock(self, lock: Lock) -> None:
-        async with grpc.aio.insecure_channel(self._address) as channel:
-            stub = DistlockStub(channel)
-            try:
-                _ = await stub.ReleaseLock(lock.to_pb())
-            except grpc.RpcError as e:
-                if e.code() == grpc.StatusCode.ABORTED:
-                    raise UnreleasableError(e.details())
-                elif e.code() == grpc.StatusCode.NOT_FOUND:
-                    raise NotFoundError(f"Lock by the name {lock.key} does not exist")
-                raise
+    async def iter_locks(
+        self,
+        prefix: str = "",
+        page_size: int = 0,
+        *,
+        deadline_seconds: float | None = None,
+    ) -> AsyncIterator[Lock]:
+        """
+        Lazily iterates over the locks on the server whose keys start with
+        prefix, in key order. See Distlock.iter_locks.
+        """
+        pages = self._stream_locks(
+            distlock_pb2.StreamLocksRequest(prefix=prefix, page_size=page_size),
+            _deadline(deadline_seconds, float("inf")),
+        )
+        async for page in pages:
+            for lock in page.locks:
+                yield Lock.from_pb(lock)
+
+    async def release_lock(
+        self, lock: Lock, *, deadline_seconds: float | None = None
+    ) -> None:
+        try:
+            _ = await self._stub().ReleaseLock(
+                _release_request(lock), deadline=self._deadline(deadline_seconds)
+            )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.ABORTED:
+                raise UnreleasableError(e.details())
+            elif e.code() == grpc.StatusCode.NOT_FOUND:
+                raise NotFoundError(f"Lock by the name {lock.key} does not exist")
+            raise
+
+    async def renew_lock(
+        self,
+        lock: Lock,
+        expires_in_seconds: int,
+        *,
+        deadline_seconds: float | None = None,
+    ) -> Lock:
+        """
+        Extends a held lease to expires_in_seconds from now. Raises
+        LeaseLostError if the lock was released, expired or acquired again
+        since lock was acquired.
+        """
+        try:
+            pb_lock = await self._stub().RenewLock(
+                distlock_pb2.RenewLockRequest(
+                    key=lock.key,
+                    clock=lock.clock,
+                    expires_in_seconds=expires_in_seconds,
+                ),
+                deadline=self._deadline(deadline_seconds),
+            )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.ABORTED:
+                raise LeaseLostError(e.details())
+            elif e.code() == grpc.StatusCode.NOT_FOUND:
+                raise NotFoundError(f"Lock by the name {lock.key} does not exist")
+            raise
+        return Lock.from_pb(pb_lock)
+
+    def keep_alive(
+        self,
+        lock: Lock,
+        expires_in_seconds: int,
+        *,
+        interval_seconds: float | None = None,
+        on_lost: OnLost | None = None,
+    ) -> KeepAliveAsync:
+        """
+        Starts renewing the lease on lock in the background, so that it can be
+        acquired with a short expiry and still be held for as long as needed.
+        See KeepAliveAsync for when on_lost is called.
+        """
+        keep_alive = KeepAliveAsync(
+            self,
+            lock,
+            expires_in_seconds,
+            interval_seconds=interval_seconds,
+            on_lost=on_lost,
+        )
+        keep_alive.start()
+        return keep_alive
+
+    # The batch methods below send all keys in a single call. They return one
+    # result per key, in order: the lock, or the exception the single key
+    # method would have raised for that key.
+    async def create_many(
+        self, keys: list[str], *, deadline_seconds: float | None = None
+    ) -> list[Lock | Exception]:
+        results = await self._stub().CreateLocks(
+            distlock_pb2.Locks(locks=[distlock_pb2.Lock(key=key) for key in keys]),
+            deadline=self._deadline(deadline_seconds),
+        )
+        return [_lock_or_error(result) for result in results.results]
+
+    async def acquire_many(
+        self,
+        keys: list[str],
+        expires_in_seconds: int,
+        *,
+        deadline_seconds: float | None = None,
+    ) -> list[Lock | Exception]:
+        """
+        Acquires the locks without blocking; check acquired on each lock.
+        """
+        results = await self._stub().AcquireLocks(
+            distlock_pb2.AcquireLocksRequest(
+                requests=[
+                    distlock_pb2.AcquireLockRequest(
+                        key=key, expires_in_seconds=expires_in_seconds
+                    )
+                    for key in keys
+                ]
+            ),
+            deadline=self._deadline(deadline_seconds),
+        )
+        return [_lock_or_error(result) for result in results.results]
+
+    async def release_many(
+        self, locks: list[Lock], *, deadline_seconds: float | None = None
+    ) -> list[Lock | Exception]:
+        results = await self._stub().ReleaseLocks(
+            distlock_pb2.Locks(locks=[lock.to_pb() for lock in locks]),
+            deadline=self._deadline(deadline_seconds),
+        )
+        return [_lock_or_error(result) for result in results.results]
+
+    async def get_many(
+        self, keys: list[str], *, deadline_seconds: float | None = None
+    ) -> list[Lock | Exception]:
+        results = await self._stub().GetLocks(
+            distlock_pb2.Locks(locks=[distlock_pb2.Lock(key=key) for key in keys]),
+            deadline=self._deadline(deadline_seconds),
+        )
+        return [_lock_or_error(result) for result in results.results]
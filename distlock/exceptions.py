@@ -12,3 +12,23 @@ class NotFoundError(Exception):
 
 class UnreleasableError(Exception):
     pass
+
+
+class LeaseLostError(Exception):
+    pass
+
+
+class InvalidArgumentError(ValueError):
+    pass
+
+
+class ResourceExhaustedError(Exception):
+    pass
+
+
+class LockTableFullError(ResourceExhaustedError):
+    pass
+
+
+class DeadlineExceededError(TimeoutError):
+    pass
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import threading
+import time
+from types import TracebackType
+from typing import TYPE_CHECKING, Callable, Self
+
+import grpc
+
+from .exceptions import LeaseLostError, NotFoundError
+from .models import Lock
+
+if TYPE_CHECKING:
+    from .client import Distlock, DistlockAsync
+
+logger = logging.getLogger(__name__)
+
+OnLost = Callable[[Lock, Exception], None]
+
+
+def _interval_seconds(expires_in_seconds: int, interval_seconds: float | None) -> float:
+    if expires_in_seconds < 1:
+        raise ValueError(
+            f"expires_in_seconds must be at least 1, got {expires_in_seconds}"
+        )
+    if interval_seconds is None:
+        # Leaves room for two renewals to fail before the lease runs out
+        return expires_in_seconds / 3
+    if not 0 < interval_seconds < expires_in_seconds:
+        raise ValueError(
+            f"interval_seconds must be between 0 and {expires_in_seconds}, got {interval_seconds}"
+        )
+    return interval_seconds
+
+
+class KeepAlive:
+    """
+    Renews a lease from a background thread until stopped.
+
+    The lease is renewed every interval_seconds, a third of the lease by
+    default. A renewal that fails because the server could not be reached is
+    retried at the next interval, for as long as the lease could still be
+    held. Once the lease is lost, because the server refused a renewal or
+    because it ran out, renewals stop and on_lost is called with the lock and
+    the reason. Stopping does not release the lock.
+    """
+
+    def __init__(
+        self,
+        client: "Distlock",
+        lock: Lock,
+        expires_in_seconds: int,
+        *,
+        interval_seconds: float | None = None,
+        on_lost: OnLost | None = None,
+    ):
+        self._client = client
+        self._lock = lock
+        self._expires_in_seconds = expires_in_seconds
+        self._interval_seconds = _interval_seconds(expires_in_seconds, interval_seconds)
+        self._on_lost = on_lost
+        self._lost: Exception | None = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"distlock-keepalive-{lock.key}", daemon=True
+        )
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.stop()
+
+    @property
+    def lock(self) -> Lock:
+        """
+        The lock as of its latest renewal.
+        """
+        return self._lock
+
+    @property
+    def lost(self) -> Exception | None:
+        """
+        Why the lease was lost, or None while it is held.
+        """
+        return self._lost
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self) -> None:
+        held_until = time.monotonic() + self._expires_in_seconds
+        while not self._stopped.wait(self._interval_seconds):
+            try:
+                self._lock = self._client.renew_lock(
+                    self._lock, self._expires_in_seconds
+                )
+                held_until = time.monotonic() + self._expires_in_seconds
+            except (LeaseLostError, NotFoundError) as e:
+                self._lose(e)
+                return
+            except grpc.RpcError as e:
+                if time.monotonic() >= held_until:
+                    self._lose(e)
+                    return
+                logger.warning(f"Could not renew lease on {self._lock.key}: {e}")
+
+    def _lose(self, e: Exception) -> None:
+        self._lost = e
+        logger.warning(f"Lost lease on {self._lock.key}: {e}")
+        if self._on_lost is not None:
+            try:
+                self._on_lost(self._lock, e)
+            except Exception:
+                logger.exception(f"on_lost callback for {self._lock.key} failed")
+
+
+class KeepAliveAsync:
+    """
+    The asyncio counterpart of KeepAlive, which renews the lease from a task
+    on the running event loop.
+    """
+
+    def __init__(
+        self,
+        client: "DistlockAsync",
+        lock: Lock,
+        expires_in_seconds: int,
+        *,
+        interval_seconds: float | None = None,
+        on_lost: OnLost | None = None,
+    ):
+        self._client = client
+        self._lock = lock
+        self._expires_in_seconds = expires_in_seconds
+        self._interval_seconds = _interval_seconds(expires_in_seconds, interval_seconds)
+        self._on_lost = on_lost
+        self._lost: Exception | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.stop()
+
+    @property
+    def lock(self) -> Lock:
+        """
+        The lock as of its latest renewal.
+        """
+        return self._lock
+
+    @property
+    def lost(self) -> Exception | None:
+        """
+        Why the lease was lost, or None while it is held.
+        """
+        return self._lost
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(
+            self._run(), name=f"distlock-keepalive-{self._lock.key}"
+        )
+
+    async def stop(self) -> None:
+        if self._task is None or self._task is asyncio.current_task():
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self) -> None:
+        held_until = time.monotonic() + self._expires_in_seconds
+        while True:
+            await asyncio.sleep(self._interval_seconds)
+            try:
+                self._lock = await self._client.renew_lock(
+                    self._lock, self._expires_in_seconds
+                )
+                held_until = time.monotonic() + self._expires_in_seconds
+            except (LeaseLostError, NotFoundError) as e:
+                self._lose(e)
+                return
+            except grpc.RpcError as e:
+                if time.monotonic() >= held_until:
+                    self._lose(e)
+                    return
+                logger.warning(f"Could not renew lease on {self._lock.key}: {e}")
+
+    def _lose(self, e: Exception) -> None:
+        self._lost = e
+        logger.warning(f"Lost lease on {self._lock.key}: {e}")
+        if self._on_lost is not None:
+            try:
+                self._on_lost(self._lock, e)
+            except Exception:
+                logger.exception(f"on_lost callback for {self._lock.key} failed")
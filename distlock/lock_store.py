@@ -1,113 +1,1226 @@
+import asyncio
+import heapq
 import threading
-from typing import TypedDict
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Iterable, Iterator, TypeVar
 
-from .exceptions import AlreadyExistsError
-from .models import Lock
+from .exceptions import AlreadyExistsError, UnreleasableError
+from .models import LockRecord, QueuedLockRecord
+from .wal import MutationLog, encode_delete, encode_put, remember_request
 
+T = TypeVar("T")
 
-class Store(TypedDict):
-    key: Lock
+# How much each hold counts towards the running average of hold times used to
+# estimate waits, as in TCP's estimate of round trip times
+HOLD_TIME_WEIGHT = 8
 
 
 class LockStore:
-    def __init__(self):
-        self._store = Store()
+    # Whether locks are granted strictly in the order requests started
+    # waiting for them. Only the stores that can wait can be fair.
+    _fair = False
+
+    def __init__(self, wal: MutationLog | None = None):
+        self._store: dict[str, LockRecord] = {}
+        # Every mutation is appended to the log, if there is one, as it is
+        # applied, so that the log has them in the order they happened.
+        self._wal = wal
+        # Every key in the store, kept sorted so that pages of keys can be
+        # found by bisection instead of scanning or copying the whole table.
+        self._keys: list[str] = []
+        # A min-heap of (expires_at_ns, key, clock) for every lease granted, so
+        # that expired leases can be found without scanning the table. Entries
+        # for leases that were released or deleted are not removed, they are
+        # skipped when they reach the top of the heap.
+        self._expiries: list[tuple[int, str, int]] = []
+        # How many entries were live when the heap was last rebuilt
+        self._live_expiries = 0
+        # For fair stores, when the exclusive lease on each key was granted
+        # and a running average of how long the key was recently held for,
+        # in nanoseconds, to estimate how long queued requests will wait
+        self._granted_at: dict[str, int] = {}
+        self._hold_ns: dict[str, int] = {}
+        # The (key, clock) of the lease each recent request id was granted or
+        # released, oldest first
+        self._requests: dict[str, tuple[str, int]] = {}
+
+    def _index_expiry(self, key: str, lock: LockRecord) -> None:
+        self._push_expiry((lock.expires_at_ns, key, lock.clock))
+
+    def _push_expiry(self, entry: tuple[int, str, int]) -> None:
+        expiries = self._expiries
+        heapq.heappush(expiries, entry)
+        # Every key has one live entry per lease it holds, so once most entries
+        # are stale the heap is rebuilt from the live ones, in amortized O(1).
+        if (
+            len(expiries) > 2 * len(self._store) + 64
+            and len(expiries) > 2 * self._live_expiries + 64
+        ):
+            self._expiries = [
+                entry for lock in self._store.values() for entry in _leases(lock)
+            ]
+            heapq.heapify(self._expiries)
+            self._live_expiries = len(self._expiries)
+
+    def _writer_waiting(self, key: str) -> bool:
+        """
+        Whether an exclusive request waits for the lock, which holds shared
+        requests back. Nothing waits on this store.
+        """
+        return False
+
+    def _queued(self, key: str) -> int:
+        """
+        How many requests queue for the lock in a fair store, which a new
+        request may not overtake. Nothing waits on this store.
+        """
+        return 0
+
+    def _queued_lock(self, lock: LockRecord, ahead: int) -> QueuedLockRecord:
+        """
+        The lock for a request turned down with ahead requests queued before
+        it, with a guess at how long they will take from recent hold times.
+        """
+        estimated_wait_ns = 0
+        hold_ns = self._hold_ns.get(lock.key)
+        if hold_ns is not None:
+            estimated_wait_ns = ahead * hold_ns
+            granted_at_ns = self._granted_at.get(lock.key)
+            if granted_at_ns is not None and lock.acquired:
+                # What is left of the current holder's hold, if it is typical
+                estimated_wait_ns += max(
+                    min(granted_at_ns + hold_ns, lock.expires_at_ns)
+                    - time.monotonic_ns(),
+                    0,
+                )
+        return QueuedLockRecord(
+            lock.key,
+            False,
+            lock.clock,
+            lock.expires_at_ns,
+            lock.shared,
+            permits=lock.permits,
+            queue_position=ahead,
+            estimated_wait_ns=estimated_wait_ns,
+        )
+
+    def _held(self, key: str, hold_ns: int) -> None:
+        average_ns = self._hold_ns.get(key)
+        if average_ns is None:
+            self._hold_ns[key] = hold_ns
+        else:
+            self._hold_ns[key] = average_ns + (hold_ns - average_ns) // HOLD_TIME_WEIGHT
+
+    def _granted(self, key: str, lock: LockRecord, exclusive: bool) -> None:
+        """
+        Keeps track of hold times in a fair store as the lock is granted.
+        """
+        now_ns = time.monotonic_ns()
+        granted_at_ns = self._granted_at.pop(key, None)
+        # The previous exclusive lease was never released, so it was held
+        # until it expired
+        if granted_at_ns is not None:
+            self._held(key, min(lock.expires_at_ns, now_ns) - granted_at_ns)
+        if exclusive:
+            self._granted_at[key] = now_ns
+
+    def _granted_before(self, lock: LockRecord, request_id: str) -> LockRecord | None:
+        """
+        The holder's lock of the lease that was granted to an earlier try of
+        the request, if it is still held.
+        """
+        granted = self._requests.get(request_id)
+        if granted is None or granted[0] != lock.key:
+            return None
+        clock = granted[1]
+        if lock.readers is not None:
+            expires_at_ns = lock.readers.get(clock, 0)
+            if expires_at_ns <= time.monotonic_ns():
+                return None
+            return LockRecord(
+                lock.key, True, clock, expires_at_ns, lock.shared, permits=lock.permits
+            )
+        if clock != lock.clock or not lock.acquired or lock.expired:
+            return None
+        return lock
 
     def __len__(self) -> int:
         return len(self._store)
 
-    def __getitem__(self, key: str) -> Lock:
+    def __getitem__(self, key: str) -> LockRecord:
         return self._store[key]
 
-    def __setitem__(self, key: str, value: Lock) -> None:
+    def _put(self, key: str, value: LockRecord) -> None:
+        if key not in self._store:
+            insort(self._keys, key)
         self._store[key] = value
+        if value.acquired:
+            for entry in _leases(value):
+                self._push_expiry(entry)
+
+    def _log_put(self, lock: LockRecord, request_id: str = "", clock: int = 0) -> None:
+        """
+        Logs the put of lock, along with the request_id it was made for, if
+        any, which was granted or released the lease at clock.
+        """
+        if request_id:
+            remember_request(self._requests, request_id, lock.key, clock)
+        if self._wal is not None:
+            self._wal.append(encode_put(lock, request_id, clock))
+
+    def __setitem__(self, key: str, value: LockRecord) -> None:
+        self._put(key, value)
+        self._log_put(value)
 
     def __delitem__(self, key: str) -> None:
         del self._store[key]
+        del self._keys[bisect_left(self._keys, key)]
+        self._granted_at.pop(key, None)
+        self._hold_ns.pop(key, None)
+        if self._wal is not None:
+            self._wal.append(encode_delete(key))
 
     def __contains__(self, key: str) -> bool:
         return key in self._store
 
-    def acquire(self, key: str, expires_in_seconds: int) -> Lock:
+    def acquire(
+        self,
+        key: str,
+        expires_in_seconds: int,
+        shared: bool = False,
+        owner: str = "",
+        request_id: str = "",
+    ) -> LockRecord:
+        """
+        Acquires the lock exclusively, or shared with other shared holders,
+        and returns the holder's lock, which is not acquired if the lock is
+        taken. Acquiring a semaphore takes one of its permits, whatever the
+        mode.
+
+        An exclusive lock can have an owner, which acquires the lock again
+        while it holds it, rather than being turned down. A request whose
+        request_id was granted a lease that is still held gets that lease
+        back, without acquiring the lock again.
+
+        A fair store turns the request down while others queue for the lock,
+        unless the owner holds it.
+        """
         lock = self._store[key]
+        if owner and (shared or lock.permits):
+            raise ValueError("Only locks acquired exclusively can have an owner")
+        if request_id:
+            holder = self._granted_before(lock, request_id)
+            if holder is not None:
+                return holder
+        if owner and lock.held_by(owner):
+            lock.reenter(expires_in_seconds=expires_in_seconds)
+            self._index_expiry(key, lock)
+            self._log_put(lock, request_id, lock.clock)
+            return lock
+        if self._fair:
+            ahead = self._queued(key)
+            if ahead:
+                return self._queued_lock(lock, ahead)
+        if lock.permits:
+            holder = lock.acquire_permit(expires_in_seconds=expires_in_seconds)
+            if holder.acquired:
+                if self._fair:
+                    self._granted(key, lock, exclusive=False)
+                self._index_expiry(key, holder)
+                self._log_put(lock, request_id, holder.clock)
+            return holder
+        if shared:
+            if (
+                lock.acquired and not lock.expired and not lock.shared
+            ) or self._writer_waiting(key):
+                return LockRecord(
+                    lock.key, False, lock.clock, lock.expires_at_ns, lock.shared
+                )
+            if self._fair:
+                self._granted(key, lock, exclusive=False)
+            holder = lock.acquire_shared(expires_in_seconds=expires_in_seconds)
+            self._index_expiry(key, holder)
+            self._log_put(lock, request_id, holder.clock)
+            return holder
         if lock.acquired and not lock.expired:
-            unacquired_lock = Lock(
-                key=lock.key,
-                acquired=False,
-                clock=lock.clock,
-                expires_at=lock.expires_at,
+            return LockRecord(
+                lock.key, False, lock.clock, lock.expires_at_ns, lock.shared
             )
-            return unacquired_lock
-        lock.acquire(expires_in_seconds=expires_in_seconds)
+        if self._fair:
+            self._granted(key, lock, exclusive=True)
+        lock.acquire(expires_in_seconds=expires_in_seconds, owner=owner)
+        self._index_expiry(key, lock)
+        self._log_put(lock, request_id, lock.clock)
         return lock
 
-    def release(self, key: str, clock: int) -> None:
+    def release(self, key: str, clock: int, request_id: str = "") -> None:
+        """
+        Releases the lease at clock, or one of the holds of its owner. A
+        request_id that released the lease before is not released again.
+        """
         lock = self._store[key]
+        if request_id and self._requests.get(request_id) == (key, clock):
+            return
         lock.release(clock=clock)
+        if self._fair and not lock.acquired:
+            granted_at_ns = self._granted_at.pop(key, None)
+            if granted_at_ns is not None:
+                self._held(key, time.monotonic_ns() - granted_at_ns)
+        self._log_put(lock, request_id, clock)
 
-    def set_not_exists(self, key: str, value: Lock) -> None:
+    def renew(self, key: str, clock: int, expires_in_seconds: int) -> LockRecord:
+        lock = self._store[key]
+        holder = lock.renew(clock=clock, expires_in_seconds=expires_in_seconds)
+        # The entry for the old expiry goes stale, like one for a released lease
+        self._index_expiry(key, holder)
+        self._log_put(lock)
+        return holder
+
+    def load(
+        self,
+        locks: Iterable[LockRecord],
+        requests: dict[str, tuple[str, int]] | None = None,
+    ) -> None:
+        """
+        Puts locks recovered from disk into the store without logging them,
+        and remembers the (key, clock) each recovered request id was granted
+        or released, oldest first.
+        """
+        for lock in locks:
+            self._put(lock.key, lock)
+        for request_id, (key, clock) in (requests or {}).items():
+            remember_request(self._requests, request_id, key, clock)
+
+    def recent_requests(self) -> dict[str, tuple[str, int]]:
+        """
+        The (key, clock) each request id the store remembers was granted or
+        released, oldest first.
+        """
+        return dict(self._requests)
+
+    def reset(
+        self,
+        locks: Iterable[LockRecord],
+        requests: dict[str, tuple[str, int]] | None = None,
+    ) -> None:
+        """
+        Replaces everything in the store with locks and requests, without
+        logging them.
+        """
+        self._store.clear()
+        self._keys.clear()
+        self._expiries.clear()
+        self._live_expiries = 0
+        self._granted_at.clear()
+        self._hold_ns.clear()
+        self._requests.clear()
+        LockStore.load(self, locks, requests)
+
+    def set_not_exists(self, key: str, value: LockRecord) -> None:
         if key in self._store:
             raise AlreadyExistsError
-        self._store[key] = value
+        if value.permits < 0:
+            raise ValueError(
+                f"A semaphore needs at least one permit, got {value.permits}"
+            )
+        LockStore.__setitem__(self, key, value)
+
+    # The batch methods below return one result per item, in order, with the
+    # exception that the single item method would have raised in place of a
+    # failed item's lock, so one bad key does not fail the whole batch. They
+    # call the single item methods of this class explicitly so that subclasses
+    # can wrap a whole batch in one critical section.
+    def set_not_exists_many(
+        self, locks: list[LockRecord]
+    ) -> list[LockRecord | Exception]:
+        results: list[LockRecord | Exception] = []
+        for lock in locks:
+            try:
+                LockStore.set_not_exists(self, lock.key, lock)
+            except (KeyError, ValueError) as e:
+                results.append(e)
+            else:
+                results.append(lock)
+        return results
+
+    def acquire_many(
+        self, requests: list[tuple[str, int]]
+    ) -> list[LockRecord | Exception]:
+        results: list[LockRecord | Exception] = []
+        for key, expires_in_seconds in requests:
+            try:
+                results.append(LockStore.acquire(self, key, expires_in_seconds))
+            except KeyError as e:
+                results.append(e)
+        return results
+
+    def release_many(
+        self, requests: list[tuple[str, int]]
+    ) -> list[LockRecord | Exception]:
+        results: list[LockRecord | Exception] = []
+        for key, clock in requests:
+            try:
+                LockStore.release(self, key, clock)
+            except (KeyError, UnreleasableError) as e:
+                results.append(e)
+            else:
+                results.append(self._store[key])
+        return results
+
+    def get_many(self, keys: list[str]) -> list[LockRecord | Exception]:
+        results: list[LockRecord | Exception] = []
+        for key in keys:
+            try:
+                results.append(self._store[key])
+            except KeyError as e:
+                results.append(e)
+        return results
+
+    def page(
+        self, prefix: str = "", start_after: str | None = None, limit: int = 1000
+    ) -> list[LockRecord]:
+        """
+        Returns up to limit locks whose keys start with prefix, in key order,
+        starting after the key start_after. Pass the key of the last lock of a
+        page as start_after to fetch the next page.
+        """
+        if start_after is not None and start_after >= prefix:
+            start = bisect_right(self._keys, start_after)
+        else:
+            start = bisect_left(self._keys, prefix)
+        locks = []
+        for key in self._keys[start : start + limit]:
+            if not key.startswith(prefix):
+                break
+            locks.append(self._store[key])
+        return locks
+
+    def reap(self) -> list[str]:
+        """
+        Releases every lease that has expired, and returns their keys. Each
+        expired lease costs O(log n), and leases that have not expired are not
+        looked at.
+        """
+        now_ns = time.monotonic_ns()
+        reaped = []
+        while self._expiries and self._expiries[0][0] <= now_ns:
+            expires_at_ns, key, clock = heapq.heappop(self._expiries)
+            lock = self._store.get(key)
+            if lock is None or not lock.acquired:
+                continue
+            if lock.readers is not None:
+                if lock.readers.get(clock) == expires_at_ns:
+                    lock.drop_reader(clock)
+                    reaped.append(key)
+            elif lock.clock == clock and lock.expires_at_ns == expires_at_ns:
+                lock.acquired = False
+                lock.holds = 0
+                reaped.append(key)
+        return reaped
+
+    def next_expiry_ns(self) -> int | None:
+        """
+        Returns when the earliest lease expires, as a monotonic clock reading,
+        or None if no lease was granted. The lease may already be released.
+        """
+        return self._expiries[0][0] if self._expiries else None
+
+    def held_count(self) -> int:
+        """
+        Counts the locks that are leased out, which takes a scan of the table.
+        """
+        return sum(1 for lock in self._store.values() if lock.acquired)
 
     # We define this method so that the API of this class is the same as the
     # ThreadSafeLockStore class.
-    def to_list(self) -> list[Lock]:
+    def to_list(self) -> list[LockRecord]:
         return list(self._store.values())
 
 
-class ThreadSafeLockStore:
-    def __init__(self):
+def _leases(lock: LockRecord) -> list[tuple[int, str, int]]:
+    """
+    The (expires_at_ns, key, clock) of every lease the lock is held under.
+    """
+    if not lock.acquired:
+        return []
+    if lock.readers is not None:
+        return [
+            (expires_at_ns, lock.key, clock)
+            for clock, expires_at_ns in lock.readers.items()
+        ]
+    return [(lock.expires_at_ns, lock.key, lock.clock)]
+
+
+class _FairQueue(dict[int, T]):
+    """
+    The waiters of a fair store on a single key, by ticket in the order they
+    started waiting.
+
+    Waiters leave from anywhere in the queue when they give up, so how many
+    wait ahead of a ticket is kept in a Fenwick tree over the tickets, to be
+    found in O(log n) rather than by walking the queue.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        # 1-based, node i counts the waiters with tickets in
+        # (i - lowbit(i), i]
+        self._tree = [0]
+
+    def join(self, waiter: T) -> int:
+        """
+        Queues the waiter at the back and returns its ticket.
+        """
+        ticket = len(self._tree)
+        self._tree.append(
+            1 + self._count(ticket - 1) - self._count(ticket - (ticket & -ticket))
+        )
+        self[ticket] = waiter
+        return ticket
+
+    def leave(self, ticket: int) -> None:
+        del self[ticket]
+        while ticket < len(self._tree):
+            self._tree[ticket] -= 1
+            ticket += ticket & -ticket
+
+    def ahead(self, ticket: int) -> int:
+        """
+        How many waiters are queued before the ticket.
+        """
+        return self._count(ticket - 1)
+
+    def _count(self, ticket: int) -> int:
+        """
+        How many waiters hold tickets up to and including this one.
+        """
+        count = 0
+        while ticket > 0:
+            count += self._tree[ticket]
+            ticket -= ticket & -ticket
+        return count
+
+
+class _Waiters:
+    """
+    The queue of threads waiting on a single key.
+
+    threading.Condition already wakes waiters in FIFO order, we only keep a
+    count alongside it so the condition can be dropped once nobody waits, and
+    a count of the exclusive waiters that hold shared requests back.
+
+    In a fair store, every waiter instead has a condition of its own, by
+    ticket in the order they started waiting, so that only the waiter at the
+    head of the queue is woken to take the lock.
+    """
+
+    def __init__(self, lock: threading.Lock):
+        self.condition = threading.Condition(lock)
+        self.count = 0
+        self.writers = 0
+        self.queue: _FairQueue[threading.Condition] = _FairQueue()
+
+
+class ThreadSafeLockStore(LockStore):
+    """
+    A lock store that can be used from many threads, and in which threads
+    can wait for locks.
+
+    If fair, locks are granted strictly in the order in which requests started
+    waiting for them: a request, waiting or not, is turned down while others
+    queue for the lock, and the lock goes to the longest waiting request once
+    it is released or expires. This replaces the preference of exclusive over
+    shared requests, as nobody can overtake a waiting writer anyway.
+    """
+
+    def __init__(self, wal: MutationLog | None = None, fair: bool = False):
+        super().__init__(wal)
+        self._fair = fair
         self._lock = threading.Lock()
-        self._store = Store()
+        self._waiters: dict[str, _Waiters] = {}
+        # The key whose longest waiting request is taking its turn, which
+        # must not be turned down for the requests queued behind it
+        self._granting: str | None = None
+
+    def _notify(self, key: str, everyone: bool = False) -> None:
+        """
+        Wakes the longest waiting thread on the key, or all of them. Must be
+        called with the lock held.
+        """
+        waiters = self._waiters.get(key)
+        if waiters is not None:
+            if waiters.queue:
+                for condition in waiters.queue.values():
+                    condition.notify()
+                    if not everyone:
+                        return
+            # Shared waiters may all get the lock at once, so they are all
+            # woken, along with any exclusive waiters queued among them
+            elif everyone or waiters.count > waiters.writers:
+                waiters.condition.notify_all()
+            else:
+                waiters.condition.notify()
+
+    def _writer_waiting(self, key: str) -> bool:
+        waiters = self._waiters.get(key)
+        return waiters is not None and waiters.writers > 0
+
+    def _queued(self, key: str) -> int:
+        waiters = self._waiters.get(key)
+        if waiters is None or self._granting == key:
+            return 0
+        return len(waiters.queue)
 
     def __len__(self) -> int:
         with self._lock:
-            return len(self._store)
+            return super().__len__()
 
-    def __getitem__(self, key: str) -> Lock:
+    def __getitem__(self, key: str) -> LockRecord:
         with self._lock:
-            return self._store[key]
+            return super().__getitem__(key)
 
-    def __setitem__(self, key: str, value: Lock) -> None:
+    def __setitem__(self, key: str, value: LockRecord) -> None:
         with self._lock:
-            self._store[key] = value
+            super().__setitem__(key, value)
 
     def __delitem__(self, key: str) -> None:
         with self._lock:
-            del self._store[key]
+            super().__delitem__(key)
+            # Wake everybody waiting on the key so they can find out it is gone
+            self._notify(key, everyone=True)
 
     def __contains__(self, key: str) -> bool:
         with self._lock:
-            return key in self._store
+            return super().__contains__(key)
 
-    def acquire(self, key: str, expires_in_seconds: int) -> Lock:
+    def acquire(
+        self,
+        key: str,
+        expires_in_seconds: int,
+        shared: bool = False,
+        owner: str = "",
+        request_id: str = "",
+    ) -> LockRecord:
         with self._lock:
-            lock = self._store[key]
-            if lock.acquired and not lock.expired:
-                unacquired_lock = Lock(
-                    key=lock.key,
-                    acquired=False,
-                    clock=lock.clock,
-                    expires_at=lock.expires_at,
-                )
-                return unacquired_lock
-            lock.acquire(expires_in_seconds=expires_in_seconds)
+            return super().acquire(key, expires_in_seconds, shared, owner, request_id)
+
+    def acquire_wait(
+        self,
+        key: str,
+        expires_in_seconds: int,
+        timeout_seconds: float,
+        shared: bool = False,
+        owner: str = "",
+        request_id: str = "",
+    ) -> LockRecord:
+        """
+        Acquire the lock, waiting up to timeout_seconds for it to be released
+        or to expire. Waiters on a key are woken one at a time, in the order in
+        which they started waiting, when the lock is released. If the timeout
+        passes first, the returned lock is not acquired.
+
+        Shared requests are turned down for as long as an exclusive request
+        waits, so that readers coming and going cannot starve writers.
+
+        In a fair store, if the timeout passes first, the returned lock has the
+        place in the queue the request gave up.
+        """
+        if self._fair:
+            return self._acquire_wait_fair(
+                key, expires_in_seconds, timeout_seconds, shared, owner, request_id
+            )
+        deadline = time.monotonic() + timeout_seconds
+        with self._lock:
+            lock = super().acquire(key, expires_in_seconds, shared, owner, request_id)
+            if lock.acquired:
+                return lock
+            # A semaphore's permits are waited for like an exclusive lock
+            shared = shared and not lock.permits
+            waiters = self._waiters.get(key)
+            if waiters is None:
+                waiters = self._waiters[key] = _Waiters(self._lock)
+            waiters.count += 1
+            if not shared:
+                waiters.writers += 1
+            try:
+                while not lock.acquired:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if shared and waiters.writers:
+                        # Held back by a writer rather than by a lease, so
+                        # only a wake up from the writer can change that
+                        waiters.condition.wait(remaining)
+                    else:
+                        waiters.condition.wait(
+                            min(remaining, max(lock.seconds_until_expiry, 0))
+                        )
+                    lock = super().acquire(
+                        key, expires_in_seconds, shared, owner, request_id
+                    )
+            finally:
+                waiters.count -= 1
+                if not shared:
+                    waiters.writers -= 1
+                    # Readers held back by this writer check again, whether
+                    # it got the lock or gave up
+                    if waiters.count > waiters.writers:
+                        waiters.condition.notify_all()
+                if waiters.count == 0:
+                    del self._waiters[key]
             return lock
 
-    def release(self, key: str, clock: int) -> None:
+    def _acquire_wait_fair(
+        self,
+        key: str,
+        expires_in_seconds: int,
+        timeout_seconds: float,
+        shared: bool,
+        owner: str,
+        request_id: str,
+    ) -> LockRecord:
+        deadline = time.monotonic() + timeout_seconds
+        with self._lock:
+            lock = super().acquire(key, expires_in_seconds, shared, owner, request_id)
+            if lock.acquired:
+                return lock
+            waiters = self._waiters.get(key)
+            if waiters is None:
+                waiters = self._waiters[key] = _Waiters(self._lock)
+            waiters.count += 1
+            condition = threading.Condition(self._lock)
+            ticket = waiters.queue.join(condition)
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if next(iter(waiters.queue)) == ticket:
+                        self._granting = key
+                        try:
+                            lock = super().acquire(
+                                key, expires_in_seconds, shared, owner, request_id
+                            )
+                        finally:
+                            self._granting = None
+                        if lock.acquired:
+                            break
+                        timeout = min(remaining, max(lock.seconds_until_expiry, 0))
+                    else:
+                        # Only woken once it is next, or the lock is deleted
+                        lock = self._store[key]
+                        timeout = remaining
+                    if remaining <= 0:
+                        lock = self._queued_lock(
+                            self._store[key], waiters.queue.ahead(ticket)
+                        )
+                        break
+                    condition.wait(timeout)
+            finally:
+                waiters.queue.leave(ticket)
+                waiters.count -= 1
+                # The next in line takes its turn, whether this one got the
+                # lock, which it may share, or gave up
+                self._notify(key)
+                if waiters.count == 0:
+                    del self._waiters[key]
+            return lock
+
+    def release(self, key: str, clock: int, request_id: str = "") -> None:
+        with self._lock:
+            super().release(key, clock, request_id)
+            self._notify(key)
+
+    def renew(self, key: str, clock: int, expires_in_seconds: int) -> LockRecord:
+        with self._lock:
+            return super().renew(key, clock, expires_in_seconds)
+
+    def set_not_exists(self, key: str, value: LockRecord) -> None:
+        with self._lock:
+            super().set_not_exists(key, value)
+
+    def set_not_exists_many(
+        self, locks: list[LockRecord]
+    ) -> list[LockRecord | Exception]:
+        with self._lock:
+            return super().set_not_exists_many(locks)
+
+    def acquire_many(
+        self, requests: list[tuple[str, int]]
+    ) -> list[LockRecord | Exception]:
+        with self._lock:
+            return super().acquire_many(requests)
+
+    def release_many(
+        self, requests: list[tuple[str, int]]
+    ) -> list[LockRecord | Exception]:
         with self._lock:
-            lock = self._store[key]
-            lock.release(clock=clock)
+            results = super().release_many(requests)
+            for (key, _), result in zip(requests, results):
+                if not isinstance(result, Exception):
+                    self._notify(key)
+            return results
 
-    def set_not_exists(self, key: str, value: Lock) -> None:
+    def get_many(self, keys: list[str]) -> list[LockRecord | Exception]:
         with self._lock:
-            if key in self._store:
-                raise AlreadyExistsError
-            self._store[key] = value
+            return super().get_many(keys)
+
+    def page(
+        self, prefix: str = "", start_after: str | None = None, limit: int = 1000
+    ) -> list[LockRecord]:
+        with self._lock:
+            return super().page(prefix, start_after, limit)
+
+    def load(
+        self,
+        locks: Iterable[LockRecord],
+        requests: dict[str, tuple[str, int]] | None = None,
+    ) -> None:
+        with self._lock:
+            super().load(locks, requests)
+
+    def recent_requests(self) -> dict[str, tuple[str, int]]:
+        with self._lock:
+            return super().recent_requests()
+
+    def reset(
+        self,
+        locks: Iterable[LockRecord],
+        requests: dict[str, tuple[str, int]] | None = None,
+    ) -> None:
+        with self._lock:
+            super().reset(locks, requests)
+            for key in list(self._waiters):
+                self._notify(key, everyone=True)
+
+    def reap(self) -> list[str]:
+        with self._lock:
+            reaped = super().reap()
+            for key in reaped:
+                self._notify(key)
+            return reaped
+
+    def next_expiry_ns(self) -> int | None:
+        with self._lock:
+            return super().next_expiry_ns()
+
+    def held_count(self) -> int:
+        with self._lock:
+            return super().held_count()
 
     # Can't define __iter__ and use list(lock_store) in the
     # calling code because that would not be thread safe.
-    def to_list(self) -> list[Lock]:
+    def to_list(self) -> list[LockRecord]:
         with self._lock:
-            return list(self._store.values())
+            return super().to_list()
+
+
+class ShardedLockStore:
+    """
+    A thread safe lock store that spreads keys over independently locked
+    shards, so that operations on keys in different shards do not serialize on
+    each other.
+
+    Single key operations only take the lock of the key's shard. Operations
+    that span shards take the locks of every shard involved, always in shard
+    order so that they cannot deadlock, which makes batches atomic and makes
+    __len__ and to_list consistent snapshots of the whole store.
+
+    If fair, every shard grants locks in the order requests started waiting,
+    as a fair ThreadSafeLockStore does.
+    """
+
+    def __init__(
+        self, shards: int = 16, wal: MutationLog | None = None, fair: bool = False
+    ):
+        if shards < 1:
+            raise ValueError(f"shards must be at least 1, got {shards}")
+        self._shards = [ThreadSafeLockStore(wal, fair) for _ in range(shards)]
+
+    def _shard(self, key: str) -> ThreadSafeLockStore:
+        return self._shards[hash(key) % len(self._shards)]
+
+    @contextmanager
+    def _locked(self, indices: Iterable[int]) -> Iterator[None]:
+        with ExitStack() as stack:
+            for index in sorted(indices):
+                stack.enter_context(self._shards[index]._lock)
+            yield
+
+    def _batch(
+        self,
+        items: list[T],
+        key: Callable[[T], str],
+        run: Callable[[ThreadSafeLockStore, list[T]], list[LockRecord | Exception]],
+    ) -> list[LockRecord | Exception]:
+        """
+        Runs a batch by splitting it into one batch per shard, with the locks
+        of every shard involved held, then puts the results back in order.
+        """
+        positions: dict[int, list[int]] = {}
+        for position, item in enumerate(items):
+            index = hash(key(item)) % len(self._shards)
+            positions.setdefault(index, []).append(position)
+        results: dict[int, LockRecord | Exception] = {}
+        with self._locked(positions):
+            for index, shard_positions in positions.items():
+                shard_items = [items[position] for position in shard_positions]
+                shard_results = run(self._shards[index], shard_items)
+                results.update(zip(shard_positions, shard_results))
+        return [results[position] for position in range(len(items))]
+
+    def __len__(self) -> int:
+        with self._locked(range(len(self._shards))):
+            return sum(LockStore.__len__(shard) for shard in self._shards)
+
+    def __getitem__(self, key: str) -> LockRecord:
+        return self._shard(key)[key]
+
+    def __setitem__(self, key: str, value: LockRecord) -> None:
+        self._shard(key)[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self._shard(key)[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._shard(key)
+
+    def acquire(
+        self,
+        key: str,
+        expires_in_seconds: int,
+        shared: bool = False,
+        owner: str = "",
+        request_id: str = "",
+    ) -> LockRecord:
+        return self._shard(key).acquire(
+            key, expires_in_seconds, shared, owner, request_id
+        )
+
+    def acquire_wait(
+        self,
+        key: str,
+        expires_in_seconds: int,
+        timeout_seconds: float,
+        shared: bool = False,
+        owner: str = "",
+        request_id: str = "",
+    ) -> LockRecord:
+        return self._shard(key).acquire_wait(
+            key, expires_in_seconds, timeout_seconds, shared, owner, request_id
+        )
+
+    def release(self, key: str, clock: int, request_id: str = "") -> None:
+        self._shard(key).release(key, clock, request_id)
+
+    def renew(self, key: str, clock: int, expires_in_seconds: int) -> LockRecord:
+        return self._shard(key).renew(key, clock, expires_in_seconds)
+
+    def set_not_exists(self, key: str, value: LockRecord) -> None:
+        self._shard(key).set_not_exists(key, value)
+
+    def set_not_exists_many(
+        self, locks: list[LockRecord]
+    ) -> list[LockRecord | Exception]:
+        return self._batch(locks, lambda lock: lock.key, LockStore.set_not_exists_many)
+
+    def acquire_many(
+        self, requests: list[tuple[str, int]]
+    ) -> list[LockRecord | Exception]:
+        return self._batch(requests, lambda request: request[0], LockStore.acquire_many)
+
+    def release_many(
+        self, requests: list[tuple[str, int]]
+    ) -> list[LockRecord | Exception]:
+        def release_many(
+            shard: ThreadSafeLockStore, requests: list[tuple[str, int]]
+        ) -> list[LockRecord | Exception]:
+            results = LockStore.release_many(shard, requests)
+            for (key, _), result in zip(requests, results):
+                if not isinstance(result, Exception):
+                    shard._notify(key)
+            return results
+
+        return self._batch(requests, lambda request: request[0], release_many)
+
+    def get_many(self, keys: list[str]) -> list[LockRecord | Exception]:
+        return self._batch(keys, lambda key: key, LockStore.get_many)
+
+    def page(
+        self, prefix: str = "", start_after: str | None = None, limit: int = 1000
+    ) -> list[LockRecord]:
+        """
+        Each shard is paged on its own, one shard lock at a time, and the pages
+        are merged. A page is therefore not a snapshot of the whole store, but
+        paging with start_after still visits every key that exists throughout.
+        """
+        pages = [shard.page(prefix, start_after, limit) for shard in self._shards]
+        merged = heapq.merge(*pages, key=lambda lock: lock.key)
+        return [lock for _, lock in zip(range(limit), merged)]
+
+    def _by_shard(self, locks: Iterable[LockRecord]) -> list[list[LockRecord]]:
+        shard_locks: list[list[LockRecord]] = [[] for _ in self._shards]
+        for lock in locks:
+            shard_locks[hash(lock.key) % len(self._shards)].append(lock)
+        return shard_locks
+
+    def _requests_by_shard(
+        self, requests: dict[str, tuple[str, int]] | None
+    ) -> list[dict[str, tuple[str, int]]]:
+        shard_requests: list[dict[str, tuple[str, int]]] = [{} for _ in self._shards]
+        for request_id, (key, clock) in (requests or {}).items():
+            shard_requests[hash(key) % len(self._shards)][request_id] = (key, clock)
+        return shard_requests
+
+    def load(
+        self,
+        locks: Iterable[LockRecord],
+        requests: dict[str, tuple[str, int]] | None = None,
+    ) -> None:
+        for shard, locks_in_shard, requests_in_shard in zip(
+            self._shards, self._by_shard(locks), self._requests_by_shard(requests)
+        ):
+            shard.load(locks_in_shard, requests_in_shard)
+
+    def recent_requests(self) -> dict[str, tuple[str, int]]:
+        # One shard at a time, as only requests made before the call matter
+        return {
+            request_id: granted
+            for shard in self._shards
+            for request_id, granted in shard.recent_requests().items()
+        }
+
+    def reset(
+        self,
+        locks: Iterable[LockRecord],
+        requests: dict[str, tuple[str, int]] | None = None,
+    ) -> None:
+        for shard, locks_in_shard, requests_in_shard in zip(
+            self._shards, self._by_shard(locks), self._requests_by_shard(requests)
+        ):
+            shard.reset(locks_in_shard, requests_in_shard)
+
+    def reap(self) -> list[str]:
+        return [key for shard in self._shards for key in shard.reap()]
+
+    def next_expiry_ns(self) -> int | None:
+        expiries = [shard.next_expiry_ns() for shard in self._shards]
+        return min((expiry for expiry in expiries if expiry is not None), default=None)
+
+    def held_count(self) -> int:
+        # One shard at a time, as a gauge does not need a consistent view
+        return sum(shard.held_count() for shard in self._shards)
+
+    def to_list(self) -> list[LockRecord]:
+        with self._locked(range(len(self._shards))):
+            return [lock for shard in self._shards for lock in LockStore.to_list(shard)]
+
+
+class AsyncLockStore(LockStore):
+    """
+    A lock store owned by a single asyncio event loop.
+
+    Every method must be called from the loop's thread. Since none of them
+    awaits while the store is half updated, no two calls can interleave, and
+    the store needs no locks at all. Waiters are futures on the loop, queued
+    per key and woken one at a time, in the order in which they started
+    waiting, when the lock is released or expires.
+
+    If fair, locks are granted strictly in the order in which requests started
+    waiting for them, as in a fair ThreadSafeLockStore.
+    """
+
+    def __init__(self, wal: MutationLog | None = None, fair: bool = False):
+        super().__init__(wal)
+        self._fair = fair
+        self._waiters: dict[str, deque[asyncio.Future[None]]] = {}
+        # How many of the waiters on each key want the lock exclusively
+        self._writers: dict[str, int] = {}
+        # In a fair store, the future each waiter waits on, by ticket in the
+        # order they started waiting
+        self._queues: dict[str, _FairQueue[asyncio.Future[None]]] = {}
+        # As in ThreadSafeLockStore
+        self._granting: str | None = None
+
+    def _notify(self, key: str, everyone: bool = False) -> None:
+        """
+        Wakes the longest waiting coroutine on the key, or all of them.
+        """
+        queue = self._queues.get(key)
+        if queue:
+            for waiter in queue.values():
+                if not waiter.done():
+                    waiter.set_result(None)
+                if not everyone:
+                    return
+            return
+        waiters = self._waiters.get(key, ())
+        # Shared waiters may all get the lock at once, as in
+        # ThreadSafeLockStore._notify
+        everyone = everyone or len(waiters) > self._writers.get(key, 0)
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+                if not everyone:
+                    return
+
+    def _writer_waiting(self, key: str) -> bool:
+        return key in self._writers
+
+    def _queued(self, key: str) -> int:
+        if self._granting == key:
+            return 0
+        return len(self._queues.get(key, ()))
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        # Wake everybody waiting on the key so they can find out it is gone
+        self._notify(key, everyone=True)
+
+    async def acquire_wait(
+        self,
+        key: str,
+        expires_in_seconds: int,
+        timeout_seconds: float,
+        shared: bool = False,
+        owner: str = "",
+        request_id: str = "",
+    ) -> LockRecord:
+        """
+        Acquire the lock, waiting up to timeout_seconds for it to be released
+        or to expire, like ThreadSafeLockStore.acquire_wait but without
+        blocking the event loop.
+        """
+        if self._fair:
+            return await self._acquire_wait_fair(
+                key, expires_in_seconds, timeout_seconds, shared, owner, request_id
+            )
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout_seconds
+        lock = self.acquire(key, expires_in_seconds, shared, owner, request_id)
+        if lock.acquired:
+            return lock
+        # A semaphore's permits are waited for like an exclusive lock
+        shared = shared and not lock.permits
+        if not shared:
+            self._writers[key] = self._writers.get(key, 0) + 1
+        try:
+            while not lock.acquired:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                if shared and key in self._writers:
+                    # Held back by a writer rather than by a lease
+                    timeout = remaining
+                else:
+                    timeout = min(remaining, max(lock.seconds_until_expiry, 0))
+                waiter = loop.create_future()
+                waiters = self._waiters.setdefault(key, deque())
+                waiters.append(waiter)
+                try:
+                    await asyncio.wait_for(waiter, timeout)
+                except TimeoutError:
+                    pass
+                except asyncio.CancelledError:
+                    # Don't swallow a wake up meant for this waiter, pass it on
+                    if waiter.done() and not waiter.cancelled():
+                        self._notify(key)
+                    raise
+                finally:
+                    waiters.remove(waiter)
+                    if not waiters and self._waiters.get(key) is waiters:
+                        del self._waiters[key]
+                lock = self.acquire(key, expires_in_seconds, shared, owner, request_id)
+        finally:
+            if not shared:
+                if self._writers[key] == 1:
+                    del self._writers[key]
+                else:
+                    self._writers[key] -= 1
+                # Readers held back by this writer check again, whether it got
+                # the lock or gave up
+                if len(self._waiters.get(key, ())) > self._writers.get(key, 0):
+                    self._notify(key, everyone=True)
+        return lock
+
+    async def _acquire_wait_fair(
+        self,
+        key: str,
+        expires_in_seconds: int,
+        timeout_seconds: float,
+        shared: bool,
+        owner: str,
+        request_id: str,
+    ) -> LockRecord:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout_seconds
+        lock = self.acquire(key, expires_in_seconds, shared, owner, request_id)
+        if lock.acquired:
+            return lock
+        queue = self._queues.setdefault(key, _FairQueue())
+        ticket = queue.join(loop.create_future())
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if next(iter(queue)) == ticket:
+                    self._granting = key
+                    try:
+                        lock = self.acquire(
+                            key, expires_in_seconds, shared, owner, request_id
+                        )
+                    finally:
+                        self._granting = None
+                    if lock.acquired:
+                        break
+                    timeout = min(remaining, max(lock.seconds_until_expiry, 0))
+                else:
+                    # Only woken once it is next, or the lock is deleted
+                    lock = self._store[key]
+                    timeout = remaining
+                if remaining <= 0:
+                    lock = self._queued_lock(self._store[key], queue.ahead(ticket))
+                    break
+                # A wake up can only come while waiting, so a fresh future
+                # misses none
+                waiter = queue[ticket] = loop.create_future()
+                try:
+                    await asyncio.wait_for(waiter, timeout)
+                except TimeoutError:
+                    pass
+        finally:
+            queue.leave(ticket)
+            if not queue and self._queues.get(key) is queue:
+                del self._queues[key]
+            # The next in line takes its turn, whether this one got the lock,
+            # which it may share, gave up or was cancelled
+            self._notify(key)
+        return lock
+
+    def release(self, key: str, clock: int, request_id: str = "") -> None:
+        super().release(key, clock, request_id)
+        self._notify(key)
+
+    def release_many(
+        self, requests: list[tuple[str, int]]
+    ) -> list[LockRecord | Exception]:
+        results = super().release_many(requests)
+        for (key, _), result in zip(requests, results):
+            if not isinstance(result, Exception):
+                self._notify(key)
+        return results
+
+    def reset(
+        self,
+        locks: Iterable[LockRecord],
+        requests: dict[str, tuple[str, int]] | None = None,
+    ) -> None:
+        super().reset(locks, requests)
+        for key in list(self._waiters):
+            self._notify(key, everyone=True)
+
+    def reap(self) -> list[str]:
+        reaped = super().reap()
+        for key in reaped:
+            self._notify(key)
+        return reaped
@@ -0,0 +1,90 @@
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = "%(levelname)s %(asctime)s.%(msecs)03d %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_listener: QueueListener | None = None
+# The arguments of the latest configure_logging call, for processes started
+# from this one to log the same way
+_settings: tuple[int | str, float] | None = None
+
+
+class SampleFilter(logging.Filter):
+    """
+    Lets through only sample_rate of the records below WARNING, picked at
+    random. Warnings and errors always get through.
+    """
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(f"sample_rate must be between 0 and 1, got {sample_rate}")
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return (
+            record.levelno >= logging.WARNING
+            or self.sample_rate >= 1
+            or random.random() < self.sample_rate
+        )
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Puts records on the queue as they are, unlike QueueHandler, which formats
+    them first. The message is only formatted by the listener's thread, so
+    logging costs the caller little more than creating the record.
+
+    The queue never leaves the process, so there is no need to make records
+    picklable, but arguments must not be changed after they are logged.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_logging(
+    level: int | str = logging.INFO, sample_rate: float = 1.0
+) -> None:
+    """
+    Logs to stderr from a background thread, so that logging a record never
+    waits on I/O. Only sample_rate of the records below WARNING are logged.
+    Replaces the configuration of an earlier call. Call stop_logging to
+    write out the records still queued.
+    """
+    global _listener, _settings
+    stop_logging()
+    _settings = (level, sample_rate)
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SampleFilter(sample_rate))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """
+    Writes out the queued records and stops the background thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def logging_settings() -> tuple[int | str, float] | None:
+    """
+    Returns the level and sample rate logging was last configured with, or
+    None if it was not, to configure a child process the same way.
+    """
+    return _settings
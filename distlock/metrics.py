@@ -0,0 +1,392 @@
+import logging
+import socket
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Protocol
+
+import grpc
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the buckets of the latency histograms. Waiting
+# for a lock can take up to a minute, hence the long tail.
+DEFAULT_LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+# A gauge is a name, a help text and a function that reads its value when the
+# metrics are scraped.
+Gauge = tuple[str, str, Callable[[], float]]
+
+
+class MeasurableLockStore(Protocol):
+    def __len__(self) -> int: ...
+
+    def held_count(self) -> int: ...
+
+
+def lock_store_gauges(lock_store: MeasurableLockStore) -> list[Gauge]:
+    return [
+        ("distlock_locks", "Locks in the lock table.", lock_store.__len__),
+        ("distlock_locks_held", "Locks that are leased out.", lock_store.held_count),
+    ]
+
+
+class _Counts:
+    """
+    The counts recorded by one thread. Only that thread writes to them, so
+    they are updated without taking a lock.
+    """
+
+    def __init__(self) -> None:
+        self.requests: dict[tuple[str, str], int] = {}
+        # Per method, the count of every bucket followed by the sum
+        self.latencies: dict[str, list[float]] = {}
+        self.in_flight: dict[str, int] = {}
+
+
+class RpcMetrics:
+    """
+    Request counts by method and status code, latency histograms by method,
+    and the number of requests in flight by method.
+
+    Every thread records into counts of its own, which are only added up when
+    the metrics are collected, so recording a request never contends with
+    other threads.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._local = threading.local()
+        self._all_counts: list[_Counts] = []
+        self._all_counts_lock = threading.Lock()
+
+    def _counts(self) -> _Counts:
+        try:
+            return self._local.counts
+        except AttributeError:
+            counts = self._local.counts = _Counts()
+            with self._all_counts_lock:
+                self._all_counts.append(counts)
+            return counts
+
+    def started(self, method: str) -> None:
+        in_flight = self._counts().in_flight
+        in_flight[method] = in_flight.get(method, 0) + 1
+
+    def finished(self, method: str, code: str, seconds: float) -> None:
+        counts = self._counts()
+        counts.in_flight[method] -= 1
+        key = (method, code)
+        counts.requests[key] = counts.requests.get(key, 0) + 1
+        latencies = counts.latencies.get(method)
+        if latencies is None:
+            latencies = counts.latencies[method] = [0.0] * (len(self.buckets) + 2)
+        latencies[bisect_left(self.buckets, seconds)] += 1
+        latencies[-1] += seconds
+
+    def collect(
+        self,
+    ) -> tuple[dict[tuple[str, str], int], dict[str, list[float]], dict[str, int]]:
+        """
+        Adds up the counts of every thread into requests, latencies and
+        requests in flight. The counts may be a request or so behind.
+        """
+        with self._all_counts_lock:
+            all_counts = list(self._all_counts)
+        requests: dict[tuple[str, str], int] = {}
+        latencies: dict[str, list[float]] = {}
+        in_flight: dict[str, int] = {}
+        for counts in all_counts:
+            # Copied in one step, as the owning thread may add a key meanwhile
+            for key, count in list(counts.requests.items()):
+                requests[key] = requests.get(key, 0) + count
+            for method, counted in list(counts.latencies.items()):
+                total = latencies.setdefault(method, [0.0] * len(counted))
+                for i, value in enumerate(list(counted)):
+                    total[i] += value
+            for method, count in list(counts.in_flight.items()):
+                in_flight[method] = in_flight.get(method, 0) + count
+        return requests, latencies, in_flight
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def render(rpc_metrics: RpcMetrics, gauges: list[Gauge]) -> str:
+    """
+    Renders the metrics in the Prometheus text exposition format.
+    """
+    requests, latencies, in_flight = rpc_metrics.collect()
+    lines = [
+        "# HELP distlock_rpc_requests_total Requests handled, by method and status code.",
+        "# TYPE distlock_rpc_requests_total counter",
+    ]
+    for (method, code), count in sorted(requests.items()):
+        lines.append(
+            f'distlock_rpc_requests_total{{method="{method}",code="{code}"}} {count}'
+        )
+    lines += [
+        "# HELP distlock_rpc_latency_seconds Time taken to handle requests, by method.",
+        "# TYPE distlock_rpc_latency_seconds histogram",
+    ]
+    for method, counted in sorted(latencies.items()):
+        cumulative = 0.0
+        for bound, bucket_count in zip(rpc_metrics.buckets, counted):
+            cumulative += bucket_count
+            lines.append(
+                f'distlock_rpc_latency_seconds_bucket{{method="{method}",le="{bound}"}} {_format_value(cumulative)}'
+            )
+        cumulative += counted[-2]
+        lines += [
+            f'distlock_rpc_latency_seconds_bucket{{method="{method}",le="+Inf"}} {_format_value(cumulative)}',
+            f'distlock_rpc_latency_seconds_sum{{method="{method}"}} {_format_value(counted[-1])}',
+            f'distlock_rpc_latency_seconds_count{{method="{method}"}} {_format_value(cumulative)}',
+        ]
+    lines += [
+        "# HELP distlock_rpc_in_flight Requests being handled, by method.",
+        "# TYPE distlock_rpc_in_flight gauge",
+    ]
+    for method, count in sorted(in_flight.items()):
+        lines.append(f'distlock_rpc_in_flight{{method="{method}"}} {count}')
+    for name, help, read in gauges:
+        try:
+            value = read()
+        except Exception:
+            logger.exception("Could not read gauge %s", name)
+            continue
+        lines += [
+            f"# HELP {name} {help}",
+            f"# TYPE {name} gauge",
+            f"{name} {_format_value(value)}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def _method_name(handler_call_details: grpc.HandlerCallDetails) -> str:
+    method: str = handler_call_details.method  # type: ignore[attr-defined]
+    return method.rsplit("/", 1)[-1]
+
+
+def _code(context: grpc.ServicerContext, default: grpc.StatusCode) -> str:
+    code = context.code()  # type: ignore[attr-defined]
+    if code is None:
+        code = default
+    return code.name if isinstance(code, grpc.StatusCode) else str(code)
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """
+    Records the method, status code and latency of every request to the
+    threaded server.
+    """
+
+    def __init__(self, rpc_metrics: RpcMetrics):
+        self.rpc_metrics = rpc_metrics
+
+    def intercept_service(
+        self,
+        continuation: Callable[[grpc.HandlerCallDetails], grpc.RpcMethodHandler],
+        handler_call_details: grpc.HandlerCallDetails,
+    ) -> grpc.RpcMethodHandler:
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return handler
+        method = _method_name(handler_call_details)
+        rpc_metrics = self.rpc_metrics
+
+        if handler.unary_unary is not None:
+            unary = handler.unary_unary
+
+            def unary_unary(request: Any, context: grpc.ServicerContext) -> Any:
+                rpc_metrics.started(method)
+                start = time.perf_counter()
+                default = grpc.StatusCode.UNKNOWN
+                try:
+                    response = unary(request, context)
+                    default = grpc.StatusCode.OK
+                    return response
+                finally:
+                    rpc_metrics.finished(
+                        method,
+                        _code(context, default),
+                        time.perf_counter() - start,
+                    )
+
+            return grpc.unary_unary_rpc_method_handler(
+                unary_unary,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer,
+            )
+        if handler.unary_stream is not None:
+            stream = handler.unary_stream
+
+            def unary_stream(
+                request: Any, context: grpc.ServicerContext
+            ) -> Iterator[Any]:
+                rpc_metrics.started(method)
+                start = time.perf_counter()
+                default = grpc.StatusCode.UNKNOWN
+                try:
+                    yield from stream(request, context)
+                    default = grpc.StatusCode.OK
+                finally:
+                    rpc_metrics.finished(
+                        method,
+                        _code(context, default),
+                        time.perf_counter() - start,
+                    )
+
+            return grpc.unary_stream_rpc_method_handler(
+                unary_stream,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer,
+            )
+        return handler
+
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+    """
+    The asyncio counterpart of MetricsInterceptor, for the async server.
+    """
+
+    def __init__(self, rpc_metrics: RpcMetrics):
+        self.rpc_metrics = rpc_metrics
+
+    async def intercept_service(
+        self,
+        continuation: Callable[
+            [grpc.HandlerCallDetails], Awaitable[grpc.RpcMethodHandler]
+        ],
+        handler_call_details: grpc.HandlerCallDetails,
+    ) -> grpc.RpcMethodHandler:
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return handler
+        method = _method_name(handler_call_details)
+        rpc_metrics = self.rpc_metrics
+
+        if handler.unary_unary is not None:
+            unary = handler.unary_unary
+
+            async def unary_unary(
+                request: Any, context: grpc.aio.ServicerContext
+            ) -> Any:
+                rpc_metrics.started(method)
+                start = time.perf_counter()
+                default = grpc.StatusCode.UNKNOWN
+                try:
+                    response = await unary(request, context)
+                    default = grpc.StatusCode.OK
+                    return response
+                finally:
+                    rpc_metrics.finished(
+                        method,
+                        _code(context, default),
+                        time.perf_counter() - start,
+                    )
+
+            return grpc.unary_unary_rpc_method_handler(
+                unary_unary,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer,
+            )
+        if handler.unary_stream is not None:
+            stream = handler.unary_stream
+
+            async def unary_stream(
+                request: Any, context: grpc.aio.ServicerContext
+            ) -> AsyncIterator[Any]:
+                rpc_metrics.started(method)
+                start = time.perf_counter()
+                default = grpc.StatusCode.UNKNOWN
+                try:
+                    async for response in stream(request, context):
+                        yield response
+                    default = grpc.StatusCode.OK
+                finally:
+                    rpc_metrics.finished(
+                        method,
+                        _code(context, default),
+                        time.perf_counter() - start,
+                    )
+
+            return grpc.unary_stream_rpc_method_handler(
+                unary_stream,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer,
+            )
+        return handler
+
+
+class _IPv6HTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_INET6
+
+
+class MetricsServer:
+    """
+    Serves the metrics over HTTP from a background thread, for Prometheus to
+    scrape from /metrics.
+    """
+
+    def __init__(
+        self, rpc_metrics: RpcMetrics, gauges: list[Gauge], address: str, port: int
+    ):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render(rpc_metrics, gauges).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                logger.debug(format, *args)
+
+        # Addresses are given the way gRPC takes them, with IPv6 addresses in
+        # brackets
+        host = address.strip("[]")
+        server_class = _IPv6HTTPServer if ":" in host else ThreadingHTTPServer
+        self._server = server_class((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="distlock-metrics", daemon=True
+        )
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
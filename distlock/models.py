@@ -1,10 +1,12 @@
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Self
 
 from google.protobuf.timestamp_pb2 import Timestamp
 from pydantic import BaseModel
 
-from .exceptions import UnreleasableError
+from .exceptions import LeaseLostError, UnreleasableError
 from .stubs import distlock_pb2
 
 EPOCH_START = datetime(
@@ -14,12 +16,26 @@ EPOCH_START = datetime(
     tzinfo=timezone.utc,
 )
 
+NANOSECONDS_PER_SECOND = 1_000_000_000
+
+# Converts monotonic clock readings to wall clock time for clients. It is
+# sampled once so that expiry on the server is immune to wall clock jumps.
+MONOTONIC_TO_WALL_CLOCK_NS = time.time_ns() - time.monotonic_ns()
+
 
 class Lock(BaseModel):
     key: str = ""
     acquired: bool = False
     clock: int = 0
     expires_at: datetime = EPOCH_START
+    shared: bool = False
+    permits: int = 0
+    # Only set on a lock that was not acquired from a fair server
+    queue_position: int = 0
+    estimated_wait_seconds: float = 0.0
+    # Only set on an exclusive lock acquired with an owner
+    owner: str = ""
+    holds: int = 0
 
     def acquire(self, expires_in_seconds: int) -> None:
         self.acquired = True
@@ -46,6 +62,12 @@ class Lock(BaseModel):
             acquired=lock.acquired,
             clock=lock.clock,
             expires_at=lock.expires_at.ToDatetime(),
+            shared=lock.shared,
+            permits=lock.permits,
+            queue_position=lock.queue_position,
+            estimated_wait_seconds=lock.estimated_wait_seconds,
+            owner=lock.owner,
+            holds=lock.holds,
         )
         return new_lock
 
@@ -57,4 +79,247 @@ class Lock(BaseModel):
             acquired=self.acquired,
             clock=self.clock,
             expires_at=expires_at,
+            shared=self.shared,
+            permits=self.permits,
+            owner=self.owner,
+            holds=self.holds,
+        )
+
+
+@dataclass(slots=True)
+class LockRecord:
+    """
+    The server side representation of a lock.
+
+    This sits on the hot path of every request, so unlike Lock it is a plain
+    slotted record that keeps expiry as a monotonic clock reading in
+    nanoseconds and converts to protobuf without creating datetime objects.
+    An expiry of zero means the lock has never been acquired.
+
+    A lock held in shared mode keeps the expiry of every holder's lease by the
+    holder's clock in readers. Its clock is then the latest holder's, and its
+    expiry the latest any lease runs out, so the lock stays held until the
+    last of them is released or expires.
+
+    A lock created with permits is a counting semaphore, whose holders are
+    kept in readers as well, up to one per permit.
+
+    A lock acquired exclusively with an owner keeps the owner, and how many
+    times the owner holds the lock in holds, which is zero for a lock without
+    an owner. The owner of the last holder is kept once the lock is released.
+    """
+
+    key: str = ""
+    acquired: bool = False
+    clock: int = 0
+    expires_at_ns: int = 0
+    shared: bool = False
+    readers: dict[int, int] | None = None
+    permits: int = 0
+    owner: str = ""
+    holds: int = 0
+
+    def acquire(self, expires_in_seconds: int, owner: str = "") -> None:
+        self.acquired = True
+        self.clock += 1
+        self.expires_at_ns = (
+            time.monotonic_ns() + expires_in_seconds * NANOSECONDS_PER_SECOND
+        )
+        self.owner = owner
+        self.holds = 1 if owner else 0
+        if self.readers is not None:
+            self.shared = False
+            self.readers = None
+
+    def held_by(self, owner: str) -> bool:
+        """
+        Whether owner holds the lock exclusively, with a lease that is live.
+        """
+        return (
+            self.owner == owner
+            and self.acquired
+            and self.readers is None
+            and not self.expired
+        )
+
+    def reenter(self, expires_in_seconds: int) -> None:
+        """
+        Holds the lock once more for its owner, under the same lease and clock,
+        extending the lease if it would run out before expires_in_seconds.
+        """
+        self.holds += 1
+        self.expires_at_ns = max(
+            self.expires_at_ns,
+            time.monotonic_ns() + expires_in_seconds * NANOSECONDS_PER_SECOND,
+        )
+
+    def acquire_shared(self, expires_in_seconds: int) -> "LockRecord":
+        """
+        Adds a shared holder with a lease and clock of its own, and returns the
+        holder's lock. The lock must not be held exclusively.
+        """
+        expires_at_ns = (
+            time.monotonic_ns() + expires_in_seconds * NANOSECONDS_PER_SECOND
+        )
+        if self.readers is None or not self.acquired or self.expired:
+            self.readers = {}
+            self.expires_at_ns = 0
+        self.acquired = True
+        self.shared = True
+        self.clock += 1
+        self.readers[self.clock] = expires_at_ns
+        self.expires_at_ns = max(self.expires_at_ns, expires_at_ns)
+        return LockRecord(self.key, True, self.clock, expires_at_ns, True)
+
+    def acquire_permit(self, expires_in_seconds: int) -> "LockRecord":
+        """
+        Takes one of the permits of a semaphore, with a lease and clock of its
+        own, and returns the holder's lock. If no permit is left, the returned
+        lock is not acquired, and expires when the first lease runs out.
+        """
+        now_ns = time.monotonic_ns()
+        if self.readers is None:
+            self.readers = {}
+        else:
+            # Leases the reaper has yet to get to no longer count
+            for clock, expires_at_ns in list(self.readers.items()):
+                if expires_at_ns <= now_ns:
+                    del self.readers[clock]
+        if len(self.readers) >= self.permits:
+            return LockRecord(
+                self.key,
+                False,
+                self.clock,
+                min(self.readers.values()),
+                permits=self.permits,
+            )
+        expires_at_ns = now_ns + expires_in_seconds * NANOSECONDS_PER_SECOND
+        self.acquired = True
+        self.clock += 1
+        self.readers[self.clock] = expires_at_ns
+        self.expires_at_ns = max(self.readers.values())
+        return LockRecord(
+            self.key, True, self.clock, expires_at_ns, permits=self.permits
+        )
+
+    def drop_reader(self, clock: int) -> None:
+        """
+        Ends the lease of the shared holder or semaphore permit at clock, and
+        releases the lock if it was the last one.
+        """
+        assert self.readers is not None
+        del self.readers[clock]
+        if self.readers:
+            self.expires_at_ns = max(self.readers.values())
+        else:
+            self.acquired = False
+            self.shared = False
+            self.readers = None
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at_ns <= time.monotonic_ns()
+
+    @property
+    def seconds_until_expiry(self) -> float:
+        return (self.expires_at_ns - time.monotonic_ns()) / NANOSECONDS_PER_SECOND
+
+    def release(self, clock: int) -> None:
+        if self.readers is not None:
+            if clock not in self.readers:
+                raise UnreleasableError(
+                    f"Tried to release {'semaphore' if self.permits else 'shared lock'} at clock {clock}, but no holder has that clock. Perhaps client is out of sync?"
+                )
+            self.drop_reader(clock)
+            return
+        if clock != self.clock:
+            raise UnreleasableError(
+                f"Tried to release lock at clock {self.clock}, but given clock {clock}. Perhaps client is out of sync?"
+            )
+        # An owner that acquired the lock again keeps it until it was released
+        # as many times
+        if self.holds > 1:
+            self.holds -= 1
+            return
+        self.acquired = False
+        self.holds = 0
+
+    def renew(self, clock: int, expires_in_seconds: int) -> "LockRecord":
+        """
+        Extends the lease at clock, and returns the lock of its holder.
+        """
+        now_ns = time.monotonic_ns()
+        expires_at_ns = now_ns + expires_in_seconds * NANOSECONDS_PER_SECOND
+        if self.readers is not None:
+            if self.readers.get(clock, 0) <= now_ns:
+                raise LeaseLostError(
+                    f"Tried to renew {'permit' if self.permits else 'shared lease'} at clock {clock}, but no holder has a live lease at that clock"
+                )
+            self.readers[clock] = expires_at_ns
+            self.expires_at_ns = max(self.readers.values())
+            return LockRecord(
+                self.key, True, clock, expires_at_ns, self.shared, permits=self.permits
+            )
+        if clock != self.clock or not self.acquired or self.expired:
+            raise LeaseLostError(
+                f"Tried to renew lease at clock {clock}, but the lease at clock {self.clock} is {'held' if self.acquired and not self.expired else 'not held'}"
+            )
+        self.expires_at_ns = expires_at_ns
+        return self
+
+    def copy(self) -> "LockRecord":
+        return LockRecord(
+            self.key,
+            self.acquired,
+            self.clock,
+            self.expires_at_ns,
+            self.shared,
+            None if self.readers is None else dict(self.readers),
+            self.permits,
+            self.owner,
+            self.holds,
+        )
+
+    def to_pb(self) -> distlock_pb2.Lock:
+        if self.expires_at_ns:
+            seconds, nanos = divmod(
+                self.expires_at_ns + MONOTONIC_TO_WALL_CLOCK_NS,
+                NANOSECONDS_PER_SECOND,
+            )
+            expires_at = Timestamp(seconds=seconds, nanos=nanos)
+        else:
+            expires_at = Timestamp()
+        lock = distlock_pb2.Lock(
+            key=self.key,
+            acquired=self.acquired,
+            clock=self.clock,
+            expires_at=expires_at,
         )
+        # Set apart, as every keyword argument costs, and most locks are
+        # neither shared nor semaphores
+        if self.shared:
+            lock.shared = True
+        if self.permits:
+            lock.permits = self.permits
+        if self.owner:
+            lock.owner = self.owner
+            lock.holds = self.holds
+        return lock
+
+
+@dataclass(slots=True)
+class QueuedLockRecord(LockRecord):
+    """
+    The lock returned to a request turned down by a fair lock store because
+    others queue for the lock, with how many requests are ahead and a guess
+    at how long they will take, in nanoseconds, or zero if there is no guess.
+    """
+
+    queue_position: int = 0
+    estimated_wait_ns: int = 0
+
+    def to_pb(self) -> distlock_pb2.Lock:
+        lock = LockRecord.to_pb(self)
+        lock.queue_position = self.queue_position
+        lock.estimated_wait_seconds = self.estimated_wait_ns / NANOSECONDS_PER_SECOND
+        return lock
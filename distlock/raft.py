@@ -0,0 +1,1053 @@
+import io
+import logging
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Protocol
+
+import grpc
+
+from .models import LockRecord
+from .snapshot import dump_snapshot, parse_snapshot, snapshot_path, snapshots
+from .stubs import distlock_pb2, distlock_pb2_grpc
+from .wal import FRAME, decode, decode_request, frame, fsync_dir, remember_request
+
+ELECTION_TIMEOUT_SECONDS = (1.0, 2.0)
+HEARTBEAT_SECONDS = 0.1
+RPC_TIMEOUT_SECONDS = 1.0
+MAX_ENTRIES_PER_APPEND = 1_000
+# Sent along with UNAVAILABLE by a node that is not the leader, so that the
+# client can retry on the leader. Empty while there is no known leader.
+LEADER_METADATA_KEY = "distlock-leader"
+# Peers that go away are reconnected to promptly, rather than after gRPC's
+# default backoff of up to two minutes, so that a node that restarts rejoins
+# the cluster as soon as it is back
+PEER_CHANNEL_OPTIONS = [
+    ("grpc.initial_reconnect_backoff_ms", 100),
+    ("grpc.min_reconnect_backoff_ms", 100),
+    ("grpc.max_reconnect_backoff_ms", 1_000),
+]
+
+STATE_FILE = "raft-state"
+# The log before the first snapshot, and after it the log starting at the last
+# index of the snapshot, which is named after it as in raft-<index>.log
+LOG_FILE = "raft.log"
+LOG_PREFIX = "raft-"
+LOG_SUFFIX = ".log"
+# The state file holds the current term followed by the UTF-8 id of the node
+# voted for in it, if any, and each entry of the log file the entry's term
+# followed by its body, both framed as in the write-ahead log. Snapshots are
+# written as by the snapshotter of a single server.
+TERM = struct.Struct("<q")
+# The log is compacted into a snapshot once it has this many committed entries
+# beyond the latest snapshot, or more if there are more locks than that, so
+# that writing a snapshot costs a few entries' worth of work per entry
+SNAPSHOT_ENTRIES = 10_000
+# Snapshots are sent to followers in chunks of this size, well below gRPC's
+# default limit on the size of a message
+SNAPSHOT_CHUNK_BYTES = 1 << 20
+SNAPSHOT_RETRY_SECONDS = 1.0
+
+FOLLOWER = "follower"
+CANDIDATE = "candidate"
+LEADER = "leader"
+
+logger = logging.getLogger(__name__)
+
+
+class NotLeaderError(Exception):
+    def __init__(self, leader_id: str | None):
+        super().__init__(f"Not the leader, the leader is {leader_id or 'unknown'}")
+        self.leader_id = leader_id
+
+
+class ResettableLockStore(Protocol):
+    def reset(
+        self,
+        locks: Iterable[LockRecord],
+        requests: dict[str, tuple[str, int]] | None = None,
+    ) -> None: ...
+
+
+@dataclass(slots=True)
+class Entry:
+    term: int
+    body: bytes
+
+
+class RaftStorage:
+    """
+    Keeps the term, vote, log and latest snapshot of a node in data_dir, so
+    that a node that restarts neither votes twice in a term nor loses entries
+    it told a leader it has.
+
+    The term and vote are written to a new file that is renamed over the old
+    one whenever they change. The log is an append-only file, truncated when a
+    leader replaces entries that conflict with its own. It is compacted by
+    writing a snapshot of the lock table, then a new log file named after the
+    last index the snapshot covers, which starts with the entry at that index,
+    and only then removing the old snapshot and log. Each file is written
+    under a temporary name and renamed into place, so whatever a crash leaves
+    behind, the latest snapshot that has its log file is complete.
+    """
+
+    def __init__(self, data_dir: Path):
+        self.data_dir = data_dir
+        self._state_path = data_dir / STATE_FILE
+        # The index of the first entry in the log file, which is the last
+        # index the snapshot covers, or 0 before the first snapshot
+        self._start = 0
+        self._log_path = log_path(data_dir, 0)
+        # Where each entry of the log ends in the file, by position from the
+        # start
+        self._ends = [0]
+        self._fd = -1
+
+    def load(self) -> tuple[int, str | None, int, bytes, list[Entry]]:
+        """
+        Returns the term, vote, snapshot and log kept in data_dir, and opens
+        the log for appending. The snapshot is returned along with the last
+        index it covers, and the log starts with the entry at that index, or
+        with a placeholder at index 0 if there is no snapshot.
+        """
+        term = 0
+        voted_for = None
+        if self._state_path.exists():
+            state = self._state_path.read_bytes()
+            length, crc = FRAME.unpack_from(state)
+            body = state[FRAME.size : FRAME.size + length]
+            # The file is renamed into place once complete, so a mismatch is
+            # damage rather than an interrupted write
+            if len(body) < length or zlib.crc32(body) != crc:
+                raise ValueError(f"{self._state_path} is corrupt")
+            (term,) = TERM.unpack_from(body)
+            voted_for = body[TERM.size :].decode() or None
+        snapshot = b""
+        for index, path in reversed(snapshots(self.data_dir)):
+            if log_path(self.data_dir, index).exists():
+                self._start = index
+                snapshot = path.read_bytes()
+                break
+        self._log_path = log_path(self.data_dir, self._start)
+        # Left behind by a compaction that a crash interrupted
+        self._remove_other_files()
+        entries = [] if self._start else [Entry(0, b"")]
+        self._ends = [] if self._start else [0]
+        data = memoryview(
+            self._log_path.read_bytes() if self._log_path.exists() else b""
+        )
+        offset = 0
+        while offset + FRAME.size <= len(data):
+            length, crc = FRAME.unpack_from(data, offset)
+            record = data[offset + FRAME.size : offset + FRAME.size + length]
+            if len(record) < length or zlib.crc32(record) != crc:
+                break
+            (entry_term,) = TERM.unpack_from(record)
+            entries.append(Entry(entry_term, bytes(record[TERM.size :])))
+            offset += FRAME.size + length
+            self._ends.append(offset)
+        if not entries:
+            raise ValueError(f"{self._log_path} is corrupt")
+        self._fd = os.open(
+            self._log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o666
+        )
+        if offset < len(data):
+            # Entries are only acknowledged once synced, so these never were
+            logger.warning(
+                f"Dropping {len(data) - offset} bytes of incomplete entries from the end of {self._log_path}"
+            )
+            os.ftruncate(self._fd, offset)
+        fsync_dir(self.data_dir)
+        return term, voted_for, self._start, snapshot, entries
+
+    def save_state(self, term: int, voted_for: str | None) -> None:
+        path = self._state_path.with_name(f"{STATE_FILE}.tmp")
+        with path.open("wb") as file:
+            file.write(frame(TERM.pack(term) + (voted_for or "").encode()))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path, self._state_path)
+        fsync_dir(self.data_dir)
+
+    def append(self, entries: list[Entry]) -> None:
+        """
+        Writes entries after the last one in the file, without waiting for
+        them to reach the disk.
+        """
+        start = self._ends[-1]
+        data = bytearray()
+        for entry in entries:
+            data += frame(TERM.pack(entry.term) + entry.body)
+            self._ends.append(start + len(data))
+        os.write(self._fd, data)
+
+    def truncate(self, index: int) -> None:
+        """
+        Drops the entries from index on.
+        """
+        position = index - self._start
+        os.ftruncate(self._fd, self._ends[position - 1])
+        del self._ends[position:]
+
+    def compact(self, index: int, snapshot: bytes, entries: list[Entry]) -> None:
+        """
+        Replaces everything kept with snapshot, which covers the log up to
+        index, and entries, which start with the entry at index.
+        """
+        _write_file(snapshot_path(self.data_dir, index), snapshot)
+        path = log_path(self.data_dir, index)
+        data = bytearray()
+        ends = []
+        for entry in entries:
+            data += frame(TERM.pack(entry.term) + entry.body)
+            ends.append(len(data))
+        _write_file(path, data)
+        os.close(self._fd)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        self._start = index
+        self._log_path = path
+        self._ends = ends
+        self._remove_other_files()
+
+    def sync(self) -> None:
+        os.fsync(self._fd)
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _remove_other_files(self) -> None:
+        for index, path in snapshots(self.data_dir) + log_files(self.data_dir):
+            if index != self._start:
+                path.unlink()
+        for path in self.data_dir.glob("*.tmp"):
+            path.unlink()
+
+
+def log_path(data_dir: Path, start: int) -> Path:
+    """
+    The path of the log file that starts at index start.
+    """
+    if not start:
+        return data_dir / LOG_FILE
+    return data_dir / f"{LOG_PREFIX}{start:020d}{LOG_SUFFIX}"
+
+
+def log_files(data_dir: Path) -> list[tuple[int, Path]]:
+    """
+    Returns the index each log file in data_dir starts at, and its path.
+    """
+    found = []
+    if (data_dir / LOG_FILE).exists():
+        found.append((0, data_dir / LOG_FILE))
+    for path in data_dir.glob(f"{LOG_PREFIX}*{LOG_SUFFIX}"):
+        start = path.name[len(LOG_PREFIX) : -len(LOG_SUFFIX)]
+        if start.isdigit():
+            found.append((int(start), path))
+    return sorted(found)
+
+
+def _write_file(path: Path, data: bytes | bytearray) -> None:
+    """
+    Writes data to a new file at path, which replaces any file already there
+    only once it is complete and durable.
+    """
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open("wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(path.parent)
+
+
+def _apply(
+    entries: Iterable[Entry],
+    locks: dict[str, LockRecord],
+    requests: dict[str, tuple[str, int]],
+) -> None:
+    """
+    Applies entries to the table of locks, remembering their request ids.
+    """
+    for entry in entries:
+        if not entry.body:
+            continue
+        key, lock = decode(entry.body)
+        if lock is None:
+            locks.pop(key, None)
+        else:
+            locks[key] = lock
+        request = decode_request(entry.body)
+        if request is not None:
+            remember_request(requests, request[0], key, request[1])
+
+
+class RaftNode:
+    """
+    One node of a cluster that replicates lock changes with Raft. node_id is
+    the address clients reach the node's lock service on, which followers
+    hand out to redirect clients to the leader, and peers are the Raft
+    addresses of the other nodes.
+
+    The node is the lock store's log: the leader's store appends the put and
+    delete entries of every change as it applies it, exactly as it would to
+    the write-ahead log, and sync() returns once they are committed, that is
+    once a majority of the cluster has them. Entries carry the outcome of a
+    change rather than the request, so that applying them does not depend on
+    the clock of the node applying them, and clocks are carried over to the
+    next leader as they are.
+
+    Followers only apply committed entries to a table of their own. A node that
+    wins an election loads that table, plus whatever it has beyond the commit
+    index, into its store before it serves requests, so that it carries on
+    from every lease a previous leader granted.
+
+    Once enough entries are committed, a node compacts its log into a
+    snapshot of the committed table, from a thread of its own, and drops the
+    entries the snapshot covers. A leader sends its snapshot to a follower
+    that needs entries it dropped.
+
+    If data_dir is given, the node keeps its term, vote, log and snapshot
+    there and picks up from them when it restarts, so that a committed change
+    survives the whole cluster going down. Nodes count themselves towards a
+    majority only for entries they have synced. Without data_dir, all of it
+    is only kept in memory, and a committed change survives only as long as a
+    majority of the cluster stays up.
+    """
+
+    def __init__(
+        self,
+        node_id: str,
+        peers: list[str],
+        election_timeout_seconds: tuple[float, float] = ELECTION_TIMEOUT_SECONDS,
+        heartbeat_seconds: float = HEARTBEAT_SECONDS,
+        data_dir: Path | None = None,
+        snapshot_entries: int = SNAPSHOT_ENTRIES,
+    ):
+        self.node_id = node_id
+        self._peers = peers
+        self._election_timeout_seconds = election_timeout_seconds
+        self._heartbeat_seconds = heartbeat_seconds
+        self._snapshot_entries = snapshot_entries
+        self._lock = threading.Lock()
+        # Notified whenever the log, the commit index or the node's role changes
+        self._changed = threading.Condition(self._lock)
+        self._term = 0
+        self._voted_for: str | None = None
+        # Log indexes start at 1. The log starts with the last entry the
+        # latest snapshot covers, at _snapshot_index, with its body dropped,
+        # or before the first snapshot with an entry at 0 that only
+        # simplifies bookkeeping.
+        self._log = [Entry(0, b"")]
+        self._snapshot_index = 0
+        # The snapshot, encoded as in a snapshot file, and the snapshot a
+        # leader is sending the node, as received so far
+        self._snapshot = b""
+        self._incoming_snapshot = bytearray()
+        self._committed: dict[str, LockRecord] = {}
+        # The (key, clock) each recent request id in the committed entries was
+        # granted or released, so that a new leader recognizes retries
+        self._committed_requests: dict[str, tuple[str, int]] = {}
+        self._storage: RaftStorage | None = None
+        if data_dir is not None:
+            self._storage = RaftStorage(data_dir)
+            (
+                self._term,
+                self._voted_for,
+                self._snapshot_index,
+                self._snapshot,
+                self._log,
+            ) = self._storage.load()
+            if self._snapshot:
+                self._committed = parse_snapshot(
+                    self._snapshot,
+                    self._committed_requests,
+                    f"Snapshot {snapshot_path(data_dir, self._snapshot_index)}",
+                )
+        # The last entry of the leader's own log known to be synced, and one
+        # sync at a time so that the syncs of concurrent requests are shared.
+        # The log is only compacted or replaced with both locks held.
+        self._synced_index = 0
+        self._sync_lock = threading.Lock()
+        self._commit_index = self._snapshot_index
+        self._state = FOLLOWER
+        self._leader_id: str | None = None
+        self._ready = False
+        self._next_index: dict[str, int] = {}
+        self._match_index: dict[str, int] = {}
+        # When each peer last answered the leader, so that a leader cut off from
+        # the majority notices and stops accepting requests it cannot commit
+        self._last_contact: dict[str, float] = {}
+        self._election_deadline = 0.0
+        self._reset_election_deadline()
+        self._stopped = False
+        self._lock_store: ResettableLockStore | None = None
+        self._channels = [
+            grpc.insecure_channel(peer, options=PEER_CHANNEL_OPTIONS)
+            for peer in self._peers
+        ]
+        self._stubs = {
+            peer: distlock_pb2_grpc.RaftStub(channel)
+            for peer, channel in zip(self._peers, self._channels)
+        }
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(len(self._peers), 1), thread_name_prefix="distlock-raft"
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="distlock-raft", daemon=True
+        )
+        self._snapshot_thread = threading.Thread(
+            target=self._snapshot_forever, name="distlock-raft-snapshot", daemon=True
+        )
+
+    @property
+    def is_leader(self) -> bool:
+        """
+        Whether the node is the leader and ready to serve requests.
+        """
+        return self._state == LEADER and self._ready
+
+    @property
+    def leader_id(self) -> str | None:
+        """
+        The node clients should go to, or None while there is none to go to,
+        including while a new leader loads its store, so that clients back off
+        rather than being sent back to it straight away.
+        """
+        if self._state == LEADER:
+            return self.node_id if self._ready else None
+        return self._leader_id
+
+    @property
+    def term(self) -> int:
+        return self._term
+
+    @property
+    def commit_index(self) -> int:
+        return self._commit_index
+
+    def start(self, lock_store: ResettableLockStore) -> None:
+        self._lock_store = lock_store
+        self._thread.start()
+        self._snapshot_thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stopped = True
+            self._state = FOLLOWER
+            self._ready = False
+            self._changed.notify_all()
+        if self._thread.ident is not None:
+            self._thread.join()
+        if self._snapshot_thread.ident is not None:
+            self._snapshot_thread.join()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for channel in self._channels:
+            channel.close()
+        if self._storage is not None:
+            with self._sync_lock, self._lock:
+                self._storage.close()
+
+    def append(self, body: bytes) -> None:
+        with self._lock:
+            if self._state != LEADER:
+                raise NotLeaderError(self._leader_id)
+            entry = Entry(self._term, body)
+            if self._storage is not None:
+                self._storage.append([entry])
+            self._log.append(entry)
+            self._advance_commit_index()
+            self._changed.notify_all()
+
+    def sync(self) -> None:
+        """
+        Waits until everything appended so far is committed. Raises
+        NotLeaderError if the node loses its leadership first, in which case
+        the changes may or may not be committed by the next leader.
+        """
+        with self._lock:
+            target = self._last_index()
+            term = self._term
+        self._sync_entries(term)
+        with self._lock:
+            while (
+                self._commit_index < target
+                and self._state == LEADER
+                and self._term == term
+            ):
+                self._changed.wait()
+            if self._state != LEADER or self._term != term:
+                raise NotLeaderError(self._leader_id)
+
+    def request_vote(
+        self, request: distlock_pb2.RequestVoteRequest
+    ) -> distlock_pb2.RequestVoteResponse:
+        with self._lock:
+            if request.term > self._term:
+                self._step_down(request.term)
+            last_log = (self._log[-1].term, self._last_index())
+            granted = (
+                request.term == self._term
+                and self._voted_for in (None, request.candidate_id)
+                and (request.last_log_term, request.last_log_index) >= last_log
+            )
+            if granted:
+                self._voted_for = request.candidate_id
+                self._save_state()
+                self._reset_election_deadline()
+            return distlock_pb2.RequestVoteResponse(
+                term=self._term, vote_granted=granted
+            )
+
+    def append_entries(
+        self, request: distlock_pb2.AppendEntriesRequest
+    ) -> distlock_pb2.AppendEntriesResponse:
+        with self._lock:
+            if request.term < self._term:
+                return distlock_pb2.AppendEntriesResponse(
+                    term=self._term, success=False, last_log_index=self._last_index()
+                )
+            if request.term > self._term or self._state != FOLLOWER:
+                self._step_down(request.term)
+            self._leader_id = request.leader_id
+            self._reset_election_deadline()
+            prev_index = request.prev_log_index
+            # Entries the snapshot covers are committed, so they match the
+            # leader's
+            if prev_index > self._last_index() or (
+                prev_index > self._snapshot_index
+                and self._entry(prev_index).term != request.prev_log_term
+            ):
+                return distlock_pb2.AppendEntriesResponse(
+                    term=self._term,
+                    success=False,
+                    last_log_index=min(self._last_index() + 1, prev_index) - 1,
+                )
+            index = prev_index
+            appended = []
+            for entry in request.entries:
+                index += 1
+                if index <= self._snapshot_index:
+                    continue
+                if index <= self._last_index():
+                    if self._entry(index).term == entry.term:
+                        continue
+                    # Entries that conflict with the leader were never committed
+                    del self._log[index - self._snapshot_index :]
+                    if self._storage is not None:
+                        self._storage.truncate(index)
+                appended.append(Entry(entry.term, entry.body))
+                self._log.append(appended[-1])
+            if appended and self._storage is not None:
+                # The leader counts the entries as replicated once told so
+                self._storage.append(appended)
+                self._storage.sync()
+            # The entries sent may end before those the snapshot covers
+            commit_index = min(request.leader_commit, index)
+            if commit_index > self._commit_index:
+                self._commit(commit_index)
+            return distlock_pb2.AppendEntriesResponse(
+                term=self._term, success=True, last_log_index=index
+            )
+
+    def install_snapshot(
+        self, request: distlock_pb2.InstallSnapshotRequest
+    ) -> distlock_pb2.InstallSnapshotResponse:
+        # Both locks, since the log may be replaced, as in a compaction
+        with self._sync_lock, self._lock:
+            if request.term < self._term:
+                return distlock_pb2.InstallSnapshotResponse(
+                    term=self._term, success=False
+                )
+            if request.term > self._term or self._state != FOLLOWER:
+                self._step_down(request.term)
+            self._leader_id = request.leader_id
+            self._reset_election_deadline()
+            if request.offset == 0:
+                self._incoming_snapshot = bytearray()
+            elif request.offset != len(self._incoming_snapshot):
+                return distlock_pb2.InstallSnapshotResponse(
+                    term=self._term, success=False
+                )
+            self._incoming_snapshot += request.data
+            if not request.done:
+                return distlock_pb2.InstallSnapshotResponse(
+                    term=self._term, success=True
+                )
+            snapshot = bytes(self._incoming_snapshot)
+            self._incoming_snapshot = bytearray()
+            index = request.last_included_index
+            # Otherwise the node already has everything the snapshot covers
+            if index > self._commit_index:
+                requests: dict[str, tuple[str, int]] = {}
+                locks = parse_snapshot(
+                    snapshot, requests, f"Snapshot from {request.leader_id}"
+                )
+                # Entries beyond the snapshot are kept if the log agrees with
+                # the leader's up to it
+                entries = []
+                if (
+                    index <= self._last_index()
+                    and self._entry(index).term == request.last_included_term
+                ):
+                    entries = self._log[index - self._snapshot_index + 1 :]
+                self._compact(index, request.last_included_term, snapshot, entries)
+                self._committed = locks
+                self._committed_requests = requests
+                self._commit_index = index
+                self._changed.notify_all()
+            return distlock_pb2.InstallSnapshotResponse(term=self._term, success=True)
+
+    def _last_index(self) -> int:
+        return self._snapshot_index + len(self._log) - 1
+
+    def _entry(self, index: int) -> Entry:
+        return self._log[index - self._snapshot_index]
+
+    def _compact(
+        self, index: int, term: int, snapshot: bytes, entries: list[Entry]
+    ) -> None:
+        """
+        Must be called with both locks held. Replaces the log up to index,
+        whose entry is of term, with snapshot, and the rest of it with entries.
+        """
+        log = [Entry(term, b"")] + entries
+        if self._storage is not None:
+            self._storage.compact(index, snapshot, log)
+        self._log = log
+        self._snapshot_index = index
+        self._snapshot = snapshot
+
+    def _snapshot_forever(self) -> None:
+        while True:
+            with self._lock:
+                while (
+                    not self._stopped
+                    and self._commit_index - self._snapshot_index
+                    < max(self._snapshot_entries, len(self._committed))
+                ):
+                    self._changed.wait()
+                if self._stopped:
+                    return
+                index = self._commit_index
+                locks = list(self._committed.values())
+                requests = dict(self._committed_requests)
+            # Encoded outside of the node's lock, as only copying the table
+            # has to hold it
+            file = io.BytesIO()
+            dump_snapshot(file, [locks], requests)
+            with self._sync_lock, self._lock:
+                # A snapshot from the leader may have overtaken this one
+                if self._stopped or index <= self._snapshot_index:
+                    continue
+                try:
+                    self._compact(
+                        index,
+                        self._entry(index).term,
+                        file.getvalue(),
+                        self._log[index - self._snapshot_index + 1 :],
+                    )
+                except OSError:
+                    logger.exception("Could not compact the log")
+                else:
+                    logger.info(f"Compacted the log up to index {index}")
+                    continue
+            time.sleep(SNAPSHOT_RETRY_SECONDS)
+
+    def _reset_election_deadline(self) -> None:
+        self._election_deadline = time.monotonic() + random.uniform(
+            *self._election_timeout_seconds
+        )
+
+    def _save_state(self) -> None:
+        """
+        Must be called with the lock held, whenever the term or vote changes
+        and before anyone is told of it.
+        """
+        if self._storage is not None:
+            self._storage.save_state(self._term, self._voted_for)
+
+    def _step_down(self, term: int) -> None:
+        if term > self._term:
+            self._term = term
+            self._voted_for = None
+            self._leader_id = None
+            self._save_state()
+        if self._state != FOLLOWER:
+            logger.info(f"Stepping down as {self._state} in term {self._term}")
+        self._state = FOLLOWER
+        self._ready = False
+        self._reset_election_deadline()
+        self._changed.notify_all()
+
+    def _commit(self, index: int) -> None:
+        start = self._commit_index + 1 - self._snapshot_index
+        _apply(
+            self._log[start : index + 1 - self._snapshot_index],
+            self._committed,
+            self._committed_requests,
+        )
+        self._commit_index = index
+        self._changed.notify_all()
+
+    def _advance_commit_index(self) -> None:
+        """
+        Commits up to the latest entry of the current term that a majority of
+        the cluster has. Entries of earlier terms are committed along with it.
+        """
+        majority = (len(self._peers) + 1) // 2 + 1
+        for index in range(self._last_index(), self._commit_index, -1):
+            if self._entry(index).term != self._term:
+                return
+            synced = self._storage is None or index <= self._synced_index
+            replicas = synced + sum(
+                match >= index for match in self._match_index.values()
+            )
+            if replicas >= majority:
+                self._commit(index)
+                return
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if self._stopped:
+                    return
+                if self._state == LEADER:
+                    if not self._has_quorum():
+                        logger.warning(
+                            f"Lost contact with the majority of the cluster in term {self._term}"
+                        )
+                        self._step_down(self._term)
+                        continue
+                    self._changed.wait(self._heartbeat_seconds)
+                    continue
+                remaining = self._election_deadline - time.monotonic()
+                if remaining > 0:
+                    self._changed.wait(remaining)
+                    continue
+                self._term += 1
+                self._state = CANDIDATE
+                self._voted_for = self.node_id
+                self._leader_id = None
+                self._save_state()
+                self._reset_election_deadline()
+                term = self._term
+                request = distlock_pb2.RequestVoteRequest(
+                    term=term,
+                    candidate_id=self.node_id,
+                    last_log_index=self._last_index(),
+                    last_log_term=self._log[-1].term,
+                )
+            logger.info(f"Starting election for term {term}")
+            votes = 1 + sum(
+                self._executor.map(
+                    lambda peer, request=request: self._ask_for_vote(peer, request),
+                    self._peers,
+                )
+            )
+            with self._lock:
+                if self._state != CANDIDATE or self._term != term:
+                    continue
+                if votes <= (len(self._peers) + 1) // 2:
+                    continue
+                locks, requests = self._become_leader()
+            self._load_store(term, locks, requests)
+
+    def _has_quorum(self) -> bool:
+        since = time.monotonic() - self._election_timeout_seconds[1]
+        replicas = 1 + sum(contact >= since for contact in self._last_contact.values())
+        return replicas >= (len(self._peers) + 1) // 2 + 1
+
+    def _sync_entries(self, term: int) -> None:
+        """
+        Syncs the entries the node appended as the leader of term, so that it
+        counts itself among the nodes that have them.
+        """
+        if self._storage is None:
+            return
+        with self._sync_lock:
+            with self._lock:
+                if self._state != LEADER or self._term != term:
+                    return
+                index = self._last_index()
+                if index <= self._synced_index:
+                    return
+            # Outside of the node's lock, so that entries are appended while
+            # earlier ones are synced, and synced together next
+            self._storage.sync()
+            with self._lock:
+                # A leader only appends, so the entries are still there
+                if self._state == LEADER and self._term == term:
+                    self._synced_index = index
+                    self._advance_commit_index()
+
+    def _ask_for_vote(
+        self, peer: str, request: distlock_pb2.RequestVoteRequest
+    ) -> bool:
+        try:
+            response = self._stubs[peer].RequestVote(
+                request, timeout=RPC_TIMEOUT_SECONDS
+            )
+        except grpc.RpcError:
+            return False
+        with self._lock:
+            if response.term > self._term:
+                self._step_down(response.term)
+        return response.vote_granted
+
+    def _become_leader(
+        self,
+    ) -> tuple[list[LockRecord], dict[str, tuple[str, int]]]:
+        """
+        Must be called with the lock held. Returns the locks the new leader's
+        store must start with, and the request ids it must remember.
+        """
+        logger.info(f"Elected leader for term {self._term}")
+        self._state = LEADER
+        self._leader_id = self.node_id
+        self._next_index = {peer: self._last_index() + 1 for peer in self._peers}
+        self._match_index = {peer: 0 for peer in self._peers}
+        self._last_contact = {peer: time.monotonic() for peer in self._peers}
+        locks = dict(self._committed)
+        requests = dict(self._committed_requests)
+        _apply(
+            self._log[self._commit_index + 1 - self._snapshot_index :], locks, requests
+        )
+        # Committing an entry of its own term also commits everything before
+        # it, including any entries of earlier terms the leader has
+        entry = Entry(self._term, b"")
+        if self._storage is not None:
+            self._storage.append([entry])
+            self._storage.sync()
+        self._log.append(entry)
+        self._synced_index = self._last_index()
+        self._advance_commit_index()
+        for peer in self._peers:
+            threading.Thread(
+                target=self._replicate,
+                args=(peer, self._term),
+                name=f"distlock-raft-{peer}",
+                daemon=True,
+            ).start()
+        return [lock.copy() for lock in locks.values()], requests
+
+    def _load_store(
+        self,
+        term: int,
+        locks: list[LockRecord],
+        requests: dict[str, tuple[str, int]],
+    ) -> None:
+        assert self._lock_store is not None
+        # The store's locks are taken outside of the node's lock, since the
+        # store holds its own locks while it appends to the node.
+        self._lock_store.reset(locks, requests)
+        with self._lock:
+            if self._state == LEADER and self._term == term:
+                self._ready = True
+                logger.info(
+                    f"Serving as leader for term {term} with {len(locks)} locks"
+                )
+
+    def _replicate(self, peer: str, term: int) -> None:
+        stub = self._stubs[peer]
+        while True:
+            # Syncs the leader's no-op, which no request waits on, and
+            # entries whose request has not called sync() yet, so that
+            # followers get them without waiting for that request
+            self._sync_entries(term)
+            with self._lock:
+                if self._stopped or self._state != LEADER or self._term != term:
+                    return
+                next_index = self._next_index[peer]
+                if next_index <= self._snapshot_index:
+                    # The peer needs entries the snapshot replaced
+                    snapshot = (
+                        self._snapshot_index,
+                        self._log[0].term,
+                        self._snapshot,
+                    )
+                else:
+                    snapshot = None
+                    prev_index = next_index - 1
+                    start = next_index - self._snapshot_index
+                    request = distlock_pb2.AppendEntriesRequest(
+                        term=term,
+                        leader_id=self.node_id,
+                        prev_log_index=prev_index,
+                        prev_log_term=self._entry(prev_index).term,
+                        entries=[
+                            distlock_pb2.LogEntry(term=entry.term, body=entry.body)
+                            for entry in self._log[
+                                start : start + MAX_ENTRIES_PER_APPEND
+                            ]
+                        ],
+                        leader_commit=self._commit_index,
+                    )
+            if snapshot is not None:
+                self._send_snapshot(peer, term, *snapshot)
+                continue
+            try:
+                response = stub.AppendEntries(request, timeout=RPC_TIMEOUT_SECONDS)
+            except grpc.RpcError:
+                response = None
+            with self._lock:
+                if self._stopped or self._state != LEADER or self._term != term:
+                    return
+                if response is None:
+                    self._changed.wait(self._heartbeat_seconds)
+                    continue
+                self._last_contact[peer] = time.monotonic()
+                if response.term > self._term:
+                    self._step_down(response.term)
+                    return
+                if not response.success:
+                    self._next_index[peer] = max(
+                        1, min(next_index - 1, response.last_log_index + 1)
+                    )
+                    continue
+                match_index = prev_index + len(request.entries)
+                self._match_index[peer] = max(self._match_index[peer], match_index)
+                self._next_index[peer] = match_index + 1
+                self._advance_commit_index()
+                if self._next_index[peer] > self._last_index():
+                    self._changed.wait(self._heartbeat_seconds)
+
+    def _send_snapshot(
+        self, peer: str, term: int, index: int, last_term: int, snapshot: bytes
+    ) -> None:
+        """
+        Sends peer the snapshot that covers the log up to index, whose entry is
+        of last_term, a chunk at a time, and carries on replicating from just
+        past it once the peer has it all.
+        """
+        offset = 0
+        while True:
+            chunk = snapshot[offset : offset + SNAPSHOT_CHUNK_BYTES]
+            done = offset + len(chunk) >= len(snapshot)
+            request = distlock_pb2.InstallSnapshotRequest(
+                term=term,
+                leader_id=self.node_id,
+                last_included_index=index,
+                last_included_term=last_term,
+                offset=offset,
+                data=chunk,
+                done=done,
+            )
+            try:
+                response = self._stubs[peer].InstallSnapshot(
+                    request, timeout=RPC_TIMEOUT_SECONDS
+                )
+            except grpc.RpcError:
+                response = None
+            with self._lock:
+                if self._stopped or self._state != LEADER or self._term != term:
+                    return
+                if response is None:
+                    self._changed.wait(self._heartbeat_seconds)
+                    return
+                self._last_contact[peer] = time.monotonic()
+                if response.term > self._term:
+                    self._step_down(response.term)
+                    return
+                # Started over next time round
+                if not response.success:
+                    return
+                if done:
+                    self._match_index[peer] = max(self._match_index[peer], index)
+                    self._next_index[peer] = index + 1
+                    self._advance_commit_index()
+                    return
+            offset += len(chunk)
+
+
+class RaftServicer(distlock_pb2_grpc.RaftServicer):
+    def __init__(self, node: RaftNode):
+        self.node = node
+
+    def RequestVote(
+        self, request: distlock_pb2.RequestVoteRequest, context: grpc.ServicerContext
+    ) -> distlock_pb2.RequestVoteResponse:
+        return self.node.request_vote(request)
+
+    def AppendEntries(
+        self,
+        request: distlock_pb2.AppendEntriesRequest,
+        context: grpc.ServicerContext,
+    ) -> distlock_pb2.AppendEntriesResponse:
+        return self.node.append_entries(request)
+
+    def InstallSnapshot(
+        self,
+        request: distlock_pb2.InstallSnapshotRequest,
+        context: grpc.ServicerContext,
+    ) -> distlock_pb2.InstallSnapshotResponse:
+        return self.node.install_snapshot(request)
+
+
+class LeaderInterceptor(grpc.ServerInterceptor):
+    """
+    Turns away lock service calls on any node but the leader with UNAVAILABLE,
+    along with the leader's address in the trailing metadata so that the
+    client can retry there.
+    """
+
+    def __init__(self, node: RaftNode):
+        self.node = node
+
+    def _redirect(self, context: grpc.ServicerContext, leader_id: str | None) -> None:
+        context.set_trailing_metadata(((LEADER_METADATA_KEY, leader_id or ""),))
+        context.abort(
+            grpc.StatusCode.UNAVAILABLE,
+            f"Not the leader, the leader is {leader_id or 'unknown'}",
+        )
+
+    def intercept_service(
+        self,
+        continuation: Callable[[grpc.HandlerCallDetails], grpc.RpcMethodHandler],
+        handler_call_details: grpc.HandlerCallDetails,
+    ) -> grpc.RpcMethodHandler:
+        handler = continuation(handler_call_details)
+        method: str = handler_call_details.method  # type: ignore[attr-defined]
+        if handler is None or not method.startswith("/distlock.Distlock/"):
+            return handler
+        node = self.node
+
+        if handler.unary_unary is not None:
+            unary = handler.unary_unary
+
+            def unary_unary(request: Any, context: grpc.ServicerContext) -> Any:
+                if not node.is_leader:
+                    self._redirect(context, node.leader_id)
+                try:
+                    return unary(request, context)
+                except NotLeaderError as e:
+                    self._redirect(context, e.leader_id)
+
+            return grpc.unary_unary_rpc_method_handler(
+                unary_unary,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer,
+            )
+        if handler.unary_stream is not None:
+            stream = handler.unary_stream
+
+            def unary_stream(
+                request: Any, context: grpc.ServicerContext
+            ) -> Iterator[Any]:
+                if not node.is_leader:
+                    self._redirect(context, node.leader_id)
+                yield from stream(request, context)
+
+            return grpc.unary_stream_rpc_method_handler(
+                unary_stream,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer,
+            )
+        return handler
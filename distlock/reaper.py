@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Protocol
+
+from .models import NANOSECONDS_PER_SECOND
+
+# Leases granted while the reaper sleeps may expire before it wakes up, so it
+# never sleeps for longer than this.
+MAX_REAP_INTERVAL_SECONDS = 0.25
+
+logger = logging.getLogger(__name__)
+
+
+class ReapableLockStore(Protocol):
+    def reap(self) -> list[str]: ...
+
+    def next_expiry_ns(self) -> int | None: ...
+
+
+def seconds_until_next_reap(
+    lock_store: ReapableLockStore, max_interval_seconds: float
+) -> float:
+    next_expiry_ns = lock_store.next_expiry_ns()
+    if next_expiry_ns is None:
+        return max_interval_seconds
+    seconds = (next_expiry_ns - time.monotonic_ns()) / NANOSECONDS_PER_SECOND
+    return min(max(seconds, 0), max_interval_seconds)
+
+
+class Reaper:
+    """
+    Releases expired leases from a background thread as they expire, so that
+    lock state stays accurate for keys nobody touches, and waiters on those
+    keys are woken.
+    """
+
+    def __init__(
+        self,
+        lock_store: ReapableLockStore,
+        max_interval_seconds: float = MAX_REAP_INTERVAL_SECONDS,
+    ):
+        self._lock_store = lock_store
+        self._max_interval_seconds = max_interval_seconds
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="distlock-reaper", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            reaped = self._lock_store.reap()
+            if reaped:
+                logger.info("Released %s expired leases", len(reaped))
+            self._stopped.wait(
+                seconds_until_next_reap(self._lock_store, self._max_interval_seconds)
+            )
+
+
+async def reap_forever(
+    lock_store: ReapableLockStore,
+    on_reaped: Callable[[list[str]], None] | None = None,
+    max_interval_seconds: float = MAX_REAP_INTERVAL_SECONDS,
+) -> None:
+    """
+    The asyncio counterpart of Reaper, to be run as a task on the server's
+    event loop. on_reaped, if given, is called with the keys of the released
+    leases.
+    """
+    while True:
+        reaped = lock_store.reap()
+        if reaped:
+            logger.info("Released %s expired leases", len(reaped))
+            if on_reaped is not None:
+                on_reaped(reaped)
+        await asyncio.sleep(seconds_until_next_reap(lock_store, max_interval_seconds))
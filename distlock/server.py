@@ -1,35 +1,144 @@
 import logging
+import multiprocessing
+import multiprocessing.connection
+import signal
+import sys
 from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
 
 import grpc
 
-from .exceptions import AlreadyExistsError, UnreleasableError
-from .lock_store import ThreadSafeLockStore
-from .models import Lock
+from .exceptions import (
+    AlreadyExistsError,
+    LeaseLostError,
+    LockTableFullError,
+    UnreleasableError,
+)
+from .lock_store import ShardedLockStore
+from .log import configure_logging, logging_settings, stop_logging
+from .metrics import (
+    MetricsInterceptor,
+    MetricsServer,
+    RpcMetrics,
+    lock_store_gauges,
+)
+from .models import LockRecord
+from .raft import LeaderInterceptor, RaftNode, RaftServicer
+from .reaper import Reaper
+from .shared_lock_store import DEFAULT_CAPACITY, SharedLockStore
+from .snapshot import DEFAULT_SNAPSHOT_INTERVAL_SECONDS, Snapshotter, recover
 from .stubs import distlock_pb2, distlock_pb2_grpc
+from .tuning import AdmissionInterceptor, ServerTuning
+from .wal import MutationLog
 
 ONE_MINUTE_IN_SECONDS = 1 * 60
+MAX_WAIT_SECONDS = ONE_MINUTE_IN_SECONDS
+DEFAULT_PAGE_SIZE = 1_000
+MAX_PAGE_SIZE = 10_000
+DEFAULT_LOCK_SHARDS = 16
+DEFAULT_RAFT_MAX_WORKERS = 4
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(levelname)s %(asctime)s.%(msecs)03d %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
 logger = logging.getLogger(__name__)
 
 
+def lock_result(key: str, result: LockRecord | Exception) -> distlock_pb2.LockResult:
+    """
+    Converts one result of a batch lock store call into the status the single
+    key RPC would have returned for it.
+    """
+    if not isinstance(result, Exception):
+        return distlock_pb2.LockResult(lock=result.to_pb())
+    if isinstance(result, AlreadyExistsError):
+        code = grpc.StatusCode.ALREADY_EXISTS
+        details = f"A lock with key {key} already exists"
+    elif isinstance(result, KeyError):
+        code = grpc.StatusCode.NOT_FOUND
+        details = f"A lock with key {key} does not exist"
+    elif isinstance(result, UnreleasableError):
+        code = grpc.StatusCode.ABORTED
+        details = f"Could not release lock: {result}"
+    elif isinstance(result, LockTableFullError):
+        code = grpc.StatusCode.RESOURCE_EXHAUSTED
+        details = str(result)
+    elif isinstance(result, ValueError):
+        code = grpc.StatusCode.INVALID_ARGUMENT
+        details = str(result)
+    else:
+        code = grpc.StatusCode.INTERNAL
+        details = str(result)
+    return distlock_pb2.LockResult(
+        lock=distlock_pb2.Lock(key=key),
+        code=code.value[0],
+        details=details,
+    )
+
+
+def acquire_batch(
+    requests: Iterable[distlock_pb2.AcquireLockRequest],
+    acquire_many: Callable[[list[tuple[str, int]]], list[LockRecord | Exception]],
+) -> list[LockRecord | Exception]:
+    """
+    Acquires a batch of locks with acquire_many, turning down the requests
+    for shared locks and with an owner, which can only be acquired one at a
+    time.
+    """
+    requests = list(requests)
+    results = iter(
+        acquire_many(
+            [
+                (
+                    request.key,
+                    request.expires_in_seconds
+                    if request.expires_in_seconds != 0
+                    else ONE_MINUTE_IN_SECONDS,
+                )
+                for request in requests
+                if request.mode != distlock_pb2.SHARED and not request.owner
+            ]
+        )
+    )
+    return [
+        ValueError("Locks can only be acquired exclusively in a batch")
+        if request.mode == distlock_pb2.SHARED
+        else ValueError("Locks with an owner cannot be acquired in a batch")
+        if request.owner
+        else next(results)
+        for request in requests
+    ]
+
+
 class Servicer(distlock_pb2_grpc.DistlockServicer):
-    def __init__(self):
-        self.lock_store = ThreadSafeLockStore()
+    def __init__(
+        self,
+        lock_shards: int = DEFAULT_LOCK_SHARDS,
+        wal: MutationLog | None = None,
+        lock_store: ShardedLockStore | SharedLockStore | None = None,
+    ):
+        self.lock_store = (
+            lock_store
+            if lock_store is not None
+            else ShardedLockStore(shards=lock_shards, wal=wal)
+        )
+        self.wal = wal
+
+    def _sync(self) -> None:
+        """
+        Waits until every mutation made so far is on disk, or committed by the
+        cluster, so that a response is never sent for a change that would be
+        lost in a crash.
+        """
+        if self.wal is not None:
+            self.wal.sync()
 
     def CreateLock(
         self, request: distlock_pb2.Lock, context: grpc.ServicerContext
     ) -> distlock_pb2.EmptyResponse:
-        logger.info(f"Received request to create lock named {request.key}")
+        logger.debug("Received request to create lock named %s", request.key)
         try:
             self.lock_store.set_not_exists(
                 request.key,
-                Lock(key=request.key),
+                LockRecord(key=request.key, permits=request.permits),
             )
         except AlreadyExistsError:
             msg = f"A lock with key {request.key} already exists"
@@ -37,14 +146,29 @@ class Servicer(distlock_pb2_grpc.DistlockServicer):
             context.set_details(msg)
             context.set_code(grpc.StatusCode.ALREADY_EXISTS)
             return distlock_pb2.EmptyResponse()
-        logger.info(f"Created lock named {request.key}")
+        except LockTableFullError as e:
+            msg = f"Could not create lock: {e}"
+            logger.error(msg)
+            context.set_details(msg)
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            return distlock_pb2.EmptyResponse()
+        except ValueError as e:
+            msg = f"Could not create lock: {e}"
+            logger.error(msg)
+            context.set_details(msg)
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            return distlock_pb2.EmptyResponse()
+        self._sync()
+        logger.info("Created lock named %s", request.key)
         return distlock_pb2.EmptyResponse()
 
     def AcquireLock(
         self, request: distlock_pb2.AcquireLockRequest, context: grpc.ServicerContext
     ) -> distlock_pb2.Lock:
-        logger.info(
-            f"Received request to acquire lock named {request.key} with an expires in of {request.expires_in_seconds} seconds"
+        logger.debug(
+            "Received request to acquire lock named %s with an expires in of %s seconds",
+            request.key,
+            request.expires_in_seconds,
         )
         if request.expires_in_seconds != 0:
             expires_in_seconds = request.expires_in_seconds
@@ -54,6 +178,60 @@ class Servicer(distlock_pb2_grpc.DistlockServicer):
             lock = self.lock_store.acquire(
                 key=request.key,
                 expires_in_seconds=expires_in_seconds,
+                shared=request.mode == distlock_pb2.SHARED,
+                owner=request.owner,
+                request_id=request.request_id,
+            )
+        except KeyError:
+            msg = f"A lock with key {request.key} does not exist"
+            logger.error(msg)
+            context.set_details(msg)
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            return distlock_pb2.Lock()
+        except ValueError as e:
+            msg = f"Could not acquire lock: {e}"
+            logger.error(msg)
+            context.set_details(msg)
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            return distlock_pb2.Lock()
+        self._sync()
+        logger.info(
+            "Lock with key %s has %s been acquired",
+            request.key,
+            "" if lock.acquired else "not",
+        )
+        return lock.to_pb()
+
+    def WaitAcquireLock(
+        self,
+        request: distlock_pb2.WaitAcquireLockRequest,
+        context: grpc.ServicerContext,
+    ) -> distlock_pb2.Lock:
+        logger.debug(
+            "Received request to wait up to %s seconds to acquire lock named %s with an expires in of %s seconds",
+            request.timeout_seconds,
+            request.key,
+            request.expires_in_seconds,
+        )
+        if request.expires_in_seconds != 0:
+            expires_in_seconds = request.expires_in_seconds
+        else:
+            expires_in_seconds = ONE_MINUTE_IN_SECONDS
+        if request.timeout_seconds >= 0:
+            timeout_seconds = min(request.timeout_seconds, MAX_WAIT_SECONDS)
+        else:
+            timeout_seconds = MAX_WAIT_SECONDS
+        time_remaining = context.time_remaining()
+        if time_remaining is not None:
+            timeout_seconds = min(timeout_seconds, time_remaining)
+        try:
+            lock = self.lock_store.acquire_wait(
+                key=request.key,
+                expires_in_seconds=expires_in_seconds,
+                timeout_seconds=timeout_seconds,
+                shared=request.mode == distlock_pb2.SHARED,
+                owner=request.owner,
+                request_id=request.request_id,
             )
         except KeyError:
             msg = f"A lock with key {request.key} does not exist"
@@ -61,21 +239,42 @@ class Servicer(distlock_pb2_grpc.DistlockServicer):
             context.set_details(msg)
             context.set_code(grpc.StatusCode.NOT_FOUND)
             return distlock_pb2.Lock()
+        except ValueError as e:
+            msg = f"Could not acquire lock: {e}"
+            logger.error(msg)
+            context.set_details(msg)
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            return distlock_pb2.Lock()
+        if lock.acquired and not context.is_active():
+            # The caller cancelled or ran out its deadline while this thread
+            # waited, so nobody would ever release the lock it was granted
+            logger.info(
+                "Giving back lock with key %s, its caller went away", request.key
+            )
+            try:
+                self.lock_store.release(key=request.key, clock=lock.clock)
+            except UnreleasableError:
+                pass
+        self._sync()
         logger.info(
-            f"Lock with key {request.key} has {'' if lock.acquired else 'not'} been acquired"
+            "Lock with key %s has %s been acquired",
+            request.key,
+            "" if lock.acquired else "not",
         )
         return lock.to_pb()
 
     def ReleaseLock(
         self, request: distlock_pb2.Lock, context: grpc.ServicerContext
     ) -> distlock_pb2.EmptyResponse:
-        logger.info(f"Received request to release lock named {request.key}")
+        logger.debug("Received request to release lock named %s", request.key)
         try:
             self.lock_store.release(
                 key=request.key,
                 clock=request.clock,
+                request_id=request.request_id,
             )
-            logger.info(f"Lock with key {request.key} has been released")
+            self._sync()
+            logger.info("Lock with key %s has been released", request.key)
         except UnreleasableError as e:
             msg = f"Could not release lock: {e}"
             logger.error(msg)
@@ -90,13 +289,47 @@ class Servicer(distlock_pb2_grpc.DistlockServicer):
             return distlock_pb2.EmptyResponse()
         return distlock_pb2.EmptyResponse()
 
+    def RenewLock(
+        self, request: distlock_pb2.RenewLockRequest, context: grpc.ServicerContext
+    ) -> distlock_pb2.Lock:
+        logger.debug(
+            "Received request to renew lease on lock named %s for %s seconds",
+            request.key,
+            request.expires_in_seconds,
+        )
+        if request.expires_in_seconds != 0:
+            expires_in_seconds = request.expires_in_seconds
+        else:
+            expires_in_seconds = ONE_MINUTE_IN_SECONDS
+        try:
+            lock = self.lock_store.renew(
+                key=request.key,
+                clock=request.clock,
+                expires_in_seconds=expires_in_seconds,
+            )
+        except LeaseLostError as e:
+            msg = f"Could not renew lease: {e}"
+            logger.error(msg)
+            context.set_details(msg)
+            context.set_code(grpc.StatusCode.ABORTED)
+            return distlock_pb2.Lock()
+        except KeyError:
+            msg = f"A lock with key {request.key} does not exist"
+            logger.error(msg)
+            context.set_details(msg)
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            return distlock_pb2.Lock()
+        self._sync()
+        logger.info("Lease on lock with key %s has been renewed", request.key)
+        return lock.to_pb()
+
     def GetLock(
         self, request: distlock_pb2.Lock, context: grpc.ServicerContext
     ) -> distlock_pb2.Lock:
-        logger.info(f"Received request to fetch lock named {request.key}")
+        logger.debug("Received request to fetch lock named %s", request.key)
         try:
             lock = self.lock_store[request.key]
-            logger.info(f"Lock with key {lock.key} has been fetched")
+            logger.info("Lock with key %s has been fetched", lock.key)
         except KeyError:
             msg = f"A lock with key {request.key} does not exist"
             logger.error(msg)
@@ -108,17 +341,37 @@ class Servicer(distlock_pb2_grpc.DistlockServicer):
     def ListLocks(
         self, request: distlock_pb2.EmptyRequest, context: grpc.ServicerContext
     ) -> distlock_pb2.Locks:
-        logger.info("Received request to list locks")
+        logger.debug("Received request to list locks")
         locks = [lock.to_pb() for lock in self.lock_store.to_list()]
         return distlock_pb2.Locks(locks=locks)
 
+    def StreamLocks(
+        self, request: distlock_pb2.StreamLocksRequest, context: grpc.ServicerContext
+    ) -> Iterator[distlock_pb2.Locks]:
+        logger.debug("Received request to stream locks with prefix %r", request.prefix)
+        if request.page_size > 0:
+            page_size = min(request.page_size, MAX_PAGE_SIZE)
+        else:
+            page_size = DEFAULT_PAGE_SIZE
+        start_after = None
+        while True:
+            locks = self.lock_store.page(
+                prefix=request.prefix, start_after=start_after, limit=page_size
+            )
+            if locks:
+                yield distlock_pb2.Locks(locks=[lock.to_pb() for lock in locks])
+            if len(locks) < page_size:
+                return
+            start_after = locks[-1].key
+
     def DeleteLock(
         self, request: distlock_pb2.Lock, context: grpc.ServicerContext
     ) -> distlock_pb2.EmptyResponse:
-        logger.info(f"Received request to delete lock with key {request.key}")
+        logger.debug("Received request to delete lock with key %s", request.key)
         try:
             del self.lock_store[request.key]
-            logger.info(f"Lock with key {request.key} has been deleted")
+            self._sync()
+            logger.info("Lock with key %s has been deleted", request.key)
         except KeyError:
             msg = f"A lock with key {request.key} does not exist"
             logger.error(msg)
@@ -127,11 +380,279 @@ class Servicer(distlock_pb2_grpc.DistlockServicer):
             return distlock_pb2.EmptyResponse()
         return distlock_pb2.EmptyResponse()
 
+    def CreateLocks(
+        self, request: distlock_pb2.Locks, context: grpc.ServicerContext
+    ) -> distlock_pb2.LockResults:
+        logger.debug("Received request to create %s locks", len(request.locks))
+        results = self.lock_store.set_not_exists_many(
+            [LockRecord(key=lock.key, permits=lock.permits) for lock in request.locks]
+        )
+        self._sync()
+        return distlock_pb2.LockResults(
+            results=[
+                lock_result(lock.key, result)
+                for lock, result in zip(request.locks, results)
+            ]
+        )
+
+    def AcquireLocks(
+        self,
+        request: distlock_pb2.AcquireLocksRequest,
+        context: grpc.ServicerContext,
+    ) -> distlock_pb2.LockResults:
+        logger.debug("Received request to acquire %s locks", len(request.requests))
+        results = acquire_batch(request.requests, self.lock_store.acquire_many)
+        self._sync()
+        return distlock_pb2.LockResults(
+            results=[
+                lock_result(acquire_request.key, result)
+                for acquire_request, result in zip(request.requests, results)
+            ]
+        )
 
-def serve(*, address: str, port: int, max_workers: int):
-    server = grpc.server(ThreadPoolExecutor(max_workers=max_workers))
-    distlock_pb2_grpc.add_DistlockServicer_to_server(Servicer(), server)
+    def ReleaseLocks(
+        self, request: distlock_pb2.Locks, context: grpc.ServicerContext
+    ) -> distlock_pb2.LockResults:
+        logger.debug("Received request to release %s locks", len(request.locks))
+        results = self.lock_store.release_many(
+            [(lock.key, lock.clock) for lock in request.locks]
+        )
+        self._sync()
+        return distlock_pb2.LockResults(
+            results=[
+                lock_result(lock.key, result)
+                for lock, result in zip(request.locks, results)
+            ]
+        )
+
+    def GetLocks(
+        self, request: distlock_pb2.Locks, context: grpc.ServicerContext
+    ) -> distlock_pb2.LockResults:
+        logger.debug("Received request to fetch %s locks", len(request.locks))
+        results = self.lock_store.get_many([lock.key for lock in request.locks])
+        return distlock_pb2.LockResults(
+            results=[
+                lock_result(lock.key, result)
+                for lock, result in zip(request.locks, results)
+            ]
+        )
+
+
+def serve(
+    *,
+    address: str,
+    port: int,
+    max_workers: int,
+    lock_shards: int = DEFAULT_LOCK_SHARDS,
+    data_dir: Path | None = None,
+    snapshot_interval_seconds: float = DEFAULT_SNAPSHOT_INTERVAL_SECONDS,
+    raft_port: int | None = None,
+    peers: list[str] | None = None,
+    node_id: str | None = None,
+    lock_store: SharedLockStore | None = None,
+    metrics_port: int | None = None,
+    fair: bool = False,
+    tuning: ServerTuning | None = None,
+):
+    """
+    Runs a cluster node instead of a standalone server if peers are given.
+    The node replicates through Raft on raft_port, and node_id is the address
+    other nodes send clients to when this node leads. data_dir then holds the
+    node's Raft log and votes instead of a write-ahead log.
+
+    If lock_store is given, the server serves the locks in it, alongside the
+    other processes that share it, instead of keeping its own.
+
+    If metrics_port is given, metrics are served on it for Prometheus.
+
+    If fair, locks are granted strictly in the order in which requests
+    started waiting for them.
+
+    tuning sets up the gRPC server that serves the locks, but not the one
+    Raft replicates through.
+    """
+    if tuning is None:
+        tuning = ServerTuning()
+    if lock_store is not None and (peers or data_dir is not None or fair):
+        raise ValueError(
+            "A server sharing its locks cannot keep a write-ahead log, be a cluster node or be fair"
+        )
+    if lock_store is not None:
+        if tuning.so_reuseport is False:
+            raise ValueError("A server sharing its locks needs so_reuseport")
+        # Every process sharing the locks listens on the same port, and the
+        # kernel spreads connections between them
+        tuning = tuning.override(so_reuseport=True)
+    if peers and raft_port is None:
+        raise ValueError("A cluster node needs a Raft port")
+    log: MutationLog | None = None
+    wal = None
+    raft = None
+    raft_server = None
+    interceptors: list[grpc.ServerInterceptor] = []
+    rpc_metrics = None
+    if metrics_port is not None:
+        # First, so that calls turned away by other interceptors are counted
+        rpc_metrics = RpcMetrics()
+        interceptors.append(MetricsInterceptor(rpc_metrics))
+    if peers:
+        raft = RaftNode(node_id or f"localhost:{port}", peers, data_dir=data_dir)
+        log = raft
+        interceptors.append(LeaderInterceptor(raft))
+        # Raft gets its own server, so that heartbeats are never stuck behind
+        # lock requests waiting for a worker
+        raft_server = grpc.server(
+            ThreadPoolExecutor(
+                max_workers=max(DEFAULT_RAFT_MAX_WORKERS, 2 * len(peers))
+            )
+        )
+        distlock_pb2_grpc.add_RaftServicer_to_server(RaftServicer(raft), raft_server)
+        raft_server.add_insecure_port(f"{address}:{raft_port}")
+    elif data_dir is not None:
+        wal, locks, requests = recover(data_dir)
+        log = wal
+    if tuning.max_waiting_rpcs is not None:
+        # After the leader check, so that followers redirect rather than
+        # turn away calls
+        interceptors.append(AdmissionInterceptor(tuning.max_waiting_rpcs))
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    server = grpc.server(
+        executor,
+        interceptors=interceptors,
+        options=tuning.grpc_options(),
+        maximum_concurrent_rpcs=tuning.max_concurrent_rpcs,
+        compression=tuning.grpc_compression(),
+    )
+    snapshotter = None
+    sharded_lock_store = None
+    if lock_store is None:
+        sharded_lock_store = ShardedLockStore(shards=lock_shards, wal=log, fair=fair)
+        if wal is not None:
+            sharded_lock_store.load(locks.values(), requests)
+            snapshotter = Snapshotter(
+                sharded_lock_store, wal, snapshot_interval_seconds
+            )
+        servicer = Servicer(wal=log, lock_store=sharded_lock_store)
+    else:
+        servicer = Servicer(wal=log, lock_store=lock_store)
+    metrics_server = None
+    if rpc_metrics is not None and metrics_port is not None:
+        gauges = lock_store_gauges(servicer.lock_store) + [
+            (
+                "distlock_thread_pool_queue_depth",
+                "Requests waiting for a worker thread.",
+                # ThreadPoolExecutor has no public way to see its queue
+                executor._work_queue.qsize,
+            )
+        ]
+        metrics_server = MetricsServer(rpc_metrics, gauges, address, metrics_port)
+    distlock_pb2_grpc.add_DistlockServicer_to_server(servicer, server)
     server.add_insecure_port(f"{address}:{port}")
-    logger.info(f"Starting server on {address}:{port}")
+    logger.info("Starting server on %s:%s", address, port)
+    reaper = Reaper(servicer.lock_store)
+    reaper.start()
+    if snapshotter is not None:
+        snapshotter.start()
+    if metrics_server is not None:
+        logger.info("Serving metrics on %s:%s", address, metrics_port)
+        metrics_server.start()
+    if raft is not None and raft_server is not None:
+        logger.info(
+            "Starting Raft on %s:%s as %s with peers %s",
+            address,
+            raft_port,
+            raft.node_id,
+            ", ".join(peers or []),
+        )
+        raft_server.start()
+        # A server sharing its locks is never a cluster node
+        assert sharded_lock_store is not None
+        raft.start(sharded_lock_store)
     server.start()
-    server.wait_for_termination()
+    try:
+        server.wait_for_termination()
+    finally:
+        reaper.stop()
+        if snapshotter is not None:
+            snapshotter.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        if wal is not None:
+            wal.close()
+        if raft is not None and raft_server is not None:
+            raft.stop()
+            raft_server.stop(None)
+
+
+def _serve_spawned(log_settings: tuple[int | str, float] | None, **kwargs) -> None:
+    # Exit on termination rather than being killed, so that the records still
+    # queued for logging are written out
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if log_settings is not None:
+        configure_logging(*log_settings)
+    try:
+        serve(**kwargs)
+    finally:
+        stop_logging()
+
+
+def serve_processes(
+    *,
+    processes: int,
+    address: str,
+    port: int,
+    max_workers: int,
+    max_locks: int = DEFAULT_CAPACITY,
+    metrics_port: int | None = None,
+    tuning: ServerTuning | None = None,
+):
+    """
+    Runs processes servers on the same port, each in a process of its own so
+    that they are not bound by one GIL, serving the same locks from a table
+    in shared memory. Stops them all once any of them stops.
+
+    Each process counts the requests it handles on its own, so each serves
+    its metrics on a port of its own, from metrics_port up. Likewise, the
+    admission limits of tuning apply to each process on its own.
+
+    The processes are spawned rather than forked, as this process already
+    runs threads, such as the one that writes logs, which a fork would copy
+    in whatever state they were in. Each process logs as this one does.
+    """
+    lock_store = SharedLockStore(capacity=max_locks)
+    context = multiprocessing.get_context(SharedLockStore.START_METHOD)
+    workers = [
+        context.Process(
+            target=_serve_spawned,
+            kwargs=dict(
+                log_settings=logging_settings(),
+                address=address,
+                port=port,
+                max_workers=max_workers,
+                lock_store=lock_store,
+                metrics_port=None if metrics_port is None else metrics_port + i,
+                tuning=tuning,
+            ),
+            name=f"distlock-server-{i}",
+        )
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    logger.info(
+        "Started %s server processes on %s:%s sharing a table of %s locks",
+        processes,
+        address,
+        port,
+        lock_store.capacity,
+    )
+    # Turn termination into an exception, so that the servers are stopped too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        multiprocessing.connection.wait([worker.sentinel for worker in workers])
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+        lock_store.close()
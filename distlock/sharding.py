@@ -0,0 +1,672 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+from bisect import bisect
+from concurrent.futures import Executor, ThreadPoolExecutor
+from types import TracebackType
+from typing import Any, AsyncIterator, Iterator, Self, TypeVar
+
+from .client import Distlock, DistlockAsync
+from .keepalive import KeepAlive, KeepAliveAsync, OnLost
+from .models import Lock
+
+DEFAULT_VIRTUAL_NODES = 160
+# How many locks iter_locks reads ahead from each server at a time, unless
+# given a page size
+READ_AHEAD = 1_000
+
+T = TypeVar("T")
+
+
+def _hash(value: str) -> int:
+    # Python's hash() of a str changes between processes, and every client
+    # must route a key to the same server
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest())
+
+
+def _split_endpoint(endpoint: str) -> tuple[str, int]:
+    address, _, port = endpoint.rpartition(":")
+    if not address or not port.isdigit():
+        raise ValueError(f"Endpoint must look like host:port, got {endpoint!r}")
+    return address, int(port)
+
+
+class HashRing:
+    """
+    Maps keys to endpoints with consistent hashing. Each endpoint is placed on
+    the ring at virtual_nodes points, which evens out how many keys each one
+    gets, and a key belongs to the first point at or after its own hash.
+    Adding or removing an endpoint therefore only moves the keys of the points
+    it gains or loses.
+    """
+
+    def __init__(
+        self, endpoints: list[str], virtual_nodes: int = DEFAULT_VIRTUAL_NODES
+    ):
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        if virtual_nodes < 1:
+            raise ValueError(f"virtual_nodes must be at least 1, got {virtual_nodes}")
+        points = sorted(
+            (_hash(f"{endpoint}#{i}"), endpoint)
+            for endpoint in endpoints
+            for i in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._endpoints = [endpoint for _, endpoint in points]
+
+    def endpoint_for(self, key: str) -> str:
+        index = bisect(self._hashes, _hash(key))
+        return self._endpoints[index % len(self._endpoints)]
+
+
+def _group(
+    ring: HashRing, items: list[T], keys: list[str]
+) -> dict[str, tuple[list[int], list[T]]]:
+    """
+    Groups items by the endpoint of their key, along with their positions in
+    items so that per endpoint results can be put back in order.
+    """
+    groups: dict[str, tuple[list[int], list[T]]] = {}
+    for position, (item, key) in enumerate(zip(items, keys)):
+        positions, grouped = groups.setdefault(ring.endpoint_for(key), ([], []))
+        positions.append(position)
+        grouped.append(item)
+    return groups
+
+
+def _ungroup(
+    size: int, groups: list[list[int]], results: list[list[Lock | Exception]]
+) -> list[Lock | Exception]:
+    ordered: dict[int, Lock | Exception] = {}
+    for positions, group_results in zip(groups, results):
+        ordered.update(zip(positions, group_results))
+    return [ordered[position] for position in range(size)]
+
+
+def _read_ahead(
+    executor: Executor, locks: Iterator[Lock], count: int
+) -> Iterator[Lock]:
+    """
+    Reads count locks at a time from locks in the executor, starting right
+    away, and the next count while the caller goes through them.
+    """
+
+    def read() -> list[Lock]:
+        return list(itertools.islice(locks, count))
+
+    pending = executor.submit(read)
+
+    def read_ahead() -> Iterator[Lock]:
+        nonlocal pending
+        try:
+            while batch := pending.result():
+                pending = executor.submit(read)
+                yield from batch
+        finally:
+            pending.cancel()
+
+    return read_ahead()
+
+
+class ShardedDistlock:
+    """
+    Client that spreads keys over several independent distlock servers.
+
+    Every key lives on exactly one server, picked by consistent hashing, and
+    each server gets its own Distlock client with its own channel pool.
+    Calls that span keys, like listing locks and the batch methods, go to the
+    servers involved in parallel. Keyword arguments other than virtual_nodes
+    are passed on to every Distlock.
+    """
+
+    def __init__(
+        self,
+        endpoints: list[str],
+        *,
+        virtual_nodes: int = DEFAULT_VIRTUAL_NODES,
+        **client_kwargs: Any,
+    ):
+        self._ring = HashRing(endpoints, virtual_nodes)
+        self._clients = {
+            endpoint: Distlock(*_split_endpoint(endpoint), **client_kwargs)
+            for endpoint in endpoints
+        }
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(endpoints), thread_name_prefix="distlock-sharded"
+        )
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        for client in self._clients.values():
+            client.close()
+
+    def client_for(self, key: str) -> Distlock:
+        return self._clients[self._ring.endpoint_for(key)]
+
+    def acquire_lock(
+        self,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        blocking: bool = True,
+        timeout_seconds: float = -1.0,
+        heartbeat_seconds: float = 3.0,
+        shared: bool = False,
+        owner: str | None = None,
+    ) -> Lock:
+        return self.client_for(key).acquire_lock(
+            key=key,
+            expires_in_seconds=expires_in_seconds,
+            blocking=blocking,
+            timeout_seconds=timeout_seconds,
+            heartbeat_seconds=heartbeat_seconds,
+            shared=shared,
+            owner=owner,
+        )
+
+    def acquire_read_lock(
+        self,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        blocking: bool = True,
+        timeout_seconds: float = -1.0,
+        heartbeat_seconds: float = 3.0,
+    ) -> Lock:
+        return self.client_for(key).acquire_read_lock(
+            key=key,
+            expires_in_seconds=expires_in_seconds,
+            blocking=blocking,
+            timeout_seconds=timeout_seconds,
+            heartbeat_seconds=heartbeat_seconds,
+        )
+
+    def acquire_write_lock(
+        self,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        blocking: bool = True,
+        timeout_seconds: float = -1.0,
+        heartbeat_seconds: float = 3.0,
+        owner: str | None = None,
+    ) -> Lock:
+        return self.client_for(key).acquire_write_lock(
+            key=key,
+            expires_in_seconds=expires_in_seconds,
+            blocking=blocking,
+            timeout_seconds=timeout_seconds,
+            heartbeat_seconds=heartbeat_seconds,
+            owner=owner,
+        )
+
+    def acquire_permit(
+        self,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        blocking: bool = True,
+        timeout_seconds: float = -1.0,
+        heartbeat_seconds: float = 3.0,
+    ) -> Lock:
+        return self.client_for(key).acquire_permit(
+            key=key,
+            expires_in_seconds=expires_in_seconds,
+            blocking=blocking,
+            timeout_seconds=timeout_seconds,
+            heartbeat_seconds=heartbeat_seconds,
+        )
+
+    def create_lock(self, key: str, *, deadline_seconds: float | None = None) -> None:
+        self.client_for(key).create_lock(key, deadline_seconds=deadline_seconds)
+
+    def create_semaphore(
+        self, key: str, permits: int, *, deadline_seconds: float | None = None
+    ) -> None:
+        self.client_for(key).create_semaphore(
+            key, permits, deadline_seconds=deadline_seconds
+        )
+
+    def delete_lock(self, key: str, *, deadline_seconds: float | None = None) -> None:
+        self.client_for(key).delete_lock(key, deadline_seconds=deadline_seconds)
+
+    def get_lock(self, key: str, *, deadline_seconds: float | None = None) -> Lock:
+        return self.client_for(key).get_lock(key, deadline_seconds=deadline_seconds)
+
+    def release_lock(
+        self, lock: Lock, *, deadline_seconds: float | None = None
+    ) -> None:
+        self.client_for(lock.key).release_lock(lock, deadline_seconds=deadline_seconds)
+
+    def renew_lock(
+        self,
+        lock: Lock,
+        expires_in_seconds: int,
+        *,
+        deadline_seconds: float | None = None,
+    ) -> Lock:
+        return self.client_for(lock.key).renew_lock(
+            lock, expires_in_seconds, deadline_seconds=deadline_seconds
+        )
+
+    def keep_alive(
+        self,
+        lock: Lock,
+        expires_in_seconds: int,
+        *,
+        interval_seconds: float | None = None,
+        on_lost: OnLost | None = None,
+    ) -> KeepAlive:
+        return self.client_for(lock.key).keep_alive(
+            lock,
+            expires_in_seconds,
+            interval_seconds=interval_seconds,
+            on_lost=on_lost,
+        )
+
+    def list_locks(self, *, deadline_seconds: float | None = None) -> list[Lock]:
+        """
+        Lists the locks of every server in parallel, merged in key order.
+        """
+        lists = self._executor.map(
+            lambda client: client.list_locks(deadline_seconds=deadline_seconds),
+            self._clients.values(),
+        )
+        return sorted(
+            (lock for locks in lists for lock in locks), key=lambda lock: lock.key
+        )
+
+    def iter_locks(
+        self,
+        prefix: str = "",
+        page_size: int = 0,
+        *,
+        deadline_seconds: float | None = None,
+    ) -> Iterator[Lock]:
+        """
+        Streams the locks of every server at once, merged in key order. Each
+        server is read from in the background, a page ahead of the caller, so
+        that the servers are waited on in parallel rather than one by one.
+        """
+        return heapq.merge(
+            *(
+                _read_ahead(
+                    self._executor,
+                    client.iter_locks(
+                        prefix=prefix,
+                        page_size=page_size,
+                        deadline_seconds=deadline_seconds,
+                    ),
+                    page_size or READ_AHEAD,
+                )
+                for client in self._clients.values()
+            ),
+            key=lambda lock: lock.key,
+        )
+
+    def create_many(
+        self, keys: list[str], *, deadline_seconds: float | None = None
+    ) -> list[Lock | Exception]:
+        groups = _group(self._ring, keys, keys)
+        results = self._executor.map(
+            lambda endpoint: self._clients[endpoint].create_many(
+                groups[endpoint][1], deadline_seconds=deadline_seconds
+            ),
+            groups,
+        )
+        return _ungroup(
+            len(keys), [positions for positions, _ in groups.values()], list(results)
+        )
+
+    def acquire_many(
+        self,
+        keys: list[str],
+        expires_in_seconds: int,
+        *,
+        deadline_seconds: float | None = None,
+    ) -> list[Lock | Exception]:
+        groups = _group(self._ring, keys, keys)
+        results = self._executor.map(
+            lambda endpoint: self._clients[endpoint].acquire_many(
+                groups[endpoint][1],
+                expires_in_seconds,
+                deadline_seconds=deadline_seconds,
+            ),
+            groups,
+        )
+        return _ungroup(
+            len(keys), [positions for positions, _ in groups.values()], list(results)
+        )
+
+    def release_many(
+        self, locks: list[Lock], *, deadline_seconds: float | None = None
+    ) -> list[Lock | Exception]:
+        groups = _group(self._ring, locks, [lock.key for lock in locks])
+        results = self._executor.map(
+            lambda endpoint: self._clients[endpoint].release_many(
+                groups[endpoint][1], deadline_seconds=deadline_seconds
+            ),
+            groups,
+        )
+        return _ungroup(
+            len(locks), [positions for positions, _ in groups.values()], list(results)
+        )
+
+    def get_many(
+        self, keys: list[str], *, deadline_seconds: float | None = None
+    ) -> list[Lock | Exception]:
+        groups = _group(self._ring, keys, keys)
+        results = self._executor.map(
+            lambda endpoint: self._clients[endpoint].get_many(
+                groups[endpoint][1], deadline_seconds=deadline_seconds
+            ),
+            groups,
+        )
+        return _ungroup(
+            len(keys), [positions for positions, _ in groups.values()], list(results)
+        )
+
+
+async def _merge_async(
+    iterators: list[AsyncIterator[Lock]],
+) -> AsyncIterator[Lock]:
+    """
+    Merges async iterators of locks in key order, like heapq.merge. The first
+    lock of every iterator is waited for concurrently.
+    """
+    firsts = await asyncio.gather(*(anext(iterator, None) for iterator in iterators))
+    heap = [
+        (lock.key, index, lock) for index, lock in enumerate(firsts) if lock is not None
+    ]
+    heapq.heapify(heap)
+    while heap:
+        _, index, lock = heap[0]
+        yield lock
+        next_lock = await anext(iterators[index], None)
+        if next_lock is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (next_lock.key, index, next_lock))
+
+
+class ShardedDistlockAsync:
+    """
+    The asyncio counterpart of ShardedDistlock, built on DistlockAsync.
+    """
+
+    def __init__(
+        self,
+        endpoints: list[str],
+        *,
+        virtual_nodes: int = DEFAULT_VIRTUAL_NODES,
+        **client_kwargs: Any,
+    ):
+        self._ring = HashRing(endpoints, virtual_nodes)
+        self._clients = {
+            endpoint: DistlockAsync(*_split_endpoint(endpoint), **client_kwargs)
+            for endpoint in endpoints
+        }
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await asyncio.gather(*(client.close() for client in self._clients.values()))
+
+    def client_for(self, key: str) -> DistlockAsync:
+        return self._clients[self._ring.endpoint_for(key)]
+
+    async def acquire_lock(
+        self,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        blocking: bool = True,
+        timeout_seconds: float = -1.0,
+        heartbeat_seconds: float = 3.0,
+        shared: bool = False,
+        owner: str | None = None,
+    ) -> Lock:
+        return await self.client_for(key).acquire_lock(
+            key=key,
+            expires_in_seconds=expires_in_seconds,
+            blocking=blocking,
+            timeout_seconds=timeout_seconds,
+            heartbeat_seconds=heartbeat_seconds,
+            shared=shared,
+            owner=owner,
+        )
+
+    async def acquire_read_lock(
+        self,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        blocking: bool = True,
+        timeout_seconds: float = -1.0,
+        heartbeat_seconds: float = 3.0,
+    ) -> Lock:
+        return await self.client_for(key).acquire_read_lock(
+            key=key,
+            expires_in_seconds=expires_in_seconds,
+            blocking=blocking,
+            timeout_seconds=timeout_seconds,
+            heartbeat_seconds=heartbeat_seconds,
+        )
+
+    async def acquire_write_lock(
+        self,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        blocking: bool = True,
+        timeout_seconds: float = -1.0,
+        heartbeat_seconds: float = 3.0,
+        owner: str | None = None,
+    ) -> Lock:
+        return await self.client_for(key).acquire_write_lock(
+            key=key,
+            expires_in_seconds=expires_in_seconds,
+            blocking=blocking,
+            timeout_seconds=timeout_seconds,
+            heartbeat_seconds=heartbeat_seconds,
+            owner=owner,
+        )
+
+    async def acquire_permit(
+        self,
+        *,
+        key: str,
+        expires_in_seconds: int,
+        blocking: bool = True,
+        timeout_seconds: float = -1.0,
+        heartbeat_seconds: float = 3.0,
+    ) -> Lock:
+        return await self.client_for(key).acquire_permit(
+            key=key,
+            expires_in_seconds=expires_in_seconds,
+            blocking=blocking,
+            timeout_seconds=timeout_seconds,
+            heartbeat_seconds=heartbeat_seconds,
+        )
+
+    async def create_lock(
+        self, key: str, *, deadline_seconds: float | None = None
+    ) -> None:
+        await self.client_for(key).create_lock(key, deadline_seconds=deadline_seconds)
+
+    async def create_semaphore(
+        self, key: str, permits: int, *, deadline_seconds: float | None = None
+    ) -> None:
+        await self.client_for(key).create_semaphore(
+            key, permits, deadline_seconds=deadline_seconds
+        )
+
+    async def delete_lock(
+        self, key: str, *, deadline_seconds: float | None = None
+    ) -> None:
+        await self.client_for(key).delete_lock(key, deadline_seconds=deadline_seconds)
+
+    async def get_lock(
+        self, key: str, *, deadline_seconds: float | None = None
+    ) -> Lock:
+        return await self.client_for(key).get_lock(
+            key, deadline_seconds=deadline_seconds
+        )
+
+    async def release_lock(
+        self, lock: Lock, *, deadline_seconds: float | None = None
+    ) -> None:
+        await self.client_for(lock.key).release_lock(
+            lock, deadline_seconds=deadline_seconds
+        )
+
+    async def renew_lock(
+        self,
+        lock: Lock,
+        expires_in_seconds: int,
+        *,
+        deadline_seconds: float | None = None,
+    ) -> Lock:
+        return await self.client_for(lock.key).renew_lock(
+            lock, expires_in_seconds, deadline_seconds=deadline_seconds
+        )
+
+    def keep_alive(
+        self,
+        lock: Lock,
+        expires_in_seconds: int,
+        *,
+        interval_seconds: float | None = None,
+        on_lost: OnLost | None = None,
+    ) -> KeepAliveAsync:
+        return self.client_for(lock.key).keep_alive(
+            lock,
+            expires_in_seconds,
+            interval_seconds=interval_seconds,
+            on_lost=on_lost,
+        )
+
+    async def list_locks(self, *, deadline_seconds: float | None = None) -> list[Lock]:
+        """
+        Lists the locks of every server concurrently, merged in key order.
+        """
+        lists = await asyncio.gather(
+            *(
+                client.list_locks(deadline_seconds=deadline_seconds)
+                for client in self._clients.values()
+            )
+        )
+        return sorted(
+            (lock for locks in lists for lock in locks), key=lambda lock: lock.key
+        )
+
+    def iter_locks(
+        self,
+        prefix: str = "",
+        page_size: int = 0,
+        *,
+        deadline_seconds: float | None = None,
+    ) -> AsyncIterator[Lock]:
+        """
+        Streams the locks of every server at once, merged in key order.
+        """
+        return _merge_async(
+            [
+                client.iter_locks(
+                    prefix=prefix,
+                    page_size=page_size,
+                    deadline_seconds=deadline_seconds,
+                )
+                for client in self._clients.values()
+            ]
+        )
+
+    async def create_many(
+        self, keys: list[str], *, deadline_seconds: float | None = None
+    ) -> list[Lock | Exception]:
+        groups = _group(self._ring, keys, keys)
+        results = await asyncio.gather(
+            *(
+                self._clients[endpoint].create_many(
+                    grouped, deadline_seconds=deadline_seconds
+                )
+                for endpoint, (_, grouped) in groups.items()
+            )
+        )
+        return _ungroup(
+            len(keys), [positions for positions, _ in groups.values()], results
+        )
+
+    async def acquire_many(
+        self,
+        keys: list[str],
+        expires_in_seconds: int,
+        *,
+        deadline_seconds: float | None = None,
+    ) -> list[Lock | Exception]:
+        groups = _group(self._ring, keys, keys)
+        results = await asyncio.gather(
+            *(
+                self._clients[endpoint].acquire_many(
+                    grouped, expires_in_seconds, deadline_seconds=deadline_seconds
+                )
+                for endpoint, (_, grouped) in groups.items()
+            )
+        )
+        return _ungroup(
+            len(keys), [positions for positions, _ in groups.values()], results
+        )
+
+    async def release_many(
+        self, locks: list[Lock], *, deadline_seconds: float | None = None
+    ) -> list[Lock | Exception]:
+        groups = _group(self._ring, locks, [lock.key for lock in locks])
+        results = await asyncio.gather(
+            *(
+                self._clients[endpoint].release_many(
+                    grouped, deadline_seconds=deadline_seconds
+                )
+                for endpoint, (_, grouped) in groups.items()
+            )
+        )
+        return _ungroup(
+            len(locks), [positions for positions, _ in groups.values()], results
+        )
+
+    async def get_many(
+        self, keys: list[str], *, deadline_seconds: float | None = None
+    ) -> list[Lock | Exception]:
+        groups = _group(self._ring, keys, keys)
+        results = await asyncio.gather(
+            *(
+                self._clients[endpoint].get_many(
+                    grouped, deadline_seconds=deadline_seconds
+                )
+                for endpoint, (_, grouped) in groups.items()
+            )
+        )
+        return _ungroup(
+            len(keys), [positions for positions, _ in groups.values()], results
+        )
@@ -0,0 +1,896 @@
+import hashlib
+import heapq
+import multiprocessing
+import struct
+import time
+from contextlib import ExitStack, contextmanager
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Final, Iterable, Iterator
+
+from .exceptions import AlreadyExistsError, LockTableFullError, UnreleasableError
+from .models import LockRecord
+from .wal import REQUEST_ID_CACHE_SIZE
+
+DEFAULT_CAPACITY = 65_536
+DEFAULT_REGIONS = 64
+MAX_KEY_BYTES = 256
+MAX_OWNER_BYTES = 64
+# Shared holders of a lock, or permits of a semaphore, each with a lease of
+# its own, that a slot has room for. Readers beyond that are turned down until
+# one of the leases ends, and semaphores cannot have more permits.
+MAX_READERS = 16
+# Waiters in a region wait on one of this many conditions, picked by key, so
+# that releasing a lock wakes waiters for the same key rather than the region
+WAIT_CHANNELS = 8
+
+# The table is split into regions. Each region is a header of (earliest
+# expiry, lock count, next request to overwrite), a wait channel header per
+# condition of (waiters, whether they wait for different keys, the key hash
+# they wait for), a table of recent request ids, and an open addressing hash
+# table of slots. A slot is (state, acquired, key length, owner length, shared,
+# reader count, holds, clock, expires_at, key hash, permits), room for the
+# UTF-8 key and owner, a table of the (clock, expires_at) of each shared
+# holder's or permit's lease, and how many readers and writers wait for the
+# key. Expiry is a monotonic clock reading, which every process on the machine
+# shares.
+REGION_HEADER = struct.Struct("<qII")
+CHANNEL = struct.Struct("<I?3xQ")
+# The request ids are kept as hashes, all of them first so that they can be
+# searched in one go, followed by the (key hash, clock) of each one's lease
+REQUEST_HASH = struct.Struct("<Q")
+REQUEST = struct.Struct("<Qq")
+SLOT = struct.Struct("<BBHH?BIqqQI")
+READER = struct.Struct("<qq")
+WAITING = struct.Struct("<HH")
+READERS_OFFSET = SLOT.size + MAX_KEY_BYTES + MAX_OWNER_BYTES
+WAITING_OFFSET = READERS_OFFSET + MAX_READERS * READER.size
+SLOT_SIZE = WAITING_OFFSET + WAITING.size
+EMPTY = 0
+USED = 1
+
+# No lease is due to expire in a region
+NEVER = 2**63 - 1
+
+
+def _hash(key: bytes) -> int:
+    # Python's hash() of a str changes between interpreters, and every server
+    # process runs one of its own
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest())
+
+
+def _request_hash(request_id: str) -> int:
+    # Zero marks a free entry of the request table
+    return _hash(request_id.encode()) or 1
+
+
+def _check_owner(owner: str) -> None:
+    if len(owner.encode()) > MAX_OWNER_BYTES:
+        raise ValueError(
+            f"Owners can be at most {MAX_OWNER_BYTES} bytes long in shared memory, got {len(owner.encode())}"
+        )
+
+
+def _drop_expired(lock: LockRecord, now_ns: int) -> int:
+    """
+    Ends the leases of the lock's shared holders that have expired, and
+    returns how many there were.
+    """
+    if lock.readers is None:
+        return 0
+    expired = [
+        clock
+        for clock, expires_at_ns in lock.readers.items()
+        if expires_at_ns <= now_ns
+    ]
+    for clock in expired:
+        lock.drop_reader(clock)
+    return len(expired)
+
+
+def _holder(lock: LockRecord, clock: int) -> LockRecord | None:
+    """
+    The holder's lock of the lease at clock, if it is still held, like
+    LockStore._granted_before.
+    """
+    if lock.readers is not None:
+        expires_at_ns = lock.readers.get(clock, 0)
+        if expires_at_ns <= time.monotonic_ns():
+            return None
+        return LockRecord(
+            lock.key, True, clock, expires_at_ns, lock.shared, permits=lock.permits
+        )
+    if clock != lock.clock or not lock.acquired or lock.expired:
+        return None
+    return lock
+
+
+class SharedLockStore:
+    """
+    A lock store in shared memory, so that several server processes can serve
+    the same locks.
+
+    The table has a fixed number of slots, set by capacity, split over
+    regions. A key hashes to one region, and to a slot within it, probing
+    linearly from there. Deleting a key moves the keys probed past it back,
+    so that no tombstones are left behind. Each region has its own lock,
+    shared by every process, so operations on keys in different regions do
+    not wait on each other.
+
+    Waiters wait on one of their region's conditions, picked by key. A lock
+    that becomes free wakes one waiter, unless waiters for other keys share
+    the condition, in which case all of them are woken to check. Deleting a
+    lock wakes all of them.
+
+    Locks can be held exclusively, with or without an owner, or in shared
+    mode, and each region remembers the latest request ids for its keys, like
+    LockStore does. A slot has room for the leases of MAX_READERS shared
+    holders, and readers beyond that are turned down until one of them ends.
+    Like ThreadSafeLockStore, readers are turned down while a writer waits.
+    Semaphores keep the leases of their permits in the same table, so they
+    can have at most MAX_READERS permits.
+
+    The store has to be created before the server processes are started,
+    and handed to them as they start, with the START_METHOD multiprocessing
+    context, so that they share its memory and locks.
+    """
+
+    START_METHOD: Final = "spawn"
+
+    def __init__(
+        self, capacity: int = DEFAULT_CAPACITY, regions: int = DEFAULT_REGIONS
+    ):
+        if regions < 1:
+            raise ValueError(f"regions must be at least 1, got {regions}")
+        if capacity < regions:
+            raise ValueError(
+                f"capacity must be at least the number of regions ({regions}), got {capacity}"
+            )
+        self._regions = regions
+        self._slots_per_region = capacity // regions
+        self._requests_per_region = -(-REQUEST_ID_CACHE_SIZE // regions)
+        self._channels_offset = REGION_HEADER.size
+        self._requests_offset = self._channels_offset + WAIT_CHANNELS * CHANNEL.size
+        self._slots_offset = self._requests_offset + self._requests_per_region * (
+            REQUEST_HASH.size + REQUEST.size
+        )
+        self._region_size = self._slots_offset + self._slots_per_region * SLOT_SIZE
+        # Shared memory starts out zeroed, which leaves every slot, channel and
+        # request free
+        self._shm = SharedMemory(create=True, size=regions * self._region_size)
+        assert self._shm.buf is not None
+        self._buf: memoryview = self._shm.buf
+        for region in range(regions):
+            REGION_HEADER.pack_into(self._buf, region * self._region_size, NEVER, 0, 0)
+        context = multiprocessing.get_context(self.START_METHOD)
+        self._locks = [context.Lock() for _ in range(regions)]
+        self._conditions = [
+            [context.Condition(lock) for _ in range(WAIT_CHANNELS)]
+            for lock in self._locks
+        ]
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Only picklable while a process is being started, like the locks
+        state = self.__dict__.copy()
+        del state["_shm"], state["_buf"]
+        state["_name"] = self._shm.name
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        name = state.pop("_name")
+        self.__dict__.update(state)
+        self._shm = SharedMemory(name=name)
+        assert self._shm.buf is not None
+        self._buf = self._shm.buf
+
+    @property
+    def capacity(self) -> int:
+        return self._regions * self._slots_per_region
+
+    def close(self) -> None:
+        """
+        Frees the shared memory. Only the process that created the store
+        should call this, once the others are done with it.
+        """
+        del self._buf
+        self._shm.close()
+        self._shm.unlink()
+
+    def _locate(self, key: str) -> tuple[bytes, int, int]:
+        encoded = key.encode()
+        key_hash = _hash(encoded)
+        return encoded, key_hash, key_hash % self._regions
+
+    def _home(self, key_hash: int) -> int:
+        return (key_hash // self._regions) % self._slots_per_region
+
+    def _slot_offset(self, region: int, slot: int) -> int:
+        return region * self._region_size + self._slots_offset + slot * SLOT_SIZE
+
+    def _find(self, region: int, encoded: bytes, key_hash: int) -> tuple[int, int]:
+        """
+        Returns the offset of the key's slot, or -1, along with the offset of
+        the empty slot the key could be put in, or -1 if the region is full.
+        Must be called with the region's lock held.
+        """
+        home = self._home(key_hash)
+        for i in range(self._slots_per_region):
+            offset = self._slot_offset(region, (home + i) % self._slots_per_region)
+            state, _, key_length, _, _, _, _, _, _, slot_hash, _ = SLOT.unpack_from(
+                self._buf, offset
+            )
+            if state == EMPTY:
+                return -1, offset
+            if (
+                slot_hash == key_hash
+                and key_length == len(encoded)
+                and self._buf[offset + SLOT.size : offset + SLOT.size + key_length]
+                == encoded
+            ):
+                return offset, -1
+        return -1, -1
+
+    def _read(self, offset: int) -> LockRecord:
+        (
+            _,
+            acquired,
+            key_length,
+            owner_length,
+            shared,
+            reader_count,
+            holds,
+            clock,
+            expires_at_ns,
+            _,
+            permits,
+        ) = SLOT.unpack_from(self._buf, offset)
+        key_offset = offset + SLOT.size
+        owner_offset = key_offset + MAX_KEY_BYTES
+        readers_offset = offset + READERS_OFFSET
+        return LockRecord(
+            str(self._buf[key_offset : key_offset + key_length], "utf-8"),
+            bool(acquired),
+            clock,
+            expires_at_ns,
+            shared,
+            dict(
+                READER.iter_unpack(
+                    self._buf[
+                        readers_offset : readers_offset + reader_count * READER.size
+                    ]
+                )
+            )
+            if reader_count
+            else None,
+            permits,
+            owner=str(self._buf[owner_offset : owner_offset + owner_length], "utf-8"),
+            holds=holds,
+        )
+
+    def _write(
+        self, region: int, offset: int, lock: LockRecord, key_length: int, key_hash: int
+    ) -> None:
+        owner = lock.owner.encode()
+        owner_offset = offset + SLOT.size + MAX_KEY_BYTES
+        self._buf[owner_offset : owner_offset + len(owner)] = owner
+        readers = lock.readers or {}
+        for i, reader in enumerate(readers.items()):
+            READER.pack_into(
+                self._buf, offset + READERS_OFFSET + i * READER.size, *reader
+            )
+        SLOT.pack_into(
+            self._buf,
+            offset,
+            USED,
+            lock.acquired,
+            key_length,
+            len(owner),
+            lock.shared,
+            len(readers),
+            lock.holds,
+            lock.clock,
+            lock.expires_at_ns,
+            key_hash,
+            lock.permits,
+        )
+        if lock.acquired:
+            # The first of the shared holders' leases to expire
+            expires_at_ns = min(readers.values(), default=lock.expires_at_ns)
+            header_offset = region * self._region_size
+            earliest, count, cursor = REGION_HEADER.unpack_from(
+                self._buf, header_offset
+            )
+            if expires_at_ns < earliest:
+                REGION_HEADER.pack_into(
+                    self._buf, header_offset, expires_at_ns, count, cursor
+                )
+
+    def _update(self, region: int, offset: int, lock: LockRecord) -> None:
+        """
+        Writes back a lock that is already in its slot.
+        """
+        key_length = SLOT.unpack_from(self._buf, offset)[2]
+        self._write(region, offset, lock, key_length, self._slot_hash(offset))
+
+    def _slot_hash(self, offset: int) -> int:
+        return SLOT.unpack_from(self._buf, offset)[9]
+
+    def _waiting(self, offset: int) -> tuple[int, int]:
+        """
+        Returns how many readers and writers wait for the key in the slot at
+        offset.
+        """
+        readers, writers = WAITING.unpack_from(self._buf, offset + WAITING_OFFSET)
+        return readers, writers
+
+    def _offset(self, key: str) -> int:
+        encoded, key_hash, region = self._locate(key)
+        return self._find(region, encoded, key_hash)[0]
+
+    def _writer_waiting(self, key: str) -> bool:
+        offset = self._offset(key)
+        return offset != -1 and self._waiting(offset)[1] > 0
+
+    def _add_waiting(self, key: str, shared: bool, delta: int) -> tuple[int, int]:
+        """
+        Adds delta to the readers or writers waiting for the key, if it still
+        exists, and returns how many wait now. Must be called with the key's
+        region lock held.
+        """
+        offset = self._offset(key)
+        if offset == -1:
+            return 0, 0
+        readers, writers = self._waiting(offset)
+        # A key deleted and created again while its waiters slept starts
+        # over from zero
+        if shared:
+            readers = max(readers + delta, 0)
+        else:
+            writers = max(writers + delta, 0)
+        WAITING.pack_into(self._buf, offset + WAITING_OFFSET, readers, writers)
+        return readers, writers
+
+    def _remove(self, region: int, offset: int) -> None:
+        """
+        Empties the slot at offset, moving back the keys after it that probed
+        past it, so that lookups still find them without tombstones.
+        """
+        slots = self._slots_per_region
+        hole = (offset - self._slot_offset(region, 0)) // SLOT_SIZE
+        slot = hole
+        for _ in range(slots - 1):
+            slot = (slot + 1) % slots
+            slot_offset = self._slot_offset(region, slot)
+            if self._buf[slot_offset] == EMPTY:
+                break
+            # A key can only move back as far as the slot it hashes to
+            home = self._home(self._slot_hash(slot_offset))
+            if (slot - home) % slots >= (slot - hole) % slots:
+                hole_offset = self._slot_offset(region, hole)
+                self._buf[hole_offset : hole_offset + SLOT_SIZE] = self._buf[
+                    slot_offset : slot_offset + SLOT_SIZE
+                ]
+                hole = slot
+        self._buf[self._slot_offset(region, hole)] = EMPTY
+        self._add_count(region, -1)
+
+    def _add_count(self, region: int, delta: int) -> None:
+        header_offset = region * self._region_size
+        earliest, count, cursor = REGION_HEADER.unpack_from(self._buf, header_offset)
+        REGION_HEADER.pack_into(
+            self._buf, header_offset, earliest, count + delta, cursor
+        )
+
+    def _recall(self, region: int, request_hash: int) -> tuple[int, int] | None:
+        """
+        Returns the (key hash, clock) of the lease the request was granted or
+        released, if the region remembers the request. Must be called with the
+        region's lock held.
+        """
+        index = self._request_index(region, request_hash)
+        if index == -1:
+            return None
+        key_hash, clock = REQUEST.unpack_from(
+            self._buf, self._request_offset(region, index)
+        )
+        return key_hash, clock
+
+    def _request_index(self, region: int, request_hash: int) -> int:
+        start = region * self._region_size + self._requests_offset
+        hashes = bytes(
+            self._buf[start : start + self._requests_per_region * REQUEST_HASH.size]
+        )
+        needle = REQUEST_HASH.pack(request_hash)
+        found = hashes.find(needle)
+        # Only matches that start on an entry count
+        while found != -1 and found % REQUEST_HASH.size:
+            found = hashes.find(needle, found + 1)
+        return found // REQUEST_HASH.size if found != -1 else -1
+
+    def _request_offset(self, region: int, index: int) -> int:
+        return (
+            region * self._region_size
+            + self._requests_offset
+            + self._requests_per_region * REQUEST_HASH.size
+            + index * REQUEST.size
+        )
+
+    def _remember(
+        self, region: int, request_hash: int, key_hash: int, clock: int
+    ) -> None:
+        """
+        Remembers the lease of a request, in place of the oldest request the
+        region remembers if it is new.
+        """
+        index = self._request_index(region, request_hash)
+        if index == -1:
+            header_offset = region * self._region_size
+            earliest, count, index = REGION_HEADER.unpack_from(self._buf, header_offset)
+            REGION_HEADER.pack_into(
+                self._buf,
+                header_offset,
+                earliest,
+                count,
+                (index + 1) % self._requests_per_region,
+            )
+            REQUEST_HASH.pack_into(
+                self._buf,
+                region * self._region_size
+                + self._requests_offset
+                + index * REQUEST_HASH.size,
+                request_hash,
+            )
+        REQUEST.pack_into(
+            self._buf, self._request_offset(region, index), key_hash, clock
+        )
+
+    def _channel(self, key_hash: int) -> int:
+        # Other bits than those that pick the region and slot
+        return (key_hash >> 48) % WAIT_CHANNELS
+
+    def _channel_offset(self, region: int, channel: int) -> int:
+        return (
+            region * self._region_size + self._channels_offset + channel * CHANNEL.size
+        )
+
+    def _join(self, region: int, key_hash: int) -> None:
+        offset = self._channel_offset(region, self._channel(key_hash))
+        waiters, mixed, waiting_hash = CHANNEL.unpack_from(self._buf, offset)
+        if not waiters:
+            mixed, waiting_hash = False, key_hash
+        elif waiting_hash != key_hash:
+            mixed = True
+        CHANNEL.pack_into(self._buf, offset, waiters + 1, mixed, waiting_hash)
+
+    def _leave(self, region: int, key_hash: int) -> None:
+        offset = self._channel_offset(region, self._channel(key_hash))
+        waiters, mixed, waiting_hash = CHANNEL.unpack_from(self._buf, offset)
+        if waiters == 1:
+            CHANNEL.pack_into(self._buf, offset, 0, False, 0)
+        else:
+            CHANNEL.pack_into(self._buf, offset, waiters - 1, mixed, waiting_hash)
+
+    def _wake(self, region: int, key_hash: int, everyone: bool = False) -> None:
+        """
+        Wakes a waiter for the key, or every waiter for it if everyone. Must
+        be called with the region's lock held.
+        """
+        channel = self._channel(key_hash)
+        waiters, mixed, waiting_hash = CHANNEL.unpack_from(
+            self._buf, self._channel_offset(region, channel)
+        )
+        if not waiters:
+            return
+        condition = self._conditions[region][channel]
+        if everyone or mixed or waiting_hash != key_hash:
+            condition.notify_all()
+        else:
+            condition.notify()
+
+    def _get(self, key: str) -> tuple[int, int, LockRecord]:
+        """
+        Returns the key's region, slot offset and lock, or raises KeyError.
+        Must be called with the key's region lock held.
+        """
+        encoded, key_hash, region = self._locate(key)
+        offset, _ = self._find(region, encoded, key_hash)
+        if offset == -1:
+            raise KeyError(key)
+        return region, offset, self._read(offset)
+
+    def _insert(self, key: str, value: LockRecord, overwrite: bool) -> None:
+        encoded, key_hash, region = self._locate(key)
+        # Longer keys are never found, since no slot has room for them
+        if len(encoded) > MAX_KEY_BYTES:
+            raise ValueError(
+                f"Keys can be at most {MAX_KEY_BYTES} bytes long, got {len(encoded)}"
+            )
+        # Turned down when the semaphore is created rather than when its
+        # permits run out of room
+        if value.permits > MAX_READERS:
+            raise ValueError(
+                f"Semaphores can have at most {MAX_READERS} permits in shared memory, got {value.permits}"
+            )
+        _check_owner(value.owner)
+        if value.readers is not None and len(value.readers) > MAX_READERS:
+            raise ValueError(
+                f"Locks can have at most {MAX_READERS} shared holders in shared memory, got {len(value.readers)}"
+            )
+        offset, free = self._find(region, encoded, key_hash)
+        if offset != -1:
+            if not overwrite:
+                raise AlreadyExistsError
+            self._write(region, offset, value, len(encoded), key_hash)
+            return
+        if free == -1:
+            raise LockTableFullError(
+                f"No room left for {key}, the lock table holds at most {self.capacity} locks"
+            )
+        self._buf[free + SLOT.size : free + SLOT.size + len(encoded)] = encoded
+        WAITING.pack_into(self._buf, free + WAITING_OFFSET, 0, 0)
+        self._write(region, free, value, len(encoded), key_hash)
+        self._add_count(region, 1)
+
+    def _region(self, key: str) -> int:
+        return self._locate(key)[2]
+
+    @contextmanager
+    def _locked(self, regions: Iterable[int]) -> Iterator[None]:
+        # Always in region order, so that batches cannot deadlock
+        with ExitStack() as stack:
+            for region in sorted(set(regions)):
+                stack.enter_context(self._locks[region])
+            yield
+
+    def __len__(self) -> int:
+        count = 0
+        for region in range(self._regions):
+            with self._locks[region]:
+                count += REGION_HEADER.unpack_from(
+                    self._buf, region * self._region_size
+                )[1]
+        return count
+
+    def __getitem__(self, key: str) -> LockRecord:
+        with self._locks[self._region(key)]:
+            return self._get(key)[2]
+
+    def __setitem__(self, key: str, value: LockRecord) -> None:
+        with self._locks[self._region(key)]:
+            self._insert(key, value, overwrite=True)
+
+    def __delitem__(self, key: str) -> None:
+        _, key_hash, region = self._locate(key)
+        with self._locks[region]:
+            _, offset, _ = self._get(key)
+            self._remove(region, offset)
+            # Wake everybody waiting for the key so they can find out
+            self._wake(region, key_hash, everyone=True)
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def _acquire(
+        self,
+        key: str,
+        expires_in_seconds: int,
+        shared: bool = False,
+        owner: str = "",
+        request_id: str = "",
+    ) -> LockRecord:
+        """
+        Acquires the lock like LockStore.acquire. Must be called with the
+        key's region lock held.
+        """
+        region, offset, lock = self._get(key)
+        if owner and (shared or lock.permits):
+            raise ValueError("Only locks acquired exclusively can have an owner")
+        key_hash = self._slot_hash(offset)
+        request_hash = _request_hash(request_id) if request_id else 0
+        if request_hash:
+            # An earlier try of the request was granted a lease still held
+            recalled = self._recall(region, request_hash)
+            if recalled is not None and recalled[0] == key_hash:
+                holder = _holder(lock, recalled[1])
+                if holder is not None:
+                    return holder
+        if lock.permits:
+            holder = lock.acquire_permit(expires_in_seconds=expires_in_seconds)
+            if holder.acquired:
+                self._update(region, offset, lock)
+                if request_hash:
+                    self._remember(region, request_hash, key_hash, holder.clock)
+            return holder
+        if shared:
+            if (
+                lock.acquired and not lock.expired and not lock.shared
+            ) or self._waiting(offset)[1]:
+                return LockRecord(
+                    lock.key, False, lock.clock, lock.expires_at_ns, lock.shared
+                )
+            if lock.readers is not None and len(lock.readers) >= MAX_READERS:
+                _drop_expired(lock, time.monotonic_ns())
+                if lock.readers is not None and len(lock.readers) >= MAX_READERS:
+                    # Until the first of the leases ends
+                    return LockRecord(
+                        lock.key, False, lock.clock, min(lock.readers.values()), True
+                    )
+            holder = lock.acquire_shared(expires_in_seconds=expires_in_seconds)
+            self._update(region, offset, lock)
+            if request_hash:
+                self._remember(region, request_hash, key_hash, holder.clock)
+            return holder
+        if owner and lock.held_by(owner):
+            lock.reenter(expires_in_seconds=expires_in_seconds)
+        elif lock.acquired and not lock.expired:
+            return LockRecord(
+                lock.key, False, lock.clock, lock.expires_at_ns, lock.shared
+            )
+        else:
+            lock.acquire(expires_in_seconds=expires_in_seconds, owner=owner)
+        self._update(region, offset, lock)
+        if request_hash:
+            self._remember(region, request_hash, key_hash, lock.clock)
+        return lock
+
+    def _wake_released(self, region: int, offset: int, lock: LockRecord) -> None:
+        """
+        Wakes the waiters a lease that just ended may let in: one waiter if
+        the lock is free or a permit of a semaphore, or every reader if
+        readers wait, as a free lock or a free place among its shared holders
+        lets all of them in.
+        """
+        readers, _ = self._waiting(offset)
+        if lock.acquired and not lock.permits and not (lock.shared and readers):
+            return
+        self._wake(region, self._slot_hash(offset), everyone=readers > 0)
+
+    def _release(self, key: str, clock: int, request_id: str = "") -> LockRecord:
+        region, offset, lock = self._get(key)
+        key_hash = self._slot_hash(offset)
+        request_hash = _request_hash(request_id) if request_id else 0
+        # A retry of a request that released the lease does not release it
+        # again
+        if request_hash and self._recall(region, request_hash) == (key_hash, clock):
+            return lock
+        lock.release(clock=clock)
+        self._update(region, offset, lock)
+        if request_hash:
+            self._remember(region, request_hash, key_hash, clock)
+        self._wake_released(region, offset, lock)
+        return lock
+
+    def acquire(
+        self,
+        key: str,
+        expires_in_seconds: int,
+        shared: bool = False,
+        owner: str = "",
+        request_id: str = "",
+    ) -> LockRecord:
+        _check_owner(owner)
+        with self._locks[self._region(key)]:
+            return self._acquire(key, expires_in_seconds, shared, owner, request_id)
+
+    def acquire_wait(
+        self,
+        key: str,
+        expires_in_seconds: int,
+        timeout_seconds: float,
+        shared: bool = False,
+        owner: str = "",
+        request_id: str = "",
+    ) -> LockRecord:
+        """
+        Acquire the lock, waiting up to timeout_seconds for it to be released
+        or to expire. Unlike ThreadSafeLockStore, waiters in different
+        processes are not woken in the order in which they started waiting.
+
+        Shared requests are turned down for as long as an exclusive request
+        waits, so that readers coming and going cannot starve writers.
+        """
+        _check_owner(owner)
+        deadline = time.monotonic() + timeout_seconds
+        _, key_hash, region = self._locate(key)
+        condition = self._conditions[region][self._channel(key_hash)]
+        with condition:
+            lock = self._acquire(key, expires_in_seconds, shared, owner, request_id)
+            if lock.acquired:
+                return lock
+            # A semaphore's permits are waited for like an exclusive lock
+            shared = shared and not lock.permits
+            self._join(region, key_hash)
+            self._add_waiting(key, shared, 1)
+            try:
+                while not lock.acquired:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if shared and self._writer_waiting(key):
+                        # Held back by a writer rather than by a lease, so
+                        # only a wake up from the writer can change that
+                        condition.wait(remaining)
+                    else:
+                        condition.wait(
+                            min(remaining, max(lock.seconds_until_expiry, 0))
+                        )
+                    lock = self._acquire(
+                        key, expires_in_seconds, shared, owner, request_id
+                    )
+            finally:
+                self._leave(region, key_hash)
+                readers, _ = self._add_waiting(key, shared, -1)
+                if not shared and readers:
+                    # Readers held back by this writer check again, whether
+                    # it got the lock or gave up
+                    self._wake(region, key_hash, everyone=True)
+            return lock
+
+    def release(self, key: str, clock: int, request_id: str = "") -> None:
+        with self._locks[self._region(key)]:
+            self._release(key, clock, request_id)
+
+    def renew(self, key: str, clock: int, expires_in_seconds: int) -> LockRecord:
+        with self._locks[self._region(key)]:
+            region, offset, lock = self._get(key)
+            holder = lock.renew(clock=clock, expires_in_seconds=expires_in_seconds)
+            self._update(region, offset, lock)
+            return holder
+
+    def set_not_exists(self, key: str, value: LockRecord) -> None:
+        with self._locks[self._region(key)]:
+            self._insert(key, value, overwrite=False)
+
+    # Like ShardedLockStore, batches hold the locks of every region involved
+    # for their whole duration, so they are atomic.
+    def set_not_exists_many(
+        self, locks: list[LockRecord]
+    ) -> list[LockRecord | Exception]:
+        results: list[LockRecord | Exception] = []
+        with self._locked(self._region(lock.key) for lock in locks):
+            for lock in locks:
+                try:
+                    self._insert(lock.key, lock, overwrite=False)
+                except (KeyError, LockTableFullError, ValueError) as e:
+                    results.append(e)
+                else:
+                    results.append(lock)
+        return results
+
+    def acquire_many(
+        self, requests: list[tuple[str, int]]
+    ) -> list[LockRecord | Exception]:
+        results: list[LockRecord | Exception] = []
+        with self._locked(self._region(key) for key, _ in requests):
+            for key, expires_in_seconds in requests:
+                try:
+                    results.append(self._acquire(key, expires_in_seconds))
+                except KeyError as e:
+                    results.append(e)
+        return results
+
+    def release_many(
+        self, requests: list[tuple[str, int]]
+    ) -> list[LockRecord | Exception]:
+        results: list[LockRecord | Exception] = []
+        with self._locked(self._region(key) for key, _ in requests):
+            for key, clock in requests:
+                try:
+                    results.append(self._release(key, clock))
+                except (KeyError, UnreleasableError) as e:
+                    results.append(e)
+        return results
+
+    def get_many(self, keys: list[str]) -> list[LockRecord | Exception]:
+        results: list[LockRecord | Exception] = []
+        with self._locked(self._region(key) for key in keys):
+            for key in keys:
+                try:
+                    results.append(self._get(key)[2])
+                except KeyError as e:
+                    results.append(e)
+        return results
+
+    def _scan(self, region: int) -> Iterator[tuple[int, LockRecord]]:
+        """
+        Yields the slot offset and lock of every lock in the region. Must be
+        called with the region's lock held.
+        """
+        for slot in range(self._slots_per_region):
+            offset = self._slot_offset(region, slot)
+            if self._buf[offset] == USED:
+                yield offset, self._read(offset)
+
+    def page(
+        self, prefix: str = "", start_after: str | None = None, limit: int = 1000
+    ) -> list[LockRecord]:
+        """
+        Returns up to limit locks whose keys start with prefix, in key order,
+        starting after the key start_after. The table keeps no key order, so
+        every page scans the whole table.
+        """
+        locks: list[LockRecord] = []
+        for region in range(self._regions):
+            with self._locks[region]:
+                locks.extend(
+                    lock
+                    for _, lock in self._scan(region)
+                    if lock.key.startswith(prefix)
+                    and (start_after is None or lock.key > start_after)
+                )
+        return heapq.nsmallest(limit, locks, key=lambda lock: lock.key)
+
+    def to_list(self) -> list[LockRecord]:
+        locks: list[LockRecord] = []
+        for region in range(self._regions):
+            with self._locks[region]:
+                locks.extend(lock for _, lock in self._scan(region))
+        return locks
+
+    def held_count(self) -> int:
+        count = 0
+        for region in range(self._regions):
+            with self._locks[region]:
+                # Reads the state and acquired bytes of each slot rather than
+                # decoding every lock
+                for slot in range(self._slots_per_region):
+                    offset = self._slot_offset(region, slot)
+                    if self._buf[offset] == USED and self._buf[offset + 1]:
+                        count += 1
+        return count
+
+    def reap(self) -> list[str]:
+        """
+        Releases every lease that has expired, and returns their keys. Only
+        regions whose earliest lease has expired are scanned.
+        """
+        now_ns = time.monotonic_ns()
+        reaped: list[str] = []
+        for region in range(self._regions):
+            header_offset = region * self._region_size
+            with self._locks[region]:
+                earliest, count, cursor = REGION_HEADER.unpack_from(
+                    self._buf, header_offset
+                )
+                if earliest > now_ns:
+                    continue
+                earliest = NEVER
+                for offset, lock in self._scan(region):
+                    if not lock.acquired:
+                        continue
+                    if lock.readers is not None:
+                        expired = _drop_expired(lock, now_ns)
+                        if expired:
+                            self._update(region, offset, lock)
+                            self._wake_released(region, offset, lock)
+                            reaped.extend([lock.key] * expired)
+                        if lock.readers is not None:
+                            earliest = min(earliest, *lock.readers.values())
+                    elif lock.expires_at_ns <= now_ns:
+                        lock.acquired = False
+                        lock.holds = 0
+                        self._update(region, offset, lock)
+                        self._wake_released(region, offset, lock)
+                        reaped.append(lock.key)
+                    else:
+                        earliest = min(earliest, lock.expires_at_ns)
+                REGION_HEADER.pack_into(
+                    self._buf, header_offset, earliest, count, cursor
+                )
+        return reaped
+
+    def next_expiry_ns(self) -> int | None:
+        """
+        Returns when the earliest lease expires, as a monotonic clock reading,
+        or None if no lease was granted. The lease may already be released.
+        """
+        # Read without the region locks, a stale value only makes the reaper
+        # look a little early or late
+        earliest = min(
+            REGION_HEADER.unpack_from(self._buf, region * self._region_size)[0]
+            for region in range(self._regions)
+        )
+        return None if earliest == NEVER else earliest
@@ -0,0 +1,340 @@
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, Protocol
+
+from .models import LockRecord
+from .wal import (
+    PERMITS,
+    WriteAheadLog,
+    decode_owner,
+    decode_readers,
+    encode_owner,
+    encode_readers,
+    from_wall_clock_ns,
+    fsync_dir,
+    remember_request,
+    replay,
+    segments,
+    to_wall_clock_ns,
+)
+
+DEFAULT_SNAPSHOT_INTERVAL_SECONDS = 5 * 60
+SNAPSHOT_PREFIX = "snapshot-"
+SNAPSHOT_SUFFIX = ".bin"
+SNAPSHOT_PAGE_SIZE = 1_000
+
+# A snapshot is a header of (magic, lock count, crc32 of the records) followed
+# by one record of (acquired, clock, expires_at, key length, kind) and the
+# UTF-8 key per lock. Locks held in shared mode are followed by the leases of
+# their holders, and semaphores by their number of permits and then the leases
+# of their holders, and locks with an owner by their holds and owner, encoded
+# as in the log. As in the log, expiry is kept as wall clock nanoseconds.
+# The records are followed by the number of request ids the store remembers,
+# then one (clock, request id length, key length), the UTF-8 request id and
+# the UTF-8 key per request, oldest first. A snapshot that ends after its
+# records remembers no requests.
+MAGIC = b"DLSNAP02"
+HEADER = struct.Struct("<8sQI")
+RECORD = struct.Struct("<?qqIB")
+REQUEST_COUNT = struct.Struct("<I")
+REQUEST = struct.Struct("<qHI")
+EXCLUSIVE = 0
+SHARED = 1
+SEMAPHORE = 2
+OWNED = 3
+
+logger = logging.getLogger(__name__)
+
+
+class PageableLockStore(Protocol):
+    def page(
+        self, prefix: str = "", start_after: str | None = None, limit: int = 1000
+    ) -> list[LockRecord]: ...
+
+    def recent_requests(self) -> dict[str, tuple[str, int]]: ...
+
+
+def snapshot_path(data_dir: Path, seq: int) -> Path:
+    return data_dir / f"{SNAPSHOT_PREFIX}{seq:020d}{SNAPSHOT_SUFFIX}"
+
+
+def snapshots(data_dir: Path) -> list[tuple[int, Path]]:
+    found = []
+    for path in data_dir.glob(f"{SNAPSHOT_PREFIX}*{SNAPSHOT_SUFFIX}"):
+        seq = path.name[len(SNAPSHOT_PREFIX) : -len(SNAPSHOT_SUFFIX)]
+        if seq.isdigit():
+            found.append((int(seq), path))
+    return sorted(found)
+
+
+def encode_record(lock: LockRecord) -> bytes:
+    key = lock.key.encode()
+    if lock.permits:
+        kind = SEMAPHORE
+    elif lock.readers is not None:
+        kind = SHARED
+    elif lock.owner:
+        kind = OWNED
+    else:
+        kind = EXCLUSIVE
+    record = (
+        RECORD.pack(
+            lock.acquired,
+            lock.clock,
+            to_wall_clock_ns(lock.expires_at_ns),
+            len(key),
+            kind,
+        )
+        + key
+    )
+    if kind == SEMAPHORE:
+        record += PERMITS.pack(lock.permits) + encode_readers(lock.readers or {})
+    elif kind == SHARED:
+        record += encode_readers(lock.readers or {})
+    elif kind == OWNED:
+        record += encode_owner(lock)
+    return record
+
+
+def encode_requests(requests: dict[str, tuple[str, int]]) -> bytes:
+    chunks = [REQUEST_COUNT.pack(len(requests))]
+    for request_id, (key, clock) in requests.items():
+        encoded_id = request_id.encode()
+        encoded_key = key.encode()
+        chunks.append(REQUEST.pack(clock, len(encoded_id), len(encoded_key)))
+        chunks.append(encoded_id)
+        chunks.append(encoded_key)
+    return b"".join(chunks)
+
+
+def iter_pages(
+    lock_store: PageableLockStore, page_size: int = SNAPSHOT_PAGE_SIZE
+) -> Iterator[list[LockRecord]]:
+    start_after = None
+    while True:
+        locks = lock_store.page(start_after=start_after, limit=page_size)
+        if locks:
+            yield locks
+        if len(locks) < page_size:
+            return
+        start_after = locks[-1].key
+
+
+def write_snapshot(data_dir: Path, seq: int, lock_store: PageableLockStore) -> Path:
+    """
+    Writes every lock in lock_store to the snapshot for log segment seq.
+
+    The store is read a page at a time, so each page only holds the store's
+    locks for as long as it takes to find its keys, and requests keep being
+    served in between. The snapshot is therefore not a picture of the store
+    at one instant, which is fine as long as the log was rotated to segment seq
+    beforehand: any key that changes while the snapshot is written has an
+    entry in segment seq or later, and replaying those on top of the snapshot
+    brings the key up to date. The same goes for the request ids the store
+    remembers.
+    """
+    path = snapshot_path(data_dir, seq)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        dump_snapshot(f, iter_pages(lock_store), lock_store.recent_requests())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(data_dir)
+    return path
+
+
+def dump_snapshot(
+    file: BinaryIO,
+    pages: Iterable[list[LockRecord]],
+    requests: dict[str, tuple[str, int]],
+) -> None:
+    """
+    Writes a snapshot of the locks in pages and of the (key, clock) of each
+    request id in requests to file, which has to be seekable.
+    """
+    count = 0
+    crc = 0
+    file.write(HEADER.pack(MAGIC, 0, 0))
+    for locks in pages:
+        chunk = b"".join(encode_record(lock) for lock in locks)
+        file.write(chunk)
+        crc = zlib.crc32(chunk, crc)
+        count += len(locks)
+    chunk = encode_requests(requests)
+    file.write(chunk)
+    crc = zlib.crc32(chunk, crc)
+    file.seek(0)
+    file.write(HEADER.pack(MAGIC, count, crc))
+
+
+def load_snapshot(
+    path: Path, requests: dict[str, tuple[str, int]] | None = None
+) -> dict[str, LockRecord]:
+    """
+    Reads a snapshot in one go and decodes every lock in it, as the log
+    written since is replayed on top of them. The request ids in it are
+    remembered in requests, if given.
+    """
+    return parse_snapshot(path.read_bytes(), requests, f"Snapshot {path}")
+
+
+def parse_snapshot(
+    data: bytes,
+    requests: dict[str, tuple[str, int]] | None = None,
+    name: str = "Snapshot",
+) -> dict[str, LockRecord]:
+    """
+    Decodes every lock in the snapshot data, and remembers the request ids in
+    it in requests, if given. Raises ValueError, naming the snapshot with
+    name, if the data is damaged.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError(f"{name} is truncated")
+    magic, count, crc = HEADER.unpack_from(data)
+    view = memoryview(data)
+    if magic != MAGIC or zlib.crc32(view[HEADER.size :]) != crc:
+        raise ValueError(f"{name} is corrupt")
+    locks: dict[str, LockRecord] = {}
+    offset = HEADER.size
+    for _ in range(count):
+        acquired, clock, expires_at_ns, key_length, kind = RECORD.unpack_from(
+            view, offset
+        )
+        offset += RECORD.size
+        key = str(view[offset : offset + key_length], "utf-8")
+        offset += key_length
+        readers: dict[int, int] | None = None
+        permits = 0
+        owner = ""
+        holds = 0
+        if kind == SEMAPHORE:
+            (permits,) = PERMITS.unpack_from(view, offset)
+            offset += PERMITS.size
+        if kind in (SHARED, SEMAPHORE):
+            readers, offset = decode_readers(view, offset)
+        elif kind == OWNED:
+            owner, holds, offset = decode_owner(view, offset)
+        locks[key] = LockRecord(
+            key,
+            acquired,
+            clock,
+            from_wall_clock_ns(expires_at_ns),
+            kind == SHARED,
+            readers or None,
+            permits,
+            owner,
+            holds,
+        )
+    if requests is not None and offset < len(view):
+        (count,) = REQUEST_COUNT.unpack_from(view, offset)
+        offset += REQUEST_COUNT.size
+        for _ in range(count):
+            clock, id_length, key_length = REQUEST.unpack_from(view, offset)
+            offset += REQUEST.size
+            request_id = str(view[offset : offset + id_length], "utf-8")
+            offset += id_length
+            key = str(view[offset : offset + key_length], "utf-8")
+            offset += key_length
+            remember_request(requests, request_id, key, clock)
+    return locks
+
+
+def recover(
+    data_dir: Path,
+) -> tuple[WriteAheadLog, dict[str, LockRecord], dict[str, tuple[str, int]]]:
+    """
+    Loads the latest snapshot in data_dir, creating the directory if need be,
+    and replays the log segments written since on top of it. Returns the log,
+    open for appending to its last segment, along with the recovered locks and
+    the (key, clock) each recent request id was granted or released.
+    """
+    start = time.perf_counter()
+    data_dir.mkdir(parents=True, exist_ok=True)
+    for tmp_path in data_dir.glob(f"{SNAPSHOT_PREFIX}*.tmp"):
+        tmp_path.unlink()
+    seq = 0
+    locks: dict[str, LockRecord] = {}
+    requests: dict[str, tuple[str, int]] = {}
+    found = snapshots(data_dir)
+    if found:
+        seq, path = found[-1]
+        locks = load_snapshot(path, requests)
+    snapshot_seconds = time.perf_counter() - start
+    replayed = 0
+    for segment_seq, path in segments(data_dir):
+        # Left behind if the server stopped before it could clean up after
+        # the latest snapshot, which already covers them
+        if segment_seq < seq:
+            continue
+        locks, valid_length = replay(path, locks, requests)
+        if path.stat().st_size > valid_length:
+            os.truncate(path, valid_length)
+        seq = segment_seq
+        replayed += 1
+    logger.info(
+        f"Recovered {len(locks)} locks from {data_dir} in {time.perf_counter() - start:.3f} seconds ({snapshot_seconds:.3f} seconds loading the snapshot, then {replayed} log segments replayed)"
+    )
+    return WriteAheadLog(data_dir, seq), locks, requests
+
+
+class Snapshotter:
+    """
+    Periodically snapshots the lock store from a background thread, and drops
+    the log segments and snapshots the new snapshot makes redundant, so that
+    the log replayed on restart stays short.
+    """
+
+    def __init__(
+        self,
+        lock_store: PageableLockStore,
+        wal: WriteAheadLog,
+        interval_seconds: float = DEFAULT_SNAPSHOT_INTERVAL_SECONDS,
+    ):
+        self._lock_store = lock_store
+        self._wal = wal
+        self._interval_seconds = interval_seconds
+        self._snapshotted_at = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="distlock-snapshotter", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def snapshot(self) -> Path:
+        appended = self._wal.appended
+        seq = self._wal.rotate()
+        start = time.perf_counter()
+        path = write_snapshot(self._wal.data_dir, seq, self._lock_store)
+        self._snapshotted_at = appended
+        for old_seq, old_path in snapshots(self._wal.data_dir):
+            if old_seq < seq:
+                old_path.unlink()
+        for old_seq, old_path in segments(self._wal.data_dir):
+            if old_seq < seq:
+                old_path.unlink()
+        logger.info(
+            f"Wrote snapshot {path} in {time.perf_counter() - start:.3f} seconds"
+        )
+        return path
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._interval_seconds):
+            # Nothing to gain from a snapshot if nothing changed
+            if self._wal.appended == self._snapshotted_at:
+                continue
+            try:
+                self.snapshot()
+            except OSError:
+                logger.exception("Could not write snapshot")
@@ -25,23 +25,53 @@ _sym_db = _symbol_database.Default()
 from google.protobuf import timestamp_pb2 as google_dot_protobuf_dot_timestamp__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0e\x64istlock.proto\x12\x08\x64istlock\x1a\x1fgoogle/protobuf/timestamp.proto\"\x0e\n\x0c\x45mptyRequest\"\x0f\n\rEmptyResponse\"d\n\x04Lock\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x10\n\x08\x61\x63quired\x18\x02 \x01(\x08\x12\r\n\x05\x63lock\x18\x03 \x01(\x03\x12.\n\nexpires_at\x18\x04 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\"&\n\x05Locks\x12\x1d\n\x05locks\x18\x01 \x03(\x0b\x32\x0e.distlock.Lock\"=\n\x12\x41\x63quireLockRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x1a\n\x12\x65xpires_in_seconds\x18\x02 \x01(\x03\x32\xda\x02\n\x08\x44istlock\x12\x37\n\nCreateLock\x12\x0e.distlock.Lock\x1a\x17.distlock.EmptyResponse\"\x00\x12=\n\x0b\x41\x63quireLock\x12\x1c.distlock.AcquireLockRequest\x1a\x0e.distlock.Lock\"\x00\x12\x38\n\x0bReleaseLock\x12\x0e.distlock.Lock\x1a\x17.distlock.EmptyResponse\"\x00\x12+\n\x07GetLock\x12\x0e.distlock.Lock\x1a\x0e.distlock.Lock\"\x00\x12\x36\n\tListLocks\x12\x16.distlock.EmptyRequest\x1a\x0f.distlock.Locks\"\x00\x12\x37\n\nDeleteLock\x12\x0e.distlock.Lock\x1a\x17.distlock.EmptyResponse\"\x00\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0e\x64istlock.proto\x12\x08\x64istlock\x1a\x1fgoogle/protobuf/timestamp.proto\"\x0e\n\x0c\x45mptyRequest\"\x0f\n\rEmptyResponse\"\xef\x01\n\x04Lock\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x10\n\x08\x61\x63quired\x18\x02 \x01(\x08\x12\r\n\x05\x63lock\x18\x03 \x01(\x03\x12.\n\nexpires_at\x18\x04 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\x0e\n\x06shared\x18\x05 \x01(\x08\x12\x0f\n\x07permits\x18\x06 \x01(\x05\x12\x16\n\x0equeue_position\x18\x07 \x01(\x05\x12\x1e\n\x16\x65stimated_wait_seconds\x18\x08 \x01(\x01\x12\r\n\x05owner\x18\t \x01(\t\x12\r\n\x05holds\x18\n \x01(\x05\x12\x12\n\nrequest_id\x18\x0b \x01(\t\"&\n\x05Locks\x12\x1d\n\x05locks\x18\x01 \x03(\x0b\x32\x0e.distlock.Lock\"\x82\x01\n\x12\x41\x63quireLockRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x1a\n\x12\x65xpires_in_seconds\x18\x02 \x01(\x03\x12 \n\x04mode\x18\x03 \x01(\x0e\x32\x12.distlock.LockMode\x12\r\n\x05owner\x18\x04 \x01(\t\x12\x12\n\nrequest_id\x18\x05 \x01(\t\"\x9f\x01\n\x16WaitAcquireLockRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x1a\n\x12\x65xpires_in_seconds\x18\x02 \x01(\x03\x12\x17\n\x0ftimeout_seconds\x18\x03 \x01(\x01\x12 \n\x04mode\x18\x04 \x01(\x0e\x32\x12.distlock.LockMode\x12\r\n\x05owner\x18\x05 \x01(\t\x12\x12\n\nrequest_id\x18\x06 \x01(\t\"J\n\x10RenewLockRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05\x63lock\x18\x02 \x01(\x03\x12\x1a\n\x12\x65xpires_in_seconds\x18\x03 \x01(\x03\"E\n\x13\x41\x63quireLocksRequest\x12.\n\x08requests\x18\x01 \x03(\x0b\x32\x1c.distlock.AcquireLockRequest\"I\n\nLockResult\x12\x1c\n\x04lock\x18\x01 \x01(\x0b\x32\x0e.distlock.Lock\x12\x0c\n\x04\x63ode\x18\x02 \x01(\x05\x12\x0f\n\x07\x64\x65tails\x18\x03 \x01(\t\"4\n\x0bLockResults\x12%\n\x07results\x18\x01 \x03(\x0b\x32\x14.distlock.LockResult\"7\n\x12StreamLocksRequest\x12\x0e\n\x06prefix\x18\x01 \x01(\t\x12\x11\n\tpage_size\x18\x02 \x01(\x05\"g\n\x12RequestVoteRequest\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x14\n\x0c\x63\x61ndidate_id\x18\x02 \x01(\t\x12\x16\n\x0elast_log_index\x18\x03 \x01(\x03\x12\x15\n\rlast_log_term\x18\x04 \x01(\x03\"9\n\x13RequestVoteResponse\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x14\n\x0cvote_granted\x18\x02 \x01(\x08\"&\n\x08LogEntry\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x0c\n\x04\x62ody\x18\x02 \x01(\x0c\"\xa2\x01\n\x14\x41ppendEntriesRequest\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x11\n\tleader_id\x18\x02 \x01(\t\x12\x16\n\x0eprev_log_index\x18\x03 \x01(\x03\x12\x15\n\rprev_log_term\x18\x04 \x01(\x03\x12#\n\x07\x65ntries\x18\x05 \x03(\x0b\x32\x12.distlock.LogEntry\x12\x15\n\rleader_commit\x18\x06 \x01(\x03\"N\n\x15\x41ppendEntriesResponse\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\x16\n\x0elast_log_index\x18\x03 \x01(\x03\"\x9e\x01\n\x16InstallSnapshotRequest\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x11\n\tleader_id\x18\x02 \x01(\t\x12\x1b\n\x13last_included_index\x18\x03 \x01(\x03\x12\x1a\n\x12last_included_term\x18\x04 \x01(\x03\x12\x0e\n\x06offset\x18\x05 \x01(\x03\x12\x0c\n\x04\x64\x61ta\x18\x06 \x01(\x0c\x12\x0c\n\x04\x64one\x18\x07 \x01(\x08\"8\n\x17InstallSnapshotResponse\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x0f\n\x07success\x18\x02 \x01(\x08*%\n\x08LockMode\x12\r\n\tEXCLUSIVE\x10\x00\x12\n\n\x06SHARED\x10\x01\x32\x8f\x06\n\x08\x44istlock\x12\x37\n\nCreateLock\x12\x0e.distlock.Lock\x1a\x17.distlock.EmptyResponse\"\x00\x12=\n\x0b\x41\x63quireLock\x12\x1c.distlock.AcquireLockRequest\x1a\x0e.distlock.Lock\"\x00\x12\x45\n\x0fWaitAcquireLock\x12 .distlock.WaitAcquireLockRequest\x1a\x0e.distlock.Lock\"\x00\x12\x38\n\x0bReleaseLock\x12\x0e.distlock.Lock\x1a\x17.distlock.EmptyResponse\"\x00\x12\x39\n\tRenewLock\x12\x1a.distlock.RenewLockRequest\x1a\x0e.distlock.Lock\"\x00\x12+\n\x07GetLock\x12\x0e.distlock.Lock\x1a\x0e.distlock.Lock\"\x00\x12\x36\n\tListLocks\x12\x16.distlock.EmptyRequest\x1a\x0f.distlock.Locks\"\x00\x12@\n\x0bStreamLocks\x12\x1c.distlock.StreamLocksRequest\x1a\x0f.distlock.Locks\"\x00\x30\x01\x12\x37\n\nDeleteLock\x12\x0e.distlock.Lock\x1a\x17.distlock.EmptyResponse\"\x00\x12\x37\n\x0b\x43reateLocks\x12\x0f.distlock.Locks\x1a\x15.distlock.LockResults\"\x00\x12\x46\n\x0c\x41\x63quireLocks\x12\x1d.distlock.AcquireLocksRequest\x1a\x15.distlock.LockResults\"\x00\x12\x38\n\x0cReleaseLocks\x12\x0f.distlock.Locks\x1a\x15.distlock.LockResults\"\x00\x12\x34\n\x08GetLocks\x12\x0f.distlock.Locks\x1a\x15.distlock.LockResults\"\x00\x32\x82\x02\n\x04Raft\x12L\n\x0bRequestVote\x12\x1c.distlock.RequestVoteRequest\x1a\x1d.distlock.RequestVoteResponse\"\x00\x12R\n\rAppendEntries\x12\x1e.distlock.AppendEntriesRequest\x1a\x1f.distlock.AppendEntriesResponse\"\x00\x12X\n\x0fInstallSnapshot\x12 .distlock.InstallSnapshotRequest\x1a!.distlock.InstallSnapshotResponse\"\x00\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'distlock_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
+  _globals['_LOCKMODE']._serialized_start=1672
+  _globals['_LOCKMODE']._serialized_end=1709
   _globals['_EMPTYREQUEST']._serialized_start=61
   _globals['_EMPTYREQUEST']._serialized_end=75
   _globals['_EMPTYRESPONSE']._serialized_start=77
   _globals['_EMPTYRESPONSE']._serialized_end=92
-  _globals['_LOCK']._serialized_start=94
-  _globals['_LOCK']._serialized_end=194
-  _globals['_LOCKS']._serialized_start=196
-  _globals['_LOCKS']._serialized_end=234
-  _globals['_ACQUIRELOCKREQUEST']._serialized_start=236
-  _globals['_ACQUIRELOCKREQUEST']._serialized_end=297
-  _globals['_DISTLOCK']._serialized_start=300
-  _globals['_DISTLOCK']._serialized_end=646
+  _globals['_LOCK']._serialized_start=95
+  _globals['_LOCK']._serialized_end=334
+  _globals['_LOCKS']._serialized_start=336
+  _globals['_LOCKS']._serialized_end=374
+  _globals['_ACQUIRELOCKREQUEST']._serialized_start=377
+  _globals['_ACQUIRELOCKREQUEST']._serialized_end=507
+  _globals['_WAITACQUIRELOCKREQUEST']._serialized_start=510
+  _globals['_WAITACQUIRELOCKREQUEST']._serialized_end=669
+  _globals['_RENEWLOCKREQUEST']._serialized_start=671
+  _globals['_RENEWLOCKREQUEST']._serialized_end=745
+  _globals['_ACQUIRELOCKSREQUEST']._serialized_start=747
+  _globals['_ACQUIRELOCKSREQUEST']._serialized_end=816
+  _globals['_LOCKRESULT']._serialized_start=818
+  _globals['_LOCKRESULT']._serialized_end=891
+  _globals['_LOCKRESULTS']._serialized_start=893
+  _globals['_LOCKRESULTS']._serialized_end=945
+  _globals['_STREAMLOCKSREQUEST']._serialized_start=947
+  _globals['_STREAMLOCKSREQUEST']._serialized_end=1002
+  _globals['_REQUESTVOTEREQUEST']._serialized_start=1004
+  _globals['_REQUESTVOTEREQUEST']._serialized_end=1107
+  _globals['_REQUESTVOTERESPONSE']._serialized_start=1109
+  _globals['_REQUESTVOTERESPONSE']._serialized_end=1166
+  _globals['_LOGENTRY']._serialized_start=1168
+  _globals['_LOGENTRY']._serialized_end=1206
+  _globals['_APPENDENTRIESREQUEST']._serialized_start=1209
+  _globals['_APPENDENTRIESREQUEST']._serialized_end=1371
+  _globals['_APPENDENTRIESRESPONSE']._serialized_start=1373
+  _globals['_APPENDENTRIESRESPONSE']._serialized_end=1451
+  _globals['_INSTALLSNAPSHOTREQUEST']._serialized_start=1454
+  _globals['_INSTALLSNAPSHOTREQUEST']._serialized_end=1612
+  _globals['_INSTALLSNAPSHOTRESPONSE']._serialized_start=1614
+  _globals['_INSTALLSNAPSHOTRESPONSE']._serialized_end=1670
+  _globals['_DISTLOCK']._serialized_start=1712
+  _globals['_DISTLOCK']._serialized_end=2495
+  _globals['_RAFT']._serialized_start=2498
+  _globals['_RAFT']._serialized_end=2756
 # @@protoc_insertion_point(module_scope)
@@ -1,11 +1,19 @@
 from google.protobuf import timestamp_pb2 as _timestamp_pb2
 from google.protobuf.internal import containers as _containers
+from google.protobuf.internal import enum_type_wrapper as _enum_type_wrapper
 from google.protobuf import descriptor as _descriptor
 from google.protobuf import message as _message
 from typing import ClassVar as _ClassVar, Iterable as _Iterable, Mapping as _Mapping, Optional as _Optional, Union as _Union
 
 DESCRIPTOR: _descriptor.FileDescriptor
 
+class LockMode(int, metaclass=_enum_type_wrapper.EnumTypeWrapper):
+    __slots__ = ()
+    EXCLUSIVE: _ClassVar[LockMode]
+    SHARED: _ClassVar[LockMode]
+EXCLUSIVE: LockMode
+SHARED: LockMode
+
 class EmptyRequest(_message.Message):
     __slots__ = ()
     def __init__(self) -> None: ...
@@ -15,16 +23,30 @@ class EmptyResponse(_message.Message):
     def __init__(self) -> None: ...
 
 class Lock(_message.Message):
-    __slots__ = ("key", "acquired", "clock", "expires_at")
+    __slots__ = ("key", "acquired", "clock", "expires_at", "shared", "permits", "queue_position", "estimated_wait_seconds", "owner", "holds", "request_id")
     KEY_FIELD_NUMBER: _ClassVar[int]
     ACQUIRED_FIELD_NUMBER: _ClassVar[int]
     CLOCK_FIELD_NUMBER: _ClassVar[int]
     EXPIRES_AT_FIELD_NUMBER: _ClassVar[int]
+    SHARED_FIELD_NUMBER: _ClassVar[int]
+    PERMITS_FIELD_NUMBER: _ClassVar[int]
+    QUEUE_POSITION_FIELD_NUMBER: _ClassVar[int]
+    ESTIMATED_WAIT_SECONDS_FIELD_NUMBER: _ClassVar[int]
+    OWNER_FIELD_NUMBER: _ClassVar[int]
+    HOLDS_FIELD_NUMBER: _ClassVar[int]
+    REQUEST_ID_FIELD_NUMBER: _ClassVar[int]
     key: str
     acquired: bool
     clock: int
     expires_at: _timestamp_pb2.Timestamp
-    def __init__(self, key: _Optional[str] = ..., acquired: bool = ..., clock: _Optional[int] = ..., expires_at: _Optional[_Union[_timestamp_pb2.Timestamp, _Mapping]] = ...) -> None: ...
+    shared: bool
+    permits: int
+    queue_position: int
+    estimated_wait_seconds: float
+    owner: str
+    holds: int
+    request_id: str
+    def __init__(self, key: _Optional[str] = ..., acquired: bool = ..., clock: _Optional[int] = ..., expires_at: _Optional[_Union[_timestamp_pb2.Timestamp, _Mapping]] = ..., shared: bool = ..., permits: _Optional[int] = ..., queue_position: _Optional[int] = ..., estimated_wait_seconds: _Optional[float] = ..., owner: _Optional[str] = ..., holds: _Optional[int] = ..., request_id: _Optional[str] = ...) -> None: ...
 
 class Locks(_message.Message):
     __slots__ = ("locks",)
@@ -33,9 +55,151 @@ class Locks(_message.Message):
     def __init__(self, locks: _Optional[_Iterable[_Union[Lock, _Mapping]]] = ...) -> None: ...
 
 class AcquireLockRequest(_message.Message):
-    __slots__ = ("key", "expires_in_seconds")
+    __slots__ = ("key", "expires_in_seconds", "mode", "owner", "request_id")
+    KEY_FIELD_NUMBER: _ClassVar[int]
+    EXPIRES_IN_SECONDS_FIELD_NUMBER: _ClassVar[int]
+    MODE_FIELD_NUMBER: _ClassVar[int]
+    OWNER_FIELD_NUMBER: _ClassVar[int]
+    REQUEST_ID_FIELD_NUMBER: _ClassVar[int]
+    key: str
+    expires_in_seconds: int
+    mode: LockMode
+    owner: str
+    request_id: str
+    def __init__(self, key: _Optional[str] = ..., expires_in_seconds: _Optional[int] = ..., mode: _Optional[_Union[LockMode, str]] = ..., owner: _Optional[str] = ..., request_id: _Optional[str] = ...) -> None: ...
+
+class WaitAcquireLockRequest(_message.Message):
+    __slots__ = ("key", "expires_in_seconds", "timeout_seconds", "mode", "owner", "request_id")
     KEY_FIELD_NUMBER: _ClassVar[int]
     EXPIRES_IN_SECONDS_FIELD_NUMBER: _ClassVar[int]
+    TIMEOUT_SECONDS_FIELD_NUMBER: _ClassVar[int]
+    MODE_FIELD_NUMBER: _ClassVar[int]
+    OWNER_FIELD_NUMBER: _ClassVar[int]
+    REQUEST_ID_FIELD_NUMBER: _ClassVar[int]
     key: str
     expires_in_seconds: int
-    def __init__(self, key: _Optional[str] = ..., expires_in_seconds: _Optional[int] = ...) -> None: ...
+    timeout_seconds: float
+    mode: LockMode
+    owner: str
+    request_id: str
+    def __init__(self, key: _Optional[str] = ..., expires_in_seconds: _Optional[int] = ..., timeout_seconds: _Optional[float] = ..., mode: _Optional[_Union[LockMode, str]] = ..., owner: _Optional[str] = ..., request_id: _Optional[str] = ...) -> None: ...
+
+class RenewLockRequest(_message.Message):
+    __slots__ = ("key", "clock", "expires_in_seconds")
+    KEY_FIELD_NUMBER: _ClassVar[int]
+    CLOCK_FIELD_NUMBER: _ClassVar[int]
+    EXPIRES_IN_SECONDS_FIELD_NUMBER: _ClassVar[int]
+    key: str
+    clock: int
+    expires_in_seconds: int
+    def __init__(self, key: _Optional[str] = ..., clock: _Optional[int] = ..., expires_in_seconds: _Optional[int] = ...) -> None: ...
+
+class AcquireLocksRequest(_message.Message):
+    __slots__ = ("requests",)
+    REQUESTS_FIELD_NUMBER: _ClassVar[int]
+    requests: _containers.RepeatedCompositeFieldContainer[AcquireLockRequest]
+    def __init__(self, requests: _Optional[_Iterable[_Union[AcquireLockRequest, _Mapping]]] = ...) -> None: ...
+
+class LockResult(_message.Message):
+    __slots__ = ("lock", "code", "details")
+    LOCK_FIELD_NUMBER: _ClassVar[int]
+    CODE_FIELD_NUMBER: _ClassVar[int]
+    DETAILS_FIELD_NUMBER: _ClassVar[int]
+    lock: Lock
+    code: int
+    details: str
+    def __init__(self, lock: _Optional[_Union[Lock, _Mapping]] = ..., code: _Optional[int] = ..., details: _Optional[str] = ...) -> None: ...
+
+class LockResults(_message.Message):
+    __slots__ = ("results",)
+    RESULTS_FIELD_NUMBER: _ClassVar[int]
+    results: _containers.RepeatedCompositeFieldContainer[LockResult]
+    def __init__(self, results: _Optional[_Iterable[_Union[LockResult, _Mapping]]] = ...) -> None: ...
+
+class StreamLocksRequest(_message.Message):
+    __slots__ = ("prefix", "page_size")
+    PREFIX_FIELD_NUMBER: _ClassVar[int]
+    PAGE_SIZE_FIELD_NUMBER: _ClassVar[int]
+    prefix: str
+    page_size: int
+    def __init__(self, prefix: _Optional[str] = ..., page_size: _Optional[int] = ...) -> None: ...
+
+class RequestVoteRequest(_message.Message):
+    __slots__ = ("term", "candidate_id", "last_log_index", "last_log_term")
+    TERM_FIELD_NUMBER: _ClassVar[int]
+    CANDIDATE_ID_FIELD_NUMBER: _ClassVar[int]
+    LAST_LOG_INDEX_FIELD_NUMBER: _ClassVar[int]
+    LAST_LOG_TERM_FIELD_NUMBER: _ClassVar[int]
+    term: int
+    candidate_id: str
+    last_log_index: int
+    last_log_term: int
+    def __init__(self, term: _Optional[int] = ..., candidate_id: _Optional[str] = ..., last_log_index: _Optional[int] = ..., last_log_term: _Optional[int] = ...) -> None: ...
+
+class RequestVoteResponse(_message.Message):
+    __slots__ = ("term", "vote_granted")
+    TERM_FIELD_NUMBER: _ClassVar[int]
+    VOTE_GRANTED_FIELD_NUMBER: _ClassVar[int]
+    term: int
+    vote_granted: bool
+    def __init__(self, term: _Optional[int] = ..., vote_granted: bool = ...) -> None: ...
+
+class LogEntry(_message.Message):
+    __slots__ = ("term", "body")
+    TERM_FIELD_NUMBER: _ClassVar[int]
+    BODY_FIELD_NUMBER: _ClassVar[int]
+    term: int
+    body: bytes
+    def __init__(self, term: _Optional[int] = ..., body: _Optional[bytes] = ...) -> None: ...
+
+class AppendEntriesRequest(_message.Message):
+    __slots__ = ("term", "leader_id", "prev_log_index", "prev_log_term", "entries", "leader_commit")
+    TERM_FIELD_NUMBER: _ClassVar[int]
+    LEADER_ID_FIELD_NUMBER: _ClassVar[int]
+    PREV_LOG_INDEX_FIELD_NUMBER: _ClassVar[int]
+    PREV_LOG_TERM_FIELD_NUMBER: _ClassVar[int]
+    ENTRIES_FIELD_NUMBER: _ClassVar[int]
+    LEADER_COMMIT_FIELD_NUMBER: _ClassVar[int]
+    term: int
+    leader_id: str
+    prev_log_index: int
+    prev_log_term: int
+    entries: _containers.RepeatedCompositeFieldContainer[LogEntry]
+    leader_commit: int
+    def __init__(self, term: _Optional[int] = ..., leader_id: _Optional[str] = ..., prev_log_index: _Optional[int] = ..., prev_log_term: _Optional[int] = ..., entries: _Optional[_Iterable[_Union[LogEntry, _Mapping]]] = ..., leader_commit: _Optional[int] = ...) -> None: ...
+
+class AppendEntriesResponse(_message.Message):
+    __slots__ = ("term", "success", "last_log_index")
+    TERM_FIELD_NUMBER: _ClassVar[int]
+    SUCCESS_FIELD_NUMBER: _ClassVar[int]
+    LAST_LOG_INDEX_FIELD_NUMBER: _ClassVar[int]
+    term: int
+    success: bool
+    last_log_index: int
+    def __init__(self, term: _Optional[int] = ..., success: bool = ..., last_log_index: _Optional[int] = ...) -> None: ...
+
+class InstallSnapshotRequest(_message.Message):
+    __slots__ = ("term", "leader_id", "last_included_index", "last_included_term", "offset", "data", "done")
+    TERM_FIELD_NUMBER: _ClassVar[int]
+    LEADER_ID_FIELD_NUMBER: _ClassVar[int]
+    LAST_INCLUDED_INDEX_FIELD_NUMBER: _ClassVar[int]
+    LAST_INCLUDED_TERM_FIELD_NUMBER: _ClassVar[int]
+    OFFSET_FIELD_NUMBER: _ClassVar[int]
+    DATA_FIELD_NUMBER: _ClassVar[int]
+    DONE_FIELD_NUMBER: _ClassVar[int]
+    term: int
+    leader_id: str
+    last_included_index: int
+    last_included_term: int
+    offset: int
+    data: bytes
+    done: bool
+    def __init__(self, term: _Optional[int] = ..., leader_id: _Optional[str] = ..., last_included_index: _Optional[int] = ..., last_included_term: _Optional[int] = ..., offset: _Optional[int] = ..., data: _Optional[bytes] = ..., done: bool = ...) -> None: ...
+
+class InstallSnapshotResponse(_message.Message):
+    __slots__ = ("term", "success")
+    TERM_FIELD_NUMBER: _ClassVar[int]
+    SUCCESS_FIELD_NUMBER: _ClassVar[int]
+    term: int
+    success: bool
+    def __init__(self, term: _Optional[int] = ..., success: bool = ...) -> None: ...
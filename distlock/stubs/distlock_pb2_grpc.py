@@ -45,11 +45,21 @@ class DistlockStub(object):
                 request_serializer=distlock__pb2.AcquireLockRequest.SerializeToString,
                 response_deserializer=distlock__pb2.Lock.FromString,
                 _registered_method=True)
+        self.WaitAcquireLock = channel.unary_unary(
+                '/distlock.Distlock/WaitAcquireLock',
+                request_serializer=distlock__pb2.WaitAcquireLockRequest.SerializeToString,
+                response_deserializer=distlock__pb2.Lock.FromString,
+                _registered_method=True)
         self.ReleaseLock = channel.unary_unary(
                 '/distlock.Distlock/ReleaseLock',
                 request_serializer=distlock__pb2.Lock.SerializeToString,
                 response_deserializer=distlock__pb2.EmptyResponse.FromString,
                 _registered_method=True)
+        self.RenewLock = channel.unary_unary(
+                '/distlock.Distlock/RenewLock',
+                request_serializer=distlock__pb2.RenewLockRequest.SerializeToString,
+                response_deserializer=distlock__pb2.Lock.FromString,
+                _registered_method=True)
         self.GetLock = channel.unary_unary(
                 '/distlock.Distlock/GetLock',
                 request_serializer=distlock__pb2.Lock.SerializeToString,
@@ -60,11 +70,36 @@ class DistlockStub(object):
                 request_serializer=distlock__pb2.EmptyRequest.SerializeToString,
                 response_deserializer=distlock__pb2.Locks.FromString,
                 _registered_method=True)
+        self.StreamLocks = channel.unary_stream(
+                '/distlock.Distlock/StreamLocks',
+                request_serializer=distlock__pb2.StreamLocksRequest.SerializeToString,
+                response_deserializer=distlock__pb2.Locks.FromString,
+                _registered_method=True)
         self.DeleteLock = channel.unary_unary(
                 '/distlock.Distlock/DeleteLock',
                 request_serializer=distlock__pb2.Lock.SerializeToString,
                 response_deserializer=distlock__pb2.EmptyResponse.FromString,
                 _registered_method=True)
+        self.CreateLocks = channel.unary_unary(
+                '/distlock.Distlock/CreateLocks',
+                request_serializer=distlock__pb2.Locks.SerializeToString,
+                response_deserializer=distlock__pb2.LockResults.FromString,
+                _registered_method=True)
+        self.AcquireLocks = channel.unary_unary(
+                '/distlock.Distlock/AcquireLocks',
+                request_serializer=distlock__pb2.AcquireLocksRequest.SerializeToString,
+                response_deserializer=distlock__pb2.LockResults.FromString,
+                _registered_method=True)
+        self.ReleaseLocks = channel.unary_unary(
+                '/distlock.Distlock/ReleaseLocks',
+                request_serializer=distlock__pb2.Locks.SerializeToString,
+                response_deserializer=distlock__pb2.LockResults.FromString,
+                _registered_method=True)
+        self.GetLocks = channel.unary_unary(
+                '/distlock.Distlock/GetLocks',
+                request_serializer=distlock__pb2.Locks.SerializeToString,
+                response_deserializer=distlock__pb2.LockResults.FromString,
+                _registered_method=True)
 
 
 class DistlockServicer(object):
@@ -85,6 +120,17 @@ class DistlockServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def WaitAcquireLock(self, request, context):
+        """Acquires the lock with the given key from the server, waiting on the
+        server until the lock is released or expires. Waiters on a key are served
+        in the order in which they arrived. If the wait times out before the lock
+        could be acquired, the returned lock is not acquired, and from a fair
+        server carries the place in the queue it gave up.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def ReleaseLock(self, request, context):
         """Releases the lock with the given key from the server.
         """
@@ -92,6 +138,16 @@ class DistlockServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def RenewLock(self, request, context):
+        """Extends the lease on the lock with the given key to expire
+        expires_in_seconds from now, if the lease is still held at the given
+        clock. Fails with ABORTED if the lease was released, expired or taken
+        over, in which case the caller no longer holds the lock.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def GetLock(self, request, context):
         """Fetches the lock with the given key from the server, without acquiring it.
         The lock object passed to this procedure does not have to have anything
@@ -108,6 +164,16 @@ class DistlockServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamLocks(self, request, context):
+        """Streams locks from the server in pages ordered by key, without acquiring
+        any of them. Only locks whose keys start with the given prefix are sent.
+        Unlike ListLocks, the server never copies or serializes the whole table at
+        once, so this should be preferred for large tables.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def DeleteLock(self, request, context):
         """Deletes the lock with the given key from the server.  The lock object
         passed tto this procedured does not have to have anything other than the
@@ -117,6 +183,39 @@ class DistlockServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def CreateLocks(self, request, context):
+        """Creates many locks in one call. The server handles the whole batch at
+        once, and returns one result per lock in the order they were given. A
+        failure for one key does not stop the others from being created.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def AcquireLocks(self, request, context):
+        """Acquires many locks in one call, without waiting for any of them. Returns
+        one result per request, in order.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ReleaseLocks(self, request, context):
+        """Releases many locks in one call. Returns one result per lock, in order.
+        Request ids are not used.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetLocks(self, request, context):
+        """Fetches many locks in one call. Only the keys of the given locks are
+        used. Returns one result per lock, in order.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_DistlockServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -130,11 +229,21 @@ def add_DistlockServicer_to_server(servicer, server):
                     request_deserializer=distlock__pb2.AcquireLockRequest.FromString,
                     response_serializer=distlock__pb2.Lock.SerializeToString,
             ),
+            'WaitAcquireLock': grpc.unary_unary_rpc_method_handler(
+                    servicer.WaitAcquireLock,
+                    request_deserializer=distlock__pb2.WaitAcquireLockRequest.FromString,
+                    response_serializer=distlock__pb2.Lock.SerializeToString,
+            ),
             'ReleaseLock': grpc.unary_unary_rpc_method_handler(
                     servicer.ReleaseLock,
                     request_deserializer=distlock__pb2.Lock.FromString,
                     response_serializer=distlock__pb2.EmptyResponse.SerializeToString,
             ),
+            'RenewLock': grpc.unary_unary_rpc_method_handler(
+                    servicer.RenewLock,
+                    request_deserializer=distlock__pb2.RenewLockRequest.FromString,
+                    response_serializer=distlock__pb2.Lock.SerializeToString,
+            ),
             'GetLock': grpc.unary_unary_rpc_method_handler(
                     servicer.GetLock,
                     request_deserializer=distlock__pb2.Lock.FromString,
@@ -145,11 +254,36 @@ def add_DistlockServicer_to_server(servicer, server):
                     request_deserializer=distlock__pb2.EmptyRequest.FromString,
                     response_serializer=distlock__pb2.Locks.SerializeToString,
             ),
+            'StreamLocks': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamLocks,
+                    request_deserializer=distlock__pb2.StreamLocksRequest.FromString,
+                    response_serializer=distlock__pb2.Locks.SerializeToString,
+            ),
             'DeleteLock': grpc.unary_unary_rpc_method_handler(
                     servicer.DeleteLock,
                     request_deserializer=distlock__pb2.Lock.FromString,
                     response_serializer=distlock__pb2.EmptyResponse.SerializeToString,
             ),
+            'CreateLocks': grpc.unary_unary_rpc_method_handler(
+                    servicer.CreateLocks,
+                    request_deserializer=distlock__pb2.Locks.FromString,
+                    response_serializer=distlock__pb2.LockResults.SerializeToString,
+            ),
+            'AcquireLocks': grpc.unary_unary_rpc_method_handler(
+                    servicer.AcquireLocks,
+                    request_deserializer=distlock__pb2.AcquireLocksRequest.FromString,
+                    response_serializer=distlock__pb2.LockResults.SerializeToString,
+            ),
+            'ReleaseLocks': grpc.unary_unary_rpc_method_handler(
+                    servicer.ReleaseLocks,
+                    request_deserializer=distlock__pb2.Locks.FromString,
+                    response_serializer=distlock__pb2.LockResults.SerializeToString,
+            ),
+            'GetLocks': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetLocks,
+                    request_deserializer=distlock__pb2.Locks.FromString,
+                    response_serializer=distlock__pb2.LockResults.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'distlock.Distlock', rpc_method_handlers)
@@ -216,6 +350,33 @@ class Distlock(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def WaitAcquireLock(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/distlock.Distlock/WaitAcquireLock',
+            distlock__pb2.WaitAcquireLockRequest.SerializeToString,
+            distlock__pb2.Lock.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def ReleaseLock(request,
             target,
@@ -243,6 +404,33 @@ class Distlock(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def RenewLock(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/distlock.Distlock/RenewLock',
+            distlock__pb2.RenewLockRequest.SerializeToString,
+            distlock__pb2.Lock.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def GetLock(request,
             target,
@@ -297,6 +485,33 @@ class Distlock(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def StreamLocks(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/distlock.Distlock/StreamLocks',
+            distlock__pb2.StreamLocksRequest.SerializeToString,
+            distlock__pb2.Locks.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def DeleteLock(request,
             target,
@@ -323,3 +538,280 @@ class Distlock(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def CreateLocks(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/distlock.Distlock/CreateLocks',
+            distlock__pb2.Locks.SerializeToString,
+            distlock__pb2.LockResults.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def AcquireLocks(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/distlock.Distlock/AcquireLocks',
+            distlock__pb2.AcquireLocksRequest.SerializeToString,
+            distlock__pb2.LockResults.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ReleaseLocks(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/distlock.Distlock/ReleaseLocks',
+            distlock__pb2.Locks.SerializeToString,
+            distlock__pb2.LockResults.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetLocks(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/distlock.Distlock/GetLocks',
+            distlock__pb2.Locks.SerializeToString,
+            distlock__pb2.LockResults.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+
+class RaftStub(object):
+    """Replication between the nodes of a distlock cluster, following Raft. Only
+    the servers of a cluster call these.
+    """
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.RequestVote = channel.unary_unary(
+                '/distlock.Raft/RequestVote',
+                request_serializer=distlock__pb2.RequestVoteRequest.SerializeToString,
+                response_deserializer=distlock__pb2.RequestVoteResponse.FromString,
+                _registered_method=True)
+        self.AppendEntries = channel.unary_unary(
+                '/distlock.Raft/AppendEntries',
+                request_serializer=distlock__pb2.AppendEntriesRequest.SerializeToString,
+                response_deserializer=distlock__pb2.AppendEntriesResponse.FromString,
+                _registered_method=True)
+        self.InstallSnapshot = channel.unary_unary(
+                '/distlock.Raft/InstallSnapshot',
+                request_serializer=distlock__pb2.InstallSnapshotRequest.SerializeToString,
+                response_deserializer=distlock__pb2.InstallSnapshotResponse.FromString,
+                _registered_method=True)
+
+
+class RaftServicer(object):
+    """Replication between the nodes of a distlock cluster, following Raft. Only
+    the servers of a cluster call these.
+    """
+
+    def RequestVote(self, request, context):
+        """Asks for the vote of another node in an election.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def AppendEntries(self, request, context):
+        """Replicates log entries from the leader to a follower. With no entries, it
+        is the leader's heartbeat.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def InstallSnapshot(self, request, context):
+        """Sends a snapshot of the lock table, in chunks, from the leader to a
+        follower that needs entries the leader already compacted away.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_RaftServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'RequestVote': grpc.unary_unary_rpc_method_handler(
+                    servicer.RequestVote,
+                    request_deserializer=distlock__pb2.RequestVoteRequest.FromString,
+                    response_serializer=distlock__pb2.RequestVoteResponse.SerializeToString,
+            ),
+            'AppendEntries': grpc.unary_unary_rpc_method_handler(
+                    servicer.AppendEntries,
+                    request_deserializer=distlock__pb2.AppendEntriesRequest.FromString,
+                    response_serializer=distlock__pb2.AppendEntriesResponse.SerializeToString,
+            ),
+            'InstallSnapshot': grpc.unary_unary_rpc_method_handler(
+                    servicer.InstallSnapshot,
+                    request_deserializer=distlock__pb2.InstallSnapshotRequest.FromString,
+                    response_serializer=distlock__pb2.InstallSnapshotResponse.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'distlock.Raft', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('distlock.Raft', rpc_method_handlers)
+
+
+ # This class is part of an EXPERIMENTAL API.
+class Raft(object):
+    """Replication between the nodes of a distlock cluster, following Raft. Only
+    the servers of a cluster call these.
+    """
+
+    @staticmethod
+    def RequestVote(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/distlock.Raft/RequestVote',
+            distlock__pb2.RequestVoteRequest.SerializeToString,
+            distlock__pb2.RequestVoteResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def AppendEntries(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/distlock.Raft/AppendEntries',
+            distlock__pb2.AppendEntriesRequest.SerializeToString,
+            distlock__pb2.AppendEntriesResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def InstallSnapshot(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/distlock.Raft/InstallSnapshot',
+            distlock__pb2.InstallSnapshotRequest.SerializeToString,
+            distlock__pb2.InstallSnapshotResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
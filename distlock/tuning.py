@@ -0,0 +1,215 @@
+import dataclasses
+import threading
+import tomllib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+import grpc
+
+ServerOptions = list[tuple[str, int | str]]
+
+WAIT_ACQUIRE_LOCK_METHOD = "/distlock.Distlock/WaitAcquireLock"
+
+_COMPRESSIONS = {
+    "none": grpc.Compression.NoCompression,
+    "deflate": grpc.Compression.Deflate,
+    "gzip": grpc.Compression.Gzip,
+}
+
+
+@dataclass(frozen=True)
+class ServerTuning:
+    """
+    How the gRPC server serving locks is set up. Every setting left as None
+    keeps gRPC's default.
+
+    max_concurrent_rpcs caps the calls the server handles at once, counting
+    those queued for a worker thread and those waiting for a lock; gRPC turns
+    away the calls past it with RESOURCE_EXHAUSTED. max_waiting_rpcs caps only
+    the calls waiting for a lock, which on the threaded server each hold a
+    worker thread for as long as they wait, so that waiters cannot starve
+    every other call of workers.
+
+    The keepalive settings are in milliseconds, message sizes in bytes and
+    compression is one of none, deflate or gzip. options are passed on to
+    gRPC as they are, after the settings above.
+    """
+
+    max_concurrent_rpcs: int | None = None
+    max_waiting_rpcs: int | None = None
+    keepalive_time_ms: int | None = None
+    keepalive_timeout_ms: int | None = None
+    keepalive_permit_without_calls: bool | None = None
+    # The shortest interval between pings from a client that the server puts
+    # up with, which has to be below the keepalive_time_ms of clients
+    min_ping_interval_ms: int | None = None
+    max_connection_idle_ms: int | None = None
+    max_connection_age_ms: int | None = None
+    max_connection_age_grace_ms: int | None = None
+    max_receive_message_bytes: int | None = None
+    max_send_message_bytes: int | None = None
+    compression: str | None = None
+    so_reuseport: bool | None = None
+    options: tuple[tuple[str, int | str], ...] = ()
+
+    def __post_init__(self) -> None:
+        # Checked here rather than left to gRPC, as settings come from files
+        for field in dataclasses.fields(self):
+            value = getattr(self, field.name)
+            if value is None:
+                continue
+            if field.type == int | None:
+                if not isinstance(value, int) or isinstance(value, bool):
+                    raise ValueError(
+                        f"{field.name} must be a whole number, got {value!r}"
+                    )
+                if value < 1:
+                    raise ValueError(f"{field.name} must be at least 1, got {value}")
+            elif field.type == bool | None and not isinstance(value, bool):
+                raise ValueError(f"{field.name} must be true or false, got {value!r}")
+        if self.compression is not None and self.compression not in _COMPRESSIONS:
+            raise ValueError(
+                f"Unknown compression {self.compression!r}, expected one of {', '.join(_COMPRESSIONS)}"
+            )
+
+    @classmethod
+    def from_file(cls, path: Path) -> "ServerTuning":
+        """
+        Reads the settings from a TOML file, in which they have the names of
+        the fields, e.g. max_concurrent_rpcs = 1000. options is a table of
+        gRPC arguments.
+        """
+        with path.open("rb") as file:
+            settings: dict[str, Any] = tomllib.load(file)
+        names = {field.name for field in dataclasses.fields(cls)}
+        unknown = sorted(settings.keys() - names)
+        if unknown:
+            raise ValueError(f"Unknown settings in {path}: {', '.join(unknown)}")
+        if "options" in settings:
+            if not isinstance(settings["options"], dict):
+                raise ValueError(f"options in {path} must be a table")
+            settings["options"] = tuple(settings["options"].items())
+        return cls(**settings)
+
+    def override(self, **settings: Any) -> "ServerTuning":
+        """
+        Returns these settings with the ones given that are not None in place,
+        as with command line flags over a file.
+        """
+        return dataclasses.replace(
+            self,
+            **{name: value for name, value in settings.items() if value is not None},
+        )
+
+    def grpc_options(self) -> ServerOptions:
+        options: ServerOptions = []
+        for name, value in (
+            ("grpc.keepalive_time_ms", self.keepalive_time_ms),
+            ("grpc.keepalive_timeout_ms", self.keepalive_timeout_ms),
+            (
+                "grpc.keepalive_permit_without_calls",
+                self.keepalive_permit_without_calls,
+            ),
+            (
+                "grpc.http2.min_ping_interval_without_data_ms",
+                self.min_ping_interval_ms,
+            ),
+            ("grpc.max_connection_idle_ms", self.max_connection_idle_ms),
+            ("grpc.max_connection_age_ms", self.max_connection_age_ms),
+            ("grpc.max_connection_age_grace_ms", self.max_connection_age_grace_ms),
+            ("grpc.max_receive_message_length", self.max_receive_message_bytes),
+            ("grpc.max_send_message_length", self.max_send_message_bytes),
+            ("grpc.so_reuseport", self.so_reuseport),
+        ):
+            if value is not None:
+                options.append((name, int(value)))
+        options.extend(self.options)
+        return options
+
+    def grpc_compression(self) -> grpc.Compression | None:
+        if self.compression is None:
+            return None
+        return _COMPRESSIONS[self.compression]
+
+
+def _too_many_waiting(max_waiting: int) -> str:
+    return f"{max_waiting} calls are already waiting for locks, try again later"
+
+
+class AdmissionInterceptor(grpc.ServerInterceptor):
+    """
+    Turns away calls that would wait for a lock with RESOURCE_EXHAUSTED once
+    max_waiting of them are waiting on the threaded server.
+    """
+
+    def __init__(self, max_waiting: int):
+        self.max_waiting = max_waiting
+        self._waiting = threading.BoundedSemaphore(max_waiting)
+
+    def intercept_service(
+        self,
+        continuation: Callable[[grpc.HandlerCallDetails], grpc.RpcMethodHandler],
+        handler_call_details: grpc.HandlerCallDetails,
+    ) -> grpc.RpcMethodHandler:
+        handler = continuation(handler_call_details)
+        method: str = handler_call_details.method  # type: ignore[attr-defined]
+        if handler is None or method != WAIT_ACQUIRE_LOCK_METHOD:
+            return handler
+        unary = handler.unary_unary
+        waiting = self._waiting
+        message = _too_many_waiting(self.max_waiting)
+
+        def unary_unary(request: Any, context: grpc.ServicerContext) -> Any:
+            if not waiting.acquire(blocking=False):
+                context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, message)
+            try:
+                return unary(request, context)
+            finally:
+                waiting.release()
+
+        return grpc.unary_unary_rpc_method_handler(
+            unary_unary,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
+
+
+class AsyncAdmissionInterceptor(grpc.aio.ServerInterceptor):
+    """
+    The asyncio counterpart of AdmissionInterceptor, for the async server.
+    """
+
+    def __init__(self, max_waiting: int):
+        self.max_waiting = max_waiting
+        # Only ever changed on the server's event loop
+        self.waiting = 0
+
+    async def intercept_service(
+        self,
+        continuation: Callable[
+            [grpc.HandlerCallDetails], Awaitable[grpc.RpcMethodHandler]
+        ],
+        handler_call_details: grpc.HandlerCallDetails,
+    ) -> grpc.RpcMethodHandler:
+        handler = await continuation(handler_call_details)
+        method: str = handler_call_details.method  # type: ignore[attr-defined]
+        if handler is None or method != WAIT_ACQUIRE_LOCK_METHOD:
+            return handler
+        unary = handler.unary_unary
+        message = _too_many_waiting(self.max_waiting)
+
+        async def unary_unary(request: Any, context: grpc.aio.ServicerContext) -> Any:
+            if self.waiting >= self.max_waiting:
+                await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, message)
+            self.waiting += 1
+            try:
+                return await unary(request, context)
+            finally:
+                self.waiting -= 1
+
+        return grpc.unary_unary_rpc_method_handler(
+            unary_unary,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
@@ -0,0 +1,428 @@
+import asyncio
+import logging
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Protocol
+
+from .models import MONOTONIC_TO_WALL_CLOCK_NS, LockRecord
+
+SEGMENT_PREFIX = "wal-"
+SEGMENT_SUFFIX = ".log"
+
+# Each entry is framed as (length, crc32) followed by the body, so a torn write
+# at the end of the log can be detected and dropped on replay. The body is
+# (op, acquired, clock, expires_at) followed by the UTF-8 key, with expiry as
+# wall clock nanoseconds since monotonic readings do not survive a restart.
+# Puts of locks held in shared mode have the number of holders and the
+# (clock, expires_at) of each holder's lease between the two. Puts of
+# semaphores have their number of permits, then their holders the same way.
+# Puts of locks with an owner have (holds, owner length) and the UTF-8 owner.
+# Puts made for a request with a request id have REQUEST_ID set in their op,
+# and (clock of the lease granted or released, request id length) and the
+# UTF-8 request id right after the body, so that retries of the request are
+# still recognized after a restart or a change of leader.
+FRAME = struct.Struct("<II")
+BODY = struct.Struct("<B?qq")
+READER_COUNT = struct.Struct("<I")
+READER = struct.Struct("<qq")
+PERMITS = struct.Struct("<I")
+OWNER = struct.Struct("<IH")
+REQUEST = struct.Struct("<qH")
+PUT = 1
+DELETE = 2
+PUT_SHARED = 3
+PUT_SEMAPHORE = 4
+PUT_OWNED = 5
+REQUEST_ID = 0x80
+# How many of the latest request ids a store remembers, to recognize retries
+REQUEST_ID_CACHE_SIZE = 4_096
+
+logger = logging.getLogger(__name__)
+
+
+class MutationLog(Protocol):
+    """
+    Where a lock store records its mutations: the write-ahead log, or the
+    replicated log of a cluster. append() is called with the store's lock
+    held, and sync() returns once everything appended so far is safe.
+    """
+
+    def append(self, body: bytes) -> None: ...
+
+    def sync(self) -> None: ...
+
+
+def to_wall_clock_ns(expires_at_ns: int) -> int:
+    return expires_at_ns + MONOTONIC_TO_WALL_CLOCK_NS if expires_at_ns else 0
+
+
+def from_wall_clock_ns(expires_at_ns: int) -> int:
+    return expires_at_ns - MONOTONIC_TO_WALL_CLOCK_NS if expires_at_ns else 0
+
+
+def encode_readers(readers: dict[int, int]) -> bytes:
+    return READER_COUNT.pack(len(readers)) + b"".join(
+        READER.pack(clock, to_wall_clock_ns(expires_at_ns))
+        for clock, expires_at_ns in readers.items()
+    )
+
+
+def decode_readers(data: bytes | memoryview, offset: int) -> tuple[dict[int, int], int]:
+    """
+    Returns the leases of the shared holders encoded at offset, along with the
+    offset just past them.
+    """
+    (count,) = READER_COUNT.unpack_from(data, offset)
+    offset += READER_COUNT.size
+    readers = {}
+    for _ in range(count):
+        clock, expires_at_ns = READER.unpack_from(data, offset)
+        readers[clock] = from_wall_clock_ns(expires_at_ns)
+        offset += READER.size
+    return readers, offset
+
+
+def encode_owner(lock: LockRecord) -> bytes:
+    owner = lock.owner.encode()
+    return OWNER.pack(lock.holds, len(owner)) + owner
+
+
+def decode_owner(data: bytes | memoryview, offset: int) -> tuple[str, int, int]:
+    """
+    Returns the owner and holds encoded at offset, along with the offset just
+    past them.
+    """
+    holds, length = OWNER.unpack_from(data, offset)
+    offset += OWNER.size
+    return bytes(data[offset : offset + length]).decode(), holds, offset + length
+
+
+def remember_request(
+    requests: dict[str, tuple[str, int]], request_id: str, key: str, clock: int
+) -> None:
+    """
+    Records that request_id was granted or released the lease at clock on key,
+    forgetting the oldest request once there are too many to remember.
+    """
+    requests[request_id] = (key, clock)
+    if len(requests) > REQUEST_ID_CACHE_SIZE:
+        del requests[next(iter(requests))]
+
+
+def encode_put(lock: LockRecord, request_id: str = "", request_clock: int = 0) -> bytes:
+    """
+    Encodes a put of lock, made for request_id if given, which was granted or
+    released the lease at request_clock.
+    """
+    if lock.permits:
+        op = PUT_SEMAPHORE
+        data = PERMITS.pack(lock.permits) + encode_readers(lock.readers or {})
+    elif lock.readers is not None:
+        op = PUT_SHARED
+        data = encode_readers(lock.readers)
+    elif lock.owner:
+        op = PUT_OWNED
+        data = encode_owner(lock)
+    else:
+        op = PUT
+        data = b""
+    if request_id:
+        op |= REQUEST_ID
+        request = request_id.encode()
+        data = REQUEST.pack(request_clock, len(request)) + request + data
+    return (
+        BODY.pack(op, lock.acquired, lock.clock, to_wall_clock_ns(lock.expires_at_ns))
+        + data
+        + lock.key.encode()
+    )
+
+
+def encode_delete(key: str) -> bytes:
+    return BODY.pack(DELETE, False, 0, 0) + key.encode()
+
+
+def decode(body: bytes | memoryview) -> tuple[str, LockRecord | None]:
+    """
+    Returns the key of the entry, and the lock record it puts or None if it
+    deletes the key.
+    """
+    op, acquired, clock, expires_at_ns = BODY.unpack_from(body)
+    readers: dict[int, int] | None = None
+    permits = 0
+    owner = ""
+    holds = 0
+    offset = BODY.size
+    if op & REQUEST_ID:
+        op &= ~REQUEST_ID
+        _, length = REQUEST.unpack_from(body, offset)
+        offset += REQUEST.size + length
+    if op == PUT_SHARED:
+        readers, offset = decode_readers(body, offset)
+    elif op == PUT_SEMAPHORE:
+        (permits,) = PERMITS.unpack_from(body, offset)
+        readers, offset = decode_readers(body, offset + PERMITS.size)
+    elif op == PUT_OWNED:
+        owner, holds, offset = decode_owner(body, offset)
+    key = bytes(body[offset:]).decode()
+    if op == DELETE:
+        return key, None
+    return key, LockRecord(
+        key,
+        acquired,
+        clock,
+        from_wall_clock_ns(expires_at_ns),
+        op == PUT_SHARED,
+        readers or None,
+        permits,
+        owner,
+        holds,
+    )
+
+
+def decode_request(body: bytes | memoryview) -> tuple[str, int] | None:
+    """
+    Returns the request id of the entry and the clock of the lease it was
+    granted or released, or None if the entry was not made for a request id.
+    """
+    if not body[0] & REQUEST_ID:
+        return None
+    clock, length = REQUEST.unpack_from(body, BODY.size)
+    offset = BODY.size + REQUEST.size
+    return bytes(body[offset : offset + length]).decode(), clock
+
+
+def frame(body: bytes) -> bytes:
+    return FRAME.pack(len(body), zlib.crc32(body)) + body
+
+
+def segment_path(data_dir: Path, seq: int) -> Path:
+    return data_dir / f"{SEGMENT_PREFIX}{seq:020d}{SEGMENT_SUFFIX}"
+
+
+def segments(data_dir: Path) -> list[tuple[int, Path]]:
+    """
+    Returns the sequence number and path of every log segment in data_dir, in
+    the order they were written.
+    """
+    found = []
+    for path in data_dir.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"):
+        seq = path.name[len(SEGMENT_PREFIX) : -len(SEGMENT_SUFFIX)]
+        if seq.isdigit():
+            found.append((int(seq), path))
+    return sorted(found)
+
+
+def fsync_dir(path: Path) -> None:
+    """
+    Makes files created in, renamed into or removed from the directory at
+    path durable.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def open_segment(path: Path) -> int:
+    """
+    Opens the segment at path for appending, creating it if need be, and
+    returns its file descriptor, which the caller has to close.
+    """
+    return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o666)
+
+
+def replay(
+    path: Path,
+    locks: dict[str, LockRecord] | None = None,
+    requests: dict[str, tuple[str, int]] | None = None,
+) -> tuple[dict[str, LockRecord], int]:
+    """
+    Applies the log segment at path to locks, or to an empty table if not
+    given, and returns the result along with the length of the segment's
+    valid prefix. The request ids of the entries are remembered in requests,
+    if given. Anything after the first incomplete or corrupt entry is the
+    remains of a write that was interrupted by a crash, and was never
+    acknowledged to a client.
+    """
+    if locks is None:
+        locks = {}
+    if not path.exists():
+        return locks, 0
+    data = memoryview(path.read_bytes())
+    offset = 0
+    while offset + FRAME.size <= len(data):
+        length, crc = FRAME.unpack_from(data, offset)
+        body = data[offset + FRAME.size : offset + FRAME.size + length]
+        if len(body) < length or zlib.crc32(body) != crc:
+            break
+        key, lock = decode(body)
+        if lock is None:
+            locks.pop(key, None)
+        else:
+            locks[key] = lock
+        if requests is not None:
+            request = decode_request(body)
+            if request is not None:
+                remember_request(requests, request[0], key, request[1])
+        offset += FRAME.size + length
+    if offset < len(data):
+        logger.warning(
+            f"Dropping {len(data) - offset} bytes of incomplete entries from the end of {path}"
+        )
+    return locks, offset
+
+
+class WriteAheadLog:
+    """
+    An append-only log of lock mutations, made durable with group commit.
+
+    append() only copies an entry into a buffer, so it is cheap enough to call
+    while holding a lock store lock, which keeps entries for the same key in
+    the order they were applied. A background thread writes and fsyncs
+    everything buffered since the previous fsync in one go, so while one fsync
+    is in flight the entries of every concurrent request pile up for the next,
+    and durability costs one fsync per batch instead of one per request.
+    sync() and sync_async() wait until everything appended so far is durable.
+
+    The log is split into numbered segments. rotate() starts a new one, so
+    that the segments before it can be dropped once a snapshot covers them.
+    """
+
+    def __init__(self, data_dir: Path, seq: int = 0):
+        self.data_dir = data_dir
+        self._seq = seq
+        self._path = segment_path(data_dir, seq)
+        self._fd = open_segment(self._path)
+        fsync_dir(data_dir)
+        self._lock = threading.Lock()
+        self._pending = threading.Condition(self._lock)
+        self._synced = threading.Condition(self._lock)
+        self._buffer = bytearray()
+        # Buffers still to be written to the segment being closed, along with
+        # the sequence number of the segment that follows it
+        self._rotations: list[tuple[bytearray, int]] = []
+        self._appended = 0
+        self._synced_to = 0
+        self._async_waiters: list[tuple[int, asyncio.Future]] = []
+        self._error: OSError | None = None
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._sync_forever, name="distlock-wal", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def appended(self) -> int:
+        """
+        The number of entries appended since the log was opened.
+        """
+        return self._appended
+
+    def append(self, body: bytes) -> None:
+        with self._lock:
+            self._buffer += frame(body)
+            self._appended += 1
+            self._pending.notify()
+
+    def rotate(self) -> int:
+        """
+        Sends every entry appended from now on to a new segment, and returns
+        its sequence number. Does not wait for any I/O.
+        """
+        with self._lock:
+            self._seq += 1
+            self._rotations.append((self._buffer, self._seq))
+            self._buffer = bytearray()
+            self._pending.notify()
+            return self._seq
+
+    def sync(self) -> None:
+        with self._lock:
+            target = self._appended
+            while self._synced_to < target and self._error is None:
+                self._synced.wait()
+            if self._synced_to < target and self._error is not None:
+                raise self._error
+
+    async def sync_async(self) -> None:
+        with self._lock:
+            target = self._appended
+            if self._synced_to >= target:
+                return
+            if self._error is not None:
+                raise self._error
+            future = asyncio.get_running_loop().create_future()
+            self._async_waiters.append((target, future))
+        await future
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._pending.notify()
+        self._thread.join()
+        os.close(self._fd)
+
+    def _write(self, buffer: bytearray) -> None:
+        if buffer:
+            view = memoryview(buffer)
+            while view:
+                view = view[os.write(self._fd, view) :]
+            os.fsync(self._fd)
+
+    def _sync_forever(self) -> None:
+        while True:
+            with self._lock:
+                while not self._buffer and not self._rotations and not self._closed:
+                    self._pending.wait()
+                if not self._buffer and not self._rotations:
+                    return
+                rotations, self._rotations = self._rotations, []
+                buffer, self._buffer = self._buffer, bytearray()
+                target = self._appended
+            try:
+                for rotated, next_seq in rotations:
+                    self._write(rotated)
+                    os.close(self._fd)
+                    self._path = segment_path(self.data_dir, next_seq)
+                    self._fd = open_segment(self._path)
+                    fsync_dir(self.data_dir)
+                self._write(buffer)
+            except OSError as e:
+                logger.exception(f"Could not write to {self._path}")
+                error: OSError | None = e
+            else:
+                error = None
+            with self._lock:
+                if error is not None:
+                    # Nothing appended from now on can be made durable either
+                    self._error = error
+                else:
+                    self._synced_to = target
+                self._synced.notify_all()
+                ready = [
+                    (seq, future)
+                    for seq, future in self._async_waiters
+                    if seq <= self._synced_to or self._error is not None
+                ]
+                self._async_waiters = [
+                    (seq, future)
+                    for seq, future in self._async_waiters
+                    if seq > self._synced_to and self._error is None
+                ]
+            for _, future in ready:
+                future.get_loop().call_soon_threadsafe(_resolve, future, self._error)
+            if error is not None:
+                return
+
+
+def _resolve(future: asyncio.Future, error: OSError | None) -> None:
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(None)
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import statistics
+import sys
+import threading
+import time
+
+from distlock.async_server import AsyncServicer
+from distlock.lock_store import AsyncLockStore
+from distlock.models import LockRecord
+from distlock.stubs import distlock_pb2
+
+
+class Context:
+    """
+    Just enough of grpc.aio.ServicerContext to call the servicer in process,
+    so that only the servicer's own work is measured, not the network.
+    """
+
+    def set_code(self, code) -> None:
+        pass
+
+    def set_details(self, details: str) -> None:
+        pass
+
+    def time_remaining(self) -> float | None:
+        return None
+
+
+class ThreadLockedLockStore(AsyncLockStore):
+    """
+    The store as the async server used it before AsyncLockStore: every call
+    made by the handlers takes a threading.Lock, like ThreadSafeLockStore's.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key: str) -> LockRecord:
+        with self._lock:
+            return super().__getitem__(key)
+
+    def set_not_exists(self, key: str, value: LockRecord) -> None:
+        with self._lock:
+            super().set_not_exists(key, value)
+
+    def acquire(
+        self,
+        key: str,
+        expires_in_seconds: int,
+        shared: bool = False,
+        owner: str = "",
+        request_id: str = "",
+    ) -> LockRecord:
+        with self._lock:
+            return super().acquire(key, expires_in_seconds, shared, owner, request_id)
+
+    def release(self, key: str, clock: int, request_id: str = "") -> None:
+        with self._lock:
+            super().release(key, clock, request_id)
+
+
+async def run_clients(concurrency: int, client) -> list[float]:
+    """
+    Runs concurrency clients at once, and returns the latency of every call
+    they made in microseconds.
+    """
+    latencies: list[float] = []
+    await asyncio.gather(*(client(i, latencies) for i in range(concurrency)))
+    return latencies
+
+
+async def run_workload(
+    lock_store: AsyncLockStore, concurrency: int, rounds: int, contended_keys: int
+) -> None:
+    servicer = AsyncServicer(lock_store=lock_store)
+    context = Context()
+    for i in range(concurrency):
+        await servicer.CreateLock(distlock_pb2.Lock(key=f"key-{i}"), context)
+
+    async def uncontended(i: int, latencies: list[float]) -> None:
+        request = distlock_pb2.AcquireLockRequest(key=f"key-{i}", expires_in_seconds=60)
+        for _ in range(rounds):
+            start = time.perf_counter()
+            lock = await servicer.AcquireLock(request, context)
+            await servicer.ReleaseLock(lock, context)
+            latencies.append((time.perf_counter() - start) * 1_000_000)
+            # Let the other clients in, as a network round trip would
+            await asyncio.sleep(0)
+
+    async def contended(i: int, latencies: list[float]) -> None:
+        request = distlock_pb2.WaitAcquireLockRequest(
+            key=f"key-{i % contended_keys}", expires_in_seconds=60, timeout_seconds=60
+        )
+        for _ in range(rounds):
+            start = time.perf_counter()
+            lock = await servicer.WaitAcquireLock(request, context)
+            latencies.append((time.perf_counter() - start) * 1_000_000)
+            # Hold the lock while other clients run, so that they queue up
+            await asyncio.sleep(0)
+            await servicer.ReleaseLock(lock, context)
+
+    for name, client in [
+        ("Acquire+Release", uncontended),
+        (f"WaitAcquire on {contended_keys} keys", contended),
+    ]:
+        start = time.perf_counter()
+        latencies = await run_clients(concurrency, client)
+        elapsed = time.perf_counter() - start
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(
+            f"{type(lock_store).__name__:>22} {name:>26} {concurrency:>6} "
+            f"{len(latencies) / elapsed:>10.0f} {quantiles[49]:>10.1f} "
+            f"{quantiles[98]:>10.1f}"
+        )
+
+
+def run(rounds: int = 20):
+    # Logging would dominate the measurement, so only the servicer is measured
+    logging.disable(logging.CRITICAL)
+    print(
+        f"{'store':>22} {'rpcs':>26} {'conc':>6} {'rpcs/s':>10} "
+        f"{'p50 us':>10} {'p99 us':>10}"
+    )
+    for concurrency in [100, 1_000, 5_000]:
+        for lock_store in [ThreadLockedLockStore(), AsyncLockStore()]:
+            asyncio.run(
+                run_workload(lock_store, concurrency, rounds, contended_keys=10)
+            )
+
+
+if __name__ == "__main__":
+    rounds = 20
+    if len(sys.argv) >= 2:
+        rounds = int(sys.argv[1])
+    run(rounds=rounds)
@@ -0,0 +1,82 @@
+import sys
+import threading
+import time
+
+from distlock.lock_store import ShardedLockStore, ThreadSafeLockStore
+from distlock.models import LockRecord
+
+
+def worker(
+    lock_store: ThreadSafeLockStore | ShardedLockStore,
+    keys: list[str],
+    operations: int,
+    barrier: threading.Barrier,
+) -> None:
+    barrier.wait()
+    for i in range(operations):
+        key = keys[i % len(keys)]
+        lock = lock_store.acquire(key, expires_in_seconds=60)
+        lock_store.release(key, clock=lock.clock)
+
+
+def throughput(
+    lock_store: ThreadSafeLockStore | ShardedLockStore,
+    threads: int,
+    keys_per_thread: int,
+    operations: int,
+) -> float:
+    """
+    Returns acquire/release pairs per second with every thread working on its
+    own keys, so any slowdown comes from contention on the store itself.
+    """
+    thread_keys = [
+        [f"key-{thread}-{i}" for i in range(keys_per_thread)]
+        for thread in range(threads)
+    ]
+    for keys in thread_keys:
+        for key in keys:
+            lock_store.set_not_exists(key, LockRecord(key=key))
+    barrier = threading.Barrier(threads + 1)
+    workers = [
+        threading.Thread(target=worker, args=(lock_store, keys, operations, barrier))
+        for keys in thread_keys
+    ]
+    for thread in workers:
+        thread.start()
+    start = time.perf_counter()
+    barrier.wait()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return threads * operations / elapsed
+
+
+def run(
+    max_threads: int = 8,
+    shards: int = 16,
+    keys_per_thread: int = 100,
+    operations: int = 20_000,
+):
+    gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(
+        f"Python {sys.version.split()[0]}, GIL {'enabled' if gil_enabled else 'disabled'}"
+    )
+    print(f"{'threads':>8} {'single lock ops/s':>18} {f'{shards} shards ops/s':>18}")
+    threads = 1
+    while threads <= max_threads:
+        single = throughput(ThreadSafeLockStore(), threads, keys_per_thread, operations)
+        sharded = throughput(
+            ShardedLockStore(shards=shards), threads, keys_per_thread, operations
+        )
+        print(f"{threads:>8} {single:>18,.0f} {sharded:>18,.0f}")
+        threads *= 2
+
+
+if __name__ == "__main__":
+    max_threads = 8
+    shards = 16
+    if len(sys.argv) >= 2:
+        max_threads = int(sys.argv[1])
+    if len(sys.argv) >= 3:
+        shards = int(sys.argv[2])
+    run(max_threads=max_threads, shards=shards)
@@ -0,0 +1,77 @@
+import logging
+import sys
+import time
+
+from distlock.server import Servicer
+from distlock.stubs import distlock_pb2
+
+
+class Context:
+    """
+    Just enough of grpc.ServicerContext to call the servicer in process, so
+    that only the servicer's own work is measured, not the network.
+    """
+
+    def set_code(self, code) -> None:
+        pass
+
+    def set_details(self, details: str) -> None:
+        pass
+
+    def time_remaining(self) -> float | None:
+        return None
+
+
+def cpu_microseconds_per_call(call, calls: int) -> float:
+    start = time.process_time()
+    for _ in range(calls):
+        call()
+    return (time.process_time() - start) / calls * 1_000_000
+
+
+def run(keys: int = 1_000, calls: int = 50_000):
+    # Logging would dominate the measurement, so only the servicer is measured
+    logging.disable(logging.CRITICAL)
+    servicer = Servicer()
+    context = Context()
+    for i in range(keys):
+        servicer.CreateLock(distlock_pb2.Lock(key=f"key-{i}"), context)
+
+    acquire_requests = [
+        distlock_pb2.AcquireLockRequest(key=f"key-{i}", expires_in_seconds=60)
+        for i in range(keys)
+    ]
+    held = [servicer.AcquireLock(request, context) for request in acquire_requests]
+    i = 0
+
+    def acquire_contended() -> None:
+        nonlocal i
+        servicer.AcquireLock(acquire_requests[i % keys], context)
+        i += 1
+
+    def get() -> None:
+        nonlocal i
+        servicer.GetLock(held[i % keys], context)
+        i += 1
+
+    def release_acquire() -> None:
+        nonlocal i
+        lock = held[i % keys]
+        servicer.ReleaseLock(lock, context)
+        held[i % keys] = servicer.AcquireLock(acquire_requests[i % keys], context)
+        i += 1
+
+    print(f"{'rpc':>24} {'cpu us/call':>12}")
+    for name, call in [
+        ("AcquireLock (contended)", acquire_contended),
+        ("GetLock", get),
+        ("ReleaseLock+AcquireLock", release_acquire),
+    ]:
+        print(f"{name:>24} {cpu_microseconds_per_call(call, calls):>12.2f}")
+
+
+if __name__ == "__main__":
+    calls = 50_000
+    if len(sys.argv) >= 2:
+        calls = int(sys.argv[1])
+    run(calls=calls)
@@ -0,0 +1,355 @@
+"""
+Microbenchmarks for the lock store and the lock models, which fail when a
+benchmark has regressed past its threshold against a saved baseline.
+
+Everything runs in process, without a server or network. Save a baseline on
+the machine you compare on, since timings from other machines mean nothing:
+
+    python scripts/microbenchmarks.py --save
+    python scripts/microbenchmarks.py
+
+A fixed pure Python loop is timed right before every repeat of every
+benchmark, and each repeat is measured relative to the loop, so that a
+machine that is busy or runs at a different clock speed than when the
+baseline was saved, even for a moment, does not read as a regression. A
+benchmark's result is the median of its repeats, which one unlucky repeat
+does not move. The baseline records each benchmark's time relative to the
+loop along with its tolerance, the fraction by which it may get slower
+before the check fails. Edit a tolerance in the baseline file to loosen or
+tighten it; saving again keeps it.
+"""
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import sys
+import threading
+import time
+from functools import partial
+from pathlib import Path
+from typing import Callable
+
+from distlock.lock_store import LockStore, ShardedLockStore, ThreadSafeLockStore
+from distlock.models import Lock, LockRecord
+from distlock.server import Servicer
+from distlock.stubs import distlock_pb2
+
+BASELINE_PATH = Path(__file__).with_name("microbenchmarks_baseline.json")
+DEFAULT_TOLERANCE = 0.3
+# Threads contending on a lock are at the mercy of the scheduler
+THREADED_TOLERANCE = 0.5
+REPEATS = 15
+THREAD_COUNTS = [1, 2, 4, 8]
+LIST_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def ns_per_op(run: Callable[[], tuple[float, int]]) -> float:
+    """
+    Calls run, which returns how long it took and how many operations it did,
+    and returns the time per operation in nanoseconds.
+    """
+    seconds, operations = run()
+    return seconds / operations * 1e9
+
+
+def measure(
+    repeats: int,
+    run: Callable[[], tuple[float, int]],
+    calibrate: Callable[[], tuple[float, int]],
+) -> tuple[float, float]:
+    """
+    Calls calibrate then run, repeats times, and returns the median of run's
+    times relative to calibrate's just before, along with the median time per
+    operation of run in nanoseconds.
+    """
+    relative = []
+    times = []
+    for _ in range(repeats):
+        calibration_ns = ns_per_op(calibrate)
+        times.append(ns_per_op(run))
+        relative.append(times[-1] / calibration_ns)
+    return statistics.median(relative), statistics.median(times)
+
+
+def calibration(operations: int = 100_000) -> Callable[[], tuple[float, int]]:
+    """
+    Work that only depends on the interpreter and the machine, which the other
+    benchmarks are measured against.
+    """
+
+    def run() -> tuple[float, int]:
+        items: dict[int, int] = {}
+        start = time.perf_counter()
+        for i in range(operations):
+            items[i & 1023] = items.get(i & 1023, 0) + i
+        return time.perf_counter() - start, operations
+
+    return run
+
+
+def store_with_keys(lock_store_class: type, keys: list[str]) -> LockStore:
+    lock_store = lock_store_class()
+    for key in keys:
+        lock_store.set_not_exists(key, LockRecord(key=key))
+    return lock_store
+
+
+def run_threads(threads: int, target: Callable[[int], None]) -> float:
+    """
+    Runs target(thread) in threads threads started together, and returns how
+    long it took for all of them to finish.
+    """
+    barrier = threading.Barrier(threads + 1)
+
+    def wait_then_run(thread: int) -> None:
+        barrier.wait()
+        target(thread)
+
+    workers = [
+        threading.Thread(target=wait_then_run, args=(thread,))
+        for thread in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    start = time.perf_counter()
+    barrier.wait()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def acquire_release(
+    lock_store_class: type, threads: int, operations: int = 20_000
+) -> Callable[[], tuple[float, int]]:
+    """
+    Acquire and release pairs, with every thread working on keys of its own
+    so that any slowdown with more threads comes from the store itself.
+    """
+
+    def run() -> tuple[float, int]:
+        thread_keys = [
+            [f"key-{thread}-{i}" for i in range(100)] for thread in range(threads)
+        ]
+        lock_store = store_with_keys(
+            lock_store_class, [key for keys in thread_keys for key in keys]
+        )
+
+        def work(thread: int) -> None:
+            keys = thread_keys[thread]
+            for i in range(operations):
+                key = keys[i % len(keys)]
+                lock = lock_store.acquire(key, expires_in_seconds=60)
+                lock_store.release(key, clock=lock.clock)
+
+        return run_threads(threads, work), threads * operations
+
+    return run
+
+
+def set_not_exists(
+    lock_store_class: type, threads: int, operations: int = 20_000
+) -> Callable[[], tuple[float, int]]:
+    """
+    Creating new keys, which also keeps the sorted key index up to date.
+    """
+
+    def run() -> tuple[float, int]:
+        lock_store = lock_store_class()
+        thread_keys = [
+            [f"key-{thread}-{i}" for i in range(operations)]
+            for thread in range(threads)
+        ]
+
+        def work(thread: int) -> None:
+            for key in thread_keys[thread]:
+                lock_store.set_not_exists(key, LockRecord(key=key))
+
+        return run_threads(threads, work), threads * operations
+
+    return run
+
+
+def lock_round_trip(operations: int = 20_000) -> Callable[[], tuple[float, int]]:
+    """
+    The client's Lock to protobuf and back.
+    """
+    locks = [Lock(key=f"key-{i}", acquired=True, clock=i) for i in range(100)]
+
+    def run() -> tuple[float, int]:
+        start = time.perf_counter()
+        for i in range(operations):
+            Lock.from_pb(locks[i % len(locks)].to_pb())
+        return time.perf_counter() - start, operations
+
+    return run
+
+
+def lock_record_to_pb(operations: int = 100_000) -> Callable[[], tuple[float, int]]:
+    """
+    The server's LockRecord to protobuf, which every response goes through.
+    """
+    records = [
+        LockRecord(key=f"key-{i}", acquired=True, clock=i, expires_at_ns=i)
+        for i in range(100)
+    ]
+
+    def run() -> tuple[float, int]:
+        start = time.perf_counter()
+        for i in range(operations):
+            records[i % len(records)].to_pb()
+        return time.perf_counter() - start, operations
+
+    return run
+
+
+class Context:
+    """
+    Just enough of grpc.ServicerContext to call the servicer in process.
+    """
+
+    def set_code(self, code) -> None:
+        pass
+
+    def set_details(self, details: str) -> None:
+        pass
+
+
+def list_locks(keys: int) -> Callable[[], tuple[float, int]]:
+    """
+    A ListLocks response for a table of keys locks, from the store to the
+    bytes sent on the wire, per lock.
+    """
+    lock_store = ShardedLockStore()
+    lock_store.load(
+        LockRecord(key=f"key-{i:07}", acquired=i % 2 == 0, clock=i) for i in range(keys)
+    )
+    servicer = Servicer(lock_store=lock_store)
+    context = Context()
+
+    def run() -> tuple[float, int]:
+        start = time.perf_counter()
+        servicer.ListLocks(distlock_pb2.EmptyRequest(), context).SerializeToString()
+        return time.perf_counter() - start, keys
+
+    return run
+
+
+def benchmarks() -> dict[str, Callable[[], Callable[[], tuple[float, int]]]]:
+    """
+    Every benchmark by name. They are built lazily, as the large tables take
+    a while to fill.
+    """
+    found: dict[str, Callable[[], Callable[[], tuple[float, int]]]] = {
+        "LockStore.acquire_release[1 thread]": partial(acquire_release, LockStore, 1),
+        "LockStore.set_not_exists[1 thread]": partial(set_not_exists, LockStore, 1),
+    }
+    # LockStore is not thread safe, so only ThreadSafeLockStore runs on more
+    for threads in THREAD_COUNTS:
+        found[f"ThreadSafeLockStore.acquire_release[{threads} threads]"] = partial(
+            acquire_release, ThreadSafeLockStore, threads
+        )
+        found[f"ThreadSafeLockStore.set_not_exists[{threads} threads]"] = partial(
+            set_not_exists, ThreadSafeLockStore, threads
+        )
+    found["Lock.to_pb+from_pb"] = lock_round_trip
+    found["LockRecord.to_pb"] = lock_record_to_pb
+    for keys in LIST_SIZES:
+        found[f"ListLocks[{keys} keys]"] = partial(list_locks, keys)
+    return found
+
+
+def load_baseline(path: Path) -> dict[str, dict[str, float]]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())["benchmarks"]
+
+
+def save_baseline(
+    path: Path,
+    results: dict[str, tuple[float, float]],
+    baseline: dict[str, dict[str, float]],
+) -> None:
+    saved = dict(baseline)
+    for name, (relative, ns) in results.items():
+        saved[name] = {
+            "relative": round(relative, 3),
+            "ns_per_op": round(ns, 1),
+            "tolerance": baseline.get(name, {}).get(
+                "tolerance",
+                THREADED_TOLERANCE
+                if "threads]" in name and "[1 threads]" not in name
+                else DEFAULT_TOLERANCE,
+            ),
+        }
+    path.write_text(
+        json.dumps(
+            {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "benchmarks": saved,
+            },
+            indent=2,
+        )
+        + "\n"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--save", action="store_true", help="Save the results as the new baseline"
+    )
+    parser.add_argument(
+        "--baseline", type=Path, default=BASELINE_PATH, help="Baseline file"
+    )
+    parser.add_argument(
+        "-k", "--filter", default="", help="Only run benchmarks whose name has this"
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=REPEATS, help="Times to run each benchmark"
+    )
+    args = parser.parse_args()
+
+    # Logging would dominate the servicer benchmarks
+    logging.disable(logging.CRITICAL)
+    baseline = load_baseline(args.baseline)
+    calibrate = calibration()
+    results: dict[str, tuple[float, float]] = {}
+    regressed: list[str] = []
+    print(
+        f"{'benchmark':<48} {'baseline':>10} {'relative':>10} {'ns/op':>12} "
+        f"{'change':>8}  status"
+    )
+    for name, build in benchmarks().items():
+        if args.filter not in name:
+            continue
+        relative, ns = measure(args.repeats, build(), calibrate)
+        results[name] = (relative, ns)
+        saved = baseline.get(name)
+        if saved is None or "relative" not in saved:
+            print(f"{name:<48} {'-':>10} {relative:>10.3f} {ns:>12,.1f} {'-':>8}  new")
+            continue
+        change = relative / saved["relative"] - 1
+        status = "ok"
+        if change > saved["tolerance"]:
+            status = f"REGRESSED (more than {saved['tolerance']:.0%})"
+            regressed.append(name)
+        print(
+            f"{name:<48} {saved['relative']:>10.3f} {relative:>10.3f} {ns:>12,.1f} "
+            f"{change:>+8.1%}  {status}"
+        )
+
+    if args.save:
+        save_baseline(args.baseline, results, baseline)
+        print(f"Saved {len(results)} results to {args.baseline}")
+        return 0
+    if regressed:
+        print(f"{len(regressed)} benchmarks regressed: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
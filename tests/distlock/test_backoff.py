@@ -0,0 +1,122 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Generator
+
+import grpc
+import pytest
+
+from distlock import Distlock, DistlockAsync, ExpiryAwareBackoff, FixedWait, Lock
+from distlock.server import Servicer
+from distlock.stubs import distlock_pb2, distlock_pb2_grpc
+
+
+def lock_expiring_in(seconds: float) -> Lock:
+    # As the server sends it, a naive datetime in UTC
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=seconds)
+    return Lock(key="key", expires_at=expires_at.replace(tzinfo=None))
+
+
+def test_fixed_wait() -> None:
+    wait = FixedWait(3)
+    assert wait(Lock(), float("inf")) == 3
+    assert wait(lock_expiring_in(1), 2) == 2
+    assert wait(Lock(), -1) == 0
+    with pytest.raises(ValueError):
+        FixedWait(-1)
+
+
+def test_expiry_aware_backoff_grows_with_jitter() -> None:
+    backoff = ExpiryAwareBackoff(cap_seconds=3, base_seconds=0.1, rng=random.Random(0))
+    delays = [backoff(Lock(), float("inf")) for _ in range(20)]
+    assert all(0.1 <= delay <= 3 for delay in delays)
+    assert delays[0] <= 0.3
+    assert max(delays) == 3
+    assert len(set(delays)) > 5
+
+    backoff = ExpiryAwareBackoff(cap_seconds=3, base_seconds=1)
+    assert backoff(Lock(), 0.5) == 0.5
+
+
+def test_expiry_aware_backoff_wakes_as_the_lease_runs_out() -> None:
+    backoff = ExpiryAwareBackoff(cap_seconds=10, base_seconds=5, lead_seconds=0.1)
+    delay = backoff(lock_expiring_in(1), float("inf"))
+    assert 0.85 < delay < 0.9
+    # Right as it runs out, once just before it
+    delay = backoff(lock_expiring_in(0.1), float("inf"))
+    assert 0.05 < delay <= 0.1
+    # A lease further out than the backoff is not waited for
+    backoff = ExpiryAwareBackoff(cap_seconds=1, base_seconds=0.1)
+    assert backoff(lock_expiring_in(60), float("inf")) <= 0.3
+
+
+class PollingServicer(Servicer):
+    """
+    A servicer that cannot wait for locks, so that clients poll it, which
+    counts the tries.
+    """
+
+    WaitAcquireLock = distlock_pb2_grpc.DistlockServicer.WaitAcquireLock
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.tries = 0
+
+    def AcquireLock(
+        self, request: distlock_pb2.AcquireLockRequest, context: grpc.ServicerContext
+    ) -> distlock_pb2.Lock:
+        self.tries += 1
+        return super().AcquireLock(request, context)
+
+
+@pytest.fixture
+def servicer() -> PollingServicer:
+    return PollingServicer()
+
+
+@pytest.fixture
+def port(servicer: PollingServicer) -> Generator[int, None, None]:
+    server = grpc.server(ThreadPoolExecutor(max_workers=4))
+    distlock_pb2_grpc.add_DistlockServicer_to_server(servicer, server)
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    yield port
+    server.stop(None)
+
+
+def test_polling_acquire_picks_up_an_expired_lease(
+    servicer: PollingServicer, port: int
+) -> None:
+    with Distlock(address="localhost", port=port) as distlock:
+        distlock.create_lock("key")
+        distlock.acquire_lock(key="key", expires_in_seconds=1)
+        start = time.monotonic()
+        lock = distlock.acquire_lock(
+            key="key", expires_in_seconds=60, timeout_seconds=5, heartbeat_seconds=3
+        )
+        assert lock.acquired
+        # Polling every heartbeat_seconds would have taken 3 seconds
+        assert time.monotonic() - start < 1.5
+        assert servicer.tries < 20
+
+
+@pytest.mark.asyncio
+async def test_polling_acquire_with_fixed_wait(
+    servicer: PollingServicer, port: int
+) -> None:
+    with Distlock(address="localhost", port=port) as distlock:
+        distlock.create_lock("key")
+        distlock.acquire_lock(key="key", expires_in_seconds=60)
+    async with DistlockAsync(
+        address="localhost", port=port, wait_policy=FixedWait
+    ) as distlock_async:
+        with pytest.raises(TimeoutError):
+            await distlock_async.acquire_lock(
+                key="key",
+                expires_in_seconds=60,
+                timeout_seconds=1,
+                heartbeat_seconds=0.4,
+            )
+    # One try to take the lock, then at 0, 0.4, 0.8 and at the timeout
+    assert 5 <= servicer.tries <= 6
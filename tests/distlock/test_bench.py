@@ -0,0 +1,102 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator
+
+import grpc
+import pytest
+
+from distlock.bench import (
+    KeyChooser,
+    Results,
+    Workload,
+    parse_mix,
+    percentile,
+    report,
+    run_benchmark,
+)
+from distlock.server import Servicer
+from distlock.stubs import distlock_pb2_grpc
+
+
+def test_parse_mix() -> None:
+    assert parse_mix("lock=80,get=20") == {"lock": 0.8, "get": 0.2}
+    assert parse_mix("wait") == {"wait": 1.0}
+    for mix in ["lock=80,steal=20", "lock=x", "lock=-1", "lock=0"]:
+        with pytest.raises(ValueError):
+            parse_mix(mix)
+
+
+def test_key_chooser() -> None:
+    with pytest.raises(ValueError):
+        KeyChooser(10, "gaussian", 1.1, seed=0)
+
+    chooser = KeyChooser(10, "uniform", 1.1, seed=0)
+    uniform = Counter(chooser.choose() for _ in range(10_000))
+    assert set(uniform) == set(range(10))
+    assert max(uniform.values()) < 2 * min(uniform.values())
+
+    chooser = KeyChooser(10, "zipf", 1.1, seed=0)
+    zipf = Counter(chooser.choose() for _ in range(10_000))
+    assert set(zipf) <= set(range(10))
+    assert zipf[0] > 2 * zipf[4] > 0
+
+    first, second = (KeyChooser(100, "zipf", 1.1, seed=1) for _ in range(2))
+    assert [first.choose() for _ in range(5)] == [second.choose() for _ in range(5)]
+
+
+def test_percentile() -> None:
+    values = [float(i) for i in range(1, 1001)]
+    assert percentile(values, 0.5) == 500
+    assert percentile(values, 0.99) == 990
+    assert percentile(values, 0.999) == 999
+    assert percentile([3.0], 0.5) == 3
+
+
+def test_report() -> None:
+    results = Results()
+    for i in range(100):
+        results.record("lock", i / 1000)
+    results.record("get", 0.5)
+    results.error("get")
+    results.contended = 7
+    lines = report(results, elapsed_seconds=2).splitlines()
+    assert lines[1].split() == ["get", "1", "1", "0", "500.000", "500.000", "500.000"]
+    assert lines[2].split()[:4] == ["lock", "100", "0", "50"]
+    assert lines[3].split()[:3] == ["all", "101", "1"]
+    assert lines[4] == "7 of 100 lock operations found the lock held"
+
+
+@pytest.fixture
+def port() -> Generator[int, None, None]:
+    server = grpc.server(ThreadPoolExecutor(max_workers=8))
+    distlock_pb2_grpc.add_DistlockServicer_to_server(Servicer(), server)
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    yield port
+    server.stop(None)
+
+
+@pytest.mark.parametrize("client", ["sync", "async"])
+def test_run_benchmark(port: int, client: str) -> None:
+    workload = Workload(
+        keys=5,
+        distribution="zipf",
+        zipf_s=1.1,
+        mix=parse_mix("lock=1,wait=1,get=1,renew=1"),
+        expires_in_seconds=10,
+        wait_timeout_seconds=5,
+        key_prefix="bench/",
+    )
+    results, elapsed = run_benchmark(
+        client=client,
+        address="localhost",
+        port=port,
+        workload=workload,
+        concurrency=4,
+        duration_seconds=0.5,
+        pool_size=1,
+        seed=0,
+    )
+    assert elapsed >= 0.5
+    assert set(results.latencies) == {"lock", "wait", "get", "renew"}
+    assert results.errors == {}
@@ -1,8 +1,19 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
-from distlock.exceptions import AlreadyExistsError
-from distlock.lock_store import LockStore, ThreadSafeLockStore
-from distlock.models import Lock
+from distlock.exceptions import AlreadyExistsError, LeaseLostError, UnreleasableError
+from distlock.lock_store import (
+    AsyncLockStore,
+    LockStore,
+    ShardedLockStore,
+    ThreadSafeLockStore,
+    _FairQueue,
+)
+from distlock.models import LockRecord, QueuedLockRecord
 
 keys = ["a_lock", "another_lock", "pizza"]
 
@@ -15,7 +26,7 @@ def test_lock_store_init() -> None:
 @pytest.mark.parametrize("key", keys)
 def test_lock_store_set_get_del(key: str) -> None:
     lock_store = LockStore()
-    lock = Lock()
+    lock = LockRecord()
     lock_store[key] = lock
     assert key in lock_store
     assert lock_store[key] == lock
@@ -26,7 +37,7 @@ def test_lock_store_set_get_del(key: str) -> None:
 @pytest.mark.parametrize("key", keys)
 def test_lock_store_set_not_exists(key: str) -> None:
     lock_store = LockStore()
-    lock = Lock()
+    lock = LockRecord()
     lock_store.set_not_exists(key, lock)
     assert key in lock_store
     assert lock_store[key] == lock
@@ -41,7 +52,7 @@ def test_lock_store_set_not_exists(key: str) -> None:
 @pytest.mark.parametrize("key", keys)
 def test_lock_store_acquire_release(key: str) -> None:
     lock_store = LockStore()
-    lock_store[key] = Lock(key=key)
+    lock_store[key] = LockRecord(key=key)
 
     # Test acquiring an available lock
     acquired_lock = lock_store.acquire(key, expires_in_seconds=60)
@@ -61,7 +72,7 @@ def test_lock_store_acquire_release(key: str) -> None:
 @pytest.mark.parametrize("keys", [[], ["key"], keys])
 def test_lock_store_to_list(keys: str) -> None:
     lock_store = LockStore()
-    locks = [Lock(key=key) for key in sorted(keys)]
+    locks = [LockRecord(key=key) for key in sorted(keys)]
     for lock in locks:
         lock_store[lock.key] = lock
     stored_locks = lock_store.to_list()
@@ -76,7 +87,7 @@ def test_thread_safe_lock_store_init() -> None:
 @pytest.mark.parametrize("key", keys)
 def test_thread_safe_lock_store_set_get_del(key: str) -> None:
     lock_store = ThreadSafeLockStore()
-    lock = Lock()
+    lock = LockRecord()
     lock_store[key] = lock
     assert key in lock_store
     assert lock_store[key] == lock
@@ -87,7 +98,7 @@ def test_thread_safe_lock_store_set_get_del(key: str) -> None:
 @pytest.mark.parametrize("key", keys)
 def test_thread_safe_lock_store_set_not_exists(key: str) -> None:
     lock_store = ThreadSafeLockStore()
-    lock = Lock()
+    lock = LockRecord()
     lock_store.set_not_exists(key, lock)
     assert key in lock_store
     assert lock_store[key] == lock
@@ -102,7 +113,7 @@ def test_thread_safe_lock_store_set_not_exists(key: str) -> None:
 @pytest.mark.parametrize("key", keys)
 def test_thread_safe_lock_store_acquire_release(key: str) -> None:
     lock_store = LockStore()
-    lock_store[key] = Lock(key=key)
+    lock_store[key] = LockRecord(key=key)
 
     # Test acquiring an available lock
     acquired_lock = lock_store.acquire(key, expires_in_seconds=60)
@@ -122,8 +133,738 @@ def test_thread_safe_lock_store_acquire_release(key: str) -> None:
 @pytest.mark.parametrize("keys", [[], ["key"], keys])
 def test_thread_safe_lock_store_to_list(keys: str) -> None:
     lock_store = ThreadSafeLockStore()
-    locks = [Lock(key=key) for key in sorted(keys)]
+    locks = [LockRecord(key=key) for key in sorted(keys)]
     for lock in locks:
         lock_store[lock.key] = lock
     stored_locks = lock_store.to_list()
     assert sorted(stored_locks, key=lambda lock: lock.key) == locks
+
+
+def test_thread_safe_lock_store_acquire_wait_available() -> None:
+    lock_store = ThreadSafeLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    lock = lock_store.acquire_wait("key", expires_in_seconds=60, timeout_seconds=0)
+    assert lock.acquired
+    assert lock.clock == 1
+
+
+def test_thread_safe_lock_store_acquire_wait_woken_by_release() -> None:
+    lock_store = ThreadSafeLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    lock_store.acquire("key", expires_in_seconds=60)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(
+            lock_store.acquire_wait, "key", expires_in_seconds=60, timeout_seconds=10
+        )
+        time.sleep(0.1)
+        assert not future.done()
+        start = time.monotonic()
+        lock_store.release("key", clock=1)
+        lock = future.result()
+        elapsed = time.monotonic() - start
+    assert lock.acquired
+    assert lock.clock == 2
+    assert elapsed < 1.0
+
+
+def test_thread_safe_lock_store_acquire_wait_woken_by_expiry() -> None:
+    lock_store = ThreadSafeLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    lock_store.acquire("key", expires_in_seconds=1)
+    start = time.monotonic()
+    lock = lock_store.acquire_wait("key", expires_in_seconds=60, timeout_seconds=10)
+    elapsed = time.monotonic() - start
+    assert lock.acquired
+    assert lock.clock == 2
+    assert elapsed < 2.0
+
+
+def test_thread_safe_lock_store_acquire_wait_timeout() -> None:
+    lock_store = ThreadSafeLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    lock_store.acquire("key", expires_in_seconds=60)
+    lock = lock_store.acquire_wait("key", expires_in_seconds=60, timeout_seconds=0.1)
+    assert not lock.acquired
+    assert lock.clock == 1
+
+
+def test_thread_safe_lock_store_acquire_wait_fifo() -> None:
+    lock_store = ThreadSafeLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    lock = lock_store.acquire("key", expires_in_seconds=60)
+    order: list[int] = []
+
+    def waiter(i: int) -> None:
+        lock = lock_store.acquire_wait("key", expires_in_seconds=60, timeout_seconds=10)
+        order.append(i)
+        lock_store.release("key", clock=lock.clock)
+
+    threads = [threading.Thread(target=waiter, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    lock_store.release("key", clock=lock.clock)
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2]
+
+
+def test_thread_safe_lock_store_acquire_wait_deleted() -> None:
+    lock_store = ThreadSafeLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    lock_store.acquire("key", expires_in_seconds=60)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(
+            lock_store.acquire_wait, "key", expires_in_seconds=60, timeout_seconds=10
+        )
+        time.sleep(0.1)
+        del lock_store["key"]
+        with pytest.raises(KeyError):
+            future.result()
+
+
+@pytest.mark.parametrize(
+    "lock_store_class",
+    [LockStore, ThreadSafeLockStore, ShardedLockStore, AsyncLockStore],
+)
+def test_lock_store_batches(lock_store_class: type) -> None:
+    lock_store = lock_store_class()
+    lock_store["existing"] = LockRecord(key="existing")
+
+    created = lock_store.set_not_exists_many(
+        [LockRecord(key="a"), LockRecord(key="existing"), LockRecord(key="b")]
+    )
+    assert [getattr(result, "key", None) for result in created] == ["a", None, "b"]
+    assert isinstance(created[1], AlreadyExistsError)
+
+    acquired = lock_store.acquire_many([("a", 60), ("missing", 60), ("a", 60)])
+    assert isinstance(acquired[0], LockRecord) and acquired[0].acquired
+    assert isinstance(acquired[1], KeyError)
+    assert isinstance(acquired[2], LockRecord) and not acquired[2].acquired
+
+    released = lock_store.release_many([("a", 1), ("b", 1), ("missing", 1)])
+    assert isinstance(released[0], LockRecord) and not released[0].acquired
+    assert isinstance(released[1], UnreleasableError)
+    assert isinstance(released[2], KeyError)
+
+    fetched = lock_store.get_many(["b", "missing"])
+    assert isinstance(fetched[0], LockRecord) and fetched[0].key == "b"
+    assert isinstance(fetched[1], KeyError)
+
+
+def test_thread_safe_lock_store_release_many_wakes_waiters() -> None:
+    lock_store = ThreadSafeLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    lock_store.acquire("key", expires_in_seconds=60)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(
+            lock_store.acquire_wait, "key", expires_in_seconds=60, timeout_seconds=10
+        )
+        time.sleep(0.1)
+        lock_store.release_many([("key", 1)])
+        lock = future.result(timeout=1)
+    assert lock.acquired
+    assert lock.clock == 2
+
+
+@pytest.mark.parametrize(
+    "lock_store_class",
+    [LockStore, ThreadSafeLockStore, ShardedLockStore, AsyncLockStore],
+)
+def test_lock_store_page(lock_store_class: type) -> None:
+    lock_store = lock_store_class()
+    keys = ["a/1", "a/2", "a/3", "b/1", "b/2", "c"]
+    for key in reversed(keys):
+        lock_store.set_not_exists(key, LockRecord(key=key))
+
+    assert [lock.key for lock in lock_store.page()] == keys
+    assert [lock.key for lock in lock_store.page(prefix="a/")] == keys[:3]
+    assert [lock.key for lock in lock_store.page(prefix="b/", limit=1)] == ["b/1"]
+    assert [lock.key for lock in lock_store.page(prefix="b/", start_after="b/1")] == [
+        "b/2"
+    ]
+    assert lock_store.page(prefix="d") == []
+
+    paged_keys: list[str] = []
+    start_after = None
+    while page := lock_store.page(start_after=start_after, limit=4):
+        paged_keys.extend(lock.key for lock in page)
+        start_after = page[-1].key
+    assert paged_keys == keys
+
+    del lock_store["a/2"]
+    lock_store["a/0"] = LockRecord(key="a/0")
+    lock_store["a/0"] = LockRecord(key="a/0")
+    assert [lock.key for lock in lock_store.page(prefix="a/")] == ["a/0", "a/1", "a/3"]
+
+
+@pytest.mark.parametrize("shards", [1, 3, 16])
+def test_sharded_lock_store_set_get_del(shards: int) -> None:
+    lock_store = ShardedLockStore(shards=shards)
+    assert len(lock_store) == 0
+    for key in keys:
+        lock_store.set_not_exists(key, LockRecord(key=key))
+        with pytest.raises(AlreadyExistsError):
+            lock_store.set_not_exists(key, LockRecord(key=key))
+    assert len(lock_store) == len(keys)
+    assert sorted(lock.key for lock in lock_store.to_list()) == sorted(keys)
+    for key in keys:
+        assert key in lock_store
+        assert lock_store[key].key == key
+        del lock_store[key]
+        assert key not in lock_store
+    assert len(lock_store) == 0
+
+
+def test_sharded_lock_store_acquire_release() -> None:
+    lock_store = ShardedLockStore(shards=4)
+    lock_store["key"] = LockRecord(key="key")
+    acquired_lock = lock_store.acquire("key", expires_in_seconds=60)
+    assert acquired_lock.acquired
+    assert not lock_store.acquire("key", expires_in_seconds=60).acquired
+    with pytest.raises(UnreleasableError):
+        lock_store.release("key", clock=0)
+    lock_store.release("key", clock=1)
+    assert not lock_store["key"].acquired
+
+
+@pytest.mark.parametrize(
+    "lock_store_class",
+    [LockStore, ThreadSafeLockStore, ShardedLockStore, AsyncLockStore],
+)
+def test_lock_store_renew(lock_store_class: type) -> None:
+    lock_store = lock_store_class()
+    lock_store["key"] = LockRecord(key="key")
+    with pytest.raises(KeyError):
+        lock_store.renew("missing", clock=1, expires_in_seconds=60)
+    lock_store.acquire("key", expires_in_seconds=1)
+    lock = lock_store.renew("key", clock=1, expires_in_seconds=60)
+    assert lock.acquired
+    assert 59 < lock.seconds_until_expiry <= 60
+    # The renewed expiry replaces the old one, so the lease is not reaped early
+    time.sleep(1.1)
+    assert lock_store.reap() == []
+    assert lock_store["key"].acquired
+    with pytest.raises(LeaseLostError):
+        lock_store.renew("key", clock=0, expires_in_seconds=60)
+
+
+def test_sharded_lock_store_acquire_wait_woken_by_release() -> None:
+    lock_store = ShardedLockStore(shards=4)
+    lock_store["key"] = LockRecord(key="key")
+    lock_store.acquire("key", expires_in_seconds=60)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(
+            lock_store.acquire_wait, "key", expires_in_seconds=60, timeout_seconds=10
+        )
+        time.sleep(0.1)
+        lock_store.release_many([("key", 1)])
+        lock = future.result(timeout=1)
+    assert lock.acquired
+    assert lock.clock == 2
+
+
+def test_sharded_lock_store_concurrent_acquire_release() -> None:
+    lock_store = ShardedLockStore(shards=8)
+    all_keys = [f"key-{i}" for i in range(64)]
+    lock_store.set_not_exists_many([LockRecord(key=key) for key in all_keys])
+    rounds = 50
+
+    def worker(worker_keys: list[str]) -> None:
+        for _ in range(rounds):
+            for key in worker_keys:
+                lock = lock_store.acquire(key, expires_in_seconds=60)
+                if lock.acquired:
+                    lock_store.release(key, clock=lock.clock)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        # Every key is contended by two workers
+        results = executor.map(worker, [all_keys[i::4] for i in range(8)])
+    _ = [result for result in results]
+    locks = lock_store.get_many(all_keys)
+    assert all(isinstance(lock, LockRecord) and not lock.acquired for lock in locks)
+    assert sum(lock.clock for lock in locks if isinstance(lock, LockRecord)) >= (
+        len(all_keys) * rounds
+    )
+
+
+@pytest.mark.parametrize(
+    "lock_store_class",
+    [LockStore, ThreadSafeLockStore, ShardedLockStore, AsyncLockStore],
+)
+def test_lock_store_reap(lock_store_class: type) -> None:
+    lock_store = lock_store_class()
+    for key in ["expired", "released", "deleted", "held"]:
+        lock_store[key] = LockRecord(key=key)
+    assert lock_store.next_expiry_ns() is None
+    assert lock_store.reap() == []
+
+    lock_store.acquire("held", expires_in_seconds=60)
+    for key in ["expired", "released", "deleted"]:
+        lock_store.acquire(key, expires_in_seconds=0)
+    lock_store.release("released", clock=1)
+    del lock_store["deleted"]
+    assert lock_store.next_expiry_ns() <= time.monotonic_ns()
+
+    assert lock_store.reap() == ["expired"]
+    assert not lock_store["expired"].acquired
+    assert lock_store["held"].acquired
+    assert lock_store.reap() == []
+    assert lock_store.next_expiry_ns() == lock_store["held"].expires_at_ns
+
+
+@pytest.mark.parametrize(
+    "lock_store_class",
+    [LockStore, ThreadSafeLockStore, ShardedLockStore, AsyncLockStore],
+)
+def test_lock_store_shared(lock_store_class: type) -> None:
+    lock_store = lock_store_class()
+    lock_store["key"] = LockRecord(key="key")
+    first = lock_store.acquire("key", expires_in_seconds=60, shared=True)
+    second = lock_store.acquire("key", expires_in_seconds=60, shared=True)
+    assert first.acquired and second.acquired
+    assert (first.clock, second.clock) == (1, 2)
+    assert not lock_store.acquire("key", expires_in_seconds=60).acquired
+
+    renewed = lock_store.renew("key", clock=1, expires_in_seconds=120)
+    assert renewed.clock == 1
+    assert 119 < renewed.seconds_until_expiry <= 120
+    lock_store.release("key", clock=1)
+    assert not lock_store.acquire("key", expires_in_seconds=60).acquired
+    lock_store.release("key", clock=2)
+
+    writer = lock_store.acquire("key", expires_in_seconds=60)
+    assert writer.acquired
+    assert writer.clock == 3
+    reader = lock_store.acquire("key", expires_in_seconds=60, shared=True)
+    assert not reader.acquired
+    assert not reader.shared
+
+
+@pytest.mark.parametrize(
+    "lock_store_class",
+    [LockStore, ThreadSafeLockStore, ShardedLockStore, AsyncLockStore],
+)
+def test_lock_store_reap_shared(lock_store_class: type) -> None:
+    lock_store = lock_store_class()
+    lock_store["key"] = LockRecord(key="key")
+    held = lock_store.acquire("key", expires_in_seconds=60, shared=True)
+    lock_store.acquire("key", expires_in_seconds=0, shared=True)
+    lock_store.acquire("key", expires_in_seconds=0, shared=True)
+    assert lock_store.reap() == ["key", "key"]
+    assert lock_store["key"].acquired
+    assert lock_store["key"].readers == {held.clock: held.expires_at_ns}
+    assert lock_store.next_expiry_ns() == held.expires_at_ns
+
+
+@pytest.mark.parametrize(
+    "lock_store_class",
+    [LockStore, ThreadSafeLockStore, ShardedLockStore, AsyncLockStore],
+)
+def test_lock_store_semaphore(lock_store_class: type) -> None:
+    lock_store = lock_store_class()
+    lock_store.set_not_exists("key", LockRecord(key="key", permits=2))
+    first = lock_store.acquire("key", expires_in_seconds=60)
+    # Permits are taken the same way whatever the mode
+    second = lock_store.acquire("key", expires_in_seconds=60, shared=True)
+    assert first.acquired and second.acquired
+    assert (first.clock, second.clock) == (1, 2)
+    assert not lock_store.acquire("key", expires_in_seconds=60).acquired
+
+    lock_store.release("key", clock=1)
+    third = lock_store.acquire("key", expires_in_seconds=0)
+    assert third.acquired
+    assert lock_store.reap() == ["key"]
+    assert lock_store.acquire("key", expires_in_seconds=60).acquired
+    assert lock_store["key"].permits == 2
+
+    with pytest.raises(ValueError):
+        lock_store.set_not_exists("other", LockRecord(key="other", permits=-1))
+    [result] = lock_store.set_not_exists_many([LockRecord(key="other", permits=-1)])
+    assert isinstance(result, ValueError)
+
+
+@pytest.mark.parametrize(
+    "lock_store_class",
+    [LockStore, ThreadSafeLockStore, ShardedLockStore, AsyncLockStore],
+)
+def test_lock_store_owner_reenters(lock_store_class: type) -> None:
+    lock_store = lock_store_class()
+    lock_store["key"] = LockRecord(key="key")
+    lock = lock_store.acquire("key", expires_in_seconds=60, owner="worker-1")
+    assert lock_store.acquire("key", expires_in_seconds=60, owner="worker-1").holds == 2
+    assert not lock_store.acquire(
+        "key", expires_in_seconds=60, owner="worker-2"
+    ).acquired
+    assert not lock_store.acquire("key", expires_in_seconds=60).acquired
+    lock_store.release("key", clock=lock.clock)
+    assert lock_store["key"].acquired
+    lock_store.release("key", clock=lock.clock)
+    assert not lock_store["key"].acquired
+    assert lock_store.acquire("key", expires_in_seconds=60, owner="worker-2").acquired
+
+    with pytest.raises(ValueError):
+        lock_store.acquire("key", expires_in_seconds=60, shared=True, owner="worker-2")
+
+
+@pytest.mark.parametrize(
+    "lock_store_class",
+    [LockStore, ThreadSafeLockStore, ShardedLockStore, AsyncLockStore],
+)
+def test_lock_store_request_ids(lock_store_class: type) -> None:
+    lock_store = lock_store_class()
+    lock_store["key"] = LockRecord(key="key")
+    lock_store["owned"] = LockRecord(key="owned")
+    # A retried acquire gets the lease granted to the first try, once
+    lock = lock_store.acquire("key", expires_in_seconds=60, request_id="acquire-1")
+    clock = lock.clock
+    retried = lock_store.acquire("key", expires_in_seconds=60, request_id="acquire-1")
+    assert retried.acquired
+    assert retried.clock == clock
+    assert not lock_store.acquire(
+        "key", expires_in_seconds=60, request_id="acquire-2"
+    ).acquired
+
+    owned = lock_store.acquire(
+        "owned", expires_in_seconds=60, owner="worker-1", request_id="acquire-3"
+    )
+    lock_store.acquire(
+        "owned", expires_in_seconds=60, owner="worker-1", request_id="acquire-3"
+    )
+    assert lock_store["owned"].holds == 1
+    # A retried release is not released again
+    lock_store.acquire(
+        "owned", expires_in_seconds=60, owner="worker-1", request_id="acquire-4"
+    )
+    lock_store.release("owned", clock=owned.clock, request_id="release-1")
+    lock_store.release("owned", clock=owned.clock, request_id="release-1")
+    assert lock_store["owned"].acquired
+    lock_store.release("owned", clock=owned.clock, request_id="release-2")
+    assert not lock_store["owned"].acquired
+
+    # Once the lease is gone, the request id acquires the lock anew
+    lock_store.release("key", clock=clock)
+    again = lock_store.acquire("key", expires_in_seconds=60, request_id="acquire-1")
+    assert again.acquired
+    assert again.clock == clock + 1
+
+
+def test_thread_safe_lock_store_semaphore_wait() -> None:
+    lock_store = ThreadSafeLockStore()
+    lock_store.set_not_exists("key", LockRecord(key="key", permits=2))
+    first = lock_store.acquire("key", expires_in_seconds=60)
+    lock_store.acquire("key", expires_in_seconds=60)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(
+            lock_store.acquire_wait,
+            "key",
+            expires_in_seconds=60,
+            timeout_seconds=10,
+            shared=True,
+        )
+        time.sleep(0.1)
+        assert not future.done()
+        lock_store.release("key", clock=first.clock)
+        permit = future.result(timeout=1)
+    assert permit.acquired
+    assert permit.clock == 3
+
+
+def test_thread_safe_lock_store_waiting_writer_holds_readers_back() -> None:
+    lock_store = ThreadSafeLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    reader = lock_store.acquire("key", expires_in_seconds=60, shared=True)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        writer_future = executor.submit(
+            lock_store.acquire_wait, "key", expires_in_seconds=60, timeout_seconds=10
+        )
+        time.sleep(0.1)
+        # Readers would keep the lock shared forever if they could still join
+        assert not lock_store.acquire(
+            "key", expires_in_seconds=60, shared=True
+        ).acquired
+        reader_future = executor.submit(
+            lock_store.acquire_wait,
+            "key",
+            expires_in_seconds=60,
+            timeout_seconds=10,
+            shared=True,
+        )
+        time.sleep(0.1)
+        lock_store.release("key", clock=reader.clock)
+        writer = writer_future.result(timeout=1)
+        assert writer.acquired
+        assert not reader_future.done()
+        lock_store.release("key", clock=writer.clock)
+        reader = reader_future.result(timeout=1)
+    assert reader.acquired
+    assert reader.shared
+
+
+def test_thread_safe_lock_store_writer_giving_up_lets_readers_in() -> None:
+    lock_store = ThreadSafeLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    lock_store.acquire("key", expires_in_seconds=60, shared=True)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        writer_future = executor.submit(
+            lock_store.acquire_wait, "key", expires_in_seconds=60, timeout_seconds=0.2
+        )
+        time.sleep(0.1)
+        start = time.monotonic()
+        reader = lock_store.acquire_wait(
+            "key", expires_in_seconds=60, timeout_seconds=10, shared=True
+        )
+        elapsed = time.monotonic() - start
+        assert not writer_future.result().acquired
+    assert reader.acquired
+    assert elapsed < 1.0
+
+
+@pytest.mark.parametrize(
+    "lock_store_class",
+    [LockStore, ThreadSafeLockStore, ShardedLockStore, AsyncLockStore],
+)
+def test_lock_store_held_count(lock_store_class: type) -> None:
+    lock_store = lock_store_class()
+    for key in keys:
+        lock_store[key] = LockRecord(key=key)
+    assert lock_store.held_count() == 0
+    for key in keys:
+        lock_store.acquire(key, expires_in_seconds=60)
+    lock_store.release(keys[0], clock=1)
+    assert lock_store.held_count() == len(keys) - 1
+
+
+@pytest.mark.parametrize("lock_store_class", [ThreadSafeLockStore, ShardedLockStore])
+def test_fair_lock_store_grants_in_ticket_order(lock_store_class: type) -> None:
+    lock_store = lock_store_class(fair=True)
+    lock_store["key"] = LockRecord(key="key")
+    lock = lock_store.acquire("key", expires_in_seconds=60)
+    order: list[int] = []
+
+    def waiter(i: int) -> None:
+        lock = lock_store.acquire_wait(
+            "key", expires_in_seconds=60, timeout_seconds=10, shared=i % 2 == 1
+        )
+        order.append(i)
+        time.sleep(0.01)
+        lock_store.release("key", clock=lock.clock)
+
+    threads = [threading.Thread(target=waiter, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    lock_store.release("key", clock=lock.clock)
+    # Nobody may overtake the queue, even while the lock is free
+    queued = lock_store.acquire("key", expires_in_seconds=60, shared=True)
+    assert not queued.acquired
+    assert 0 < queued.queue_position <= 4
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2, 3]
+    assert lock_store.acquire("key", expires_in_seconds=60).acquired
+
+
+def test_fair_lock_store_timeout_reports_queue_position() -> None:
+    lock_store = ThreadSafeLockStore(fair=True)
+    lock_store["key"] = LockRecord(key="key")
+    lock = lock_store.acquire("key", expires_in_seconds=60)
+    time.sleep(0.05)
+    lock_store.release("key", clock=lock.clock)
+    lock_store.acquire("key", expires_in_seconds=60)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(
+            lock_store.acquire_wait, "key", expires_in_seconds=60, timeout_seconds=0.3
+        )
+        time.sleep(0.05)
+        second = executor.submit(
+            lock_store.acquire_wait, "key", expires_in_seconds=60, timeout_seconds=0.1
+        )
+        queued = second.result()
+        assert isinstance(queued, QueuedLockRecord) and not queued.acquired
+        assert queued.queue_position == 1
+        # One hold of about 50ms ahead, and what is left of the current one
+        assert queued.estimated_wait_ns >= 40_000_000
+        queued = first.result()
+        assert isinstance(queued, QueuedLockRecord)
+        assert queued.queue_position == 0
+
+
+def test_fair_queue_positions() -> None:
+    queue: _FairQueue[str] = _FairQueue()
+    tickets = [queue.join(str(i)) for i in range(10)]
+    assert [queue.ahead(ticket) for ticket in tickets] == list(range(10))
+    # Waiters giving up from the middle move up everybody behind them
+    for i in [3, 7, 0]:
+        queue.leave(tickets[i])
+    assert list(queue.values()) == ["1", "2", "4", "5", "6", "8", "9"]
+    assert [queue.ahead(ticket) for ticket in queue] == list(range(7))
+    ticket = queue.join("10")
+    assert queue.ahead(ticket) == 7
+
+
+def test_lock_store_reap_compacts_stale_expiries() -> None:
+    lock_store = LockStore()
+    lock_store["key"] = LockRecord(key="key")
+    for _ in range(1_000):
+        lock = lock_store.acquire("key", expires_in_seconds=60)
+        lock_store.release("key", clock=lock.clock)
+    assert len(lock_store._expiries) <= 2 * len(lock_store) + 64
+
+
+@pytest.mark.asyncio
+async def test_async_lock_store_acquire_wait_woken_by_release() -> None:
+    lock_store = AsyncLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    lock_store.acquire("key", expires_in_seconds=60)
+    task = asyncio.create_task(
+        lock_store.acquire_wait("key", expires_in_seconds=60, timeout_seconds=10)
+    )
+    await asyncio.sleep(0.1)
+    assert not task.done()
+    lock_store.release("key", clock=1)
+    lock = await asyncio.wait_for(task, 1)
+    assert lock.acquired
+    assert lock.clock == 2
+
+
+@pytest.mark.asyncio
+async def test_async_lock_store_release_many_wakes_waiters() -> None:
+    lock_store = AsyncLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    lock_store.acquire("key", expires_in_seconds=60)
+    task = asyncio.create_task(
+        lock_store.acquire_wait("key", expires_in_seconds=60, timeout_seconds=10)
+    )
+    await asyncio.sleep(0.1)
+    lock_store.release_many([("key", 1)])
+    lock = await asyncio.wait_for(task, 1)
+    assert lock.acquired
+    assert lock.clock == 2
+
+
+@pytest.mark.asyncio
+async def test_async_lock_store_acquire_wait_timeout() -> None:
+    lock_store = AsyncLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    lock_store.acquire("key", expires_in_seconds=60)
+    lock = await lock_store.acquire_wait(
+        "key", expires_in_seconds=60, timeout_seconds=0.1
+    )
+    assert not lock.acquired
+    assert lock.clock == 1
+    assert not lock_store._waiters
+
+
+@pytest.mark.asyncio
+async def test_async_lock_store_acquire_wait_fifo() -> None:
+    lock_store = AsyncLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    lock = lock_store.acquire("key", expires_in_seconds=60)
+    order: list[int] = []
+
+    async def waiter(i: int) -> None:
+        lock = await lock_store.acquire_wait(
+            "key", expires_in_seconds=60, timeout_seconds=10
+        )
+        order.append(i)
+        await asyncio.sleep(0)
+        lock_store.release("key", clock=lock.clock)
+
+    tasks = []
+    for i in range(3):
+        tasks.append(asyncio.create_task(waiter(i)))
+        await asyncio.sleep(0.01)
+    lock_store.release("key", clock=lock.clock)
+    await asyncio.wait_for(asyncio.gather(*tasks), 1)
+    assert order == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_async_lock_store_acquire_wait_cancelled_passes_wake_up_on() -> None:
+    lock_store = AsyncLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    lock = lock_store.acquire("key", expires_in_seconds=60)
+    first = asyncio.create_task(
+        lock_store.acquire_wait("key", expires_in_seconds=60, timeout_seconds=10)
+    )
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(
+        lock_store.acquire_wait("key", expires_in_seconds=60, timeout_seconds=10)
+    )
+    await asyncio.sleep(0.01)
+    # The first waiter is woken, but cancelled before it gets to run
+    lock_store.release("key", clock=lock.clock)
+    first.cancel()
+    lock = await asyncio.wait_for(second, 1)
+    assert lock.acquired
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_async_lock_store_acquire_wait_deleted() -> None:
+    lock_store = AsyncLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    lock_store.acquire("key", expires_in_seconds=60)
+    task = asyncio.create_task(
+        lock_store.acquire_wait("key", expires_in_seconds=60, timeout_seconds=10)
+    )
+    await asyncio.sleep(0.1)
+    del lock_store["key"]
+    with pytest.raises(KeyError):
+        await asyncio.wait_for(task, 1)
+
+
+@pytest.mark.asyncio
+async def test_async_lock_store_waiting_writer_holds_readers_back() -> None:
+    lock_store = AsyncLockStore()
+    lock_store["key"] = LockRecord(key="key")
+    reader = lock_store.acquire("key", expires_in_seconds=60, shared=True)
+    writer_task = asyncio.create_task(
+        lock_store.acquire_wait("key", expires_in_seconds=60, timeout_seconds=10)
+    )
+    await asyncio.sleep(0.05)
+    assert not lock_store.acquire("key", expires_in_seconds=60, shared=True).acquired
+    reader_task = asyncio.create_task(
+        lock_store.acquire_wait(
+            "key", expires_in_seconds=60, timeout_seconds=10, shared=True
+        )
+    )
+    await asyncio.sleep(0.05)
+    lock_store.release("key", clock=reader.clock)
+    writer = await asyncio.wait_for(writer_task, 1)
+    assert writer.acquired
+    await asyncio.sleep(0.05)
+    assert not reader_task.done()
+    lock_store.release("key", clock=writer.clock)
+    reader = await asyncio.wait_for(reader_task, 1)
+    assert reader.acquired
+    assert reader.shared
+
+
+@pytest.mark.asyncio
+async def test_fair_async_lock_store_grants_in_ticket_order() -> None:
+    lock_store = AsyncLockStore(fair=True)
+    lock_store["key"] = LockRecord(key="key")
+    lock = lock_store.acquire("key", expires_in_seconds=60)
+    order: list[int] = []
+
+    async def waiter(i: int) -> None:
+        lock = await lock_store.acquire_wait(
+            "key", expires_in_seconds=60, timeout_seconds=10, shared=i % 2 == 1
+        )
+        order.append(i)
+        await asyncio.sleep(0.01)
+        lock_store.release("key", clock=lock.clock)
+
+    tasks = []
+    for i in range(4):
+        tasks.append(asyncio.create_task(waiter(i)))
+        await asyncio.sleep(0.01)
+    lock_store.release("key", clock=lock.clock)
+    queued = lock_store.acquire("key", expires_in_seconds=60, shared=True)
+    assert isinstance(queued, QueuedLockRecord) and not queued.acquired
+    assert queued.queue_position == 4
+    await asyncio.wait_for(asyncio.gather(*tasks), 1)
+    assert order == [0, 1, 2, 3]
+    assert lock_store.acquire("key", expires_in_seconds=60).acquired
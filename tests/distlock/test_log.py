@@ -0,0 +1,74 @@
+import logging
+import queue
+from typing import Generator
+
+import pytest
+
+from distlock.log import (
+    DeferredQueueHandler,
+    SampleFilter,
+    configure_logging,
+    stop_logging,
+)
+
+
+@pytest.fixture
+def restore_root_logger() -> Generator[None, None, None]:
+    root = logging.getLogger()
+    handlers, level = root.handlers, root.level
+    yield
+    stop_logging()
+    root.handlers, root.level = handlers, level
+
+
+def make_record(level: int, msg: str = "message %s", *args) -> logging.LogRecord:
+    return logging.LogRecord("distlock", level, __file__, 1, msg, args, None)
+
+
+def test_sample_filter() -> None:
+    with pytest.raises(ValueError):
+        SampleFilter(1.5)
+
+    assert all(SampleFilter(1).filter(make_record(logging.INFO)) for _ in range(100))
+    assert not any(
+        SampleFilter(0).filter(make_record(logging.INFO)) for _ in range(100)
+    )
+    assert SampleFilter(0).filter(make_record(logging.WARNING))
+    assert SampleFilter(0).filter(make_record(logging.ERROR))
+
+    sampled = sum(
+        SampleFilter(0.5).filter(make_record(logging.DEBUG)) for _ in range(10_000)
+    )
+    assert 4_000 < sampled < 6_000
+
+
+def test_deferred_queue_handler_does_not_format() -> None:
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    record = make_record(logging.INFO, "lock %s", "key")
+    handler.handle(record)
+    queued = log_queue.get_nowait()
+    assert queued is record
+    assert queued.msg == "lock %s" and queued.args == ("key",)
+
+
+def test_configure_logging(
+    restore_root_logger: None, capsys: pytest.CaptureFixture
+) -> None:
+    configure_logging(level="WARNING")
+    logger = logging.getLogger("distlock.test")
+    logger.info("not logged")
+    logger.warning("logged %s", "lazily")
+    stop_logging()
+    err = capsys.readouterr().err
+    assert "not logged" not in err
+    assert "WARNING" in err and "logged lazily" in err
+
+    configure_logging(level="DEBUG", sample_rate=0)
+    logger.debug("sampled out")
+    logger.error("always logged")
+    stop_logging()
+    err = capsys.readouterr().err
+    assert "sampled out" not in err
+    assert "always logged" in err
+    assert len(logging.getLogger().handlers) == 1
@@ -0,0 +1,147 @@
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+import pytest
+
+from distlock import Distlock, DistlockAsync, NotFoundError
+from distlock.async_server import AsyncServicer
+from distlock.lock_store import LockStore
+from distlock.metrics import (
+    AsyncMetricsInterceptor,
+    MetricsInterceptor,
+    MetricsServer,
+    RpcMetrics,
+    lock_store_gauges,
+    render,
+)
+from distlock.models import LockRecord
+from distlock.server import Servicer
+from distlock.stubs import distlock_pb2_grpc
+
+
+def test_rpc_metrics_adds_up_threads() -> None:
+    rpc_metrics = RpcMetrics(buckets=(0.1, 1.0))
+
+    def record(seconds: float) -> None:
+        rpc_metrics.started("AcquireLock")
+        rpc_metrics.finished("AcquireLock", "OK", seconds)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(record, [0.05, 0.5, 5.0] * 100))
+    rpc_metrics.started("ReleaseLock")
+
+    requests, latencies, in_flight = rpc_metrics.collect()
+    assert requests == {("AcquireLock", "OK"): 300}
+    assert latencies["AcquireLock"][:3] == [100, 100, 100]
+    assert latencies["AcquireLock"][3] == pytest.approx(555.0)
+    assert in_flight == {"AcquireLock": 0, "ReleaseLock": 1}
+
+
+def test_render() -> None:
+    rpc_metrics = RpcMetrics(buckets=(0.1, 1.0))
+    rpc_metrics.started("GetLock")
+    rpc_metrics.finished("GetLock", "OK", 0.05)
+    rpc_metrics.started("GetLock")
+    rpc_metrics.finished("GetLock", "NOT_FOUND", 2.0)
+
+    def broken() -> float:
+        raise RuntimeError
+
+    text = render(
+        rpc_metrics,
+        [("distlock_locks", "Locks.", lambda: 3), ("distlock_broken", "", broken)],
+    )
+    lines = text.splitlines()
+    assert 'distlock_rpc_requests_total{method="GetLock",code="NOT_FOUND"} 1' in lines
+    assert 'distlock_rpc_requests_total{method="GetLock",code="OK"} 1' in lines
+    assert 'distlock_rpc_latency_seconds_bucket{method="GetLock",le="0.1"} 1' in lines
+    assert 'distlock_rpc_latency_seconds_bucket{method="GetLock",le="1.0"} 1' in lines
+    assert 'distlock_rpc_latency_seconds_bucket{method="GetLock",le="+Inf"} 2' in lines
+    assert 'distlock_rpc_latency_seconds_sum{method="GetLock"} 2.05' in lines
+    assert 'distlock_rpc_latency_seconds_count{method="GetLock"} 2' in lines
+    assert 'distlock_rpc_in_flight{method="GetLock"} 0' in lines
+    assert "distlock_locks 3" in lines
+    assert "distlock_broken" not in text
+
+
+def test_lock_store_gauges() -> None:
+    lock_store = LockStore()
+    for key in ["a", "b", "c"]:
+        lock_store[key] = LockRecord(key=key)
+    lock_store.acquire("a", expires_in_seconds=60)
+    assert [(name, read()) for name, _, read in lock_store_gauges(lock_store)] == [
+        ("distlock_locks", 3),
+        ("distlock_locks_held", 1),
+    ]
+
+
+def test_metrics_server() -> None:
+    rpc_metrics = RpcMetrics()
+    metrics_server = MetricsServer(
+        rpc_metrics, [("distlock_locks", "Locks.", lambda: 7)], "localhost", 0
+    )
+    metrics_server.start()
+    try:
+        url = f"http://localhost:{metrics_server.port}"
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "distlock_locks 7" in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/other")
+    finally:
+        metrics_server.stop()
+
+
+def test_metrics_interceptor() -> None:
+    rpc_metrics = RpcMetrics()
+    server = grpc.server(
+        ThreadPoolExecutor(max_workers=2),
+        interceptors=[MetricsInterceptor(rpc_metrics)],
+    )
+    distlock_pb2_grpc.add_DistlockServicer_to_server(Servicer(), server)
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    try:
+        with Distlock(address="localhost", port=port) as distlock:
+            distlock.create_lock("key")
+            with pytest.raises(NotFoundError):
+                distlock.get_lock("missing")
+            assert [lock.key for lock in distlock.iter_locks()] == ["key"]
+    finally:
+        server.stop(None)
+
+    requests, latencies, in_flight = rpc_metrics.collect()
+    assert requests == {
+        ("CreateLock", "OK"): 1,
+        ("GetLock", "NOT_FOUND"): 1,
+        ("StreamLocks", "OK"): 1,
+    }
+    assert all(sum(counted[:-1]) == 1 for counted in latencies.values())
+    assert set(in_flight.values()) == {0}
+
+
+@pytest.mark.asyncio
+async def test_async_metrics_interceptor() -> None:
+    rpc_metrics = RpcMetrics()
+    server = grpc.aio.server(interceptors=[AsyncMetricsInterceptor(rpc_metrics)])
+    distlock_pb2_grpc.add_DistlockServicer_to_server(AsyncServicer(), server)
+    port = server.add_insecure_port("localhost:0")
+    await server.start()
+    try:
+        async with DistlockAsync(address="localhost", port=port) as distlock:
+            await distlock.create_lock("key")
+            with pytest.raises(NotFoundError):
+                await distlock.get_lock("missing")
+            assert [lock.key async for lock in distlock.iter_locks()] == ["key"]
+    finally:
+        await server.stop(None)
+
+    requests, _, in_flight = rpc_metrics.collect()
+    assert requests == {
+        ("CreateLock", "OK"): 1,
+        ("GetLock", "NOT_FOUND"): 1,
+        ("StreamLocks", "OK"): 1,
+    }
+    assert set(in_flight.values()) == {0}
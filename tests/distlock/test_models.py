@@ -0,0 +1,165 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from distlock.exceptions import LeaseLostError, UnreleasableError
+from distlock.models import EPOCH_START, Lock, LockRecord, QueuedLockRecord
+
+
+def test_lock_record_acquire_release() -> None:
+    record = LockRecord(key="key")
+    assert not record.acquired
+    assert record.expired
+    record.acquire(expires_in_seconds=60)
+    assert record.acquired
+    assert record.clock == 1
+    assert not record.expired
+    assert 59 < record.seconds_until_expiry <= 60
+    with pytest.raises(UnreleasableError):
+        record.release(clock=0)
+    record.release(clock=1)
+    assert not record.acquired
+
+
+def test_lock_record_expires() -> None:
+    record = LockRecord(key="key")
+    record.acquire(expires_in_seconds=0)
+    time.sleep(0.001)
+    assert record.expired
+
+
+def test_lock_record_renew() -> None:
+    record = LockRecord(key="key")
+    with pytest.raises(LeaseLostError):
+        record.renew(clock=0, expires_in_seconds=60)
+    record.acquire(expires_in_seconds=1)
+    with pytest.raises(LeaseLostError):
+        record.renew(clock=0, expires_in_seconds=60)
+    record.renew(clock=1, expires_in_seconds=60)
+    assert record.clock == 1
+    assert 59 < record.seconds_until_expiry <= 60
+    record.release(clock=1)
+    with pytest.raises(LeaseLostError):
+        record.renew(clock=1, expires_in_seconds=60)
+
+
+def test_lock_record_to_pb_never_acquired() -> None:
+    lock = Lock.from_pb(LockRecord(key="key").to_pb())
+    assert lock.key == "key"
+    assert not lock.acquired
+    assert lock.clock == 0
+    assert lock.expires_at.replace(tzinfo=timezone.utc) == EPOCH_START
+
+
+def test_lock_record_to_pb_wall_clock_expiry() -> None:
+    record = LockRecord(key="key")
+    record.acquire(expires_in_seconds=60)
+    lock = Lock.from_pb(record.to_pb())
+    assert lock.acquired
+    assert lock.clock == 1
+    expected = datetime.now(timezone.utc) + timedelta(seconds=60)
+    expires_at = lock.expires_at.replace(tzinfo=timezone.utc)
+    assert abs((expires_at - expected).total_seconds()) < 1
+
+
+def test_lock_record_shared() -> None:
+    record = LockRecord(key="key")
+    first = record.acquire_shared(expires_in_seconds=60)
+    second = record.acquire_shared(expires_in_seconds=1)
+    assert (first.clock, second.clock) == (1, 2)
+    assert first.acquired and first.shared
+    assert record.acquired and record.shared
+    assert record.clock == 2
+    assert record.expires_at_ns == first.expires_at_ns
+
+    renewed = record.renew(clock=2, expires_in_seconds=120)
+    assert renewed.clock == 2
+    assert record.expires_at_ns == renewed.expires_at_ns
+    with pytest.raises(LeaseLostError):
+        record.renew(clock=3, expires_in_seconds=60)
+    with pytest.raises(UnreleasableError):
+        record.release(clock=3)
+
+    record.release(clock=2)
+    assert record.acquired
+    assert record.expires_at_ns == first.expires_at_ns
+    record.release(clock=1)
+    assert not record.acquired
+    assert not record.shared
+
+    record.acquire(expires_in_seconds=60)
+    assert record.clock == 3
+    assert not record.shared
+    assert record.readers is None
+
+
+def test_lock_record_semaphore() -> None:
+    record = LockRecord(key="key", permits=2)
+    first = record.acquire_permit(expires_in_seconds=60)
+    second = record.acquire_permit(expires_in_seconds=30)
+    assert first.acquired and second.acquired
+    assert (first.clock, second.clock) == (1, 2)
+    assert first.permits == 2
+    assert not first.shared
+
+    full = record.acquire_permit(expires_in_seconds=60)
+    assert not full.acquired
+    assert full.expires_at_ns == second.expires_at_ns
+    assert record.clock == 2
+
+    renewed = record.renew(clock=2, expires_in_seconds=120)
+    assert renewed.permits == 2
+    record.release(clock=1)
+    third = record.acquire_permit(expires_in_seconds=60)
+    assert third.acquired
+    assert third.clock == 3
+    record.release(clock=2)
+    record.release(clock=3)
+    assert not record.acquired
+    assert record.readers is None
+
+
+def test_lock_record_semaphore_expired_permits_are_free() -> None:
+    record = LockRecord(key="key", permits=1)
+    assert record.acquire_permit(expires_in_seconds=0).acquired
+    assert record.acquire_permit(expires_in_seconds=60).acquired
+    assert list(record.readers or {}) == [2]
+
+
+def test_lock_record_owner_reenters() -> None:
+    record = LockRecord(key="key")
+    record.acquire(expires_in_seconds=1, owner="worker-1")
+    assert record.held_by("worker-1")
+    assert not record.held_by("worker-2")
+    expires_at_ns = record.expires_at_ns
+    record.reenter(expires_in_seconds=60)
+    assert record.holds == 2
+    assert record.clock == 1
+    assert record.expires_at_ns > expires_at_ns
+
+    record.release(clock=1)
+    assert record.acquired
+    assert record.holds == 1
+    record.release(clock=1)
+    assert not record.acquired
+    assert record.holds == 0
+    assert not record.held_by("worker-1")
+
+    lock = Lock.from_pb(record.copy().to_pb())
+    assert lock.owner == "worker-1"
+    record.acquire(expires_in_seconds=60)
+    assert record.owner == ""
+    assert record.holds == 0
+
+
+def test_queued_lock_record_to_pb() -> None:
+    record = QueuedLockRecord(
+        key="key", clock=3, queue_position=2, estimated_wait_ns=1_500_000_000
+    )
+    lock = Lock.from_pb(record.to_pb())
+    assert not lock.acquired
+    assert lock.clock == 3
+    assert lock.queue_position == 2
+    assert lock.estimated_wait_seconds == 1.5
+    assert Lock.from_pb(LockRecord(key="key").to_pb()).queue_position == 0
@@ -0,0 +1,448 @@
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable
+
+import grpc
+import pytest
+
+from distlock.lock_store import ShardedLockStore
+from distlock.models import LockRecord
+from distlock.raft import LOG_FILE, NotLeaderError, RaftNode, RaftServicer
+from distlock.snapshot import dump_snapshot, snapshots
+from distlock.stubs import distlock_pb2, distlock_pb2_grpc
+from distlock.wal import encode_delete, encode_put
+
+
+def entry(term: int, lock: LockRecord) -> distlock_pb2.LogEntry:
+    return distlock_pb2.LogEntry(term=term, body=encode_put(lock))
+
+
+def wait_for_leader(node: RaftNode) -> None:
+    wait_until(lambda: node.is_leader)
+
+
+def wait_until(condition: Callable[[], bool], timeout_seconds: float = 5) -> None:
+    deadline = time.monotonic() + timeout_seconds
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_single_node_commits_on_its_own() -> None:
+    node = RaftNode("localhost:1", [], election_timeout_seconds=(0.01, 0.02))
+    lock_store = ShardedLockStore(shards=4, wal=node)
+    node.start(lock_store)
+    try:
+        wait_for_leader(node)
+        assert node.leader_id == "localhost:1"
+        lock_store["a"] = LockRecord(key="a")
+        lock = lock_store.acquire("a", expires_in_seconds=60)
+        node.sync()
+        assert node.commit_index == 3
+        assert lock.clock == 1
+    finally:
+        node.stop()
+
+
+def test_leader_loading_its_store_sends_clients_nowhere() -> None:
+    loading = threading.Event()
+    loaded = threading.Event()
+
+    class SlowLockStore(ShardedLockStore):
+        def reset(
+            self,
+            locks: Iterable[LockRecord],
+            requests: dict[str, tuple[str, int]] | None = None,
+        ) -> None:
+            loading.set()
+            loaded.wait(5)
+            super().reset(locks, requests)
+
+    node = RaftNode("localhost:1", [], election_timeout_seconds=(0.01, 0.02))
+    node.start(SlowLockStore(shards=4, wal=node))
+    try:
+        assert loading.wait(5)
+        # Redirecting clients to itself would have them retry without pause
+        assert not node.is_leader
+        assert node.leader_id is None
+        loaded.set()
+        wait_for_leader(node)
+        assert node.leader_id == "localhost:1"
+    finally:
+        loaded.set()
+        node.stop()
+
+
+def test_follower_does_not_append() -> None:
+    node = RaftNode("localhost:1", ["localhost:2"])
+    lock_store = ShardedLockStore(shards=4, wal=node)
+    with pytest.raises(NotLeaderError):
+        lock_store["a"] = LockRecord(key="a")
+    with pytest.raises(NotLeaderError):
+        node.sync()
+
+
+def test_vote_once_per_term_for_up_to_date_logs() -> None:
+    node = RaftNode("localhost:1", ["localhost:2", "localhost:3"])
+    node.append_entries(
+        distlock_pb2.AppendEntriesRequest(
+            term=2,
+            leader_id="localhost:2",
+            entries=[entry(1, LockRecord(key="a")), entry(2, LockRecord(key="b"))],
+        )
+    )
+
+    # A candidate that is missing entries does not get the vote
+    response = node.request_vote(
+        distlock_pb2.RequestVoteRequest(
+            term=3, candidate_id="localhost:3", last_log_index=5, last_log_term=1
+        )
+    )
+    assert response.term == 3
+    assert not response.vote_granted
+
+    response = node.request_vote(
+        distlock_pb2.RequestVoteRequest(
+            term=3, candidate_id="localhost:2", last_log_index=2, last_log_term=2
+        )
+    )
+    assert response.vote_granted
+    response = node.request_vote(
+        distlock_pb2.RequestVoteRequest(
+            term=3, candidate_id="localhost:3", last_log_index=2, last_log_term=2
+        )
+    )
+    assert not response.vote_granted
+
+
+def test_append_entries_replaces_conflicting_entries() -> None:
+    node = RaftNode("localhost:1", ["localhost:2", "localhost:3"])
+    response = node.append_entries(
+        distlock_pb2.AppendEntriesRequest(
+            term=1,
+            leader_id="localhost:2",
+            entries=[entry(1, LockRecord(key="a")), entry(1, LockRecord(key="b"))],
+            leader_commit=1,
+        )
+    )
+    assert response.success
+    assert response.last_log_index == 2
+    assert node.commit_index == 1
+
+    # The leader's log has nothing at index 3 yet, so the follower asks for
+    # what follows its last entry
+    response = node.append_entries(
+        distlock_pb2.AppendEntriesRequest(
+            term=2, leader_id="localhost:3", prev_log_index=3, prev_log_term=2
+        )
+    )
+    assert not response.success
+    assert response.last_log_index == 2
+
+    # Entry 2 was never committed, a new leader replaces it
+    response = node.append_entries(
+        distlock_pb2.AppendEntriesRequest(
+            term=2,
+            leader_id="localhost:3",
+            prev_log_index=1,
+            prev_log_term=1,
+            entries=[
+                distlock_pb2.LogEntry(term=2, body=encode_delete("a")),
+                entry(2, LockRecord(key="c")),
+            ],
+            leader_commit=3,
+        )
+    )
+    assert response.success
+    assert response.last_log_index == 3
+    assert node.commit_index == 3
+    assert node.leader_id == "localhost:3"
+    assert sorted(node._committed) == ["c"]
+
+    # A leader of an older term is turned away
+    response = node.append_entries(
+        distlock_pb2.AppendEntriesRequest(term=1, leader_id="localhost:2")
+    )
+    assert not response.success
+    assert response.term == 2
+
+
+def test_single_node_syncs_before_committing(tmp_path: Path) -> None:
+    node = RaftNode(
+        "localhost:1", [], election_timeout_seconds=(0.01, 0.02), data_dir=tmp_path
+    )
+    lock_store = ShardedLockStore(shards=4, wal=node)
+    node.start(lock_store)
+    try:
+        wait_for_leader(node)
+        lock_store["a"] = LockRecord(key="a")
+        assert node.commit_index == 1
+        node.sync()
+        assert node.commit_index == 2
+    finally:
+        node.stop()
+
+    node = RaftNode("localhost:1", [], data_dir=tmp_path)
+    try:
+        assert node.term == 1
+        assert [entry.term for entry in node._log] == [0, 1, 1]
+    finally:
+        node.stop()
+
+
+def test_new_leader_remembers_request_ids(tmp_path: Path) -> None:
+    node = RaftNode(
+        "localhost:1", [], election_timeout_seconds=(0.01, 0.02), data_dir=tmp_path
+    )
+    lock_store = ShardedLockStore(shards=4, wal=node)
+    node.start(lock_store)
+    try:
+        wait_for_leader(node)
+        lock_store["a"] = LockRecord(key="a")
+        lock = lock_store.acquire("a", expires_in_seconds=60, request_id="acquire-1")
+        node.sync()
+    finally:
+        node.stop()
+
+    node = RaftNode(
+        "localhost:1", [], election_timeout_seconds=(0.01, 0.02), data_dir=tmp_path
+    )
+    lock_store = ShardedLockStore(shards=4, wal=node)
+    node.start(lock_store)
+    try:
+        wait_for_leader(node)
+        retried = lock_store.acquire("a", expires_in_seconds=60, request_id="acquire-1")
+        assert retried.acquired and retried.clock == lock.clock
+    finally:
+        node.stop()
+
+
+def test_restart_keeps_term_vote_and_log(tmp_path: Path) -> None:
+    node = RaftNode("localhost:1", ["localhost:2", "localhost:3"], data_dir=tmp_path)
+    node.append_entries(
+        distlock_pb2.AppendEntriesRequest(
+            term=1,
+            leader_id="localhost:2",
+            entries=[entry(1, LockRecord(key="a")), entry(1, LockRecord(key="b"))],
+        )
+    )
+    node.append_entries(
+        distlock_pb2.AppendEntriesRequest(
+            term=2,
+            leader_id="localhost:3",
+            prev_log_index=1,
+            prev_log_term=1,
+            entries=[entry(2, LockRecord(key="c"))],
+        )
+    )
+    assert node.request_vote(
+        distlock_pb2.RequestVoteRequest(
+            term=3, candidate_id="localhost:3", last_log_index=2, last_log_term=2
+        )
+    ).vote_granted
+    node.stop()
+
+    node = RaftNode("localhost:1", ["localhost:2", "localhost:3"], data_dir=tmp_path)
+    try:
+        assert node.term == 3
+        # The vote of the term was already cast before the restart
+        assert not node.request_vote(
+            distlock_pb2.RequestVoteRequest(
+                term=3, candidate_id="localhost:2", last_log_index=2, last_log_term=2
+            )
+        ).vote_granted
+        # The entry replaced by the leader of term 2 stays replaced
+        response = node.append_entries(
+            distlock_pb2.AppendEntriesRequest(
+                term=3,
+                leader_id="localhost:3",
+                prev_log_index=2,
+                prev_log_term=2,
+                leader_commit=2,
+            )
+        )
+        assert response.success
+        assert sorted(node._committed) == ["a", "c"]
+    finally:
+        node.stop()
+
+
+def test_restart_drops_incomplete_entries(tmp_path: Path) -> None:
+    node = RaftNode("localhost:1", ["localhost:2", "localhost:3"], data_dir=tmp_path)
+    node.append_entries(
+        distlock_pb2.AppendEntriesRequest(
+            term=1, leader_id="localhost:2", entries=[entry(1, LockRecord(key="a"))]
+        )
+    )
+    node.stop()
+    with (tmp_path / LOG_FILE).open("ab") as file:
+        file.write(b"\x01\x02\x03")
+
+    node = RaftNode("localhost:1", ["localhost:2", "localhost:3"], data_dir=tmp_path)
+    try:
+        assert len(node._log) == 2
+        response = node.append_entries(
+            distlock_pb2.AppendEntriesRequest(
+                term=1,
+                leader_id="localhost:2",
+                prev_log_index=1,
+                prev_log_term=1,
+                entries=[entry(1, LockRecord(key="b"))],
+            )
+        )
+        assert response.last_log_index == 2
+    finally:
+        node.stop()
+
+    node = RaftNode("localhost:1", ["localhost:2", "localhost:3"], data_dir=tmp_path)
+    try:
+        assert [entry.term for entry in node._log] == [0, 1, 1]
+    finally:
+        node.stop()
+
+
+def test_log_is_compacted_and_restored(tmp_path: Path) -> None:
+    node = RaftNode(
+        "localhost:1",
+        [],
+        election_timeout_seconds=(0.01, 0.02),
+        data_dir=tmp_path,
+        snapshot_entries=5,
+    )
+    lock_store = ShardedLockStore(shards=4, wal=node)
+    node.start(lock_store)
+    try:
+        wait_for_leader(node)
+        lock_store.set_not_exists_many([LockRecord(key=key) for key in "abc"])
+        for _ in range(10):
+            lock = lock_store.acquire("a", expires_in_seconds=60)
+            lock_store.release("a", clock=lock.clock)
+        lock_store.acquire("b", expires_in_seconds=60, request_id="acquire-1")
+        node.sync()
+        wait_until(lambda: node._snapshot_index >= 20)
+        assert len(node._log) < 10
+        assert not (tmp_path / LOG_FILE).exists()
+        assert [index for index, _ in snapshots(tmp_path)] == [node._snapshot_index]
+    finally:
+        node.stop()
+
+    node = RaftNode(
+        "localhost:1", [], election_timeout_seconds=(0.01, 0.02), data_dir=tmp_path
+    )
+    lock_store = ShardedLockStore(shards=4, wal=node)
+    node.start(lock_store)
+    try:
+        wait_for_leader(node)
+        assert sorted(lock.key for lock in lock_store.to_list()) == ["a", "b", "c"]
+        assert lock_store["a"].clock == 10 and not lock_store["a"].acquired
+        retried = lock_store.acquire("b", expires_in_seconds=60, request_id="acquire-1")
+        assert retried.acquired and retried.clock == 1
+    finally:
+        node.stop()
+
+
+def test_follower_installs_snapshot_in_chunks(tmp_path: Path) -> None:
+    file = io.BytesIO()
+    dump_snapshot(
+        file,
+        [[LockRecord(key="a"), LockRecord(key="b", clock=3)]],
+        {"acquire-1": ("b", 3)},
+    )
+    snapshot = file.getvalue()
+    node = RaftNode("localhost:1", ["localhost:2"], data_dir=tmp_path)
+    node.append_entries(
+        distlock_pb2.AppendEntriesRequest(
+            term=1, leader_id="localhost:2", entries=[entry(1, LockRecord(key="x"))]
+        )
+    )
+
+    def install(offset: int, data: bytes, done: bool) -> bool:
+        return node.install_snapshot(
+            distlock_pb2.InstallSnapshotRequest(
+                term=2,
+                leader_id="localhost:2",
+                last_included_index=5,
+                last_included_term=2,
+                offset=offset,
+                data=data,
+                done=done,
+            )
+        ).success
+
+    assert install(0, snapshot[:10], False)
+    # A chunk that does not follow the previous one makes the leader start over
+    assert not install(20, snapshot[20:], True)
+    assert install(0, snapshot[:10], False)
+    assert install(10, snapshot[10:], True)
+    assert node.commit_index == 5
+    assert sorted(node._committed) == ["a", "b"]
+    assert node._committed_requests == {"acquire-1": ("b", 3)}
+    response = node.append_entries(
+        distlock_pb2.AppendEntriesRequest(
+            term=2,
+            leader_id="localhost:2",
+            prev_log_index=5,
+            prev_log_term=2,
+            entries=[entry(2, LockRecord(key="c"))],
+        )
+    )
+    assert response.success and response.last_log_index == 6
+    node.stop()
+
+    node = RaftNode("localhost:1", ["localhost:2"], data_dir=tmp_path)
+    try:
+        assert node.commit_index == 5
+        assert sorted(node._committed) == ["a", "b"]
+        assert [entry.term for entry in node._log] == [2, 2]
+    finally:
+        node.stop()
+
+
+def test_leader_sends_snapshot_to_lagging_follower() -> None:
+    servers = [grpc.server(ThreadPoolExecutor(max_workers=8)) for _ in range(3)]
+    addresses = [
+        f"localhost:{server.add_insecure_port('localhost:0')}" for server in servers
+    ]
+    nodes = [
+        RaftNode(
+            address,
+            [peer for peer in addresses if peer != address],
+            election_timeout_seconds=(0.5, 1.0),
+            heartbeat_seconds=0.05,
+            snapshot_entries=5,
+        )
+        for address in addresses
+    ]
+    lock_stores = [ShardedLockStore(shards=4, wal=node) for node in nodes]
+    for server, node in zip(servers, nodes):
+        distlock_pb2_grpc.add_RaftServicer_to_server(RaftServicer(node), server)
+    # The third node is down while the others commit and compact their logs
+    for server, node, lock_store in zip(servers[:2], nodes[:2], lock_stores[:2]):
+        server.start()
+        node.start(lock_store)
+    try:
+        wait_until(lambda: nodes[0].is_leader or nodes[1].is_leader)
+        leader = 0 if nodes[0].is_leader else 1
+        lock_store = lock_stores[leader]
+        lock_store.set_not_exists_many([LockRecord(key=key) for key in "abc"])
+        for _ in range(10):
+            lock = lock_store.acquire("a", expires_in_seconds=60)
+            lock_store.release("a", clock=lock.clock)
+        nodes[leader].sync()
+        wait_until(lambda: nodes[leader]._snapshot_index > 0)
+
+        servers[2].start()
+        nodes[2].start(lock_stores[2])
+        # The node may first force an election that it cannot win
+        wait_until(lambda: nodes[2].commit_index >= 20, timeout_seconds=10)
+        assert nodes[2]._snapshot_index > 0
+        assert sorted(nodes[2]._committed) == ["a", "b", "c"]
+        assert nodes[2]._committed["a"].clock == 10
+    finally:
+        for node in nodes:
+            node.stop()
+        for server in servers:
+            server.stop(None)
@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+import pytest
+
+from distlock.lock_store import ShardedLockStore
+from distlock.models import LockRecord
+from distlock.reaper import Reaper, reap_forever
+
+
+def test_reaper_releases_expired_leases() -> None:
+    lock_store = ShardedLockStore(shards=4)
+    lock_store.set_not_exists_many([LockRecord(key=key) for key in ["a", "b"]])
+    lock_store.acquire("a", expires_in_seconds=1)
+    lock_store.acquire("b", expires_in_seconds=60)
+    reaper = Reaper(lock_store)
+    reaper.start()
+    try:
+        time.sleep(1.5)
+        assert not lock_store["a"].acquired
+        assert lock_store["b"].acquired
+    finally:
+        reaper.stop()
+
+
+@pytest.mark.asyncio
+async def test_reap_forever_releases_expired_leases() -> None:
+    lock_store = ShardedLockStore(shards=1)
+    lock_store["a"] = LockRecord(key="a")
+    lock_store.acquire("a", expires_in_seconds=1)
+    reaped: list[str] = []
+    task = asyncio.create_task(reap_forever(lock_store, reaped.extend))
+    try:
+        await asyncio.sleep(1.5)
+        assert reaped == ["a"]
+        assert not lock_store["a"].acquired
+    finally:
+        task.cancel()
@@ -0,0 +1,77 @@
+from pathlib import Path
+from typing import Any, Iterator
+
+import grpc
+import pytest
+
+from distlock import server as server_module
+from distlock.raft import RaftNode
+from distlock.server import Servicer, serve
+from distlock.shared_lock_store import SharedLockStore
+from distlock.wal import WriteAheadLog
+
+
+@pytest.fixture
+def servicers(monkeypatch: pytest.MonkeyPatch) -> Iterator[list[Servicer]]:
+    """
+    Makes serve return as soon as it has started, and collects the servicers
+    it serves.
+    """
+    servicers: list[Servicer] = []
+    servers: list[grpc.Server] = []
+    make_server = grpc.server
+
+    class RecordingServicer(Servicer):
+        def __init__(self, *args: Any, **kwargs: Any) -> None:
+            super().__init__(*args, **kwargs)
+            servicers.append(self)
+
+    def server(*args: Any, **kwargs: Any) -> grpc.Server:
+        made = make_server(*args, **kwargs)
+        made.wait_for_termination = lambda timeout=None: True  # type: ignore[method-assign]
+        servers.append(made)
+        return made
+
+    monkeypatch.setattr(server_module, "Servicer", RecordingServicer)
+    monkeypatch.setattr(grpc, "server", server)
+    yield servicers
+    for made in servers:
+        made.stop(None)
+
+
+def test_serve_syncs_the_write_ahead_log(
+    servicers: list[Servicer], tmp_path: Path
+) -> None:
+    serve(address="localhost", port=0, max_workers=2, data_dir=tmp_path)
+    [servicer] = servicers
+    # Otherwise replies are sent before the changes are on disk
+    assert isinstance(servicer.wal, WriteAheadLog)
+
+
+def test_serve_waits_for_the_cluster_to_commit(servicers: list[Servicer]) -> None:
+    serve(
+        address="localhost",
+        port=0,
+        max_workers=2,
+        raft_port=0,
+        peers=["localhost:1"],
+    )
+    [servicer] = servicers
+    # Otherwise replies are sent before the changes are replicated
+    assert isinstance(servicer.wal, RaftNode)
+
+
+def test_serve_shared_lock_store_only(
+    servicers: list[Servicer], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def sharded_lock_store(*args: Any, **kwargs: Any) -> None:
+        raise AssertionError("A store of its own is not needed")
+
+    monkeypatch.setattr(server_module, "ShardedLockStore", sharded_lock_store)
+    lock_store = SharedLockStore(capacity=8, regions=1)
+    try:
+        serve(address="localhost", port=0, max_workers=2, lock_store=lock_store)
+        [servicer] = servicers
+        assert servicer.lock_store is lock_store
+    finally:
+        lock_store.close()
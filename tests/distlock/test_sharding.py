@@ -0,0 +1,54 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+import pytest
+
+from distlock.models import Lock
+from distlock.sharding import HashRing, _read_ahead
+
+ENDPOINTS = ["localhost:50051", "localhost:50052", "localhost:50053"]
+KEYS = [f"key-{i}" for i in range(30_000)]
+
+
+def test_hash_ring_is_deterministic() -> None:
+    ring = HashRing(ENDPOINTS)
+    same_ring = HashRing(list(reversed(ENDPOINTS)))
+    assert all(ring.endpoint_for(key) == same_ring.endpoint_for(key) for key in KEYS)
+
+
+def test_hash_ring_spreads_keys_evenly() -> None:
+    ring = HashRing(ENDPOINTS)
+    counts = Counter(ring.endpoint_for(key) for key in KEYS)
+    assert set(counts) == set(ENDPOINTS)
+    for count in counts.values():
+        assert abs(count - len(KEYS) / len(ENDPOINTS)) < 0.1 * len(KEYS)
+
+
+def test_hash_ring_moves_few_keys_when_endpoint_added() -> None:
+    ring = HashRing(ENDPOINTS)
+    grown = HashRing(ENDPOINTS + ["localhost:50054"])
+    moved = [key for key in KEYS if ring.endpoint_for(key) != grown.endpoint_for(key)]
+    # Only keys taken over by the new endpoint move, about a quarter of them
+    assert all(grown.endpoint_for(key) == "localhost:50054" for key in moved)
+    assert len(moved) < 0.35 * len(KEYS)
+
+
+def test_hash_ring_requires_endpoints() -> None:
+    with pytest.raises(ValueError):
+        HashRing([])
+
+
+def test_read_ahead_reads_before_it_is_asked() -> None:
+    read: list[str] = []
+
+    def locks() -> Iterator[Lock]:
+        for i in range(7):
+            read.append(f"key-{i}")
+            yield Lock(key=f"key-{i}")
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        locks_read_ahead = _read_ahead(executor, locks(), 3)
+        executor.submit(lambda: None).result()
+        assert read == ["key-0", "key-1", "key-2"]
+        assert [lock.key for lock in locks_read_ahead] == [f"key-{i}" for i in range(7)]
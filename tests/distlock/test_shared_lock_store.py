@@ -0,0 +1,394 @@
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator
+
+import pytest
+
+from distlock.exceptions import (
+    AlreadyExistsError,
+    LeaseLostError,
+    LockTableFullError,
+    UnreleasableError,
+)
+from distlock.models import LockRecord
+from distlock.shared_lock_store import EMPTY, MAX_READERS, SharedLockStore, _hash
+
+
+@pytest.fixture
+def lock_store() -> Generator[SharedLockStore, None, None]:
+    lock_store = SharedLockStore(capacity=64, regions=4)
+    yield lock_store
+    lock_store.close()
+
+
+def test_shared_lock_store_init() -> None:
+    with pytest.raises(ValueError):
+        SharedLockStore(capacity=2, regions=4)
+    lock_store = SharedLockStore(capacity=100, regions=8)
+    assert lock_store.capacity == 96
+    assert len(lock_store) == 0
+    lock_store.close()
+
+
+@pytest.mark.parametrize("key", ["a_lock", "another_lock", "pizza", "ünïcode"])
+def test_shared_lock_store_set_get_del(lock_store: SharedLockStore, key: str) -> None:
+    assert key not in lock_store
+    lock_store[key] = LockRecord(key=key)
+    assert key in lock_store
+    assert lock_store[key] == LockRecord(key=key)
+    assert len(lock_store) == 1
+    del lock_store[key]
+    assert key not in lock_store
+    assert len(lock_store) == 0
+    with pytest.raises(KeyError):
+        lock_store[key]
+    with pytest.raises(KeyError):
+        del lock_store[key]
+
+
+def test_shared_lock_store_set_not_exists(lock_store: SharedLockStore) -> None:
+    lock_store.set_not_exists("key", LockRecord(key="key"))
+    with pytest.raises(AlreadyExistsError):
+        lock_store.set_not_exists("key", LockRecord(key="key"))
+
+
+def test_shared_lock_store_acquire_release_renew(lock_store: SharedLockStore) -> None:
+    lock_store["key"] = LockRecord(key="key")
+    lock = lock_store.acquire("key", expires_in_seconds=60)
+    assert lock.acquired and lock.clock == 1
+    assert not lock_store.acquire("key", expires_in_seconds=60).acquired
+
+    renewed = lock_store.renew("key", clock=1, expires_in_seconds=120)
+    assert renewed.expires_at_ns > lock.expires_at_ns
+
+    with pytest.raises(UnreleasableError):
+        lock_store.release("key", clock=0)
+    lock_store.release("key", clock=1)
+    assert not lock_store["key"].acquired
+    assert lock_store.acquire("key", expires_in_seconds=60).clock == 2
+
+
+def test_shared_lock_store_batches(lock_store: SharedLockStore) -> None:
+    lock_store["existing"] = LockRecord(key="existing")
+
+    created = lock_store.set_not_exists_many(
+        [LockRecord(key="a"), LockRecord(key="existing"), LockRecord(key="b")]
+    )
+    assert [getattr(result, "key", None) for result in created] == ["a", None, "b"]
+    assert isinstance(created[1], AlreadyExistsError)
+
+    acquired = lock_store.acquire_many([("a", 60), ("missing", 60), ("a", 60)])
+    assert isinstance(acquired[0], LockRecord) and acquired[0].acquired
+    assert isinstance(acquired[1], KeyError)
+    assert isinstance(acquired[2], LockRecord) and not acquired[2].acquired
+
+    released = lock_store.release_many([("a", 1), ("b", 1), ("missing", 1)])
+    assert isinstance(released[0], LockRecord) and not released[0].acquired
+    assert isinstance(released[1], UnreleasableError)
+    assert isinstance(released[2], KeyError)
+
+    fetched = lock_store.get_many(["b", "missing"])
+    assert isinstance(fetched[0], LockRecord) and fetched[0].key == "b"
+    assert isinstance(fetched[1], KeyError)
+
+
+def test_shared_lock_store_page(lock_store: SharedLockStore) -> None:
+    keys = ["a/1", "a/2", "a/3", "b/1", "b/2", "c"]
+    for key in reversed(keys):
+        lock_store.set_not_exists(key, LockRecord(key=key))
+
+    assert [lock.key for lock in lock_store.page()] == keys
+    assert [lock.key for lock in lock_store.page(prefix="a/")] == keys[:3]
+    assert [lock.key for lock in lock_store.page(prefix="b/", start_after="b/1")] == [
+        "b/2"
+    ]
+    assert sorted(lock.key for lock in lock_store.to_list()) == keys
+
+    # A deleted slot must not end the probe for keys stored past it
+    del lock_store["a/2"]
+    assert [lock.key for lock in lock_store.page(limit=3)] == ["a/1", "a/3", "b/1"]
+    assert all(key in lock_store for key in keys if key != "a/2")
+
+
+def test_shared_lock_store_reap(lock_store: SharedLockStore) -> None:
+    for key in ["expired", "released", "held"]:
+        lock_store[key] = LockRecord(key=key)
+    assert lock_store.next_expiry_ns() is None
+    assert lock_store.reap() == []
+
+    lock_store.acquire("held", expires_in_seconds=60)
+    for key in ["expired", "released"]:
+        lock_store.acquire(key, expires_in_seconds=0)
+    lock_store.release("released", clock=1)
+    assert lock_store.held_count() == 2
+    next_expiry_ns = lock_store.next_expiry_ns()
+    assert next_expiry_ns is not None
+    assert next_expiry_ns <= time.monotonic_ns()
+
+    assert lock_store.reap() == ["expired"]
+    assert not lock_store["expired"].acquired
+    assert lock_store["held"].acquired
+    assert lock_store.reap() == []
+    assert lock_store.next_expiry_ns() == lock_store["held"].expires_at_ns
+
+
+def test_shared_lock_store_read_locks(lock_store: SharedLockStore) -> None:
+    lock_store["key"] = LockRecord(key="key")
+    readers = [
+        lock_store.acquire("key", expires_in_seconds=60, shared=True)
+        for _ in range(MAX_READERS)
+    ]
+    assert all(reader.acquired and reader.shared for reader in readers)
+    assert [reader.clock for reader in readers] == list(range(1, MAX_READERS + 1))
+    assert not lock_store.acquire("key", expires_in_seconds=60).acquired
+    # The slot has no room left for another lease until one of them ends
+    turned_down = lock_store.acquire("key", expires_in_seconds=60, shared=True)
+    assert not turned_down.acquired
+    assert turned_down.expires_at_ns == readers[0].expires_at_ns
+
+    renewed = lock_store.renew("key", clock=1, expires_in_seconds=120)
+    assert renewed.clock == 1 and renewed.expires_at_ns > readers[0].expires_at_ns
+    lock_store.release("key", clock=1)
+    with pytest.raises(UnreleasableError):
+        lock_store.release("key", clock=1)
+    with pytest.raises(LeaseLostError):
+        lock_store.renew("key", clock=1, expires_in_seconds=60)
+    assert lock_store.acquire("key", expires_in_seconds=60, shared=True).acquired
+
+    for reader in readers[1:]:
+        lock_store.release("key", clock=reader.clock)
+    lock_store.release("key", clock=MAX_READERS + 1)
+    assert not lock_store["key"].acquired
+    writer = lock_store.acquire("key", expires_in_seconds=60)
+    assert writer.acquired and not writer.shared
+    assert not lock_store.acquire("key", expires_in_seconds=60, shared=True).acquired
+
+
+def test_shared_lock_store_reaps_read_locks(lock_store: SharedLockStore) -> None:
+    lock_store["key"] = LockRecord(key="key")
+    held = lock_store.acquire("key", expires_in_seconds=60, shared=True)
+    lock_store.acquire("key", expires_in_seconds=0, shared=True)
+    assert lock_store.reap() == ["key"]
+    lock = lock_store["key"]
+    assert lock.acquired and lock.readers == {held.clock: held.expires_at_ns}
+    assert lock_store.next_expiry_ns() == held.expires_at_ns
+    assert lock_store.reap() == []
+
+    # A retry gets its lease back for as long as it is held
+    reader = lock_store.acquire(
+        "key", expires_in_seconds=60, shared=True, request_id="read-1"
+    )
+    retried = lock_store.acquire(
+        "key", expires_in_seconds=60, shared=True, request_id="read-1"
+    )
+    assert retried == reader
+    assert len(lock_store["key"].readers or {}) == 2
+
+
+def test_shared_lock_store_writer_holds_back_readers(
+    lock_store: SharedLockStore,
+) -> None:
+    lock_store["key"] = LockRecord(key="key")
+    reader = lock_store.acquire("key", expires_in_seconds=60, shared=True)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        writer = executor.submit(
+            lock_store.acquire_wait, "key", expires_in_seconds=60, timeout_seconds=10
+        )
+        time.sleep(0.2)
+        # Turned down while the writer waits, though only readers hold the lock
+        assert not lock_store.acquire(
+            "key", expires_in_seconds=60, shared=True
+        ).acquired
+        waiting_reader = executor.submit(
+            lock_store.acquire_wait,
+            "key",
+            expires_in_seconds=60,
+            timeout_seconds=10,
+            shared=True,
+        )
+        lock_store.release("key", clock=reader.clock)
+        lock = writer.result(timeout=5)
+        assert lock.acquired and not lock.shared
+        time.sleep(0.2)
+        assert not waiting_reader.done()
+        lock_store.release("key", clock=lock.clock)
+        assert waiting_reader.result(timeout=5).acquired
+
+
+def test_shared_lock_store_semaphores(lock_store: SharedLockStore) -> None:
+    with pytest.raises(ValueError):
+        lock_store.set_not_exists(
+            "semaphore", LockRecord(key="semaphore", permits=MAX_READERS + 1)
+        )
+    assert "semaphore" not in lock_store
+
+    lock_store.set_not_exists("semaphore", LockRecord(key="semaphore", permits=2))
+    assert lock_store["semaphore"].permits == 2
+    permits = [
+        lock_store.acquire("semaphore", expires_in_seconds=60, shared=shared)
+        for shared in (False, True)
+    ]
+    assert all(permit.acquired and permit.permits == 2 for permit in permits)
+    turned_down = lock_store.acquire_wait(
+        "semaphore", expires_in_seconds=60, timeout_seconds=0
+    )
+    assert not turned_down.acquired
+    assert turned_down.expires_at_ns == permits[0].expires_at_ns
+    with pytest.raises(ValueError):
+        lock_store.acquire("semaphore", expires_in_seconds=60, owner="worker-1")
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        waiter = executor.submit(
+            lock_store.acquire_wait,
+            "semaphore",
+            expires_in_seconds=60,
+            timeout_seconds=10,
+        )
+        time.sleep(0.2)
+        lock_store.release("semaphore", clock=permits[0].clock)
+        assert waiter.result(timeout=5).acquired
+    lock_store.renew("semaphore", clock=permits[1].clock, expires_in_seconds=0)
+    assert lock_store.reap() == ["semaphore"]
+    assert lock_store.acquire("semaphore", expires_in_seconds=60).acquired
+
+
+def test_shared_lock_store_owners(lock_store: SharedLockStore) -> None:
+    lock_store["key"] = LockRecord(key="key")
+    lock = lock_store.acquire("key", expires_in_seconds=60, owner="worker-1")
+    assert lock.acquired and lock.owner == "worker-1" and lock.holds == 1
+    lock = lock_store.acquire_wait(
+        "key", expires_in_seconds=60, timeout_seconds=0, owner="worker-1"
+    )
+    assert lock.acquired and lock.clock == 1 and lock.holds == 2
+    assert not lock_store.acquire(
+        "key", expires_in_seconds=60, owner="worker-2"
+    ).acquired
+
+    lock_store.release("key", clock=1)
+    assert lock_store["key"].acquired
+    lock_store.release("key", clock=1)
+    assert not lock_store["key"].acquired
+
+    with pytest.raises(ValueError):
+        lock_store.acquire("key", expires_in_seconds=60, owner="x" * 65)
+    with pytest.raises(ValueError):
+        lock_store.acquire("key", expires_in_seconds=60, shared=True, owner="worker-1")
+
+
+def test_shared_lock_store_request_ids(lock_store: SharedLockStore) -> None:
+    lock_store["key"] = LockRecord(key="key")
+    lock = lock_store.acquire("key", expires_in_seconds=60, request_id="acquire-1")
+    # A retry gets the lease back rather than being turned down
+    retried = lock_store.acquire_wait(
+        "key", expires_in_seconds=60, timeout_seconds=0, request_id="acquire-1"
+    )
+    assert retried.acquired and retried.clock == lock.clock == 1
+    assert not lock_store.acquire(
+        "key", expires_in_seconds=60, request_id="acquire-2"
+    ).acquired
+
+    lock_store.release("key", clock=1, request_id="release-1")
+    assert lock_store.acquire("key", expires_in_seconds=60).clock == 2
+    # A retried release is not applied again, so it cannot fail
+    lock_store.release("key", clock=1, request_id="release-1")
+    assert lock_store["key"].acquired
+    # Nor does a request id carry over to another key
+    lock_store["other"] = LockRecord(key="other")
+    assert lock_store.acquire(
+        "other", expires_in_seconds=60, request_id="acquire-1"
+    ).acquired
+
+
+def test_shared_lock_store_reuses_deleted_slots() -> None:
+    lock_store = SharedLockStore(capacity=8, regions=1)
+    try:
+        for round in range(10):
+            keys = [f"key-{round}-{i}" for i in range(lock_store.capacity)]
+            for key in keys:
+                lock_store[key] = LockRecord(key=key)
+            # Every key is still found past those deleted before it
+            for i, key in enumerate(keys):
+                assert all(other in lock_store for other in keys[i:])
+                del lock_store[key]
+            assert len(lock_store) == 0
+            assert lock_store._buf[lock_store._slot_offset(0, 0)] == EMPTY
+    finally:
+        lock_store.close()
+
+
+def test_shared_lock_store_full(lock_store: SharedLockStore) -> None:
+    with pytest.raises(ValueError):
+        lock_store["x" * 257] = LockRecord(key="x" * 257)
+
+    with pytest.raises(LockTableFullError):
+        for i in range(lock_store.capacity + 1):
+            lock_store[f"key-{i}"] = LockRecord(key=f"key-{i}")
+    # Only the region the key hashes to has to be full
+    assert len(lock_store) <= lock_store.capacity
+
+
+def test_shared_lock_store_acquire_wait_timeout(lock_store: SharedLockStore) -> None:
+    lock_store["key"] = LockRecord(key="key")
+    lock_store.acquire("key", expires_in_seconds=60)
+    start = time.monotonic()
+    lock = lock_store.acquire_wait("key", expires_in_seconds=60, timeout_seconds=0.2)
+    assert not lock.acquired
+    assert time.monotonic() - start >= 0.2
+
+
+def test_shared_lock_store_wakes_waiters_for_the_key() -> None:
+    lock_store = SharedLockStore(capacity=8, regions=1)
+    # Two keys whose waiters share a condition, so that waking the waiter of
+    # one must not leave the other waiting for good
+    channel = lock_store._channel(_hash(b"key-0"))
+    keys = ["key-0"] + [
+        key
+        for key in (f"key-{i}" for i in range(1, 100))
+        if lock_store._channel(_hash(key.encode())) == channel
+    ][:1]
+    try:
+        for key in keys:
+            lock_store[key] = LockRecord(key=key)
+            lock_store.acquire(key, expires_in_seconds=60)
+        with ThreadPoolExecutor(max_workers=len(keys)) as executor:
+            waiters = [
+                executor.submit(
+                    lock_store.acquire_wait,
+                    key,
+                    expires_in_seconds=60,
+                    timeout_seconds=10,
+                )
+                for key in keys
+            ]
+            time.sleep(0.2)
+            lock_store.release(keys[0], clock=1)
+            assert waiters[0].result(timeout=5).acquired
+            assert not waiters[1].done()
+            lock_store.release(keys[1], clock=1)
+            assert waiters[1].result(timeout=5).acquired
+    finally:
+        lock_store.close()
+
+
+def _release_later(lock_store: SharedLockStore) -> None:
+    time.sleep(0.2)
+    lock_store.release("key", clock=1)
+
+
+def test_shared_lock_store_acquire_wait_woken_by_other_process(
+    lock_store: SharedLockStore,
+) -> None:
+    lock_store["key"] = LockRecord(key="key")
+    lock_store.acquire("key", expires_in_seconds=60)
+
+    process = multiprocessing.get_context(SharedLockStore.START_METHOD).Process(
+        target=_release_later, args=(lock_store,)
+    )
+    process.start()
+    start = time.monotonic()
+    lock = lock_store.acquire_wait("key", expires_in_seconds=60, timeout_seconds=10)
+    process.join()
+    assert lock.acquired
+    assert lock.clock == 2
+    assert time.monotonic() - start < 5
@@ -0,0 +1,176 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+from distlock.lock_store import ShardedLockStore, ThreadSafeLockStore
+from distlock.models import LockRecord
+from distlock.snapshot import (
+    Snapshotter,
+    load_snapshot,
+    recover,
+    snapshots,
+    write_snapshot,
+)
+from distlock.wal import segments
+
+
+def test_write_and_load_snapshot(tmp_path: Path) -> None:
+    lock_store = ShardedLockStore(shards=4)
+    lock_store.set_not_exists_many(
+        [LockRecord(key=f"key-{i}") for i in range(2_500)] + [LockRecord(key="ключ")]
+    )
+    lock_store.acquire("key-7", expires_in_seconds=60)
+    path = write_snapshot(tmp_path, 3, lock_store)
+    assert snapshots(tmp_path) == [(3, path)]
+
+    locks = load_snapshot(path)
+    assert len(locks) == 2_501
+    assert locks["ключ"] == LockRecord(key="ключ")
+    assert locks["key-7"].acquired
+    assert locks["key-7"].clock == 1
+    assert abs(locks["key-7"].expires_at_ns - lock_store["key-7"].expires_at_ns) < 1_000
+
+
+def test_write_and_load_snapshot_shared(tmp_path: Path) -> None:
+    lock_store = ThreadSafeLockStore()
+    lock_store["a"] = LockRecord(key="a")
+    lock_store["b"] = LockRecord(key="b")
+    lock_store.acquire("a", expires_in_seconds=60, shared=True)
+    lock_store.acquire("a", expires_in_seconds=60, shared=True)
+    locks = load_snapshot(write_snapshot(tmp_path, 0, lock_store))
+    assert locks["a"].shared
+    assert locks["a"].readers is not None
+    assert sorted(locks["a"].readers) == [1, 2]
+    assert locks["b"] == LockRecord(key="b")
+
+
+def test_write_and_load_snapshot_semaphore(tmp_path: Path) -> None:
+    lock_store = ThreadSafeLockStore()
+    lock_store["idle"] = LockRecord(key="idle", permits=2)
+    lock_store["used"] = LockRecord(key="used", permits=2)
+    lock_store.acquire("used", expires_in_seconds=60)
+    locks = load_snapshot(write_snapshot(tmp_path, 0, lock_store))
+    assert locks["idle"] == LockRecord(key="idle", permits=2)
+    assert locks["used"].permits == 2
+    assert not locks["used"].shared
+    assert locks["used"].readers is not None
+    assert list(locks["used"].readers) == [1]
+
+
+def test_write_and_load_snapshot_owned(tmp_path: Path) -> None:
+    lock_store = ThreadSafeLockStore()
+    lock_store["owned"] = LockRecord(key="owned")
+    lock_store["plain"] = LockRecord(key="plain")
+    lock_store.acquire("owned", expires_in_seconds=60, owner="worker-1")
+    lock_store.acquire("owned", expires_in_seconds=60, owner="worker-1")
+    lock_store.acquire("plain", expires_in_seconds=60)
+    locks = load_snapshot(write_snapshot(tmp_path, 0, lock_store))
+    assert (locks["owned"].owner, locks["owned"].holds) == ("worker-1", 2)
+    assert locks["owned"].acquired
+    assert (locks["plain"].owner, locks["plain"].holds) == ("", 0)
+
+
+def test_load_corrupt_snapshot(tmp_path: Path) -> None:
+    lock_store = ThreadSafeLockStore()
+    lock_store["a"] = LockRecord(key="a")
+    path = write_snapshot(tmp_path, 0, lock_store)
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(data)
+    with pytest.raises(ValueError):
+        load_snapshot(path)
+
+
+@pytest.mark.parametrize("lock_store_class", [ThreadSafeLockStore, ShardedLockStore])
+def test_snapshot_truncates_log(tmp_path: Path, lock_store_class: type) -> None:
+    wal, _, _ = recover(tmp_path)
+    lock_store = lock_store_class(wal=wal)
+    snapshotter = Snapshotter(lock_store, wal)
+    lock_store.set_not_exists_many([LockRecord(key=key) for key in "abc"])
+    lock_store.acquire("a", expires_in_seconds=60)
+    snapshotter.snapshot()
+    del lock_store["b"]
+    snapshotter.snapshot()
+    lock_store["d"] = LockRecord(key="d")
+    wal.sync()
+    wal.close()
+    assert [seq for seq, _ in snapshots(tmp_path)] == [2]
+    assert [seq for seq, _ in segments(tmp_path)] == [2]
+
+    wal, locks, _ = recover(tmp_path)
+    wal.close()
+    assert sorted(locks) == ["a", "c", "d"]
+    assert locks["a"].acquired
+
+
+def test_snapshot_during_writes(tmp_path: Path) -> None:
+    """
+    Keys changed while the snapshot is written end up as they were last
+    changed, whether the snapshot saw the change or not.
+    """
+    wal, _, _ = recover(tmp_path)
+    lock_store = ShardedLockStore(shards=4, wal=wal)
+    lock_store.set_not_exists_many([LockRecord(key=f"key-{i}") for i in range(5_000)])
+    snapshotter = Snapshotter(lock_store, wal)
+    done = threading.Event()
+
+    def writer() -> None:
+        i = 0
+        while not done.is_set():
+            key = f"key-{i % 5_000}"
+            lock = lock_store.acquire(key, expires_in_seconds=60)
+            lock_store.release(key, clock=lock.clock)
+            lock_store[f"new-{i}"] = LockRecord(key=f"new-{i}")
+            i += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(3):
+            snapshotter.snapshot()
+    finally:
+        done.set()
+        thread.join()
+    wal.sync()
+    wal.close()
+    expected = {lock.key: (lock.acquired, lock.clock) for lock in lock_store.to_list()}
+
+    wal, locks, _ = recover(tmp_path)
+    wal.close()
+    assert {key: (lock.acquired, lock.clock) for key, lock in locks.items()} == expected
+
+
+def test_snapshot_keeps_request_ids(tmp_path: Path) -> None:
+    wal, _, _ = recover(tmp_path)
+    lock_store = ShardedLockStore(shards=4, wal=wal)
+    snapshotter = Snapshotter(lock_store, wal)
+    lock_store.set_not_exists_many([LockRecord(key=key) for key in "ab"])
+    lock_store.acquire("a", expires_in_seconds=60, request_id="acquire-1")
+    snapshotter.snapshot()
+    lock_store.acquire("b", expires_in_seconds=60, request_id="acquire-2")
+    wal.sync()
+    wal.close()
+
+    wal, _, requests = recover(tmp_path)
+    wal.close()
+    assert requests == {"acquire-1": ("a", 1), "acquire-2": ("b", 1)}
+
+
+def test_recover_skips_segments_covered_by_snapshot(tmp_path: Path) -> None:
+    wal, _, _ = recover(tmp_path)
+    lock_store = ThreadSafeLockStore(wal=wal)
+    lock_store["a"] = LockRecord(key="a")
+    seq = wal.rotate()
+    del lock_store["a"]
+    lock_store["b"] = LockRecord(key="b")
+    wal.sync()
+    wal.close()
+    # As if the server stopped after writing the snapshot, but before removing
+    # the segments it covers
+    write_snapshot(tmp_path, seq, lock_store)
+    assert [seq for seq, _ in segments(tmp_path)] == [0, 1]
+
+    wal, locks, _ = recover(tmp_path)
+    wal.close()
+    assert sorted(locks) == ["b"]
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import grpc
+import pytest
+
+from distlock import Distlock, DistlockAsync
+from distlock.async_server import AsyncServicer
+from distlock.server import Servicer
+from distlock.stubs import distlock_pb2_grpc
+from distlock.tuning import (
+    AdmissionInterceptor,
+    AsyncAdmissionInterceptor,
+    ServerTuning,
+)
+
+
+def test_server_tuning_from_file(tmp_path: Path) -> None:
+    path = tmp_path / "server.toml"
+    path.write_text(
+        'max_concurrent_rpcs = 100\ncompression = "gzip"\n'
+        'so_reuseport = false\n[options]\n"grpc.http2.max_pings_without_data" = 0\n'
+    )
+    tuning = ServerTuning.from_file(path).override(
+        max_concurrent_rpcs=None, keepalive_time_ms=10_000
+    )
+    assert tuning.max_concurrent_rpcs == 100
+    assert tuning.grpc_compression() == grpc.Compression.Gzip
+    assert tuning.grpc_options() == [
+        ("grpc.keepalive_time_ms", 10_000),
+        ("grpc.so_reuseport", 0),
+        ("grpc.http2.max_pings_without_data", 0),
+    ]
+    assert ServerTuning().grpc_options() == []
+
+    path.write_text("max_concurrent_rpc = 100\n")
+    with pytest.raises(ValueError, match="max_concurrent_rpc"):
+        ServerTuning.from_file(path)
+
+
+@pytest.mark.parametrize(
+    "settings",
+    [
+        {"max_concurrent_rpcs": 0},
+        {"max_waiting_rpcs": "10"},
+        {"so_reuseport": 1},
+        {"compression": "zstd"},
+    ],
+)
+def test_server_tuning_checks_settings(settings: dict) -> None:
+    with pytest.raises(ValueError):
+        ServerTuning(**settings)
+
+
+def test_admission_interceptor() -> None:
+    tuning = ServerTuning(max_waiting_rpcs=1, compression="gzip")
+    server = grpc.server(
+        ThreadPoolExecutor(max_workers=4),
+        interceptors=[AdmissionInterceptor(1)],
+        options=tuning.grpc_options(),
+        compression=tuning.grpc_compression(),
+    )
+    distlock_pb2_grpc.add_DistlockServicer_to_server(Servicer(), server)
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    try:
+        with Distlock(address="localhost", port=port, pool_size=2) as distlock:
+            distlock.create_lock("key")
+            lock = distlock.acquire_lock(key="key", expires_in_seconds=60)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                waiting = executor.submit(
+                    distlock.acquire_lock,
+                    key="key",
+                    expires_in_seconds=60,
+                    timeout_seconds=5,
+                )
+                time.sleep(0.3)
+                with pytest.raises(grpc.RpcError) as e:
+                    distlock.acquire_lock(
+                        key="key", expires_in_seconds=60, timeout_seconds=5
+                    )
+                assert e.value.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+                # Calls that do not wait are let through
+                assert not distlock.acquire_lock(
+                    key="key", expires_in_seconds=60, blocking=False
+                ).acquired
+                distlock.release_lock(lock)
+                lock = waiting.result()
+            assert lock.acquired
+            distlock.release_lock(lock)
+            # The waiter made room for the next one
+            assert distlock.acquire_lock(
+                key="key", expires_in_seconds=60, timeout_seconds=5
+            ).acquired
+    finally:
+        server.stop(None)
+
+
+@pytest.mark.asyncio
+async def test_async_admission_interceptor() -> None:
+    interceptor = AsyncAdmissionInterceptor(1)
+    server = grpc.aio.server(interceptors=[interceptor])
+    distlock_pb2_grpc.add_DistlockServicer_to_server(AsyncServicer(), server)
+    port = server.add_insecure_port("localhost:0")
+    await server.start()
+    try:
+        async with DistlockAsync(address="localhost", port=port) as distlock:
+            await distlock.create_lock("key")
+            lock = await distlock.acquire_lock(key="key", expires_in_seconds=60)
+            waiting = asyncio.create_task(
+                distlock.acquire_lock(
+                    key="key", expires_in_seconds=60, timeout_seconds=5
+                )
+            )
+            await asyncio.sleep(0.3)
+            with pytest.raises(grpc.RpcError) as e:
+                await distlock.acquire_lock(
+                    key="key", expires_in_seconds=60, timeout_seconds=5
+                )
+            assert e.value.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+            await distlock.release_lock(lock)
+            assert (await waiting).acquired
+            assert interceptor.waiting == 0
+    finally:
+        await server.stop(None)
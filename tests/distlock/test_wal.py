@@ -0,0 +1,228 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+from distlock.lock_store import LockStore, ShardedLockStore, ThreadSafeLockStore
+from distlock.models import LockRecord
+from distlock.snapshot import recover
+from distlock.wal import (
+    WriteAheadLog,
+    decode,
+    decode_request,
+    encode_delete,
+    encode_put,
+    replay,
+    segment_path,
+    segments,
+)
+
+
+def test_encode_decode() -> None:
+    lock = LockRecord(key="ключ")
+    lock.acquire(expires_in_seconds=60)
+    key, decoded = decode(encode_put(lock))
+    assert key == lock.key
+    assert decoded is not None
+    assert decoded.acquired
+    assert decoded.clock == lock.clock
+    assert abs(decoded.expires_at_ns - lock.expires_at_ns) < 1_000
+
+    key, decoded = decode(encode_delete("gone"))
+    assert key == "gone"
+    assert decoded is None
+
+
+def test_encode_decode_shared() -> None:
+    lock = LockRecord(key="ключ")
+    lock.acquire_shared(expires_in_seconds=60)
+    lock.acquire_shared(expires_in_seconds=30)
+    key, decoded = decode(encode_put(lock))
+    assert key == lock.key
+    assert decoded is not None
+    assert decoded.acquired and decoded.shared
+    assert decoded.clock == 2
+    assert decoded.readers is not None and lock.readers is not None
+    assert decoded.readers.keys() == lock.readers.keys()
+    for clock, expires_at_ns in decoded.readers.items():
+        assert abs(expires_at_ns - lock.readers[clock]) < 1_000
+
+
+def test_encode_decode_semaphore() -> None:
+    lock = LockRecord(key="key", permits=3)
+    key, decoded = decode(encode_put(lock))
+    assert decoded == lock
+    holder = lock.acquire_permit(expires_in_seconds=60)
+    key, decoded = decode(encode_put(lock))
+    assert decoded is not None
+    assert decoded.acquired and not decoded.shared
+    assert decoded.permits == 3
+    assert decoded.readers is not None
+    assert list(decoded.readers) == [holder.clock]
+
+
+def test_encode_decode_owned() -> None:
+    lock = LockRecord(key="key")
+    lock.acquire(expires_in_seconds=60, owner="worker-ü")
+    lock.reenter(expires_in_seconds=60)
+    key, decoded = decode(encode_put(lock))
+    assert key == "key"
+    assert decoded is not None
+    assert (decoded.owner, decoded.holds) == ("worker-ü", 2)
+    assert decoded.acquired and decoded.readers is None
+
+
+def test_encode_decode_request_id() -> None:
+    lock = LockRecord(key="key")
+    lock.acquire(expires_in_seconds=60, owner="worker-1")
+    body = encode_put(lock, "request-ü", lock.clock)
+    key, decoded = decode(body)
+    assert key == "key"
+    assert decoded is not None
+    assert (decoded.owner, decoded.clock) == ("worker-1", lock.clock)
+    assert decode_request(body) == ("request-ü", lock.clock)
+    assert decode_request(encode_put(lock)) is None
+    assert decode_request(encode_delete("key")) is None
+
+
+@pytest.mark.parametrize(
+    "lock_store_class", [LockStore, ThreadSafeLockStore, ShardedLockStore]
+)
+def test_request_ids_are_recovered(tmp_path: Path, lock_store_class: type) -> None:
+    wal, _, _ = recover(tmp_path)
+    lock_store = lock_store_class(wal=wal)
+    lock_store.set_not_exists_many([LockRecord(key=key) for key in "ab"])
+    lock = lock_store.acquire("a", expires_in_seconds=60, request_id="acquire-1")
+    released = lock_store.acquire("b", expires_in_seconds=60)
+    lock_store.release("b", clock=released.clock, request_id="release-1")
+    wal.sync()
+    wal.close()
+
+    wal, locks, requests = recover(tmp_path)
+    wal.close()
+    assert requests == {"acquire-1": ("a", lock.clock), "release-1": ("b", 1)}
+    recovered = lock_store_class()
+    recovered.load(locks.values(), requests)
+    retried = recovered.acquire("a", expires_in_seconds=60, request_id="acquire-1")
+    assert retried.acquired and retried.clock == lock.clock
+    # Released already, rather than unreleasable
+    recovered.release("b", clock=released.clock, request_id="release-1")
+
+
+@pytest.mark.parametrize(
+    "lock_store_class", [LockStore, ThreadSafeLockStore, ShardedLockStore]
+)
+def test_lock_store_is_recovered(tmp_path: Path, lock_store_class: type) -> None:
+    wal, locks, _ = recover(tmp_path)
+    assert locks == {}
+    lock_store = lock_store_class(wal=wal)
+    lock_store.set_not_exists_many([LockRecord(key=key) for key in "abcd"])
+    lock_store.acquire("a", expires_in_seconds=60)
+    acquired = lock_store.acquire("b", expires_in_seconds=60)
+    lock_store.release("b", clock=acquired.clock)
+    lock_store.acquire_many([("c", 60)])
+    del lock_store["d"]
+    wal.sync()
+    wal.close()
+
+    wal, locks, _ = recover(tmp_path)
+    wal.close()
+    recovered = lock_store_class()
+    recovered.load(locks.values())
+    assert [lock.key for lock in recovered.page()] == ["a", "b", "c"]
+    for key in "abc":
+        assert recovered[key].acquired == lock_store[key].acquired
+        assert recovered[key].clock == lock_store[key].clock
+    assert 59 < recovered["a"].seconds_until_expiry <= 60
+    assert recovered.acquire("a", expires_in_seconds=60).acquired is False
+
+
+def test_torn_tail_is_dropped(tmp_path: Path) -> None:
+    wal = WriteAheadLog(tmp_path)
+    lock_store = LockStore(wal=wal)
+    lock_store["a"] = LockRecord(key="a")
+    lock_store["b"] = LockRecord(key="b")
+    wal.sync()
+    wal.close()
+    path = segment_path(tmp_path, 0)
+    valid_length = path.stat().st_size
+    with open(path, "ab") as f:
+        f.write(b"\x20\x00\x00\x00torn")
+
+    locks, length = replay(path)
+    assert list(locks) == ["a", "b"]
+    assert length == valid_length
+
+    wal, locks, _ = recover(tmp_path)
+    assert path.stat().st_size == valid_length
+    LockStore(wal=wal)["c"] = LockRecord(key="c")
+    wal.sync()
+    wal.close()
+    locks, _ = replay(path)
+    assert list(locks) == ["a", "b", "c"]
+
+
+def test_corrupt_entry_is_dropped(tmp_path: Path) -> None:
+    wal = WriteAheadLog(tmp_path)
+    lock_store = LockStore(wal=wal)
+    lock_store["a"] = LockRecord(key="a")
+    lock_store["b"] = LockRecord(key="b")
+    wal.sync()
+    wal.close()
+    path = segment_path(tmp_path, 0)
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(data)
+
+    locks, _ = replay(path)
+    assert list(locks) == ["a"]
+
+
+def test_concurrent_syncs_are_grouped(tmp_path: Path) -> None:
+    wal = WriteAheadLog(tmp_path)
+    lock_store = ShardedLockStore(shards=4, wal=wal)
+    threads = 8
+
+    def worker(thread: int) -> None:
+        for i in range(50):
+            lock_store[f"{thread}-{i}"] = LockRecord(key=f"{thread}-{i}")
+            wal.sync()
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    wal.close()
+    locks, _ = replay(segment_path(tmp_path, 0))
+    assert len(locks) == threads * 50
+
+
+@pytest.mark.asyncio
+async def test_sync_async(tmp_path: Path) -> None:
+    wal = WriteAheadLog(tmp_path)
+    lock_store = ThreadSafeLockStore(wal=wal)
+    lock_store["a"] = LockRecord(key="a")
+    await wal.sync_async()
+    locks, _ = replay(segment_path(tmp_path, 0))
+    assert list(locks) == ["a"]
+    # Nothing new to wait for
+    await wal.sync_async()
+    wal.close()
+
+
+def test_rotate(tmp_path: Path) -> None:
+    wal = WriteAheadLog(tmp_path)
+    lock_store = LockStore(wal=wal)
+    lock_store["a"] = LockRecord(key="a")
+    assert wal.rotate() == 1
+    lock_store["b"] = LockRecord(key="b")
+    wal.sync()
+    wal.close()
+    assert [seq for seq, _ in segments(tmp_path)] == [0, 1]
+    assert list(replay(segment_path(tmp_path, 0))[0]) == ["a"]
+    assert list(replay(segment_path(tmp_path, 1))[0]) == ["b"]
+
+    wal, locks, _ = recover(tmp_path)
+    wal.close()
+    assert sorted(locks) == ["a", "b"]
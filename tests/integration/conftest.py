@@ -1,8 +1,10 @@
 import shlex
 import subprocess
+import tempfile
 import time
 from typing import Generator
 
+import grpc
 import pytest
 
 from distlock import Distlock, DistlockAsync, NotFoundError
@@ -19,22 +21,25 @@ from distlock import Distlock, DistlockAsync, NotFoundError
 @pytest.fixture(scope="module")
 def distlock_server() -> Generator[subprocess.Popen, None, None]:
     command = shlex.split("python -m distlock")
-    process = subprocess.Popen(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-    )
+    # The server logs every request, so its output goes to a file rather than
+    # a pipe, which would fill up and block the server if not read from
+    with tempfile.TemporaryFile("w+") as output:
+        process = subprocess.Popen(
+            command,
+            stdout=output,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
 
-    # Wait for server to start up
-    time.sleep(1)
+        # Wait for server to start up
+        time.sleep(1)
 
-    yield process
+        yield process
 
-    process.terminate()
-    process.wait()
-    assert process.stdout is not None
-    print(process.stdout.read())
+        process.terminate()
+        process.wait()
+        output.seek(0)
+        print(output.read())
 
 
 # NOTE: It is possible that you will need to kill the process opened here manually.
@@ -48,22 +53,105 @@ def distlock_server() -> Generator[subprocess.Popen, None, None]:
 @pytest.fixture(scope="module")
 def distlock_server_async() -> Generator[subprocess.Popen, None, None]:
     command = shlex.split("python -m distlock --port 50052 --run-async")
-    process = subprocess.Popen(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-    )
-
-    # Wait for server to start up
-    time.sleep(1)
-
-    yield process
-
-    process.terminate()
-    process.wait()
-    assert process.stdout is not None
-    print(process.stdout.read())
+    # The server logs every request, so its output goes to a file rather than
+    # a pipe, which would fill up and block the server if not read from
+    with tempfile.TemporaryFile("w+") as output:
+        process = subprocess.Popen(
+            command,
+            stdout=output,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+
+        # Wait for server to start up
+        time.sleep(1)
+
+        yield process
+
+        process.terminate()
+        process.wait()
+        output.seek(0)
+        print(output.read())
+
+
+# NOTE: As with the servers above, the processes opened here may need to be
+# killed manually, they listen on port 50055.
+@pytest.fixture(scope="module")
+def distlock_server_processes() -> Generator[subprocess.Popen, None, None]:
+    command = shlex.split("python -m distlock --port 50055 --processes 3")
+    with tempfile.TemporaryFile("w+") as output:
+        process = subprocess.Popen(
+            command,
+            stdout=output,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+
+        with grpc.insecure_channel("localhost:50055") as channel:
+            grpc.channel_ready_future(channel).result(timeout=30)
+
+        yield process
+
+        process.terminate()
+        process.wait()
+        output.seek(0)
+        print(output.read())
+
+
+# Client and Raft ports of the nodes of a three node cluster
+CLUSTER_PORTS = [(50061, 50161), (50062, 50162), (50063, 50163)]
+
+
+# NOTE: As with the servers above, the processes opened here may need to be
+# killed manually, they listen on the ports in CLUSTER_PORTS.
+@pytest.fixture(scope="module")
+def distlock_cluster() -> Generator[dict[int, subprocess.Popen], None, None]:
+    processes = {}
+    outputs = {}
+    for port, raft_port in CLUSTER_PORTS:
+        peers = " ".join(
+            f"--peer localhost:{peer_raft_port}"
+            for _, peer_raft_port in CLUSTER_PORTS
+            if peer_raft_port != raft_port
+        )
+        command = shlex.split(
+            f"python -m distlock --port {port} --raft-port {raft_port} {peers}"
+        )
+        outputs[port] = tempfile.TemporaryFile("w+")
+        processes[port] = subprocess.Popen(
+            command,
+            stdout=outputs[port],
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+
+    # Wait for servers to start up and elect a leader, which on a loaded
+    # machine can take longer than clients follow redirects for
+    for port, _ in CLUSTER_PORTS:
+        with grpc.insecure_channel(f"localhost:{port}") as channel:
+            grpc.channel_ready_future(channel).result(timeout=30)
+    deadline = time.monotonic() + 30
+    with Distlock("localhost", CLUSTER_PORTS[0][0]) as client:
+        while True:
+            try:
+                client.list_locks()
+                break
+            except grpc.RpcError as e:
+                if (
+                    e.code() != grpc.StatusCode.UNAVAILABLE
+                    or time.monotonic() > deadline
+                ):
+                    raise
+
+    yield processes
+
+    for process in processes.values():
+        process.terminate()
+    for port, process in processes.items():
+        process.wait()
+        outputs[port].seek(0)
+        print(outputs[port].read())
+        outputs[port].close()
 
 
 @pytest.fixture(scope="function")
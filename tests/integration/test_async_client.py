@@ -1,14 +1,19 @@
 import asyncio
+import subprocess
 import time
 
+import grpc
 import pytest
 
 from distlock import (
     AlreadyExistsError,
+    DistlockAsync,
+    LeaseLostError,
     Lock,
     NotFoundError,
 )
 from distlock.exceptions import UnreleasableError
+from distlock.stubs import distlock_pb2
 
 from .conftest import cleanup_client_async
 
@@ -450,3 +455,287 @@ async def test_acquire_release_cycle_clock_updates(
     locks = await asyncio.gather(*[distlock.get_lock(key) for key in create_locks])
     assert all(not lock.acquired for lock in locks)
     assert all(lock.clock == 2 for lock in locks)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("port", [50051, 50052])
+async def test_async_client_context_manager_shares_pool(
+    port: int,
+    distlock_server: subprocess.Popen,
+    distlock_server_async: subprocess.Popen,
+) -> None:
+    keys = [f"pooled-key-{i}" for i in range(12)]
+
+    async def client(distlock: DistlockAsync, key: str) -> None:
+        await distlock.create_lock(key)
+        lock = await distlock.acquire_lock(key=key, expires_in_seconds=1)
+        assert lock.acquired
+        await distlock.release_lock(lock)
+        await distlock.delete_lock(key)
+
+    async with DistlockAsync(port=port, pool_size=3) as distlock:
+        await asyncio.gather(*[client(distlock, key) for key in keys])
+        lock_names = {lock.key for lock in await distlock.list_locks()}
+    assert not lock_names & set(keys)
+
+
+@pytest.mark.asyncio
+async def test_async_client_close_closes_every_channel(
+    distlock_server: subprocess.Popen,
+) -> None:
+    distlock = DistlockAsync(port=50051, pool_size=2)
+    await distlock.list_locks()
+    retired_stubs = distlock._stubs
+    # As when the client follows a redirect to the leader
+    distlock._retired_channels.extend(distlock._channels)
+    distlock._channels, distlock._stubs = [], []
+    await distlock.list_locks()
+    await distlock.close()
+    for stub in retired_stubs + distlock._stubs:
+        with pytest.raises(grpc.aio.UsageError):
+            await stub.ListLocks(distlock_pb2.EmptyRequest())
+    # Rather than opening a pool that nothing would close
+    with pytest.raises(grpc.aio.UsageError):
+        await distlock.list_locks()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "create_locks_str, client_str",
+    [
+        ("create_locks", "distlock_client_async"),
+        ("create_locks_async", "distlock_async_client_async"),
+    ],
+)
+async def test_acquire_lock_blocking_handoff_on_release_async(
+    create_locks_str: str, client_str: str, request: pytest.FixtureRequest
+) -> None:
+    create_locks = request.getfixturevalue(create_locks_str)
+    distlock = request.getfixturevalue(client_str)
+    for key in create_locks:
+        lock = await distlock.acquire_lock(key=key, expires_in_seconds=60)
+        task = asyncio.create_task(
+            distlock.acquire_lock(
+                key=key,
+                expires_in_seconds=60,
+                blocking=True,
+                timeout_seconds=10,
+            )
+        )
+        await asyncio.sleep(0.5)
+        assert not task.done()
+        start = time.time()
+        await distlock.release_lock(lock)
+        acquired_lock = await task
+        elapsed = time.time() - start
+        assert acquired_lock.acquired
+        assert acquired_lock.clock == 2
+        assert elapsed < 1.0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "create_locks_str, client_str",
+    [
+        ("create_locks", "distlock_client_async"),
+        ("create_locks_async", "distlock_async_client_async"),
+    ],
+)
+async def test_read_write_locks_async(
+    create_locks_str: str, client_str: str, request: pytest.FixtureRequest
+) -> None:
+    create_locks = request.getfixturevalue(create_locks_str)
+    distlock = request.getfixturevalue(client_str)
+    key = create_locks[0]
+    readers = [
+        await distlock.acquire_read_lock(key=key, expires_in_seconds=60)
+        for _ in range(2)
+    ]
+    assert all(reader.acquired and reader.shared for reader in readers)
+    task = asyncio.create_task(
+        distlock.acquire_write_lock(key=key, expires_in_seconds=60, timeout_seconds=10)
+    )
+    await asyncio.sleep(0.5)
+    assert not (
+        await distlock.acquire_read_lock(key=key, expires_in_seconds=60, blocking=False)
+    ).acquired
+    for reader in readers:
+        await distlock.release_lock(reader)
+    writer = await task
+    assert writer.acquired
+    assert not writer.shared
+    assert writer.clock == 3
+    await distlock.release_lock(writer)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "client_str", ["distlock_client_async", "distlock_async_client_async"]
+)
+async def test_semaphore_async(client_str: str, request: pytest.FixtureRequest) -> None:
+    distlock = request.getfixturevalue(client_str)
+    key = "semaphore-async"
+    await distlock.create_semaphore(key, permits=1)
+    try:
+        permit = await distlock.acquire_permit(key=key, expires_in_seconds=60)
+        assert permit.acquired
+        task = asyncio.create_task(
+            distlock.acquire_permit(key=key, expires_in_seconds=60, timeout_seconds=10)
+        )
+        await asyncio.sleep(0.5)
+        assert not task.done()
+        await distlock.release_lock(permit)
+        permit = await task
+        assert permit.acquired
+        assert permit.clock == 2
+        assert (await distlock.get_lock(key)).permits == 1
+    finally:
+        await cleanup_client_async(distlock, [key])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "client_str", ["distlock_client_async", "distlock_async_client_async"]
+)
+async def test_owner_reenters_async(
+    client_str: str, request: pytest.FixtureRequest
+) -> None:
+    distlock = request.getfixturevalue(client_str)
+    key = "owned-async"
+    await distlock.create_lock(key)
+    try:
+        lock = await distlock.acquire_lock(
+            key=key, expires_in_seconds=60, owner="worker-1"
+        )
+        again = await distlock.acquire_lock(
+            key=key, expires_in_seconds=60, owner="worker-1", blocking=False
+        )
+        assert again.acquired
+        assert (again.clock, again.holds) == (lock.clock, 2)
+        await distlock.release_lock(again)
+        await distlock.release_lock(lock)
+        assert not (await distlock.get_lock(key)).acquired
+    finally:
+        await cleanup_client_async(distlock, [key])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "create_locks_str, client_str",
+    [
+        ("create_locks", "distlock_client_async"),
+        ("create_locks_async", "distlock_async_client_async"),
+    ],
+)
+async def test_batch_calls_async(
+    create_locks_str: str, client_str: str, request: pytest.FixtureRequest
+) -> None:
+    create_locks = request.getfixturevalue(create_locks_str)
+    distlock = request.getfixturevalue(client_str)
+    new_keys = ["batch-key-1", "batch-key-2"]
+    try:
+        created = await distlock.create_many([*new_keys, create_locks[0]])
+        assert [lock.key for lock in created[:2]] == new_keys
+        assert isinstance(created[2], AlreadyExistsError)
+
+        keys = [*create_locks, *new_keys]
+        acquired = await distlock.acquire_many(
+            [*keys, "not-a-key"], expires_in_seconds=60
+        )
+        assert all(lock.acquired and lock.clock == 1 for lock in acquired[:-1])
+        assert isinstance(acquired[-1], NotFoundError)
+
+        released = await distlock.release_many(acquired[:-1])
+        assert all(not lock.acquired for lock in released)
+
+        fetched = await distlock.get_many([*keys, "not-a-key"])
+        assert [lock.key for lock in fetched[:-1]] == keys
+        assert isinstance(fetched[-1], NotFoundError)
+    finally:
+        await cleanup_client_async(distlock, new_keys)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "client_str", ["distlock_client_async", "distlock_async_client_async"]
+)
+async def test_iter_locks_async(
+    client_str: str, request: pytest.FixtureRequest
+) -> None:
+    distlock = request.getfixturevalue(client_str)
+    keys = [f"iter/{i:03}" for i in range(25)]
+    await distlock.create_many(keys)
+    try:
+        locks = [lock async for lock in distlock.iter_locks("iter/", page_size=4)]
+        assert [lock.key for lock in locks] == keys
+        locks = [lock async for lock in distlock.iter_locks("iter/01")]
+        assert [lock.key for lock in locks] == keys[10:20]
+    finally:
+        await cleanup_client_async(distlock, keys)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "client_str", ["distlock_client_async", "distlock_async_client_async"]
+)
+async def test_keep_alive_async(
+    client_str: str, request: pytest.FixtureRequest
+) -> None:
+    distlock = request.getfixturevalue(client_str)
+    key = "keep-alive"
+    await distlock.create_lock(key)
+    try:
+        lock = await distlock.acquire_lock(key=key, expires_in_seconds=1)
+        renewed = await distlock.renew_lock(lock, expires_in_seconds=1)
+        assert renewed.clock == lock.clock
+        async with distlock.keep_alive(lock, expires_in_seconds=1) as keep_alive:
+            await asyncio.sleep(2.5)
+            assert (await distlock.get_lock(key)).acquired
+        assert keep_alive.lost is None
+
+        lost: list[tuple[Lock, Exception]] = []
+        async with distlock.keep_alive(
+            lock,
+            expires_in_seconds=1,
+            interval_seconds=0.5,
+            on_lost=lambda *args: lost.append(args),
+        ) as keep_alive:
+            await distlock.release_lock(lock)
+            await asyncio.sleep(1)
+        assert isinstance(keep_alive.lost, LeaseLostError)
+        assert lost == [(keep_alive.lock, keep_alive.lost)]
+        with pytest.raises(LeaseLostError):
+            await distlock.renew_lock(lock, expires_in_seconds=1)
+    finally:
+        await cleanup_client_async(distlock, [key])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "client_str", ["distlock_client_async", "distlock_async_client_async"]
+)
+async def test_cancelling_acquire_cancels_the_wait(
+    client_str: str, request: pytest.FixtureRequest
+) -> None:
+    distlock = request.getfixturevalue(client_str)
+    key = "key"
+    await distlock.create_lock(key)
+    try:
+        lock = await distlock.acquire_lock(key=key, expires_in_seconds=60)
+        waiting = asyncio.create_task(
+            distlock.acquire_lock(key=key, expires_in_seconds=60)
+        )
+        await asyncio.sleep(0.3)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        await asyncio.sleep(0.1)
+        await distlock.release_lock(lock)
+        # Had the server kept waiting, the lock would be held for a minute by
+        # a caller that is gone
+        lock = await distlock.acquire_lock(
+            key=key, expires_in_seconds=60, timeout_seconds=2
+        )
+        assert lock.acquired
+    finally:
+        await cleanup_client_async(distlock, [key])
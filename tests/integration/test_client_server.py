@@ -1,16 +1,27 @@
 import subprocess
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
+from typing import Generator
 
+import grpc
 import pytest
 
 from distlock import (
     AlreadyExistsError,
+    DeadlineExceededError,
     Distlock,
+    InvalidArgumentError,
+    LeaseLostError,
     Lock,
     NotFoundError,
+    ResourceExhaustedError,
     UnreleasableError,
 )
+from distlock.lock_store import ShardedLockStore
+from distlock.server import Servicer
+from distlock.shared_lock_store import SharedLockStore
+from distlock.stubs import distlock_pb2, distlock_pb2_grpc
 
 from .conftest import cleanup
 
@@ -426,6 +437,297 @@ def test_acquire_release_cycle_clock_updates(
     assert all(lock.clock == 2 for lock in locks)
 
 
+@pytest.mark.parametrize(
+    "create_locks_str, client_str",
+    [
+        ("create_locks", "distlock"),
+        ("create_locks_async", "distlock_async"),
+    ],
+)
+def test_acquire_lock_blocking_handoff_on_release(
+    create_locks_str: list[str], client_str: str, request: pytest.FixtureRequest
+) -> None:
+    """
+    A blocked client should be handed the lock as soon as the holder releases
+    it, rather than on its next poll.
+    """
+    create_locks = request.getfixturevalue(create_locks_str)
+    distlock = request.getfixturevalue(client_str)
+    for key in create_locks:
+        lock = distlock.acquire_lock(key=key, expires_in_seconds=60)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(
+                distlock.acquire_lock,
+                key=key,
+                expires_in_seconds=60,
+                blocking=True,
+                timeout_seconds=10,
+            )
+            time.sleep(0.5)
+            start = time.time()
+            distlock.release_lock(lock)
+            acquired_lock = future.result()
+            elapsed = time.time() - start
+        assert acquired_lock.acquired
+        assert acquired_lock.clock == 2
+        assert elapsed < 1.0
+
+
+@pytest.mark.parametrize(
+    "create_locks_str, client_str",
+    [
+        ("create_locks", "distlock"),
+        ("create_locks_async", "distlock_async"),
+    ],
+)
+def test_read_write_locks(
+    create_locks_str: list[str], client_str: str, request: pytest.FixtureRequest
+) -> None:
+    create_locks = request.getfixturevalue(create_locks_str)
+    distlock = request.getfixturevalue(client_str)
+    key = create_locks[0]
+    readers = [
+        distlock.acquire_read_lock(key=key, expires_in_seconds=60) for _ in range(2)
+    ]
+    assert all(reader.acquired and reader.shared for reader in readers)
+    assert [reader.clock for reader in readers] == [1, 2]
+    assert not distlock.acquire_write_lock(
+        key=key, expires_in_seconds=60, blocking=False
+    ).acquired
+    renewed = distlock.renew_lock(readers[0], expires_in_seconds=120)
+    assert renewed.clock == 1
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(
+            distlock.acquire_write_lock,
+            key=key,
+            expires_in_seconds=60,
+            timeout_seconds=10,
+        )
+        time.sleep(0.5)
+        # The waiting writer keeps new readers out
+        assert not distlock.acquire_read_lock(
+            key=key, expires_in_seconds=60, blocking=False
+        ).acquired
+        for reader in readers:
+            distlock.release_lock(reader)
+        writer = future.result()
+    assert writer.acquired
+    assert not writer.shared
+    assert writer.clock == 3
+    distlock.release_lock(writer)
+
+
+@pytest.mark.parametrize("client_str", ["distlock", "distlock_async"])
+def test_semaphore(client_str: str, request: pytest.FixtureRequest) -> None:
+    distlock = request.getfixturevalue(client_str)
+    key = "semaphore"
+    with pytest.raises(ValueError):
+        distlock.create_semaphore(key, permits=0)
+    distlock.create_semaphore(key, permits=2)
+    try:
+        permits = [
+            distlock.acquire_permit(key=key, expires_in_seconds=60) for _ in range(2)
+        ]
+        assert all(permit.acquired for permit in permits)
+        assert [permit.clock for permit in permits] == [1, 2]
+        assert not distlock.acquire_permit(
+            key=key, expires_in_seconds=60, blocking=False
+        ).acquired
+        assert distlock.get_lock(key).permits == 2
+        renewed = distlock.renew_lock(permits[0], expires_in_seconds=120)
+        assert renewed.clock == 1
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(
+                distlock.acquire_permit,
+                key=key,
+                expires_in_seconds=60,
+                timeout_seconds=10,
+            )
+            time.sleep(0.5)
+            assert not future.done()
+            distlock.release_lock(permits[1])
+            permit = future.result()
+        assert permit.acquired
+        assert permit.clock == 3
+    finally:
+        cleanup(distlock, [key])
+
+
+@pytest.mark.parametrize("client_str", ["distlock", "distlock_async"])
+def test_owner_reenters(client_str: str, request: pytest.FixtureRequest) -> None:
+    distlock = request.getfixturevalue(client_str)
+    key = "owned"
+    distlock.create_lock(key)
+    try:
+        lock = distlock.acquire_lock(
+            key=key, expires_in_seconds=60, owner="worker-1", blocking=False
+        )
+        assert lock.acquired
+        assert (lock.owner, lock.holds) == ("worker-1", 1)
+        again = distlock.acquire_write_lock(
+            key=key, expires_in_seconds=60, owner="worker-1", timeout_seconds=1
+        )
+        assert again.clock == lock.clock
+        assert again.holds == 2
+        assert not distlock.acquire_lock(
+            key=key, expires_in_seconds=60, owner="worker-2", blocking=False
+        ).acquired
+        with pytest.raises(ValueError):
+            distlock.acquire_lock(
+                key=key, expires_in_seconds=60, owner="worker-1", shared=True
+            )
+
+        distlock.release_lock(again)
+        assert distlock.get_lock(key).holds == 1
+        distlock.release_lock(lock)
+        assert not distlock.get_lock(key).acquired
+    finally:
+        cleanup(distlock, [key])
+
+
+@pytest.mark.parametrize(
+    "create_locks_str, client_str",
+    [
+        ("create_locks", "distlock"),
+        ("create_locks_async", "distlock_async"),
+    ],
+)
+def test_batch_calls(
+    create_locks_str: list[str], client_str: str, request: pytest.FixtureRequest
+) -> None:
+    create_locks = request.getfixturevalue(create_locks_str)
+    distlock = request.getfixturevalue(client_str)
+    new_keys = ["batch-key-1", "batch-key-2"]
+    try:
+        created = distlock.create_many([*new_keys, create_locks[0]])
+        assert [lock.key for lock in created[:2]] == new_keys
+        assert isinstance(created[2], AlreadyExistsError)
+
+        keys = [*create_locks, *new_keys]
+        acquired = distlock.acquire_many([*keys, "not-a-key"], expires_in_seconds=60)
+        assert all(lock.acquired and lock.clock == 1 for lock in acquired[:-1])
+        assert isinstance(acquired[-1], NotFoundError)
+
+        not_acquired = distlock.acquire_many(keys, expires_in_seconds=60)
+        assert all(not lock.acquired for lock in not_acquired)
+
+        out_of_sync = Lock(key=keys[0], clock=0)
+        released = distlock.release_many([*acquired[:-1], out_of_sync])
+        assert all(not lock.acquired for lock in released[:-1])
+        assert isinstance(released[-1], UnreleasableError)
+
+        fetched = distlock.get_many([*keys, "not-a-key"])
+        assert [lock.key for lock in fetched[:-1]] == keys
+        assert all(not lock.acquired for lock in fetched[:-1])
+        assert isinstance(fetched[-1], NotFoundError)
+    finally:
+        cleanup(distlock, new_keys)
+
+
+@pytest.mark.parametrize("client_str", ["distlock", "distlock_async"])
+def test_iter_locks(client_str: str, request: pytest.FixtureRequest) -> None:
+    distlock = request.getfixturevalue(client_str)
+    keys = [f"iter/{i:03}" for i in range(25)]
+    distlock.create_many([*keys, "iter-other"])
+    try:
+        assert [lock.key for lock in distlock.iter_locks("iter/", page_size=4)] == keys
+        assert [lock.key for lock in distlock.iter_locks("iter/01")] == keys[10:20]
+        assert list(distlock.iter_locks("iter/none")) == []
+        all_keys = {lock.key for lock in distlock.iter_locks()}
+        assert {*keys, "iter-other"} <= all_keys
+    finally:
+        cleanup(distlock, [*keys, "iter-other"])
+
+
+@pytest.mark.parametrize(
+    "create_locks_str, client_str",
+    [
+        ("create_locks", "distlock"),
+        ("create_locks_async", "distlock_async"),
+    ],
+)
+def test_expired_leases_are_released(
+    create_locks_str: list[str], client_str: str, request: pytest.FixtureRequest
+) -> None:
+    create_locks = request.getfixturevalue(create_locks_str)
+    distlock = request.getfixturevalue(client_str)
+    distlock.acquire_many(create_locks, expires_in_seconds=1)
+    assert all(lock.acquired for lock in distlock.get_many(create_locks))
+    time.sleep(1.5)
+    locks = {lock.key: lock for lock in distlock.list_locks()}
+    assert all(not locks[key].acquired for key in create_locks)
+    assert all(locks[key].clock == 1 for key in create_locks)
+
+
+@pytest.mark.parametrize(
+    "create_locks_str, client_str",
+    [
+        ("create_locks", "distlock"),
+        ("create_locks_async", "distlock_async"),
+    ],
+)
+def test_renew_lock(
+    create_locks_str: list[str], client_str: str, request: pytest.FixtureRequest
+) -> None:
+    create_locks = request.getfixturevalue(create_locks_str)
+    distlock = request.getfixturevalue(client_str)
+    lock = distlock.acquire_lock(key=create_locks[0], expires_in_seconds=1)
+    renewed = distlock.renew_lock(lock, expires_in_seconds=60)
+    assert renewed.acquired
+    assert renewed.clock == lock.clock
+    assert renewed.expires_at > lock.expires_at
+    time.sleep(1.5)
+    assert distlock.get_lock(create_locks[0]).acquired
+
+    distlock.release_lock(lock)
+    with pytest.raises(LeaseLostError):
+        distlock.renew_lock(lock, expires_in_seconds=60)
+    with pytest.raises(NotFoundError):
+        distlock.renew_lock(Lock(key="not-a-key", clock=1), expires_in_seconds=60)
+
+
+@pytest.mark.parametrize(
+    "create_locks_str, client_str",
+    [
+        ("create_locks", "distlock"),
+        ("create_locks_async", "distlock_async"),
+    ],
+)
+def test_keep_alive(
+    create_locks_str: list[str], client_str: str, request: pytest.FixtureRequest
+) -> None:
+    create_locks = request.getfixturevalue(create_locks_str)
+    distlock = request.getfixturevalue(client_str)
+    lost: list[tuple[Lock, Exception]] = []
+    lock = distlock.acquire_lock(key=create_locks[0], expires_in_seconds=1)
+    with distlock.keep_alive(
+        lock, expires_in_seconds=1, on_lost=lambda *args: lost.append(args)
+    ) as keep_alive:
+        # Well past the lease the lock was acquired with
+        time.sleep(2.5)
+        assert distlock.get_lock(create_locks[0]).acquired
+        assert keep_alive.lock.expires_at > lock.expires_at
+    assert keep_alive.lost is None
+    time.sleep(1.5)
+    assert not distlock.get_lock(create_locks[0]).acquired
+
+    # Another holder took the lock over, so the next renewal is refused
+    lock = distlock.acquire_lock(key=create_locks[1], expires_in_seconds=1)
+    with distlock.keep_alive(
+        lock,
+        expires_in_seconds=1,
+        interval_seconds=0.5,
+        on_lost=lambda *args: lost.append(args),
+    ) as keep_alive:
+        distlock.release_lock(lock)
+        distlock.acquire_lock(key=create_locks[1], expires_in_seconds=60)
+        time.sleep(1)
+    assert isinstance(keep_alive.lost, LeaseLostError)
+    assert lost == [(lock, keep_alive.lost)]
+
+
 def test_multiple_clients(distlock_server: subprocess.Popen) -> None:
     def client(key: str) -> None:
         distlock = Distlock()
@@ -470,3 +772,254 @@ def test_multiple_clients_server_async(distlock_server_async: subprocess.Popen)
     with ThreadPoolExecutor(max_workers=3) as executor:
         results = executor.map(client, ["key1", "key2", "key3"])
     _ = [result for result in results]
+
+
+@pytest.mark.parametrize("port", [50051, 50052])
+def test_client_context_manager_closes_channels(
+    port: int,
+    distlock_server: subprocess.Popen,
+    distlock_server_async: subprocess.Popen,
+) -> None:
+    with Distlock(port=port) as distlock:
+        distlock.create_lock("key")
+        assert distlock.get_lock("key").key == "key"
+        distlock.delete_lock("key")
+    with pytest.raises(ValueError):
+        distlock.list_locks()
+
+
+def test_client_close_closes_every_channel(
+    distlock_server: subprocess.Popen,
+) -> None:
+    distlock = Distlock(port=50051, pool_size=2)
+    retired_stubs = distlock._stubs
+    # As when the client follows a redirect to the leader
+    distlock._retired_channels.extend(distlock._channels)
+    distlock._connect("localhost:50051")
+    distlock.list_locks()
+    distlock.close()
+    for stub in retired_stubs + distlock._stubs:
+        with pytest.raises(ValueError):
+            stub.ListLocks(distlock_pb2.EmptyRequest())
+
+
+def test_client_pool_shared_across_threads(distlock_server: subprocess.Popen) -> None:
+    keys = [f"pooled-key-{i}" for i in range(12)]
+
+    def client(distlock: Distlock, key: str) -> None:
+        distlock.create_lock(key)
+        lock = distlock.acquire_lock(key=key, expires_in_seconds=1)
+        assert lock.acquired
+        distlock.release_lock(lock)
+        distlock.delete_lock(key)
+
+    with Distlock(pool_size=3) as distlock:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = executor.map(lambda key: client(distlock, key), keys)
+        _ = [result for result in results]
+        lock_names = {lock.key for lock in distlock.list_locks()}
+    assert not lock_names & set(keys)
+
+
+def test_server_processes_share_locks(
+    distlock_server_processes: subprocess.Popen,
+) -> None:
+    # Each client has its own connection, which the kernel hands to any of the
+    # server processes, so the clients only agree if the processes share locks
+    # Fewer clients than --max-workers, so that blocked waiters cannot take up
+    # every thread of a process between them
+    clients = [Distlock(port=50055) for _ in range(4)]
+    clients[0].create_lock("shared-key")
+    with pytest.raises(AlreadyExistsError):
+        clients[1].create_lock("shared-key")
+
+    def work(distlock: Distlock) -> list[int]:
+        clocks = []
+        for _ in range(5):
+            lock = distlock.acquire_lock(
+                key="shared-key", expires_in_seconds=10, timeout_seconds=10
+            )
+            assert lock.acquired
+            clocks.append(lock.clock)
+            distlock.release_lock(lock)
+        return clocks
+
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        clocks = [clock for result in executor.map(work, clients) for clock in result]
+    assert sorted(clocks) == list(range(1, len(clients) * 5 + 1))
+
+    clients[2].delete_lock("shared-key")
+    for distlock in clients:
+        with pytest.raises(NotFoundError):
+            distlock.get_lock("shared-key")
+        distlock.close()
+
+
+def test_server_processes_share_read_locks(
+    distlock_server_processes: subprocess.Popen,
+) -> None:
+    # Each client has its own connection, which may be served by a different
+    # process
+    clients = [Distlock(port=50055) for _ in range(3)]
+    clients[0].create_lock("read-key")
+    try:
+        readers = [
+            distlock.acquire_read_lock(key="read-key", expires_in_seconds=60)
+            for distlock in clients[:2]
+        ]
+        assert all(reader.acquired for reader in readers)
+        assert (
+            not clients[2]
+            .acquire_write_lock(key="read-key", expires_in_seconds=60, blocking=False)
+            .acquired
+        )
+        for distlock, reader in zip(clients, readers):
+            distlock.release_lock(reader)
+        writer = clients[2].acquire_write_lock(
+            key="read-key", expires_in_seconds=60, blocking=False
+        )
+        assert writer.acquired
+        clients[2].release_lock(writer)
+    finally:
+        clients[0].delete_lock("read-key")
+        for distlock in clients:
+            distlock.close()
+
+
+def test_server_processes_share_semaphores(
+    distlock_server_processes: subprocess.Popen,
+) -> None:
+    clients = [Distlock(port=50055) for _ in range(3)]
+    clients[0].create_semaphore("semaphore-key", permits=2)
+    try:
+        permits = [
+            distlock.acquire_permit(
+                key="semaphore-key", expires_in_seconds=60, blocking=False
+            )
+            for distlock in clients
+        ]
+        assert [permit.acquired for permit in permits] == [True, True, False]
+        clients[0].release_lock(permits[0])
+        permit = clients[2].acquire_permit(
+            key="semaphore-key", expires_in_seconds=60, blocking=False
+        )
+        assert permit.acquired
+        clients[1].release_lock(permits[1])
+        clients[2].release_lock(permit)
+    finally:
+        clients[0].delete_lock("semaphore-key")
+        for distlock in clients:
+            distlock.close()
+
+
+def test_batch_errors_are_typed() -> None:
+    lock_store = SharedLockStore(capacity=8, regions=1)
+    server = grpc.server(ThreadPoolExecutor(max_workers=2))
+    distlock_pb2_grpc.add_DistlockServicer_to_server(
+        Servicer(lock_store=lock_store), server
+    )
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    try:
+        with Distlock(address="localhost", port=port) as distlock:
+            keys = [f"key-{i}" for i in range(lock_store.capacity)]
+            created = distlock.create_many(["x" * 257, *keys, "one-too-many"])
+            assert isinstance(created[0], InvalidArgumentError)
+            assert all(isinstance(lock, Lock) for lock in created[1:-1])
+            assert isinstance(created[-1], ResourceExhaustedError)
+    finally:
+        server.stop(None)
+        lock_store.close()
+
+
+@pytest.fixture
+def fair_port() -> Generator[int, None, None]:
+    server = grpc.server(ThreadPoolExecutor(max_workers=8))
+    distlock_pb2_grpc.add_DistlockServicer_to_server(
+        Servicer(lock_store=ShardedLockStore(fair=True)), server
+    )
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    yield port
+    server.stop(None)
+
+
+def test_fair_server_reports_queue_position(fair_port: int) -> None:
+    with Distlock(address="localhost", port=fair_port) as distlock:
+        distlock.create_lock("key")
+        lock = distlock.acquire_lock(key="key", expires_in_seconds=60)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(
+                distlock.acquire_lock,
+                key="key",
+                expires_in_seconds=60,
+                timeout_seconds=10,
+            )
+            time.sleep(0.5)
+            queued = distlock.acquire_lock(
+                key="key", expires_in_seconds=60, blocking=False
+            )
+            assert not queued.acquired
+            assert queued.queue_position == 1
+            with pytest.raises(TimeoutError, match="1 requests still queued ahead"):
+                distlock.acquire_lock(
+                    key="key", expires_in_seconds=60, timeout_seconds=0.2
+                )
+            distlock.release_lock(lock)
+            assert future.result().acquired
+
+
+class WedgedServicer(Servicer):
+    """
+    A servicer that hangs on reads and waits, as a wedged server would.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.unwedged = threading.Event()
+
+    def GetLock(
+        self, request: distlock_pb2.Lock, context: grpc.ServicerContext
+    ) -> distlock_pb2.Lock:
+        self.unwedged.wait(10)
+        return super().GetLock(request, context)
+
+    def WaitAcquireLock(
+        self,
+        request: distlock_pb2.WaitAcquireLockRequest,
+        context: grpc.ServicerContext,
+    ) -> distlock_pb2.Lock:
+        self.unwedged.wait(10)
+        return super().WaitAcquireLock(request, context)
+
+
+@pytest.fixture
+def wedged_port() -> Generator[int, None, None]:
+    servicer = WedgedServicer()
+    server = grpc.server(ThreadPoolExecutor(max_workers=4))
+    distlock_pb2_grpc.add_DistlockServicer_to_server(servicer, server)
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    yield port
+    servicer.unwedged.set()
+    server.stop(None)
+
+
+def test_calls_have_deadlines(wedged_port: int) -> None:
+    with Distlock(
+        address="localhost", port=wedged_port, deadline_seconds=0.2
+    ) as distlock:
+        distlock.create_lock("key")
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            distlock.get_lock("key")
+        assert time.monotonic() - start < 1
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            distlock.get_lock("key", deadline_seconds=0.5)
+        assert 0.5 <= time.monotonic() - start < 1.5
+        # A blocking acquire is bounded by its timeout instead
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            distlock.acquire_lock(key="key", expires_in_seconds=60, timeout_seconds=1)
+        assert 1 <= time.monotonic() - start < 2
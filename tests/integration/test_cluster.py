@@ -0,0 +1,103 @@
+import subprocess
+import time
+
+import grpc
+import pytest
+
+from distlock import Distlock, DistlockAsync, UnreleasableError
+
+
+def leader_port(client: Distlock) -> int:
+    # The client follows redirects, so it ends up connected to the leader
+    client.list_locks()
+    return int(client._address.rsplit(":", 1)[1])
+
+
+def wait_for_leader(client: Distlock) -> int:
+    # On a loaded machine an election can outlast the time clients follow
+    # redirects for
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            return leader_port(client)
+        except grpc.RpcError as e:
+            if e.code() != grpc.StatusCode.UNAVAILABLE or time.monotonic() > deadline:
+                raise
+
+
+def test_followers_redirect_to_leader(
+    distlock_cluster: dict[int, subprocess.Popen],
+) -> None:
+    clients = [Distlock("localhost", port) for port in distlock_cluster]
+    clients[0].create_lock("cluster-key")
+    for client in clients:
+        lock = client.acquire_lock(
+            key="cluster-key", expires_in_seconds=60, blocking=False
+        )
+        assert lock.acquired == (client is clients[0])
+    leaders = {leader_port(client) for client in clients}
+    assert len(leaders) == 1
+    lock = clients[1].get_lock("cluster-key")
+    assert lock.acquired
+    assert lock.clock == 1
+    clients[2].release_lock(lock)
+    assert [lock.key for lock in clients[2].iter_locks(prefix="cluster-")] == [
+        "cluster-key"
+    ]
+    clients[0].delete_lock("cluster-key")
+    for client in clients:
+        client.close()
+
+
+@pytest.mark.asyncio
+async def test_async_client_follows_redirect(
+    distlock_cluster: dict[int, subprocess.Popen],
+) -> None:
+    with Distlock("localhost", next(iter(distlock_cluster))) as client:
+        leader = leader_port(client)
+    follower = next(port for port in distlock_cluster if port != leader)
+    async with DistlockAsync("localhost", follower) as client_async:
+        await client_async.create_lock("cluster-async-key")
+        lock = await client_async.acquire_lock(
+            key="cluster-async-key", expires_in_seconds=60
+        )
+        assert lock.acquired
+        assert [lock.key async for lock in client_async.iter_locks("cluster-")] == [
+            "cluster-async-key"
+        ]
+        await client_async.release_lock(lock)
+        await client_async.delete_lock("cluster-async-key")
+
+
+def test_failover_keeps_leases_and_clocks(
+    distlock_cluster: dict[int, subprocess.Popen],
+) -> None:
+    client = Distlock("localhost", next(iter(distlock_cluster)))
+    wait_for_leader(client)
+    client.create_lock("failover-key")
+    first = client.acquire_lock(key="failover-key", expires_in_seconds=60)
+    client.release_lock(first)
+    second = client.acquire_lock(key="failover-key", expires_in_seconds=60)
+
+    leader = leader_port(client)
+    distlock_cluster[leader].terminate()
+    distlock_cluster[leader].wait()
+    survivor = next(port for port in distlock_cluster if port != leader)
+    client = Distlock("localhost", survivor)
+    assert wait_for_leader(client) != leader
+
+    # The new leader carries on from the lease the old one granted
+    lock = client.get_lock("failover-key")
+    assert lock.acquired
+    assert lock.clock == second.clock
+    assert not client.acquire_lock(
+        key="failover-key", expires_in_seconds=60, blocking=False
+    ).acquired
+    with pytest.raises(UnreleasableError):
+        client.release_lock(first)
+    client.release_lock(second)
+    third = client.acquire_lock(key="failover-key", expires_in_seconds=60)
+    assert third.clock == second.clock + 1
+    client.release_lock(third)
+    client.delete_lock("failover-key")
+    client.close()
@@ -0,0 +1,167 @@
+import subprocess
+from typing import Generator
+
+import pytest
+
+from distlock import (
+    AlreadyExistsError,
+    Distlock,
+    NotFoundError,
+    ShardedDistlock,
+    ShardedDistlockAsync,
+)
+
+from .conftest import cleanup
+
+ENDPOINTS = ["localhost:50051", "localhost:50052"]
+KEYS = [f"sharded-{i:02d}" for i in range(20)]
+
+
+@pytest.fixture(scope="function")
+def sharded_distlock(
+    distlock_server: subprocess.Popen, distlock_server_async: subprocess.Popen
+) -> Generator[ShardedDistlock, None, None]:
+    with ShardedDistlock(ENDPOINTS) as client:
+        yield client
+        for endpoint in ENDPOINTS:
+            address, port = endpoint.split(":")
+            with Distlock(address, int(port)) as server_client:
+                cleanup(server_client, KEYS)
+
+
+def test_sharded_client_routes_keys(sharded_distlock: ShardedDistlock) -> None:
+    for key in KEYS:
+        sharded_distlock.create_lock(key)
+    on_servers = []
+    for endpoint in ENDPOINTS:
+        address, port = endpoint.split(":")
+        with Distlock(address, int(port)) as client:
+            keys = [lock.key for lock in client.iter_locks(prefix="sharded-")]
+        assert keys
+        on_servers.extend(keys)
+        assert all(
+            sharded_distlock.client_for(key) is sharded_distlock._clients[endpoint]
+            for key in keys
+        )
+    assert sorted(on_servers) == KEYS
+
+    lock = sharded_distlock.acquire_lock(key=KEYS[0], expires_in_seconds=60)
+    assert lock.acquired
+    assert sharded_distlock.get_lock(KEYS[0]).clock == lock.clock
+    sharded_distlock.release_lock(lock)
+    sharded_distlock.delete_lock(KEYS[0])
+    with pytest.raises(NotFoundError):
+        sharded_distlock.get_lock(KEYS[0])
+
+
+def test_sharded_client_fans_out(sharded_distlock: ShardedDistlock) -> None:
+    results = sharded_distlock.create_many(KEYS)
+    assert [lock.key for lock in results if not isinstance(lock, Exception)] == KEYS
+    results = sharded_distlock.create_many(KEYS[:2])
+    assert all(isinstance(result, AlreadyExistsError) for result in results)
+
+    listed = [
+        lock.key
+        for lock in sharded_distlock.list_locks()
+        if lock.key.startswith("sharded-")
+    ]
+    assert listed == KEYS
+    assert [lock.key for lock in sharded_distlock.iter_locks("sharded-")] == KEYS
+    # More pages than one read ahead from each server
+    assert [
+        lock.key for lock in sharded_distlock.iter_locks("sharded-", page_size=3)
+    ] == KEYS
+
+    acquired = sharded_distlock.acquire_many(KEYS, expires_in_seconds=60)
+    assert all(not isinstance(lock, Exception) and lock.acquired for lock in acquired)
+    got = sharded_distlock.get_many(KEYS)
+    assert [lock.key for lock in got if not isinstance(lock, Exception)] == KEYS
+    released = sharded_distlock.release_many(
+        [lock for lock in acquired if not isinstance(lock, Exception)]
+    )
+    assert [lock.key for lock in released if not isinstance(lock, Exception)] == KEYS
+
+
+@pytest.mark.asyncio
+async def test_sharded_client_async(sharded_distlock: ShardedDistlock) -> None:
+    async with ShardedDistlockAsync(ENDPOINTS) as client:
+        results = await client.create_many(KEYS)
+        assert all(not isinstance(result, Exception) for result in results)
+        listed = [
+            lock.key
+            for lock in await client.list_locks()
+            if lock.key.startswith("sharded-")
+        ]
+        assert listed == KEYS
+        assert [lock.key async for lock in client.iter_locks("sharded-")] == KEYS
+        lock = await client.acquire_lock(key=KEYS[3], expires_in_seconds=60)
+        assert lock.acquired
+        assert (await client.get_lock(KEYS[3])).acquired
+        await client.release_lock(lock)
+        acquired = await client.acquire_many(KEYS, expires_in_seconds=60)
+        assert all(
+            not isinstance(lock, Exception) and lock.acquired for lock in acquired
+        )
+        released = await client.release_many(
+            [lock for lock in acquired if not isinstance(lock, Exception)]
+        )
+        assert all(not isinstance(result, Exception) for result in released)
+        got = await client.get_many(KEYS)
+        assert all(
+            not isinstance(lock, Exception) and not lock.acquired for lock in got
+        )
+        await client.delete_lock(KEYS[0])
+        with pytest.raises(NotFoundError):
+            await client.get_lock(KEYS[0])
+
+        readers = [
+            await client.acquire_read_lock(key=KEYS[1], expires_in_seconds=60)
+            for _ in range(2)
+        ]
+        assert all(reader.acquired for reader in readers)
+        assert not (
+            await client.acquire_write_lock(
+                key=KEYS[1], expires_in_seconds=60, blocking=False
+            )
+        ).acquired
+        for reader in readers:
+            await client.release_lock(reader)
+        await client.create_semaphore("sharded-semaphore", permits=2)
+        try:
+            permit = await client.acquire_permit(
+                key="sharded-semaphore", expires_in_seconds=60
+            )
+            assert permit.acquired
+        finally:
+            await client.delete_lock("sharded-semaphore")
+
+
+def test_sharded_client_read_write_and_permits(
+    sharded_distlock: ShardedDistlock,
+) -> None:
+    sharded_distlock.create_many(KEYS[:2])
+    readers = [
+        sharded_distlock.acquire_read_lock(key=KEYS[0], expires_in_seconds=60)
+        for _ in range(2)
+    ]
+    assert all(reader.acquired for reader in readers)
+    assert not sharded_distlock.acquire_write_lock(
+        key=KEYS[0], expires_in_seconds=60, blocking=False
+    ).acquired
+    for reader in readers:
+        sharded_distlock.release_lock(reader)
+    writer = sharded_distlock.acquire_write_lock(key=KEYS[0], expires_in_seconds=60)
+    assert writer.acquired
+    sharded_distlock.release_lock(writer)
+
+    sharded_distlock.create_semaphore("sharded-semaphore", permits=2)
+    try:
+        permits = [
+            sharded_distlock.acquire_permit(
+                key="sharded-semaphore", expires_in_seconds=60, blocking=False
+            )
+            for _ in range(3)
+        ]
+        assert [permit.acquired for permit in permits] == [True, True, False]
+    finally:
+        sharded_distlock.delete_lock("sharded-semaphore")